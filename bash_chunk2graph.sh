@@ -1,8 +1,7 @@
 #!/usr/bin/env bash
 
-for file in ./data/bashinput/*.txt ; do
-        python3 ./chunk_to_graph.py -i "$file" \
-                -p promts/prompt_pilou02.txt \
-                -o "${file%.txt}".json ;
-        mv "${file%.txt}".json ./data/bashoutput/ ;
-done
+# Extract all chunks in one process; see chunk_to_graph.py --help for
+# --workers (concurrent requests) and --overwrite.
+python3 ./chunk_to_graph.py --input-dir ./data/bashinput \
+        -p promts/prompt_pilou02.txt \
+        --output-dir ./data/bashoutput "$@"
@@ -0,0 +1,67 @@
+"""
+Timing of entity_resolution.resolve_entities at corpus scale, on copies of
+the extractions in data/bashoutput (see bench_graph_memory.replicate). The
+family names get a suffix shared by --same-names consecutive copies: with 1
+every copy is a family of its own (and contains one duplicate to merge),
+larger values make the blocks grow (a worst case for the blocking, where
+most candidates are ambiguous).
+
+    python -m benchmarks.bench_entity_resolution [--copies 1000] [--same-names 1]
+"""
+
+import time
+import argparse
+
+from compact_family_graph import CompactFamilyGraph
+from entity_resolution import find_candidates, resolve_entities
+from benchmarks.bench_graph_memory import load_samples, replicate
+
+
+def letters(number: int) -> str:
+    """number written with the letters a-z (digits are dropped from names)"""
+    word: str = ""
+    while True:
+        number, digit = divmod(number, 26)
+        word += chr(ord("a") + digit)
+        if not number:
+            return word
+
+
+def rename_families(extractions: list[dict], per_copy: int, same_names: int) -> None:
+    """suffix the family names of every same_names consecutive copies"""
+    for i, extraction in enumerate(extractions):
+        suffix: str = letters(i // per_copy // same_names)
+        for person in extraction["persons"]:
+            person["family_name"] = f"{person['family_name']}{suffix}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the entity resolution.")
+    parser.add_argument("--samples", default="data/bashoutput", help="directory of extraction JSONs")
+    parser.add_argument("--copies", type=int, default=1000, help="copies of the samples to load")
+    parser.add_argument("--same-names", type=int, default=1, help="copies sharing their family names")
+    args = parser.parse_args()
+
+    samples: list[dict] = load_samples(args.samples)
+    extractions: list[dict] = replicate(samples, args.copies)
+    rename_families(extractions, len(samples), args.same_names)
+    graph = CompactFamilyGraph()
+    graph.load_extractions(extractions, workers=1)
+    persons: int = graph.G.number_of_nodes()
+
+    start: float = time.perf_counter()
+    table, candidates = find_candidates(graph)
+    blocks: int = sum(1 for rows in table.blocks().values() if len(rows) > 1)
+    candidate_seconds: float = time.perf_counter() - start
+
+    start = time.perf_counter()
+    merges: list[dict] = resolve_entities(graph)
+    resolve_seconds: float = time.perf_counter() - start
+
+    print(f"{persons} persons, {blocks} blocks, {len(candidates)} candidates")
+    print(f"  candidates          {candidate_seconds:8.2f} s")
+    print(f"  resolve (all)       {resolve_seconds:8.2f} s, {len(merges)} merges")
+
+
+if __name__ == "__main__":
+    main()
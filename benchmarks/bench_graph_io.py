@@ -0,0 +1,88 @@
+"""
+Benchmark of saving and loading the graph: the notebook way (stringified copy
+and nx.write_gexf / nx.read_gexf) against the streaming typed writers and
+readers of graph_io (and Parquet, if pyarrow is installed), with the samples
+replicated to about 100k persons.
+
+    python -m benchmarks.bench_graph_io [--copies 1820]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable
+
+import networkx as nx
+
+import graph_io
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from benchmarks.bench_graph_memory import load_samples, replicate
+
+
+def notebook_write_gexf(graph: FamilyGraph, path: str) -> None:
+    g2 = graph.to_networkx().copy()
+    for node in g2.nodes():
+        for key, val in g2.nodes[node].items():
+            g2.nodes[node][key] = str(val)
+    nx.write_gexf(g2, path)
+
+
+def measure(function: Callable[[], object]) -> tuple[float, int]:
+    """(seconds, peak bytes allocated) of calling function"""
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    function()
+    seconds: float = time.perf_counter() - start
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def size_of(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark saving and loading the graph.")
+    parser.add_argument("--samples", default="data/bashoutput", help="directory of extraction JSONs")
+    parser.add_argument("--copies", type=int, default=1820, help="copies of the samples (1820 ~ 100k persons)")
+    parser.add_argument("--compact", action="store_true", help="use the compact backend")
+    args = parser.parse_args()
+
+    graph_class = CompactFamilyGraph if args.compact else FamilyGraph
+    graph = graph_class()
+    graph.load_extractions(replicate(load_samples(args.samples), args.copies), workers=1)
+    print(f"{graph.G.number_of_nodes()} persons, {graph.G.number_of_edges()} relations")
+
+    directory: str = tempfile.mkdtemp()
+    cases: list[tuple[str, str, Callable, Callable]] = [
+        ("networkx gexf", "nx.gexf", lambda path: notebook_write_gexf(graph, path), nx.read_gexf),
+        ("stream gexf", "graph.gexf", graph.save, graph_class.load),
+        ("stream graphml", "graph.graphml", graph.save, graph_class.load),
+    ]
+    try:
+        graph_io.pyarrow_modules()
+        cases.append(("parquet", "graph.parquet", graph.save, graph_class.load))
+    except ImportError:
+        print("  (pyarrow is not installed, skipping Parquet)")
+
+    try:
+        for name, file_name, write, read in cases:
+            path: str = os.path.join(directory, file_name)
+            write_seconds, write_peak = measure(lambda: write(path))
+            read_seconds, read_peak = measure(lambda: read(path))
+            print(f"  {name:15} write {write_seconds:6.2f} s {write_peak / 2**20:7.1f} MiB peak  "
+                  f"read {read_seconds:6.2f} s {read_peak / 2**20:7.1f} MiB peak  "
+                  f"{size_of(path) / 2**20:6.1f} MiB on disk")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Memory benchmark of CompactFamilyGraph against the networkx backend of
+FamilyGraph. The extractions in data/bashoutput are replicated (with the
+family ids made unique per copy, so the copies are not merged) to reach
+corpus scale.
+
+    python -m benchmarks.bench_graph_memory [--copies 2000]
+"""
+
+import os
+import json
+import time
+import argparse
+import tracemalloc
+
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+
+FAMILY_ID_FIELDS = ("family_id", "father_family_id", "husband_family_id")
+
+
+def load_samples(directory: str) -> list[dict]:
+    samples: list[dict] = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                samples.append(json.load(f))
+    return samples
+
+
+def replicate(samples: list[dict], copies: int) -> list[dict]:
+    """copies of the samples with the family ids suffixed by the copy number"""
+    extractions: list[dict] = []
+    for copy in range(copies):
+        for sample in samples:
+            persons: list[dict] = []
+            for person in sample["persons"]:
+                person = dict(person)
+                for key in FAMILY_ID_FIELDS:
+                    if person.get(key) is not None:
+                        person[key] = f"{person[key]}_{copy}"
+                persons.append(person)
+            extractions.append({"persons": persons, "relations": sample["relations"]})
+    return extractions
+
+
+def measure(graph_class, extractions: list[dict]) -> tuple[int, float, int]:
+    """(bytes allocated by the graph, seconds to load, number of persons)"""
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    graph = graph_class()
+    graph.load_extractions(extractions, workers=1)
+    seconds: float = time.perf_counter() - start
+    # report memory with the per-file reports already released
+    size: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, seconds, graph.G.number_of_nodes()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the memory of the graph backends.")
+    parser.add_argument("--samples", default="data/bashoutput", help="directory of extraction JSONs")
+    parser.add_argument("--copies", type=int, default=2000, help="copies of the samples to load")
+    args = parser.parse_args()
+
+    extractions: list[dict] = replicate(load_samples(args.samples), args.copies)
+    print(f"{len(extractions)} extractions")
+    results: dict[str, int] = {}
+    for name, graph_class in [("networkx", FamilyGraph), ("compact", CompactFamilyGraph)]:
+        size, seconds, persons = measure(graph_class, extractions)
+        results[name] = size
+        print(f"  {name:9} {persons} persons  {size / 2**20:8.1f} MiB  "
+              f"{size / persons:6.0f} bytes/person  {seconds:6.2f} s")
+    print(f"  compact uses {results['compact'] / results['networkx']:.0%} of the memory")
+
+
+if __name__ == "__main__":
+    main()
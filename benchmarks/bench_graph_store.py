@@ -0,0 +1,68 @@
+"""
+Benchmark of the SQLite store (graph_store.StoredFamilyGraph): writing the
+replicated samples (with family names unique per copy, see
+bench_entity_resolution.rename_families), opening the store, loading single
+families and loading everything, against rebuilding the graph from the
+extractions in memory.
+
+    python -m benchmarks.bench_graph_store [--copies 1820]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from family_graph import FamilyGraph
+from graph_store import StoredFamilyGraph
+from benchmarks.bench_graph_memory import load_samples, replicate
+from benchmarks.bench_entity_resolution import rename_families
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite graph store.")
+    parser.add_argument("--samples", default="data/bashoutput", help="directory of extraction JSONs")
+    parser.add_argument("--copies", type=int, default=1820, help="copies of the samples (1820 ~ 100k persons)")
+    parser.add_argument("--families", type=int, default=50, help="single families to load")
+    args = parser.parse_args()
+
+    samples: list[dict] = load_samples(args.samples)
+    extractions: list[dict] = replicate(samples, args.copies)
+    rename_families(extractions, len(samples), 1)
+
+    start: float = time.perf_counter()
+    FamilyGraph().load_extractions(extractions, workers=1)
+    print(f"  build in memory     {time.perf_counter() - start:8.2f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = os.path.join(directory, "graph.sqlite")
+        start = time.perf_counter()
+        with StoredFamilyGraph(path) as graph:
+            graph.load_extractions(extractions, workers=1)
+        print(f"  build in store      {time.perf_counter() - start:8.2f} s, "
+              f"{os.path.getsize(path) / 2**20:.1f} MiB")
+
+        start = time.perf_counter()
+        graph = StoredFamilyGraph(path)
+        print(f"  open                {(time.perf_counter() - start) * 1000:8.2f} ms")
+        stats: dict[str, int] = graph.stats()
+        names: list[str] = random.Random(0).sample(sorted(graph.families()), args.families)
+        seconds: list[float] = []
+        for name in names:
+            start = time.perf_counter()
+            graph.load_family(name)
+            seconds.append(time.perf_counter() - start)
+        print(f"  load one family     {statistics.median(seconds) * 1000:8.2f} ms median "
+              f"({graph.G.number_of_nodes() / args.families:.0f} persons per family)")
+
+        start = time.perf_counter()
+        graph.load_all()
+        print(f"  load all            {time.perf_counter() - start:8.2f} s, "
+              f"{stats['persons']} persons, {stats['families']} families")
+        graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of text_normalizer.normalize_text against the former chain of
+separate substitutions in txt_to_chunks.py, on the samples in data/alt.
+
+The chain is the one of the baseline txt_to_chunks.py. Its output differs
+where normalize_text deliberately changed the rules: only letters are
+de-hyphenated (the chain joined open lifespans like "1638-" with the next
+line), and a person marker is also recognized at the start of a text.
+
+    python -m benchmarks.bench_normalizer [--repeat 200]
+"""
+
+import re
+import glob
+import time
+import argparse
+
+from text_normalizer import filename_suffix, normalize_text
+
+
+def substitution_chain(text: str) -> str:
+    """the former normalization: one full copy of the text per substitution"""
+    text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
+    text = re.compile(r"<.*?>").sub("", text)
+    return re.compile(r"\n__BLANK__\n(?=\d)").sub("\nNEWFILE\n", text)
+
+
+def suffix_chain(person: str) -> str:
+    """the former derivation of the file name suffix: four nested substitutions"""
+    return re.sub(
+        r"\\.*",
+        "",
+        re.sub(r"\s+.*", "", re.sub(r"\.*", "", re.sub(r"/.*", "", person[:3].replace(" ", "_")))),
+    )
+
+
+def best_of(function, argument, repeat: int, rounds: int = 5) -> float:
+    """best wall time in seconds of repeat calls of function(argument)"""
+    best: float = float("inf")
+    for _ in range(rounds):
+        start: float = time.perf_counter()
+        for _ in range(repeat):
+            function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the text normalizer.")
+    parser.add_argument("--samples", default="data/alt/*.txt", help="glob of sample texts")
+    parser.add_argument("--repeat", type=int, default=200, help="calls per round")
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(args.samples)):
+        with open(path, encoding="utf-8") as f:
+            text: str = f.read()
+
+        normalized: str = normalize_text(text).text
+        expected: str = substitution_chain(text)
+        persons: list[str] = [p.strip() for p in normalized.split("NEWFILE")]
+
+        chain: float = best_of(substitution_chain, text, args.repeat)
+        single: float = best_of(lambda t: normalize_text(t, track_offsets=False), text, args.repeat)
+        tracked: float = best_of(normalize_text, text, args.repeat)
+        old_suffix: float = best_of(lambda ps: [suffix_chain(p) for p in ps], persons, args.repeat)
+        new_suffix: float = best_of(lambda ps: [filename_suffix(p) for p in ps], persons, args.repeat)
+
+        print(f"{path} ({len(text)} chars, same output as the chain: {normalized == expected})")
+        print(f"  substitution chain       {chain / args.repeat * 1e6:9.1f} us")
+        print(f"  single pass              {single / args.repeat * 1e6:9.1f} us")
+        print(f"  single pass with map     {tracked / args.repeat * 1e6:9.1f} us")
+        print(f"  suffixes: nested re.sub  {old_suffix / args.repeat * 1e6:9.1f} us")
+        print(f"  suffixes: single regex   {new_suffix / args.repeat * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
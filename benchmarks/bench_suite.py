@@ -0,0 +1,184 @@
+"""
+Benchmark suite of the whole chain on synthetic corpora (see
+synthetic_corpus.py) of 1k, 10k and 100k persons:
+
+    chunking     txt_to_chunks.chunk_families (one process, jsonl shard)
+    ingest       FamilyGraph.load_extractions and the compact backend (one process)
+    resolve      entity_resolution.resolve_entities (merges vs. marriages of the corpus)
+    export       graph_io.write_gexf and FamilyGraph.load
+    kinship      KinshipIndex, 1000 relationship queries and node_weights
+    search       PersonSearchIndex and 1000 name/profession/year queries
+    demographics GraphColumns and demographic_report
+
+The results are written to a JSON file (with the commit they were measured
+at), and two result files can be compared:
+
+    python -m benchmarks.bench_suite [--sizes 1000 10000 100000] [--output bench.json]
+    python -m benchmarks.bench_suite --compare before.json after.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Callable
+
+import txt_to_chunks
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from entity_resolution import resolve_entities
+from graph_io import write_gexf
+from kinship import KinshipIndex
+from demographics import GraphColumns, demographic_report
+from person_search import PersonSearchIndex
+from synthetic_corpus import generate_corpus, write_corpus
+
+QUERIES: int = 1000
+
+
+def timed(function: Callable[[], object]) -> tuple[float, object]:
+    """(seconds, result) of calling function"""
+    start: float = time.perf_counter()
+    result: object = function()
+    return time.perf_counter() - start, result
+
+
+def stage(seconds: float, items: int, unit: str, **extra: object) -> dict:
+    return {"seconds": round(seconds, 4), unit: items, f"{unit}_per_second": round(items / seconds, 1), **extra}
+
+
+def input_bytes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def run_size(persons: int, seed: int) -> dict[str, dict]:
+    """all stages on a corpus of the given number of persons"""
+    results: dict[str, dict] = {}
+    seconds, corpus = timed(lambda: generate_corpus(persons, seed))
+    truth: dict[str, int] = corpus.truth
+    results["generate"] = stage(seconds, truth["persons"], "persons", **truth)
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_corpus(corpus, directory)
+        data: str = os.path.join(directory, "data")
+        bashoutput: str = os.path.join(directory, "bashoutput")
+
+        families: dict[str, list[str]] = txt_to_chunks.discover_families(
+            sorted(txt_to_chunks.find_md_files(data)))
+        seconds, chunks = timed(lambda: sum(
+            len(written) for _, written in txt_to_chunks.chunk_families(
+                families, os.path.join(directory, "chunks"), processes=1, output_format="jsonl")))
+        results["chunking"] = stage(seconds, chunks, "chunks", megabytes=round(input_bytes(data) / 2**20, 2),
+                                    megabytes_per_second=round(input_bytes(data) / 2**20 / seconds, 2))
+
+        for name, graph_class in [("ingest", FamilyGraph), ("ingest_compact", CompactFamilyGraph)]:
+            graph = graph_class()
+            seconds, _ = timed(lambda: graph.load_extractions(bashoutput, workers=1))
+            results[name] = stage(seconds, truth["mentions"], "mentions", nodes=graph.G.number_of_nodes())
+
+        graph = FamilyGraph()
+        graph.load_extractions(bashoutput, workers=1)
+        seconds, merges = timed(lambda: resolve_entities(graph))
+        results["resolve"] = stage(seconds, graph.G.number_of_nodes() + len(merges), "persons",
+                                   merges=len(merges), marriages=truth["marriages"],
+                                   nodes=graph.G.number_of_nodes(), distinct_persons=truth["persons"])
+
+        path: str = os.path.join(directory, "graph.gexf")
+        seconds, _ = timed(lambda: write_gexf(graph, path))
+        results["export_gexf"] = stage(seconds, graph.G.number_of_nodes(), "persons")
+        seconds, _ = timed(lambda: FamilyGraph.load(path))
+        results["load_gexf"] = stage(seconds, graph.G.number_of_nodes(), "persons")
+
+    seconds, kinship = timed(lambda: KinshipIndex(graph))
+    results["kinship_index"] = stage(seconds, len(kinship.nodes), "persons")
+    rng: random.Random = random.Random(seed)
+    # small corpora have fewer persons than queries
+    queries: int = min(QUERIES, len(kinship.nodes))
+    pairs: list[tuple] = [tuple(rng.sample(kinship.nodes, 2)) for _ in range(queries)] if queries >= 2 else []
+    seconds, _ = timed(lambda: [kinship.relationship(a, b) for a, b in pairs])
+    results["kinship_queries"] = stage(seconds, len(pairs), "queries")
+    seconds, _ = timed(kinship.node_weights)
+    results["node_weights"] = stage(seconds, len(kinship.nodes), "persons")
+
+    seconds, search = timed(lambda: PersonSearchIndex(graph))
+    results["search_index"] = stage(seconds, len(search.entries), "persons")
+    persons: list[dict] = [graph.G.nodes[person_id] for person_id in rng.sample(kinship.nodes, queries)]
+    seconds, _ = timed(lambda: [
+        search.search(family_name=(person["family_name"] or "")[:4], given_name=person["given_name"],
+                      profession=person.get("profession"), birth_year=(1600, None), limit=20)
+        for person in persons
+    ])
+    results["search_queries"] = stage(seconds, queries, "queries")
+
+    seconds, columns = timed(lambda: GraphColumns(graph))
+    results["columns"] = stage(seconds, len(columns), "persons")
+    seconds, _ = timed(lambda: demographic_report(columns))
+    results["demographics"] = stage(seconds, len(columns), "persons")
+    return results
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """print the seconds of every stage and size of two result files"""
+    with open(before_path, encoding="utf-8") as f:
+        before: dict = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after: dict = json.load(f)
+    print(f"{'':24} {before['commit'] or before_path:>11} {after['commit'] or after_path:>11}")
+    for size, stages in after["results"].items():
+        for name, result in stages.items():
+            old: dict | None = before["results"].get(size, {}).get(name)
+            old_seconds: str = f"{old['seconds']:10.3f} s" if old else f"{'-':>12}"
+            ratio: str = f"{result['seconds'] / old['seconds']:8.2f}x" if old and old["seconds"] else ""
+            print(f"{size:>7} {name:16}{old_seconds}{result['seconds']:10.3f} s{ratio}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark all stages on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of distinct persons of the corpora")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the corpus generator")
+    parser.add_argument("--output", "-o", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    # footnote warnings of the chunking
+    logging.disable(logging.WARNING)
+    report: dict = {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {},
+    }
+    for size in args.sizes:
+        report["results"][str(size)] = results = run_size(size, args.seed)
+        for name, result in results.items():
+            print(f"{size:>7} {name:16}{result['seconds']:10.3f} s")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Builds the family graph from a directory of extraction JSONs (as written by
+chunk_to_graph.py) and saves it as GEXF for Gephi (Lite), GraphML or Parquet
+(see graph_io.py; the format follows the extension of the output).
+
+    python build_graph.py -i data/bashoutput -o data/graph_data/graph_parsed.gexf
+"""
+
+import sys
+import argparse
+from contextlib import nullcontext
+
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from metrics import Metrics, format_summary
+from provenance import ProvenanceIndex
+
+
+def summarize(reports):
+    """
+    Returns the totals of the per-file reports of FamilyGraph.load_extractions.
+    """
+    totals = {"files": len(reports)}
+    for key in ["created", "merged", "dropped_persons", "relations", "dropped_relations"]:
+        totals[key] = sum(report[key] for report in reports)
+    totals["files_with_errors"] = sum(1 for report in reports if report["errors"])
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the family graph from extraction JSONs.')
+    parser.add_argument('--input', '-i', required=True, help='Directory containing the extraction JSONs.')
+    parser.add_argument('--output', '-o', required=True, help='File to save the graph to (.gexf, .graphml or .parquet).')
+    parser.add_argument('--workers', type=int, default=None, help='Processes for parsing (default: number of CPUs).')
+    parser.add_argument('--compact', action='store_true', help='Use the compact in-memory backend (for the whole corpus).')
+    parser.add_argument('--layout', choices=['generation', 'birth_year'], help='Save GEXF with a layered layout (see graph_layout.py).')
+    parser.add_argument('--metrics', default=None, help='JSON lines file for timings and merge statistics (see metrics.py).')
+    parser.add_argument('--profile', choices=['graph', 'export'], help='Dump cProfile stats of a stage next to --metrics (use with --workers 1).')
+    parser.add_argument('--provenance', default=None, help='SQLite index to record the extraction and person_number of every node in (see provenance.py).')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print the validation errors of every file.')
+    args = parser.parse_args()
+
+    metrics = Metrics(args.metrics, profile=args.profile) if args.metrics else None
+    stage = metrics.stage if metrics is not None else lambda name: nullcontext()
+
+    graph = CompactFamilyGraph() if args.compact else FamilyGraph()
+    if args.provenance:
+        graph.provenance = ProvenanceIndex(args.provenance)
+        graph.provenance.clear_mentions()
+    with stage("graph"):
+        reports = graph.load_extractions(args.input, workers=args.workers)
+    if graph.provenance is not None:
+        graph.provenance.close()
+
+    if args.verbose:
+        for report in reports:
+            for error in report["errors"]:
+                print(f"{report['file']}: {error}")
+    for key, value in summarize(reports).items():
+        print(f"{key}: {value}")
+
+    positions = None
+    with stage("export"):
+        if args.layout:
+            from graph_layout import layered_layout
+            positions = layered_layout(graph, args.layout)
+        graph.save(args.output, positions=positions)
+    print(f"Graph with {graph.G.number_of_nodes()} persons saved to {args.output}")
+    if metrics is not None:
+        metrics.record("graph", nodes=graph.G.number_of_nodes(), edges=graph.G.number_of_edges(),
+                       **summarize(reports))
+        print(format_summary(metrics.summary()))
+        metrics.close()
+    sys.exit(0)
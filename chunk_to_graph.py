@@ -2,36 +2,95 @@
 # coding: utf-8
 
 """
-TODO: NEW description
+Extracts persons and relations from person chunks (see txt_to_chunks.py) using
+the OpenAI chat completion API and writes the returned JSON to disk.
+
+Two modes are supported:
+
+* single file:  chunk_to_graph.py -i chunk.txt -o chunk.json -p prompt.txt
+* directory:    chunk_to_graph.py --input-dir chunks/ --output-dir jsons/ -p prompt.txt
+* shard:        chunk_to_graph.py --input-shard chunks/chunks.jsonl --output-dir jsons/ -p prompt.txt
+
+In directory and shard mode the prompt and the client are set up once and the chunks
+are sent concurrently (see --workers). Rate limited or failed requests are
+retried with exponential backoff and every result is written as soon as its
+request finishes, so an interrupted run can simply be restarted.
+
+Short chunks spend most tokens on the repeated prompt; with --token-budget
+consecutive chunks of a family are packed into one request and the answer is
+split back into one JSON per chunk (see extract_chunks).
+
+With --graph the answers are streamed, validated element by element while
+they arrive (bad answers are aborted and retried early) and merged straight
+into a family graph (see extract_to_graph).
+
+With --tiers every chunk goes to a cheap model first and only answers that
+fail the validation are sent to the next, stronger model (see model_router.py).
 """
 
+import os
 import sys
+import json
+import time
+import random
 import argparse
-from openai import OpenAI
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from chunk_writer import iter_shard
+from extraction_cache import ExtractionCache
+from extraction_schema import clean_extraction
+from extraction_stream import ExtractionStreamParser, GraphIngest, InvalidStream
+from metrics import Metrics, count_persons, format_summary
+from model_router import DEFAULT_MIN_CONFIDENCE, ModelRouter, parse_tiers, validate_answer
 
 # documentation: https://pypi.org/project/openai/
 #                https://github.com/openai/openai-cookbook/
 
-# Load the API key
-try:
-    with open('api_key.txt',  encoding="utf8") as file:
-        client = OpenAI(api_key=file.read().strip())
-except FileNotFoundError:
-    print("Error: 'api_key.txt' not found. Please ensure it's in the \
+DEFAULT_MODEL = "gpt-4o"
+
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """
+    Returns the errors worth retrying: rate limits, timeouts, dropped
+    connections and 5xx. openai is only imported once it is needed, as it
+    takes about a second.
+    """
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+# Function to create the OpenAI client from the API key file
+def load_client(api_key_file="api_key.txt", base_url=None):
+    """
+    Creates an OpenAI client.
+
+    Parameters:
+        api_key_file: file containing the API key
+        base_url: optional base url of the completion endpoint, e.g. a local
+            stand-in like http://127.0.0.1:8000/v1
+
+    Returns:
+        client: OpenAI client. Retries are handled by chunk2triple, so the
+            client's own retries are disabled.
+    """
+    try:
+        with open(api_key_file, encoding="utf8") as file:
+            api_key = file.read().strip()
+    except FileNotFoundError:
+        print(f"Error: '{api_key_file}' not found. Please ensure it's in the \
     current directory.")
-    sys.exit(1)
-
-## Load the Prompt that is in a separate file for ease of use.
-#def promptread():
-#    try:
-#        with open('prompt.txt', encoding="utf8") as file:
-#            promptstring = file.read().strip()
-#    except FileNotFoundError:
-#        print("Error: 'prompt.txt' not found. Please ensure it's in the current directory.")
-#        sys.exit(1)
-#    return promptstring
-#
-# TODO prompt = promptread()
+        sys.exit(1)
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
 
 # Function to read the chunk from a specified file
 def promptread(prompt_file):
@@ -43,37 +102,189 @@ def promptread(prompt_file):
         sys.exit(1)
     return promptstring
 
-# Function to read the chunk from a specified file
+# Function to read the chunk from a specified file; a missing file raises
+# FileNotFoundError, so that only its own job fails
 def chunkread(input_file):
-    try:
-        with open(input_file, encoding="utf8") as file:
-            chunkstring = file.read().strip()
-    except FileNotFoundError:
-        print(f"Error: '{input_file}' not found. Please ensure it's in the correct directory.")
-        sys.exit(1)
-    return chunkstring
+    with open(input_file, encoding="utf8") as file:
+        return file.read().strip()
+
+
+def retry_delay(error, attempt, backoff=1.0, max_delay=60.0):
+    """
+    Returns the number of seconds to wait before retrying after error.
+    A Retry-After header sent by the server wins, otherwise exponential
+    backoff with jitter is used.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), max_delay)
+            except ValueError:
+                pass
+    delay = backoff * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), max_delay)
+
 
-def chunk2triple(chunk):
+def chunk2triple(chunk, prompt, client, model=DEFAULT_MODEL, max_retries=5, backoff=1.0,
+                 cache=None, metrics=None):
     """
-    TODO
+    Sends a chunk together with the prompt to the completion endpoint and
+    returns the answer.
+
+    Parameters:
+        chunk: text of one person chunk
+        prompt: system prompt (see promts/)
+        client: OpenAI client (see load_client)
+        model: model name
+        max_retries: number of retries on rate limits and transient errors
+        backoff: base delay in seconds for the exponential backoff
+        cache: optional ExtractionCache (see extraction_cache.py). On a hit
+            the stored answer is returned without a request.
+        metrics: optional Metrics (see metrics.py) recording latency, token
+            usage, retries and cache hits
+
+    Returns:
+        triples: the stripped content of the answer
     """
-    response = client.chat.completions.create(
-            #model="gpt-3.5-turbo",
-            model="gpt-4o",
+    if cache is not None:
+        triples = cache.get(model, prompt, chunk)
+        if triples is not None:
+            if metrics is not None:
+                metrics.record("cache_hit", model=model, chunk_chars=len(chunk))
+            return triples
 
-    messages=[
-        {"role": "system", "content":
-        # Read the prompt. It is saved in a file and read in earlier.
-        prompt 
-        },
-        {"role": "user", "content": chunk}
-    ],
-    temperature=0)
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        try:
+            response = client.chat.completions.create(
+                #model="gpt-3.5-turbo",
+                model=model,
+                messages=[
+                    {"role": "system", "content":
+                    # Read the prompt. It is saved in a file and read in earlier.
+                    prompt
+                    },
+                    {"role": "user", "content": chunk}
+                ],
+                temperature=0)
+            break
+        except retryable_errors() as e:
+            if attempt >= max_retries:
+                if metrics is not None:
+                    metrics.record("failed", model=model, retries=attempt,
+                                   error=type(e).__name__, chunk_chars=len(chunk))
+                raise
+            time.sleep(retry_delay(e, attempt, backoff))
+            attempt += 1
     triples = (response.choices[0].message.content
               .strip())
     # triples is the data in triple format (RDF).
+    if metrics is not None:
+        metrics.request(model, time.perf_counter() - start, response.usage, attempt,
+                        persons=count_persons(triples), chunk_chars=len(chunk))
+    if cache is not None:
+        cache.put(model, prompt, chunk, triples)
     return triples
 
+def stream_chunk2triple(chunk, prompt, client, model=DEFAULT_MODEL, max_retries=5,
+                        backoff=1.0, cache=None, metrics=None, on_element=None, on_abort=None):
+    """
+    Like chunk2triple, but streams the answer and parses it while it arrives
+    (see extraction_stream.py). An answer that turns out malformed or holds
+    an invalid person or relation is aborted at once and requested again.
+
+    Parameters:
+        on_element: called with ("person", person) or ("relation", relation)
+            for every validated element as soon as it is complete
+        on_abort: called before a retry; the elements passed to on_element
+            since the last call are void
+        (the other parameters as for chunk2triple)
+
+    Returns:
+        (triples, parser): the answer and its ExtractionStreamParser (with the
+        validation errors of the answer)
+    """
+    def parse(pieces, strict=True):
+        parser = ExtractionStreamParser(strict)
+        for piece in pieces:
+            for kind, element in parser.feed(piece):
+                if on_element is not None:
+                    on_element(kind, element)
+        for kind, element in parser.close():
+            if on_element is not None:
+                on_element(kind, element)
+        return parser
+
+    if cache is not None:
+        triples = cache.get(model, prompt, chunk)
+        if triples is not None:
+            try:
+                parser = parse([triples])
+            except InvalidStream:
+                if on_abort is not None:
+                    on_abort()
+            else:
+                if metrics is not None:
+                    metrics.record("cache_hit", model=model, chunk_chars=len(chunk))
+                return triples, parser
+
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        pieces = []
+        usage = None
+
+        def read(stream):
+            nonlocal usage
+            for event in stream:
+                if event.usage is not None:
+                    usage = event.usage
+                if event.choices and event.choices[0].delta.content:
+                    pieces.append(event.choices[0].delta.content)
+                    yield pieces[-1]
+
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": chunk}
+                ],
+                temperature=0,
+                stream=True,
+                stream_options={"include_usage": True})
+            try:
+                # the last attempt drops invalid elements instead of failing
+                parser = parse(read(stream), strict=attempt < max_retries)
+            finally:
+                stream.close()
+            break
+        except (InvalidStream, *retryable_errors()) as e:
+            if on_abort is not None:
+                on_abort()
+            if attempt >= max_retries:
+                if metrics is not None:
+                    metrics.record("failed", model=model, retries=attempt,
+                                   error=type(e).__name__, chunk_chars=len(chunk))
+                raise
+            if isinstance(e, InvalidStream):
+                if metrics is not None:
+                    metrics.record("stream_aborted", model=model, error=str(e),
+                                   chars=sum(map(len, pieces)))
+            else:
+                time.sleep(retry_delay(e, attempt, backoff))
+            attempt += 1
+    triples = "".join(pieces).strip()
+    if metrics is not None:
+        metrics.request(model, time.perf_counter() - start, usage, attempt,
+                        persons=len(parser.person_numbers), chunk_chars=len(chunk))
+    if cache is not None:
+        cache.put(model, prompt, chunk, triples)
+    return triples, parser
+
 # Function to save the triples to a specified file
 def save_triples(output_file, triples):
     try:
@@ -84,34 +295,515 @@ def save_triples(output_file, triples):
         sys.exit(1)
 
 
+def write_atomic(output_file, text):
+    """
+    Writes text to output_file through a temporary file, so that an
+    interrupted run never leaves a half written output behind.
+    """
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf8") as file:
+        file.write(text)
+    os.replace(tmp_file, output_file)
+
+
+# Appended to the system prompt of packed requests (see pack_jobs).
+PACKED_INSTRUCTIONS = """
+
+The input may contain several chunks, each enclosed in <chunk id="..."> and </chunk>. Parse every chunk on its own, numbering its persons from 1, and answer with one JSON object that maps the id of every chunk to the JSON structure described above for that chunk:
+
+{"1": {"persons": [...], "relations": [...]}, "2": {"persons": [...], "relations": [...]}}"""
+
+# Default budget of the chunk texts of one packed request in tokens. The
+# answer is several times longer than the chunk texts.
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_MAX_PACK = 20
+
+
+def estimate_tokens(text):
+    """
+    Returns a rough number of tokens of a text (about four characters per token).
+    """
+    return len(text) // 4 + 1
+
+
+def family_of_chunk(name):
+    """
+    Returns the family name a chunk name or file starts with (Billeter_1,
+    .../Billeter_2_.txt).
+    """
+    return os.path.basename(name).split("_")[0]
+
+
+def pack_jobs(jobs, token_budget=DEFAULT_TOKEN_BUDGET, max_pack=DEFAULT_MAX_PACK):
+    """
+    Groups consecutive jobs of the same family into packs of at most max_pack
+    chunks whose texts together stay within token_budget (a longer chunk is
+    a pack of its own). Every text is loaded once, to measure it, and
+    carried in the pack.
+
+    Yields:
+        lists of (chunk name, output file, text)
+    """
+    pack = []
+    tokens = 0
+    for name, output_file, load in jobs:
+        text = load()
+        text_tokens = estimate_tokens(text)
+        if pack and (
+            family_of_chunk(name) != family_of_chunk(pack[0][0])
+            or tokens + text_tokens > token_budget
+            or len(pack) >= max_pack
+        ):
+            yield pack
+            pack = []
+            tokens = 0
+        pack.append((name, output_file, text))
+        tokens += text_tokens
+    if pack:
+        yield pack
+
+
+def pack_text(chunks):
+    """
+    Returns the user message of a packed request: the chunks tagged with the
+    ids 1, 2, ...
+    """
+    return "\n\n".join(
+        f'<chunk id="{i}">\n{chunk}\n</chunk>' for i, chunk in enumerate(chunks, 1)
+    )
+
+
+def split_packed(answer, count):
+    """
+    Splits the answer to a packed request of count chunks.
+
+    Returns:
+        list of the extraction JSONs of the chunks, in order
+
+    Raises:
+        ValueError if the answer is no JSON object with an extraction without
+        validation errors (see extraction_schema.py) for every chunk id
+    """
+    try:
+        data = json.loads(answer)
+    except ValueError:
+        raise ValueError("packed answer is not JSON")
+    ids = [str(i) for i in range(1, count + 1)]
+    if not isinstance(data, dict) or sorted(data) != sorted(ids):
+        raise ValueError(f"packed answer does not have the chunk ids 1 to {count}")
+    extractions = []
+    for chunk_id in ids:
+        _, _, errors = clean_extraction(data[chunk_id])
+        if errors:
+            raise ValueError(f"chunk {chunk_id} of packed answer: {errors[0]}")
+        extractions.append(json.dumps(data[chunk_id], ensure_ascii=False, indent=4))
+    return extractions
+
+
+def validate_packed(answer, chunks):
+    """
+    Validates the answer to a packed request chunk by chunk (see
+    model_router.validate_answer).
+
+    Returns:
+        (errors, confidence): the errors of all chunks and the lowest confidence
+    """
+    try:
+        extractions = split_packed(answer, len(chunks))
+    except ValueError as e:
+        return [str(e)], 0.0
+    errors = []
+    confidence = 1.0
+    for extraction, chunk in zip(extractions, chunks):
+        chunk_errors, chunk_confidence = validate_answer(extraction, chunk)
+        errors.extend(chunk_errors)
+        confidence = min(confidence, chunk_confidence)
+    return errors, confidence
+
+
+def extract_chunks(jobs, prompt, client, model=DEFAULT_MODEL, workers=8,
+                   max_retries=5, backoff=1.0, cache=None, metrics=None,
+                   token_budget=None, max_pack=DEFAULT_MAX_PACK, graph=None, router=None):
+    """
+    Runs chunk2triple concurrently and writes each output as soon as its
+    request is finished.
+
+    Parameters:
+        jobs: list of (chunk name, output file, load) tuples, where load()
+            returns the chunk text
+        prompt: system prompt, read once for all chunks
+        client: OpenAI client shared by all workers
+        model: model name
+        workers: maximum number of requests in flight
+        max_retries: retries per chunk (see chunk2triple)
+        backoff: base delay of the exponential backoff in seconds
+        cache: optional ExtractionCache shared by all workers
+        metrics: optional Metrics shared by all workers
+        token_budget: if given, consecutive chunks of a family are packed
+            into one request up to this many tokens (see pack_jobs) and the
+            answer is split back into one output per chunk. The chunks of a
+            packed request that fails or whose answer fails validation are
+            sent again one by one.
+        max_pack: maximum number of chunks per packed request
+        graph: if given, the answers are streamed and merged into this
+            FamilyGraph right away (see extract_to_graph)
+        router: optional ModelRouter (see model_router.py) sending the
+            chunks to its tiers instead of to model
+
+    Returns:
+        report: dict with the lists "written" (output files) and "failed"
+            ((chunk name, error message) tuples)
+    """
+    if graph is not None:
+        if token_budget is not None:
+            raise ValueError("packed requests can not be streamed into a graph")
+        return extract_to_graph(jobs, prompt, client, graph, model=model, workers=workers,
+                                max_retries=max_retries, backoff=backoff, cache=cache,
+                                metrics=metrics, router=router)
+
+    report = {"written": [], "failed": []}
+
+    def fail(name, error):
+        print(f"Error: extraction of '{name}' failed. {error}")
+        report["failed"].append((name, str(error)))
+
+    def readable(jobs):
+        # a chunk that can not be read fails on its own instead of ending the packing
+        for name, output_file, load in jobs:
+            try:
+                text = load()
+            except OSError as e:
+                fail(name, e)
+                continue
+            yield name, output_file, partial(str, text)
+
+    def ask(text, system_prompt, validate=None):
+        if router is None:
+            return chunk2triple(text, system_prompt, client, model, max_retries=max_retries,
+                                backoff=backoff, cache=cache, metrics=metrics)
+        answer, _ = router.route(
+            text,
+            lambda tier: chunk2triple(text, system_prompt, tier.client or client, tier.model,
+                                      max_retries=max_retries, backoff=backoff, cache=cache,
+                                      metrics=metrics),
+            validate=validate, metrics=metrics)
+        return answer
+
+    def run(output_file, text):
+        triples = ask(text, prompt)
+        write_atomic(output_file, triples)
+        return output_file
+
+    def run_job(name, output_file, load):
+        return [(name, run(output_file, load()))]
+
+    def run_pack(pack):
+        """
+        Returns a list of (chunk name, output file or exception).
+        """
+        if len(pack) == 1:
+            name, output_file, text = pack[0]
+            return [(name, run(output_file, text))]
+        chunks = [text for _, _, text in pack]
+        try:
+            answer = ask(pack_text(chunks), prompt + PACKED_INSTRUCTIONS,
+                         validate=partial(validate_packed, chunks=chunks))
+            extractions = split_packed(answer, len(pack))
+        except Exception as e:
+            if metrics is not None:
+                metrics.record("pack_failed", chunks=len(pack), error=str(e))
+            results = []
+            for name, output_file, text in pack:
+                try:
+                    results.append((name, run(output_file, text)))
+                except Exception as e:
+                    results.append((name, e))
+            return results
+        for (_, output_file, _), triples in zip(pack, extractions):
+            write_atomic(output_file, triples)
+        return [(name, output_file) for name, output_file, _ in pack]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if token_budget is None:
+            futures = {executor.submit(run_job, *job): [job] for job in jobs}
+        else:
+            futures = {executor.submit(run_pack, pack): pack
+                       for pack in pack_jobs(readable(jobs), token_budget, max_pack)}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(name, e) for name, _, _ in futures[future]]
+            for name, result in results:
+                if isinstance(result, Exception):
+                    fail(name, result)
+                else:
+                    report["written"].append(result)
+
+    return report
+
+
+def extract_to_graph(jobs, prompt, client, graph, model=DEFAULT_MODEL, workers=8,
+                     max_retries=5, backoff=1.0, cache=None, metrics=None, router=None):
+    """
+    Streams the answers for the chunks concurrently (see stream_chunk2triple)
+    and merges them into graph as they complete (see
+    extraction_stream.GraphIngest), without reading them back from disk.
+
+    Parameters:
+        jobs: list of (chunk name, output file or None, load) tuples; the
+            answers are written to the output files that are given
+        graph: FamilyGraph (or subclass) to merge the extractions into
+        (the other parameters as for extract_chunks)
+
+    Returns:
+        report: dict with the lists "written" and "failed" (see
+            extract_chunks) and "graph", one report per merged chunk (see
+            FamilyGraph.load_extractions)
+    """
+    report = {"written": [], "failed": []}
+    ingest = GraphIngest(graph)
+
+    def run(name, output_file, load):
+        chunk = load()
+        parser = None
+
+        def request(model, client):
+            nonlocal parser
+            triples, parser = stream_chunk2triple(
+                chunk, prompt, client, model, max_retries=max_retries, backoff=backoff,
+                cache=cache, metrics=metrics,
+                on_element=partial(ingest.element, name), on_abort=partial(ingest.abort, name))
+            return triples
+
+        if router is None:
+            triples = request(model, client)
+        else:
+            # the elements of an escalated answer are dropped like those of an aborted stream
+            triples, _ = router.route(chunk, lambda tier: request(tier.model, tier.client or client),
+                                      on_escalate=partial(ingest.abort, name), metrics=metrics)
+        ingest.done(name, parser.errors, parser.dropped_persons, parser.dropped_relations)
+        if output_file is not None:
+            write_atomic(output_file, triples)
+        return output_file
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run, name, output_file, load): name
+            for name, output_file, load in jobs
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                output_file = future.result()
+            except Exception as e:
+                print(f"Error: extraction of '{name}' failed. {e}")
+                report["failed"].append((name, str(e)))
+                continue
+            if output_file is not None:
+                report["written"].append(output_file)
+
+    report["graph"] = ingest.close()
+    for merged in report["graph"]:
+        if "failed" in merged:
+            print(f"Error: merging '{merged['file']}' into the graph failed. {merged['failed']}")
+            report["failed"].append((merged["file"], merged["failed"]))
+    return report
+
+
+def extract_files(jobs, prompt, client, **kwargs):
+    """
+    Like extract_chunks, for a list of (chunk file, output file) jobs.
+    """
+    return extract_chunks(
+        [(input_file, output_file, partial(chunkread, input_file))
+         for input_file, output_file in jobs],
+        prompt, client, **kwargs)
+
+
+def extract_directory(input_dir, output_dir, prompt, client, model=DEFAULT_MODEL,
+                      workers=8, max_retries=5, backoff=1.0, overwrite=False, cache=None,
+                      metrics=None, **kwargs):
+    """
+    Runs chunk2triple concurrently for all *.txt chunks in input_dir and writes
+    one <chunk>.json per chunk into output_dir (see extract_files).
+
+    Parameters:
+        input_dir: directory containing the chunk files
+        output_dir: directory to write the extraction JSONs to
+        overwrite: if False, chunks with an existing output are skipped
+        (the other parameters, e.g. token_budget, are passed on to extract_files)
+
+    Returns:
+        report: dict with the lists "written", "skipped" and "failed"
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    skipped = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        input_file = os.path.join(input_dir, filename)
+        output_file = os.path.join(output_dir, filename[:-len(".txt")] + ".json")
+        if not overwrite and os.path.exists(output_file):
+            skipped.append(input_file)
+            continue
+        jobs.append((input_file, output_file))
+
+    report = extract_files(jobs, prompt, client, model=model, workers=workers,
+                           max_retries=max_retries, backoff=backoff, cache=cache,
+                           metrics=metrics, **kwargs)
+    report["skipped"] = skipped
+    return report
+
+
+def extract_shard(shard_file, output_dir, prompt, client, overwrite=False, **kwargs):
+    """
+    Runs chunk2triple concurrently for all chunks of a JSON lines shard written
+    by txt_to_chunks.py --format jsonl and writes one <chunk id>.json per chunk
+    into output_dir (see extract_chunks for the other parameters).
+
+    Returns:
+        report: dict with the lists "written", "skipped" and "failed"
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    skipped = []
+    for record in iter_shard(shard_file):
+        output_file = os.path.join(output_dir, record.chunk_id + ".json")
+        if not overwrite and os.path.exists(output_file):
+            skipped.append(record.chunk_id)
+            continue
+        jobs.append((record.chunk_id, output_file, partial(str, record.text)))
+
+    report = extract_chunks(jobs, prompt, client, **kwargs)
+    report["skipped"] = skipped
+    return report
+
+
 # Main function to handle CLI arguments
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate Turtle triples from a chunk of text using OpenAI API.')
-    
+
     # Input and output file arguments
-    parser.add_argument('--input', '-i', required=True, help='Input file containing the chunk.')
-    parser.add_argument('--output', '-o', required=True, help='Output file to save the triples.')
+    parser.add_argument('--input', '-i', help='Input file containing the chunk.')
+    parser.add_argument('--output', '-o', help='Output file to save the triples.')
     parser.add_argument('--prompt', '-p', required=True, help='File containing prompt.')
 
+    # Directory mode
+    parser.add_argument('--input-dir', help='Directory containing chunk files (*.txt).')
+    parser.add_argument('--input-shard', help='JSON lines shard of chunks (txt_to_chunks.py --format jsonl).')
+    parser.add_argument('--output-dir', help='Directory to save the JSON files to.')
+    parser.add_argument('--workers', type=int, default=8, help='Maximum number of concurrent requests.')
+    parser.add_argument('--overwrite', action='store_true', help='Extract chunks again even if their output exists.')
+    parser.add_argument('--token-budget', type=int, nargs='?', const=DEFAULT_TOKEN_BUDGET, default=None,
+                        help=f'Pack consecutive chunks of a family into one request up to this many tokens (default {DEFAULT_TOKEN_BUDGET}).')
+    parser.add_argument('--max-pack', type=int, default=DEFAULT_MAX_PACK, help='Maximum number of chunks per packed request.')
+
+    # Endpoint
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Model name.')
+    parser.add_argument('--tiers', nargs='+', default=None,
+                        help='Models to try in turn, the cheapest first (model or model@base_url); overrides --model.')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help='Answers with a lower confidence are sent to the next tier (see model_router.py).')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries on rate limits and transient errors.')
+    parser.add_argument('--api-key-file', default='api_key.txt', help='File containing the API key.')
+    parser.add_argument('--base-url', default=None, help='Base url of an alternative (e.g. local) endpoint.')
+
+    # Response cache
+    parser.add_argument('--cache', default=None, help='SQLite file caching responses (see extraction_cache.py).')
+    parser.add_argument('--cache-max-mb', type=int, default=1024, help='Size limit of the response cache in MB.')
+
+    # Streaming into a graph
+    parser.add_argument('--graph', default=None, help='Stream the answers straight into a family graph saved to this file (.gexf, .graphml or .parquet).')
+
+    # Instrumentation
+    parser.add_argument('--metrics', default=None, help='JSON lines file for timings and token usage (see metrics.py).')
+    parser.add_argument('--profile', action='store_true', help='Dump cProfile stats of the extraction next to --metrics.')
+
     # Parse the arguments
     args = parser.parse_args()
 
+    batch_input = args.input_dir or args.input_shard
+    if batch_input is None and (args.input is None or args.output is None):
+        parser.error('either --input and --output or --input-dir/--input-shard and --output-dir are required')
+    if batch_input is not None and args.output_dir is None:
+        parser.error('--input-dir and --input-shard require --output-dir')
+    if args.graph is not None and (batch_input is None or args.token_budget is not None):
+        parser.error('--graph requires --input-dir or --input-shard and can not be combined with --token-budget')
+
+    client = load_client(args.api_key_file, args.base_url)
+    router = None
+    if args.tiers is not None:
+        router = ModelRouter(parse_tiers(args.tiers, partial(load_client, args.api_key_file), args.min_confidence))
+
     # Read the prompt file.
 
     prompt = promptread(args.prompt)
 
-    # Read the input chunk.
-    chunk = chunkread(args.input)
+    cache = None
+    if args.cache is not None:
+        cache = ExtractionCache(args.cache, max_bytes=args.cache_max_mb * 1024 ** 2)
+
+    metrics = None
+    if args.metrics is not None:
+        metrics = Metrics(args.metrics, profile="extraction" if args.profile else None)
 
-    # Read the input chunk
-    #chunk = chunkread()
+    if batch_input is not None:
+        graph = None
+        if args.graph is not None:
+            from family_graph import FamilyGraph, extraction_sources
+            graph = FamilyGraph()
+        extract = extract_directory if args.input_dir is not None else extract_shard
+        with metrics.stage("extraction") if metrics is not None else nullcontext():
+            report = extract(batch_input, args.output_dir, prompt, client,
+                             model=args.model, workers=args.workers,
+                             max_retries=args.max_retries, overwrite=args.overwrite,
+                             cache=cache, metrics=metrics,
+                             token_budget=args.token_budget, max_pack=args.max_pack, graph=graph,
+                             router=router)
+        print(f"{len(report['written'])} written, {len(report['skipped'])} skipped, "
+              f"{len(report['failed'])} failed")
+        if router is not None:
+            for model, stats in router.stats.items():
+                print(f"{model}: " + ", ".join(f"{value} {key}" for key, value in stats.items()))
+        if graph is not None:
+            # the outputs of earlier runs that were skipped
+            written = set(report["written"])
+            graph.load_extractions(
+                [path for path in extraction_sources(args.output_dir) if path not in written])
+            graph.save(args.graph)
+            print(f"Graph with {graph.G.number_of_nodes()} persons saved to {args.graph}")
+        if metrics is not None:
+            print(format_summary(metrics.summary()))
+            metrics.close()
+        sys.exit(1 if report['failed'] else 0)
+
+    # Read the input chunk.
+    try:
+        chunk = chunkread(args.input)
+    except FileNotFoundError:
+        print(f"Error: '{args.input}' not found. Please ensure it's in the correct directory.")
+        sys.exit(1)
 
     # Generate triples using the chunk2triple function (assuming it's defined as in your script)
-    triples = chunk2triple(chunk)
+    if router is None:
+        triples = chunk2triple(chunk, prompt, client, args.model, max_retries=args.max_retries,
+                               cache=cache, metrics=metrics)
+    else:
+        triples, tier = router.route(
+            chunk,
+            lambda tier: chunk2triple(chunk, prompt, tier.client or client, tier.model,
+                                      max_retries=args.max_retries, cache=cache, metrics=metrics),
+            metrics=metrics)
+        print(f"Answered by {tier.model}")
+    if metrics is not None:
+        metrics.close()
 
     # Save the triples to the output file
     save_triples(args.output, triples)
 
     print(f"Triples successfully saved to {args.output}")
 
-
@@ -0,0 +1,109 @@
+"""
+Output of person chunks (see txt_to_chunks.py).
+
+Chunks are written either as one small text file per person (the format read
+by the bash loop and chunk_to_graph.py -i) or packed into a single JSON lines
+shard with one record per chunk:
+
+    {"chunk_id": "Billeter_1", "family": "Billeter", "source_file": ".../Billeter_01_md.txt",
+     "text": "1\\. Heinrich ...", "spans": [[".../Billeter_01_md.txt", 212, 1016, 9]]}
+
+chunk_to_graph.py --input-shard reads such a shard directly.
+"""
+
+import os
+import json
+from typing import Iterable, Iterator, NamedTuple
+
+# name of the shard written into the output directory
+SHARD_NAME: str = "chunks.jsonl"
+
+
+class ChunkRecord(NamedTuple):
+    """one person chunk"""
+
+    chunk_id: str
+    family: str
+    source_file: str
+    text: str
+    # (text file, start byte, end byte, first line) of the text the chunk was cut from
+    spans: tuple[tuple[str, int, int, int], ...] = ()
+
+
+class ChunkRegistry:
+    """
+    resolves chunk ids in memory: colliding names get underlines appended,
+    without a stat call per chunk and without retrying every underline count
+    for prefixes that collide often (like "1\\._")
+    """
+
+    def __init__(self) -> None:
+        self.used: set[str] = set()
+        # number of underlines to try next for a base name
+        self.next_count: dict[str, int] = {}
+
+    def resolve(self, base: str) -> str:
+        """return base, or base with underlines appended if base is taken"""
+        count: int = self.next_count.get(base, 0)
+        name: str = base + "_" * count
+        while name in self.used:
+            count += 1
+            name = base + "_" * count
+        self.used.add(name)
+        self.next_count[base] = count + 1
+        return name
+
+
+class ChunkWriter:
+    """
+    writes chunk records as text files ("files") or into a JSON lines shard ("jsonl")
+    """
+
+    def __init__(self, output_directory: str, output_format: str = "files") -> None:
+        if output_format not in ("files", "jsonl"):
+            raise ValueError(f"unknown chunk output format {output_format}")
+        self.output_directory: str = output_directory
+        self.output_format: str = output_format
+        os.makedirs(output_directory, exist_ok=True)
+        self._shard = None
+        if output_format == "jsonl":
+            self._shard = open(
+                os.path.join(output_directory, SHARD_NAME), "w", encoding="utf-8"
+            )
+
+    def write(self, records: Iterable[ChunkRecord]) -> list[str]:
+        """
+        write the records
+
+        returns the paths of the written files, or the chunk ids for a shard
+        """
+        written: list[str] = []
+        for record in records:
+            if self._shard is not None:
+                self._shard.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+                written.append(record.chunk_id)
+            else:
+                path: str = os.path.join(self.output_directory, record.chunk_id + ".txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(record.text)
+                written.append(path)
+        return written
+
+    def close(self) -> None:
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_shard(path: str) -> Iterator[ChunkRecord]:
+    """read the chunk records of a JSON lines shard"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield ChunkRecord(**json.loads(line))
@@ -0,0 +1,437 @@
+"""
+Compact in-memory backend of FamilyGraph for loading the whole corpus (and
+several extraction runs side by side).
+
+CompactFamilyGraph behaves like FamilyGraph (same duplicate detection, same
+load_extractions), but stores the persons in a CompactDiGraph instead of a
+networkx DiGraph:
+
+* persons are dense integer ids 0, 1, 2, ...; their UUIDs are only kept as
+  16 bytes each in a side table (see person_uuid)
+* the person attributes are columns: arrays of ids into a pool of interned
+  strings (names, professions and origins repeat across persons) and arrays
+  of years
+* the relations are arrays of successors and predecessors per person (a
+  plain int for persons with a single one), with the relation type packed
+  into each entry
+
+to_networkx() exports the graph with UUID nodes and the same attributes as
+FamilyGraph, for visualize; save (graph_io.py) works on the columns directly.
+
+    graph = CompactFamilyGraph()
+    graph.load_extractions("data/bashoutput")
+    graph.save("graph.gexf")
+"""
+
+import uuid
+from array import array
+
+import networkx as nx
+
+from extraction_schema import RELATION_TYPES, STRING_PERSON_FIELDS, YEAR_PERSON_FIELDS
+from family_graph import FamilyGraph, new_person_id
+
+# attributes stored as integer columns (missing values are MISSING_INT)
+INT_PERSON_FIELDS = YEAR_PERSON_FIELDS + ("person_number",)
+MISSING_INT = -2**31
+
+# the relation type is stored in the two lowest bits of every adjacency entry
+RELATION_BITS = 2
+RELATION_MASK = (1 << RELATION_BITS) - 1
+
+
+def adjacency_entries(entries):
+    """
+    Returns the entries of one person in CompactDiGraph.succ or .pred as sequence.
+    """
+    if entries is None:
+        return ()
+    if isinstance(entries, int):
+        return (entries,)
+    return entries
+
+
+class StringPool:
+    def __init__(self):
+        """
+        Interned strings: every distinct string is stored once and referred
+        to by its id. Id 0 stands for None.
+        """
+        self.strings = [None]
+        self.ids = {}
+
+    def id(self, value):
+        """
+        Returns the id of value, adding it to the pool if necessary.
+        """
+        if value is None:
+            return 0
+        string_id = self.ids.get(value)
+        if string_id is None:
+            if not isinstance(value, str):
+                raise Exception(f"Expected a string, got {value!r}")
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self.ids[value] = string_id
+        return string_id
+
+    def __len__(self):
+        return len(self.strings) - 1
+
+
+class PersonView:
+    def __init__(self, graph, node):
+        """
+        Mutable mapping view of the attributes of one person of a CompactDiGraph,
+        like graph.nodes[node] of networkx.
+        """
+        self.graph = graph
+        self.node = node
+
+    def __getitem__(self, key):
+        return self.graph.get_attribute(self.node, key)
+
+    def __setitem__(self, key, value):
+        self.graph.set_attribute(self.node, key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(STRING_PERSON_FIELDS + INT_PERSON_FIELDS) + list(
+            self.graph.extra.get(self.node, {})
+        )
+
+    def items(self):
+        """
+        Returns a list (not a view), so attributes can be set while iterating.
+        """
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class NodeView:
+    def __init__(self, graph):
+        """
+        graph.nodes of a CompactDiGraph: nodes[i] returns a PersonView,
+        nodes(data=key) yields (node, value) pairs like networkx.
+        """
+        self.graph = graph
+
+    def __getitem__(self, node):
+        if node not in self.graph:
+            raise KeyError(node)
+        return PersonView(self.graph, node)
+
+    def __call__(self, data=False):
+        nodes = self.graph.node_ids()
+        if data is False:
+            return nodes
+        if data is True:
+            return ((node, dict(PersonView(self.graph, node).items())) for node in nodes)
+        return ((node, self.graph.get_attribute(node, data)) for node in nodes)
+
+    def __iter__(self):
+        return self.graph.node_ids()
+
+    def __len__(self):
+        return len(self.graph)
+
+    def __contains__(self, node):
+        return node in self.graph
+
+
+class EdgeView:
+    def __init__(self, graph):
+        """
+        graph.edges of a CompactDiGraph: iterating yields (from, to) pairs,
+        edges(data=True) (from, to, {"relation_type": ...}) triples.
+        """
+        self.graph = graph
+
+    def __call__(self, data=False):
+        for node_from, node_to, relation_type in self.graph.iter_edges():
+            if data:
+                yield node_from, node_to, {"relation_type": relation_type}
+            else:
+                yield node_from, node_to
+
+    def __iter__(self):
+        return self()
+
+    def __len__(self):
+        return self.graph.number_of_edges()
+
+
+class CompactDiGraph:
+    def __init__(self):
+        """
+        Column store of persons with integer ids and array adjacency, offering
+        the part of the networkx DiGraph interface FamilyGraph uses.
+        """
+        self.pool = StringPool()
+        self.string_columns = {key: array("I") for key in STRING_PERSON_FIELDS}
+        self.int_columns = {key: array("i") for key in INT_PERSON_FIELDS}
+        # UUID of person i: uuids[16 * i: 16 * i + 16]
+        self.uuids = bytearray()
+        # attributes other than the columns: node -> {key: value}
+        self.extra = {}
+        # node -> (neighbour << RELATION_BITS | relation type index): None if
+        # the person has no relations, the entry itself if it has one, else an array
+        self.succ = []
+        self.pred = []
+        self.edge_count = 0
+        # 1 for persons removed by remove_node (their ids are not reused)
+        self.removed = bytearray()
+        self.removed_count = 0
+        self.nodes = NodeView(self)
+        self.edges = EdgeView(self)
+
+    def __len__(self):
+        return len(self.succ) - self.removed_count
+
+    def __contains__(self, node):
+        return isinstance(node, int) and 0 <= node < len(self.succ) and not self.removed[node]
+
+    def node_ids(self):
+        """
+        Yields the ids of all (not removed) persons.
+        """
+        if not self.removed_count:
+            return iter(range(len(self.succ)))
+        return (node for node in range(len(self.succ)) if not self.removed[node])
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        return self.edge_count
+
+    def add_person(self, person_attributes, person_uuid=None):
+        """
+        Adds a person and returns its integer id. A new UUID is drawn unless
+        person_uuid is given.
+        """
+        node = len(self.succ)
+        for key, column in self.string_columns.items():
+            column.append(self.pool.id(person_attributes.get(key)))
+        for key, column in self.int_columns.items():
+            column.append(self._int_value(key, person_attributes.get(key)))
+        extra = {
+            key: value for key, value in person_attributes.items()
+            if key not in self.string_columns and key not in self.int_columns
+        }
+        if extra:
+            self.extra[node] = extra
+        self.uuids += (person_uuid or new_person_id()).bytes
+        self.succ.append(None)
+        self.pred.append(None)
+        self.removed.append(0)
+        return node
+
+    def _int_value(self, key, value):
+        if value is None:
+            return MISSING_INT
+        if not isinstance(value, int) or isinstance(value, bool) or value == MISSING_INT:
+            raise Exception(f"{key} has to be an int or None, got {value!r}")
+        return value
+
+    def get_attribute(self, node, key):
+        if key in self.string_columns:
+            return self.pool.strings[self.string_columns[key][node]]
+        if key in self.int_columns:
+            value = self.int_columns[key][node]
+            return None if value == MISSING_INT else value
+        return self.extra.get(node, {})[key]
+
+    def set_attribute(self, node, key, value):
+        if key in self.string_columns:
+            self.string_columns[key][node] = self.pool.id(value)
+        elif key in self.int_columns:
+            self.int_columns[key][node] = self._int_value(key, value)
+        else:
+            self.extra.setdefault(node, {})[key] = value
+
+    def person_uuid(self, node):
+        """
+        Returns the UUID of a person (its node id in to_networkx).
+        """
+        return uuid.UUID(bytes=bytes(self.uuids[16 * node: 16 * node + 16]))
+
+    def add_edge(self, node_from, node_to, relation_type):
+        """
+        Adds the edge node_from -> node_to; like networkx an already existing
+        edge between the two persons gets the new relation_type.
+        """
+        type_index = RELATION_TYPES.index(relation_type)
+        if self._replace_entry(self.succ, node_from, node_to, type_index):
+            self._replace_entry(self.pred, node_to, node_from, type_index)
+            return
+        for adjacency, node, neighbour in [
+            (self.succ, node_from, node_to), (self.pred, node_to, node_from)
+        ]:
+            entry = neighbour << RELATION_BITS | type_index
+            entries = adjacency[node]
+            if entries is None:
+                # most persons have a single relation in each direction
+                adjacency[node] = entry
+            elif isinstance(entries, int):
+                adjacency[node] = array("Q", [entries, entry])
+            else:
+                entries.append(entry)
+        self.edge_count += 1
+
+    def _replace_entry(self, adjacency, node, neighbour, type_index):
+        entries = adjacency[node]
+        if isinstance(entries, int):
+            if entries >> RELATION_BITS != neighbour:
+                return False
+            adjacency[node] = neighbour << RELATION_BITS | type_index
+            return True
+        for i, entry in enumerate(entries or ()):
+            if entry >> RELATION_BITS == neighbour:
+                entries[i] = neighbour << RELATION_BITS | type_index
+                return True
+        return False
+
+    def _remove_entry(self, adjacency, node, neighbour):
+        """
+        Removes the entry of neighbour from the entries of node; returns False
+        if there is none.
+        """
+        entries = adjacency_entries(adjacency[node])
+        remaining = [entry for entry in entries if entry >> RELATION_BITS != neighbour]
+        if len(remaining) == len(entries):
+            return False
+        if not remaining:
+            adjacency[node] = None
+        elif len(remaining) == 1:
+            adjacency[node] = remaining[0]
+        else:
+            adjacency[node] = array("Q", remaining)
+        return True
+
+    def remove_node(self, node):
+        """
+        Removes a person and its relations; its id is not reused.
+        """
+        for entry in adjacency_entries(self.succ[node]):
+            self._remove_entry(self.pred, entry >> RELATION_BITS, node)
+            self.edge_count -= 1
+        for entry in adjacency_entries(self.pred[node]):
+            self._remove_entry(self.succ, entry >> RELATION_BITS, node)
+            self.edge_count -= 1
+        self.succ[node] = None
+        self.pred[node] = None
+        self.extra.pop(node, None)
+        self.removed[node] = 1
+        self.removed_count += 1
+
+    def remove_edge(self, node_from, node_to):
+        """
+        Removes the edge node_from -> node_to; like networkx a missing edge
+        raises NetworkXError.
+        """
+        if not self._remove_entry(self.succ, node_from, node_to):
+            raise nx.NetworkXError(f"The edge {node_from}-{node_to} is not in the graph.")
+        self._remove_entry(self.pred, node_to, node_from)
+        self.edge_count -= 1
+
+    def degree(self, node):
+        return len(adjacency_entries(self.succ[node])) + len(adjacency_entries(self.pred[node]))
+
+    def has_edge(self, node_from, node_to):
+        return node_to in self.successors(node_from)
+
+    def out_edges(self, node, data=False):
+        """
+        Yields (node, to) pairs, or (node, to, relation_type) if data is "relation_type".
+        """
+        for entry in adjacency_entries(self.succ[node]):
+            if data:
+                yield node, entry >> RELATION_BITS, RELATION_TYPES[entry & RELATION_MASK]
+            else:
+                yield node, entry >> RELATION_BITS
+
+    def in_edges(self, node, data=False):
+        """
+        Yields (from, node) pairs, or (from, node, relation_type) if data is "relation_type".
+        """
+        for entry in adjacency_entries(self.pred[node]):
+            if data:
+                yield entry >> RELATION_BITS, node, RELATION_TYPES[entry & RELATION_MASK]
+            else:
+                yield entry >> RELATION_BITS, node
+
+    def add_edges_from(self, edges):
+        """
+        Adds (from, to, {"relation_type": ...}) triples.
+        """
+        for node_from, node_to, data in edges:
+            self.add_edge(node_from, node_to, data["relation_type"])
+
+    def successors(self, node):
+        return (entry >> RELATION_BITS for entry in adjacency_entries(self.succ[node]))
+
+    def predecessors(self, node):
+        return (entry >> RELATION_BITS for entry in adjacency_entries(self.pred[node]))
+
+    def iter_edges(self):
+        """
+        Yields (from, to, relation_type) for all edges.
+        """
+        for node_from, entries in enumerate(self.succ):
+            for entry in adjacency_entries(entries):
+                yield node_from, entry >> RELATION_BITS, RELATION_TYPES[entry & RELATION_MASK]
+
+
+class CompactFamilyGraph(FamilyGraph):
+    def __init__(self):
+        """
+        FamilyGraph storing its persons in a CompactDiGraph (see module docstring).
+        Person ids returned by add_person are integers.
+        """
+        super().__init__()
+        self.G = CompactDiGraph()
+
+    def _new_person(self, person_attributes):
+        """
+        Adds a new person and returns its integer id.
+        """
+        return self.G.add_person(person_attributes)
+
+    def _restore_person(self, person_uuid, person_attributes):
+        """
+        Adds a person with a given UUID and returns its integer id.
+        """
+        return self.G.add_person(person_attributes, person_uuid)
+
+    def person_uuid(self, person_id):
+        """
+        Returns the UUID of the person with the integer id person_id.
+        """
+        return self.G.person_uuid(person_id)
+
+    def to_networkx(self):
+        """
+        Returns the graph as networkx DiGraph with UUID nodes and the same
+        attributes as FamilyGraph.
+        """
+        G = nx.DiGraph()
+        uuids = {node: self.G.person_uuid(node) for node in self.G.node_ids()}
+        G.add_nodes_from(
+            (uuids[node], attributes) for node, attributes in self.G.nodes(data=True)
+        )
+        G.add_edges_from(
+            (uuids[node_from], uuids[node_to], {"relation_type": relation_type})
+            for node_from, node_to, relation_type in self.G.iter_edges()
+        )
+        return G
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Demographic analyses of a FamilyGraph on columns of numpy arrays.
+
+GraphColumns converts the persons and relations of a graph once into arrays
+with one row per person:
+
+* birth and death years (MISSING where unknown; years read back as strings,
+  e.g. from GEXF files written by other tools, are converted)
+* codes of family_name and profession (0 for None), the values are in
+  family_names and professions
+* the rows of the father and of the mother (MISSING where unknown)
+* the children of every person as compressed sparse rows: the children of
+  row i are child_rows[child_offsets[i]:child_offsets[i + 1]]
+* the husband and wife rows of all couples
+
+The analyses then work on whole columns at once:
+
+    columns = GraphColumns(graph)
+    lifespan_distribution(columns)
+    child_mortality(columns, by="decade")   # or "family", "decade_family"
+    children_per_couple(columns)
+    generation_intervals(columns)
+    demographic_report(columns)             # all of the above, as JSON
+
+Usage as CLI:
+
+    python demographics.py -g graph.gexf -o report.json --family Billeter
+"""
+
+import sys
+import json
+import argparse
+
+import numpy as np
+
+MISSING = -1
+# persons dying younger than CHILD_AGE count as child deaths
+CHILD_AGE = 15
+# lifespans and ages of parents beyond MAX_AGE, and parents younger than
+# MIN_PARENT_AGE are taken for wrong years
+MAX_AGE = 110
+MIN_PARENT_AGE = 12
+
+
+def year_of(value):
+    """
+    Returns a year as int (also from strings like "1613"), MISSING if it is
+    unknown.
+    """
+    if isinstance(value, bool):
+        return MISSING
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return MISSING
+
+
+def codes_of(values):
+    """
+    Returns the codes of values (0 for None, then in order of appearance) as
+    int32 array and the list of the distinct values (code -> value).
+    """
+    codes = {None: 0}
+    array = np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int32)
+    return array, list(codes)
+
+
+class GraphColumns:
+    def __init__(self, graph):
+        """
+        Converts a graph into columns (see module docstring).
+
+        Parameters:
+            graph: FamilyGraph, CompactFamilyGraph or networkx DiGraph with
+                "relation_type" edge attributes
+        """
+        G = getattr(graph, "G", graph)
+        self.ids = list(G.nodes)
+        self.index = {person_id: row for row, person_id in enumerate(self.ids)}
+        n = len(self.ids)
+        # one pass per attribute: the compact backend reads single attributes
+        # without building the attribute dicts
+        self.birth, self.death = (
+            np.fromiter((year_of(year) for _, year in G.nodes(data=key)), dtype=np.int32, count=n)
+            for key in ["birth_year", "death_year"]
+        )
+        self.family, self.family_names = codes_of(value for _, value in G.nodes(data="family_name"))
+        self.profession, self.professions = codes_of(value for _, value in G.nodes(data="profession"))
+
+        edges = {"FATHER_CHILD": ([], []), "MOTHER_CHILD": ([], []), "HUSBAND_WIFE": ([], [])}
+        for node_from, node_to, data in G.edges(data=True):
+            rows = edges.get(data.get("relation_type"))
+            if rows is not None:
+                rows[0].append(self.index[node_from])
+                rows[1].append(self.index[node_to])
+        edges = {
+            relation_type: (np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32))
+            for relation_type, (sources, targets) in edges.items()
+        }
+        self.father = np.full(n, MISSING, dtype=np.int32)
+        self.mother = np.full(n, MISSING, dtype=np.int32)
+        for column, relation_type in [(self.father, "FATHER_CHILD"), (self.mother, "MOTHER_CHILD")]:
+            parents, children = edges[relation_type]
+            column[children] = parents
+        self.husbands, self.wives = edges["HUSBAND_WIFE"]
+
+        parents = np.concatenate([edges["FATHER_CHILD"][0], edges["MOTHER_CHILD"][0]])
+        children = np.concatenate([edges["FATHER_CHILD"][1], edges["MOTHER_CHILD"][1]])
+        self.child_rows = children[np.argsort(parents, kind="stable")]
+        self.child_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents, minlength=n), out=self.child_offsets[1:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def children(self, row):
+        return self.child_rows[self.child_offsets[row]:self.child_offsets[row + 1]]
+
+    def child_counts(self):
+        return np.diff(self.child_offsets)
+
+    def mothers(self):
+        """
+        Returns the mother rows with the mothers inferred where only the
+        father is recorded (as in most transcriptions) and he has exactly one
+        wife.
+        """
+        wife_counts = np.bincount(self.husbands, minlength=len(self))
+        only_wife = np.full(len(self), MISSING, dtype=np.int32)
+        single = wife_counts[self.husbands] == 1
+        only_wife[self.husbands[single]] = self.wives[single]
+        mothers = self.mother.copy()
+        unknown = (mothers == MISSING) & (self.father != MISSING)
+        mothers[unknown] = only_wife[self.father[unknown]]
+        return mothers
+
+    def lifespans(self):
+        """
+        Returns the rows of the persons with plausible birth and death years
+        and their lifespans.
+        """
+        known = (self.birth != MISSING) & (self.death != MISSING)
+        ages = self.death - self.birth
+        rows = np.flatnonzero(known & (ages >= 0) & (ages <= MAX_AGE))
+        return rows, ages[rows]
+
+
+def summary(values):
+    """
+    Returns the count, mean and quartiles of an array.
+    """
+    if len(values) == 0:
+        return {"count": 0}
+    low, q1, median, q3, high = np.percentile(values, [0, 25, 50, 75, 100]).tolist()
+    return {"count": len(values), "mean": round(float(np.mean(values)), 2),
+            "min": low, "q1": q1, "median": median, "q3": q3, "max": high}
+
+
+def histogram(values, bin_width=1):
+    """
+    Returns {start of bin: number of values} of the non-empty bins.
+    """
+    counts = np.bincount(values // bin_width) if len(values) else np.zeros(0, dtype=np.int64)
+    return {start * bin_width: count for start, count in enumerate(counts.tolist()) if count}
+
+
+def lifespan_distribution(columns, bin_width=10):
+    """
+    Returns the summary and histogram of the lifespans.
+    """
+    _, ages = columns.lifespans()
+    return dict(summary(ages), histogram=histogram(ages, bin_width))
+
+
+def group_rates(keys, events):
+    """
+    Counts the rows and events (bool array) per key.
+
+    Returns:
+        list of (key, rows, events)
+    """
+    groups, inverse = np.unique(keys, return_inverse=True)
+    rows = np.bincount(inverse, minlength=len(groups))
+    counts = np.bincount(inverse, weights=events, minlength=len(groups)).astype(np.int64)
+    return list(zip(groups.tolist(), rows.tolist(), counts.tolist()))
+
+
+def rate(children, deaths):
+    return {"children": children, "deaths": deaths, "rate": round(deaths / children, 4)}
+
+
+def child_mortality(columns, by="decade", max_age=CHILD_AGE, decade=10):
+    """
+    Share of the children dying younger than max_age.
+
+    Children are the persons with a known parent and birth year; those
+    without a death year count as survivors.
+
+    Parameters:
+        by: "decade" (of birth), "family" (family_name) or "decade_family"
+
+    Returns:
+        {decade or family name: {"children": .., "deaths": .., "rate": ..}},
+        for "decade_family" {family name: {decade: {...}}}
+    """
+    rows = np.flatnonzero(
+        (columns.birth != MISSING) & ((columns.father != MISSING) | (columns.mother != MISSING)))
+    ages = columns.death[rows] - columns.birth[rows]
+    deaths = (columns.death[rows] != MISSING) & (ages >= 0) & (ages < max_age)
+    decades = columns.birth[rows] // decade * decade
+    families = columns.family[rows]
+    if by == "decade":
+        return {key: rate(children, died) for key, children, died in group_rates(decades, deaths)}
+    if by == "family":
+        return {
+            columns.family_names[key]: rate(children, died)
+            for key, children, died in group_rates(families, deaths)
+        }
+    if by == "decade_family":
+        span = int(decades.max(initial=0)) + 1
+        result = {}
+        for key, children, died in group_rates(families.astype(np.int64) * span + decades, deaths):
+            family, decade_start = divmod(key, span)
+            result.setdefault(columns.family_names[family], {})[decade_start] = rate(children, died)
+        return result
+    raise ValueError(f"Unknown grouping: {by}")
+
+
+def couple_children(columns):
+    """
+    Returns the number of children of every couple (in the order of
+    columns.husbands and columns.wives): the children of the husband whose
+    mother is the wife (see GraphColumns.mothers).
+    """
+    n = len(columns)
+    mothers = columns.mothers()
+    known = (columns.father != MISSING) & (mothers != MISSING)
+    child_keys = columns.father[known].astype(np.int64) * n + mothers[known]
+    keys, counts = np.unique(child_keys, return_counts=True)
+    couple_keys = columns.husbands.astype(np.int64) * n + columns.wives
+    if not len(keys):
+        return np.zeros(len(couple_keys), dtype=np.int64)
+    positions = np.minimum(np.searchsorted(keys, couple_keys), len(keys) - 1)
+    return np.where(keys[positions] == couple_keys, counts[positions], 0)
+
+
+def children_per_couple(columns):
+    """
+    Returns the summary and histogram of the number of children of the couples.
+    """
+    counts = couple_children(columns)
+    return dict(summary(counts), histogram=histogram(counts))
+
+
+def generation_intervals(columns):
+    """
+    Returns the summaries of the ages of the fathers and of the mothers at
+    the births of their children.
+    """
+    result = {}
+    for name, parents in [("father", columns.father), ("mother", columns.mothers())]:
+        rows = np.flatnonzero((parents != MISSING) & (columns.birth != MISSING))
+        parent_births = columns.birth[parents[rows]]
+        intervals = (columns.birth[rows] - parent_births)[parent_births != MISSING]
+        result[name] = summary(intervals[(intervals >= MIN_PARENT_AGE) & (intervals <= MAX_AGE)])
+    return result
+
+
+def demographic_report(columns, max_age=CHILD_AGE):
+    """
+    Returns all analyses of the module as one dict (JSON serializable).
+    """
+    return {
+        "persons": len(columns),
+        "lifespans": lifespan_distribution(columns),
+        "child_mortality_by_decade": child_mortality(columns, "decade", max_age),
+        "child_mortality_by_family": child_mortality(columns, "family", max_age),
+        "children_per_couple": children_per_couple(columns),
+        "generation_intervals": generation_intervals(columns),
+    }
+
+
+if __name__ == "__main__":
+    from family_graph import FamilyGraph
+
+    parser = argparse.ArgumentParser(description='Demographic analyses of a saved family graph.')
+    parser.add_argument('--graph', '-g', required=True, help='Graph file (.gexf, .graphml or .parquet).')
+    parser.add_argument('--output', '-o', default=None, help='JSON file to write the whole report to.')
+    parser.add_argument('--family', default=None, help='Print the child mortality of one family per decade.')
+    parser.add_argument('--child-age', type=int, default=CHILD_AGE, help='Deaths younger than this are child deaths.')
+    args = parser.parse_args()
+
+    try:
+        graph = FamilyGraph.load(args.graph)
+    except FileNotFoundError:
+        print(f"Error: '{args.graph}' not found.")
+        sys.exit(1)
+    columns = GraphColumns(graph)
+    report = demographic_report(columns, args.child_age)
+    mortality = report["child_mortality_by_decade"]
+    if args.family is not None:
+        mortality = child_mortality(columns, "decade_family", args.child_age).get(args.family)
+        if mortality is None:
+            print(f"Error: no children of family '{args.family}' with known birth year.")
+            sys.exit(1)
+    lifespans = report["lifespans"]
+    print(f"{report['persons']} persons, {lifespans['count']} with known lifespan"
+          + (f" (mean {lifespans['mean']}, median {lifespans['median']})" if lifespans["count"] else ""))
+    for decade, row in mortality.items():
+        print(f"{decade}s: {row['deaths']:5} of {row['children']:5} children died ({row['rate']:.1%})")
+    couples = report["children_per_couple"]
+    if couples["count"]:
+        print(f"{couples['count']} couples, {couples['mean']} children on average")
+    for parent, intervals in report["generation_intervals"].items():
+        if intervals["count"]:
+            print(f"age of the {parent}s at birth: mean {intervals['mean']}, median {intervals['median']}")
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(0)
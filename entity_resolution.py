@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Cross-family entity resolution for FamilyGraph.
+
+FamilyGraph.add_person only merges persons with the same family_id, or
+children of the same father or husband with exactly the same given_name.
+Persons recorded in different ways stay separate nodes, e.g.
+
+* "Hs. Caspar" in the list of children and "Hans Caspar" in his own entry
+* a wife in her husband's family ("Susanna Billeter", wife of Geiger0006)
+  and the same woman as a daughter in her birth family
+
+resolve_entities finds such duplicates without comparing all pairs of
+persons: candidates are only compared within blocks of persons sharing the
+normalized family name and the first (expanded) given name, and within
+large blocks only persons whose birth years fall into neighbouring buckets.
+The candidates of a block are scored at once with numpy and the best-scored
+ones merged into the graph (see FamilyGraph.merge_persons). It returns a
+record of every merge it made.
+
+    python entity_resolution.py -i data/bashoutput -o graph.gexf --merge-log merges.json
+"""
+
+import re
+import sys
+import json
+import argparse
+
+import numpy as np
+
+# abbreviations and spelling variants of given names -> canonical form
+GIVEN_NAME_FORMS = {
+    "hs": "hans",
+    "joh": "johannes",
+    "jb": "jakob", "jac": "jakob", "jak": "jakob", "jacob": "jakob",
+    "hch": "heinrich", "hrch": "heinrich", "heinr": "heinrich",
+    "rud": "rudolf", "rudolph": "rudolf",
+    "casp": "kaspar", "caspar": "kaspar",
+    "conr": "konrad", "conrad": "konrad",
+    "ulr": "ulrich",
+    "chr": "christoph", "christof": "christoph",
+    "melch": "melchior",
+    "fel": "felix",
+    "a": "anna",
+    "ma": "maria",
+    "elis": "elisabeth", "elisabetha": "elisabeth",
+    "barb": "barbara",
+    "marg": "margaretha", "margaretha": "margaretha", "margareta": "margaretha",
+    "magd": "magdalena",
+    "cath": "katharina", "kath": "katharina", "catharina": "katharina",
+}
+
+# particles dropped from family names ("v. Orelli")
+NAME_PARTICLES = {"v", "von", "vom", "zum", "zur", "de"}
+
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+word_pattern = re.compile(r"[^\W\d_]+")
+
+# score weights (they add up to 1)
+NAME_WEIGHT = 0.5
+BIRTH_WEIGHT = 0.2
+DEATH_WEIGHT = 0.1
+ROLE_WEIGHT = 0.2
+# score of a year (or role) that cannot be compared
+NEUTRAL = 0.5
+
+DEFAULT_THRESHOLD = 0.8
+# birth or death years differing by more than this are different persons
+YEAR_TOLERANCE = 1
+# blocks larger than this are split by birth year buckets of BUCKET_WIDTH years
+MAX_BLOCK_SIZE = 256
+BUCKET_WIDTH = 10
+# rows scored at once for large blocks
+ROW_BATCH = 256
+# persons with more candidates than this are ambiguous and not merged
+MAX_CANDIDATES = 3
+
+
+def name_words(name):
+    return word_pattern.findall(str(name).casefold().translate(UMLAUTS))
+
+
+def normalize_family_name(family_name):
+    """
+    Returns the family name as compared by the resolution ("v. Orelli" -> "orelli").
+    """
+    if family_name is None:
+        return None
+    words = [word for word in name_words(family_name) if word not in NAME_PARTICLES]
+    return " ".join(words) or None
+
+
+def given_name_tokens(given_name):
+    """
+    Returns the tokens of a given name with abbreviations and spelling
+    variants expanded ("Hs. Caspar" -> ("hans", "kaspar")).
+    """
+    if given_name is None:
+        return ()
+    return tuple(GIVEN_NAME_FORMS.get(word, word) for word in name_words(given_name))
+
+
+class PersonTable:
+    def __init__(self, graph):
+        """
+        Columns of the attributes of all persons of a FamilyGraph used for the
+        resolution: node ids, name tokens and numpy arrays of years and of
+        codes of the family ids (0 for None).
+        """
+        self.ids = []
+        self.family_names = []
+        self.tokens = []
+        birth, death, family, father, husband = [], [], [], [], []
+        codes = {None: 0}
+        for person_id, data in graph.G.nodes(data=True):
+            self.ids.append(person_id)
+            self.family_names.append(normalize_family_name(data.get("family_name")))
+            self.tokens.append(given_name_tokens(data.get("given_name")))
+            birth.append(year_value(data.get("birth_year")))
+            death.append(year_value(data.get("death_year")))
+            for column, key in [(family, "family_id"), (father, "father_family_id"), (husband, "husband_family_id")]:
+                column.append(codes.setdefault(data.get(key), len(codes)))
+        self.birth = np.array(birth, dtype=float)
+        self.death = np.array(death, dtype=float)
+        self.family = np.array(family, dtype=np.int64)
+        self.father = np.array(father, dtype=np.int64)
+        self.husband = np.array(husband, dtype=np.int64)
+
+    def blocks(self):
+        """
+        Groups the persons by normalized family name and first given name.
+
+        Returns:
+            dict (family name, first token) -> list of row numbers
+        """
+        blocks = {}
+        for row, (family_name, tokens) in enumerate(zip(self.family_names, self.tokens)):
+            if family_name is not None and tokens:
+                blocks.setdefault((family_name, tokens[0]), []).append(row)
+        return blocks
+
+    def token_masks(self, rows):
+        """
+        Returns the given name tokens of rows as bit masks (uint64), for
+        Jaccard similarities with bit operations. Beyond 64 distinct tokens
+        in a block, tokens share bits.
+        """
+        bits = {}
+        masks = np.zeros(len(rows), dtype=np.uint64)
+        for i, row in enumerate(rows):
+            mask = 0
+            for token in self.tokens[row]:
+                mask |= 1 << (bits.setdefault(token, len(bits)) % 64)
+            masks[i] = mask
+        return masks
+
+
+def year_value(year):
+    return year if isinstance(year, int) and not isinstance(year, bool) else np.nan
+
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """
+    Number of set bits of every element of a uint64 array.
+    """
+    if hasattr(np, "bitwise_count"):
+        # numpy >= 2.0
+        return np.bitwise_count(values)
+    as_bytes = values.reshape(values.shape + (1,)).view(np.uint8)
+    return POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def year_scores(a, b):
+    """
+    Scores of year pairs: 1 if equal, decreasing to 0 beyond YEAR_TOLERANCE,
+    NEUTRAL if one is unknown. Also returns where both are known and differ
+    by more than YEAR_TOLERANCE.
+    """
+    difference = np.abs(a[:, None] - b[None, :])
+    known = ~np.isnan(difference)
+    scores = np.where(known, np.clip(1 - difference / (YEAR_TOLERANCE + 1), 0, 1), NEUTRAL)
+    return scores, known & (difference > YEAR_TOLERANCE)
+
+
+def conflicts(a, b):
+    """
+    Where two codes are both known (not 0) and differ.
+    """
+    return (a[:, None] > 0) & (b[None, :] > 0) & (a[:, None] != b[None, :])
+
+
+def score_block(table, rows, cols, masks_rows, masks_cols):
+    """
+    Scores all pairs of persons rows x cols at once.
+
+    The score is a weighted sum of the Jaccard similarity of the given name
+    tokens, the agreement of birth and death years and of the roles: a
+    person mentioned without family_id next to an entry with one, or a wife
+    next to a daughter, are likely the same person. Pairs with different
+    family_ids or father_family_ids, or with years differing more than
+    YEAR_TOLERANCE, score 0.
+
+    Returns:
+        score matrix of shape (len(rows), len(cols))
+    """
+    union = popcount(masks_rows[:, None] | masks_cols[None, :])
+    intersection = popcount(masks_rows[:, None] & masks_cols[None, :])
+    name = intersection / np.maximum(union, 1)
+
+    birth, birth_conflict = year_scores(table.birth[rows], table.birth[cols])
+    death, death_conflict = year_scores(table.death[rows], table.death[cols])
+
+    family_r, family_c = table.family[rows], table.family[cols]
+    has_family_r, has_family_c = family_r > 0, family_c > 0
+    wife_and_daughter = (
+        (table.husband[rows][:, None] > 0) & (table.father[cols][None, :] > 0)
+    ) | (
+        (table.father[rows][:, None] > 0) & (table.husband[cols][None, :] > 0)
+    )
+    mention_and_entry = has_family_r[:, None] != has_family_c[None, :]
+    role = np.where(wife_and_daughter | mention_and_entry, 1.0, NEUTRAL)
+
+    score = NAME_WEIGHT * name + BIRTH_WEIGHT * birth + DEATH_WEIGHT * death + ROLE_WEIGHT * role
+    impossible = (
+        conflicts(family_r, family_c)
+        | conflicts(table.father[rows], table.father[cols])
+        | birth_conflict
+        | death_conflict
+    )
+    return np.where(impossible, 0.0, score)
+
+
+def block_candidates(table, rows, threshold):
+    """
+    Returns the candidate pairs (score, row a, row b) of one block scoring at
+    least threshold. Blocks larger than MAX_BLOCK_SIZE are split into birth
+    year buckets; persons without birth year are compared with the whole block.
+    Persons with more than MAX_CANDIDATES candidates are ambiguous (e.g. a
+    common name without years) and get none.
+    """
+    rows = np.array(rows)
+    masks = table.token_masks(rows)
+    candidates = {}
+
+    def collect(positions_a, positions_b, upper):
+        scores = score_block(table, rows[positions_a], rows[positions_b], masks[positions_a], masks[positions_b])
+        if upper:
+            scores = np.triu(scores, k=1)
+        hits = scores >= threshold
+        counts_a, counts_b = hits.sum(axis=1), hits.sum(axis=0)
+        if upper:
+            counts_a = counts_b = counts_a + counts_b
+        hits &= (counts_a[:, None] <= MAX_CANDIDATES) & (counts_b[None, :] <= MAX_CANDIDATES)
+        for i, j in zip(*np.nonzero(hits)):
+            a, b = sorted((int(rows[positions_a[i]]), int(rows[positions_b[j]])))
+            if a != b:
+                candidates[(a, b)] = float(scores[i, j])
+
+    positions = np.arange(len(rows))
+    if len(rows) <= MAX_BLOCK_SIZE:
+        collect(positions, positions, True)
+    else:
+        births = table.birth[rows]
+        known = ~np.isnan(births)
+        # every person goes into its bucket and the next one, so persons
+        # born less than BUCKET_WIDTH years apart share a bucket
+        buckets = {}
+        for position in positions[known]:
+            bucket = int(births[position] // BUCKET_WIDTH)
+            buckets.setdefault(bucket, []).append(position)
+            buckets.setdefault(bucket + 1, []).append(position)
+        for members in buckets.values():
+            members = np.array(members)
+            collect(members, members, True)
+        unknown = positions[~known]
+        for start in range(0, len(unknown), ROW_BATCH):
+            collect(unknown[start:start + ROW_BATCH], positions, False)
+    return [(score, a, b) for (a, b), score in candidates.items()]
+
+
+def find_candidates(graph, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns the candidate pairs of duplicates of a FamilyGraph.
+
+    Returns:
+        table: the PersonTable of the graph
+        list of (score, row a, row b), best first
+    """
+    table = PersonTable(graph)
+    candidates = []
+    for rows in table.blocks().values():
+        if len(rows) > 1:
+            candidates.extend(block_candidates(table, rows, threshold))
+    # the buckets of large blocks overlap: check the ambiguity over all of them
+    counts = {}
+    for _, a, b in candidates:
+        counts[a] = counts.get(a, 0) + 1
+        counts[b] = counts.get(b, 0) + 1
+    candidates = [
+        candidate for candidate in candidates
+        if counts[candidate[1]] <= MAX_CANDIDATES and counts[candidate[2]] <= MAX_CANDIDATES
+    ]
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+    return table, candidates
+
+
+def person_summary(graph, person_id):
+    return {key: graph.G.nodes[person_id].get(key) for key in [
+        "family_id", "father_family_id", "husband_family_id",
+        "family_name", "given_name", "birth_year", "death_year",
+    ]}
+
+
+def resolve_entities(graph, threshold=DEFAULT_THRESHOLD):
+    """
+    Finds duplicate persons in a FamilyGraph and merges them (see module
+    docstring). Candidates are merged best score first. A candidate is
+    skipped if the persons merged so far have become incompatible (different
+    family_ids or father_family_ids) or are directly related.
+
+    Parameters:
+        graph: FamilyGraph (or CompactFamilyGraph)
+        threshold: minimal score of a merge (between 0 and 1)
+
+    Returns:
+        list of merge records:
+        {
+            "kept": person_id of the node kept,
+            "merged": person_id of the node merged into it and removed,
+            "score": 0.85,
+            "kept_person": {"family_id": ..., "given_name": ..., ...},
+            "merged_person": {...}
+        }
+    """
+    table, candidates = find_candidates(graph, threshold)
+    # person_id of a merged node -> person_id of the node it was merged into
+    merged_into = {}
+
+    def current(person_id):
+        while person_id in merged_into:
+            person_id = merged_into[person_id]
+        return person_id
+
+    merges = []
+    for score, a, b in candidates:
+        id_a, id_b = current(table.ids[a]), current(table.ids[b])
+        if id_a == id_b or graph.G.has_edge(id_a, id_b) or graph.G.has_edge(id_b, id_a):
+            continue
+        node_a, node_b = graph.G.nodes[id_a], graph.G.nodes[id_b]
+        if any(
+            node_a[key] is not None and node_b[key] is not None and node_a[key] != node_b[key]
+            for key in ["family_id", "father_family_id"]
+        ):
+            continue
+        # keep the person with its own entry, else the one with more relations
+        keep_id, merged_id = sorted(
+            [id_a, id_b],
+            key=lambda person_id: (
+                graph.G.nodes[person_id]["family_id"] is None,
+                -graph.G.degree(person_id),
+            ),
+        )
+        merges.append({
+            "kept": keep_id,
+            "merged": merged_id,
+            "score": round(score, 4),
+            "kept_person": person_summary(graph, keep_id),
+            "merged_person": person_summary(graph, merged_id),
+        })
+        graph.merge_persons(keep_id, merged_id)
+        merged_into[merged_id] = keep_id
+    return merges
+
+
+def write_merge_log(merges, path):
+    """
+    Writes the merge records of resolve_entities as JSON (person ids as strings).
+    """
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(merges, file, indent=1, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    from family_graph import FamilyGraph
+    from compact_family_graph import CompactFamilyGraph
+    from graph_io import write_gexf
+
+    parser = argparse.ArgumentParser(description='Build the family graph and merge duplicate persons across families.')
+    parser.add_argument('--input', '-i', required=True, help='Directory containing the extraction JSONs.')
+    parser.add_argument('--output', '-o', required=True, help='GEXF file to save the resolved graph to.')
+    parser.add_argument('--merge-log', default=None, help='JSON file to record the merges in.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Minimal score of a merge.')
+    parser.add_argument('--compact', action='store_true', help='Use the compact in-memory backend.')
+    args = parser.parse_args()
+
+    graph = CompactFamilyGraph() if args.compact else FamilyGraph()
+    graph.load_extractions(args.input)
+    persons = graph.G.number_of_nodes()
+    merges = resolve_entities(graph, threshold=args.threshold)
+    print(f"{len(merges)} of {persons} persons merged")
+    if args.merge_log is not None:
+        write_merge_log(merges, args.merge_log)
+    write_gexf(graph, args.output)
+    sys.exit(0)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Persistent, content-addressed cache for chunk2triple responses.
+
+Responses are stored in a SQLite file and keyed by a hash of model name,
+prompt text and chunk text. Since the extraction runs with temperature=0,
+a rerun over unchanged chunks can be answered from the cache without any
+request to the completion endpoint.
+
+Usage as CLI:
+
+    python extraction_cache.py --cache extractions.sqlite stats
+    python extraction_cache.py --cache extractions.sqlite invalidate -p promts/prompt_pilou02.txt
+    python extraction_cache.py --cache extractions.sqlite clear
+"""
+
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+def text_hash(text):
+    """
+    Returns the hex sha256 hash of a text.
+    """
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+def cache_key(model, prompt, chunk):
+    """
+    Returns the cache key for a request of chunk with prompt to model.
+    """
+    return text_hash("\0".join([model, prompt, chunk]))
+
+
+class ExtractionCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Opens (or creates) the cache stored at path.
+
+        Parameters:
+            path: SQLite file
+            max_bytes: once the stored responses exceed this size, the least
+                recently used entries are evicted
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_prompt ON entries (prompt_hash);
+            CREATE INDEX IF NOT EXISTS entries_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+        """)
+        self._conn.commit()
+        self.total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, model, prompt, chunk):
+        """
+        Returns the stored response or None on a cache miss.
+        """
+        key = cache_key(model, prompt, chunk)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._count("misses")
+            else:
+                self.hits += 1
+                self._count("hits")
+                self._conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return None if row is None else row[0]
+
+    def put(self, model, prompt, chunk, response):
+        """
+        Stores a response and evicts old entries if the cache grew too large.
+        """
+        key = cache_key(model, prompt, chunk)
+        size = len(response.encode("utf8"))
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, text_hash(prompt), response, size, time.time()))
+            self.total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def invalidate_prompt(self, prompt, suffixes=()):
+        """
+        Removes all entries created with the given prompt text.
+
+        Parameters:
+            prompt: prompt text
+            suffixes: also remove the entries created with the prompt followed
+                by one of these texts (e.g. chunk_to_graph.PACKED_INSTRUCTIONS)
+
+        Returns:
+            number of removed entries
+        """
+        with self._lock:
+            sizes = []
+            for suffix in ("",) + tuple(suffixes):
+                prompt_hash = text_hash(prompt + suffix)
+                sizes += [row[0] for row in self._conn.execute(
+                    "SELECT size FROM entries WHERE prompt_hash = ?", (prompt_hash,))]
+                self._conn.execute("DELETE FROM entries WHERE prompt_hash = ?", (prompt_hash,))
+            self.total_bytes -= sum(sizes)
+            self._conn.commit()
+        return len(sizes)
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self.total_bytes = 0
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Returns a dict with the number of entries, their total size and the
+        persisted hit, miss and eviction counters.
+        """
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters"))
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": entries, "bytes": self.total_bytes, **counters}
+
+    def close(self):
+        self._conn.close()
+
+    def _count(self, name, n=1):
+        self._conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (n, name))
+
+    def _evict(self):
+        # Drop least recently used entries until the size limit is respected again.
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self._count("evictions")
+
+
+if __name__ == "__main__":
+    from chunk_to_graph import PACKED_INSTRUCTIONS, promptread
+
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the chunk2triple response cache.')
+    parser.add_argument('--cache', '-c', required=True, help='Cache file.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='Print entry count, size and hit/miss counters.')
+    invalidate = subparsers.add_parser('invalidate', help='Remove entries of one prompt file.')
+    invalidate.add_argument('--prompt', '-p', required=True, help='File containing prompt.')
+    subparsers.add_parser('clear', help='Remove all entries.')
+    args = parser.parse_args()
+
+    cache = ExtractionCache(args.cache)
+    if args.command == 'stats':
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+    elif args.command == 'invalidate':
+        # packed requests (--token-budget) are cached under the extended prompt
+        removed = cache.invalidate_prompt(promptread(args.prompt), suffixes=(PACKED_INSTRUCTIONS,))
+        print(f"{removed} entries removed for {args.prompt}")
+    elif args.command == 'clear':
+        cache.clear()
+    cache.close()
+    sys.exit(0)
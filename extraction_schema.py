@@ -0,0 +1,137 @@
+"""
+Schema of the extraction JSONs returned by chunk2triple (see promts/ and
+data/bashoutput):
+
+{
+    "persons": [
+        {
+            "person_number": 1,
+            "family_id": "Billeter0001",
+            "father_family_id": None,
+            "husband_family_id": None,
+            "family_name": "Billeter",
+            "given_name": "Heinrich",
+            "birth_year": 1613,
+            "death_year": None,
+            "profession": "Pfister",
+            "origin": "Mänedorf"
+        }, ...
+    ],
+    "relations": [
+        {"person_number_1": 1, "person_number_2": 2, "relation_type": "HUSBAND_WIFE"}, ...
+    ]
+}
+"""
+
+RELATION_TYPES = ("FATHER_CHILD", "HUSBAND_WIFE", "MOTHER_CHILD")
+
+# fields that have to be present in every person (their value may be None)
+MANDATORY_PERSON_FIELDS = ("family_id", "family_name", "given_name")
+
+STRING_PERSON_FIELDS = (
+    "family_id", "father_family_id", "husband_family_id",
+    "family_name", "given_name", "profession", "origin",
+)
+YEAR_PERSON_FIELDS = ("birth_year", "death_year")
+
+
+def is_person_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def clean_person(person):
+    """
+    Validates a person of an extraction.
+
+    Returns:
+        (person, errors): a cleaned copy of the person, or None if it has to
+        be dropped, and a list of error messages. Years given as digit
+        strings are converted to int, other invalid years are set to None.
+    """
+    if not isinstance(person, dict):
+        return None, [f"person is not an object: {person!r}"]
+    if not is_person_number(person.get("person_number")):
+        return None, [f"person without valid person_number: {person!r}"]
+
+    number = person["person_number"]
+    missing = [key for key in MANDATORY_PERSON_FIELDS if key not in person]
+    if missing:
+        return None, [f"person {number}: missing {', '.join(missing)}"]
+    wrong_types = [
+        key for key in STRING_PERSON_FIELDS
+        if person.get(key) is not None and not isinstance(person[key], str)
+    ]
+    if wrong_types:
+        return None, [f"person {number}: {', '.join(wrong_types)} not a string"]
+
+    person = dict(person)
+    errors = []
+    for key in YEAR_PERSON_FIELDS:
+        value = person.get(key)
+        if value is None or is_person_number(value):
+            continue
+        if isinstance(value, str) and value.strip().isdigit():
+            person[key] = int(value)
+        else:
+            errors.append(f"person {number}: invalid {key} {value!r} set to None")
+            person[key] = None
+    return person, errors
+
+
+def clean_relation(relation, person_numbers):
+    """
+    Validates a relation of an extraction against the (valid) person numbers.
+
+    Returns:
+        (relation, errors): the relation, or None if it has to be dropped,
+        and a list of error messages
+    """
+    if not isinstance(relation, dict):
+        return None, [f"relation is not an object: {relation!r}"]
+    if relation.get("relation_type") not in RELATION_TYPES:
+        return None, [f"relation with invalid relation_type: {relation!r}"]
+    for key in ("person_number_1", "person_number_2"):
+        if relation.get(key) not in person_numbers:
+            return None, [f"relation with unknown {key}: {relation!r}"]
+    if relation["person_number_1"] == relation["person_number_2"]:
+        return None, [f"relation of a person to itself: {relation!r}"]
+    return relation, []
+
+
+def clean_extraction(data):
+    """
+    Validates a whole extraction.
+
+    Returns:
+        (persons, relations, errors): the valid persons and relations (invalid
+        ones are dropped, as are relations to dropped persons) and the list of
+        error messages
+    """
+    if not isinstance(data, dict):
+        return [], [], ["extraction is not an object"]
+    persons, relations, errors = [], [], []
+
+    raw_persons = data.get("persons", [])
+    raw_relations = data.get("relations", [])
+    if not isinstance(raw_persons, list) or not isinstance(raw_relations, list):
+        return [], [], ["persons and relations have to be lists"]
+
+    person_numbers = set()
+    for person in raw_persons:
+        person, person_errors = clean_person(person)
+        errors.extend(person_errors)
+        if person is None:
+            continue
+        if person["person_number"] in person_numbers:
+            errors.append(f"duplicate person_number {person['person_number']}")
+            continue
+        person_numbers.add(person["person_number"])
+        persons.append(person)
+
+    for relation in raw_relations:
+        relation, relation_errors = clean_relation(relation, person_numbers)
+        errors.extend(relation_errors)
+        if relation is not None:
+            relations.append(relation)
+
+    return persons, relations, errors
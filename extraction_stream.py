@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Incremental parsing of streamed extraction answers (see extraction_schema.py).
+
+ExtractionStreamParser is fed the pieces of a completion as they arrive and
+returns every person and relation as soon as its closing brace has been
+received, validated like clean_extraction does. A malformed answer or an
+invalid element raises InvalidStream right away, so the request can be
+aborted and retried before the rest of the answer is generated.
+
+GraphIngest moves the validated elements of many concurrent streams through
+a queue into one FamilyGraph on a single writer thread. The elements of an
+answer are merged into the graph once the answer is complete, so an aborted
+attempt never leaves persons behind.
+"""
+
+import json
+import queue
+import threading
+
+from extraction_schema import clean_person, clean_relation
+
+# keys of the extraction holding arrays of elements
+ARRAY_KEYS = ("persons", "relations")
+WHITESPACE = " \t\r\n"
+# returned by _scan_value while a value is incomplete (None is JSON null)
+INCOMPLETE = object()
+
+
+class InvalidStream(ValueError):
+    pass
+
+
+class ExtractionStreamParser:
+    def __init__(self, strict=True):
+        """
+        Starts parsing an answer.
+
+        Parameters:
+            strict: if True, persons or relations that clean_extraction would
+                drop raise InvalidStream, otherwise they are dropped and only
+                reported in self.errors
+        """
+        self.strict = strict
+        self.text = ""
+        self.position = 0
+        # "start", "key", "colon", "value", "element", "after_element", "after_value", "end"
+        self.state = "start"
+        self.key = None
+        self.person_numbers = set()
+        self.persons_done = False
+        self.pending_relations = []
+        self.errors = []
+        self.dropped_persons = 0
+        self.dropped_relations = 0
+        # resumable scan of the current value: (start, position, depth, in string, escaped)
+        self._scan = None
+
+    def feed(self, text):
+        """
+        Adds the next piece of the answer.
+
+        Returns:
+            list of ("person", person) and ("relation", relation) tuples
+            completed by this piece
+        """
+        self.text += text
+        elements = []
+        while self._step(elements):
+            pass
+        # drop what has been consumed, so the buffer stays small
+        if self.position > 4096:
+            self.text = self.text[self.position:]
+            if self._scan is not None:
+                start, scanned, depth, in_string, escaped = self._scan
+                self._scan = (start - self.position, scanned - self.position, depth, in_string, escaped)
+            self.position = 0
+        return elements
+
+    def close(self):
+        """
+        Ends the answer.
+
+        Returns:
+            the relations still waiting for the persons (see feed)
+
+        Raises:
+            InvalidStream if the answer is incomplete
+        """
+        if self.state != "end":
+            raise InvalidStream("answer ended before the extraction was complete")
+        return self._flush_relations()
+
+    def _skip_whitespace(self):
+        while self.position < len(self.text) and self.text[self.position] in WHITESPACE:
+            self.position += 1
+        return self.position < len(self.text)
+
+    def _step(self, elements):
+        """
+        Consumes one token or value; returns False if more text is needed.
+        """
+        if self.state == "end" or not self._skip_whitespace():
+            return False
+        char = self.text[self.position]
+
+        if self.state == "start":
+            if char == "`":
+                # a code block fence despite the prompt
+                newline = self.text.find("\n", self.position)
+                if newline < 0:
+                    return False
+                self.position = newline + 1
+                return True
+            if char != "{":
+                raise InvalidStream(f"answer does not start with an object: {char!r}")
+            self.position += 1
+            self.state = "key"
+            return True
+
+        if self.state == "key":
+            if char == "}":
+                self.position += 1
+                self.state = "end"
+                return True
+            value = self._scan_value()
+            if value is INCOMPLETE:
+                return False
+            if not isinstance(value, str):
+                raise InvalidStream(f"expected a key, got {value!r}")
+            self.key = value
+            self.state = "colon"
+            return True
+
+        if self.state == "colon":
+            if char != ":":
+                raise InvalidStream(f"expected ':' after {self.key!r}")
+            self.position += 1
+            self.state = "value"
+            return True
+
+        if self.state == "value":
+            if self.key in ARRAY_KEYS:
+                if char != "[":
+                    raise InvalidStream(f"{self.key} is not a list")
+                self.position += 1
+                self.state = "element"
+                return True
+            if self._scan_value() is INCOMPLETE:
+                return False
+            self.state = "after_value"
+            return True
+
+        if self.state == "element":
+            if char == "]":
+                self.position += 1
+                self._array_done(elements)
+                return True
+            element = self._scan_value()
+            if element is INCOMPLETE:
+                return False
+            self._add_element(element, elements)
+            self.state = "after_element"
+            return True
+
+        if self.state == "after_element":
+            if char == "]":
+                self.position += 1
+                self._array_done(elements)
+            elif char == ",":
+                self.position += 1
+                self.state = "element"
+            else:
+                raise InvalidStream(f"expected ',' or ']' in {self.key}, got {char!r}")
+            return True
+
+        if self.state == "after_value":
+            if char == "}":
+                self.state = "end"
+            elif char == ",":
+                self.state = "key"
+            else:
+                raise InvalidStream(f"expected ',' or '}}', got {char!r}")
+            self.position += 1
+            return True
+        return False
+
+    def _scan_value(self):
+        """
+        Returns the JSON value starting at self.position once it is complete
+        (and moves behind it), or INCOMPLETE if more text is needed.
+        """
+        if self._scan is None:
+            self._scan = (self.position, self.position, 0, False, False)
+        start, position, depth, in_string, escaped = self._scan
+        text = self.text
+        first = text[start]
+        end = None
+        while position < len(text):
+            char = text[position]
+            position += 1
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                    if depth == 0:
+                        end = position
+                        break
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    end = position
+                    break
+                if depth < 0:
+                    # end of a scalar value at the end of its container
+                    end = position - 1
+                    break
+            elif depth == 0 and first not in '"{[' and char in ", \t\r\n":
+                end = position - 1
+                break
+        if end is None:
+            self._scan = (start, position, depth, in_string, escaped)
+            return INCOMPLETE
+        self._scan = None
+        self.position = end
+        try:
+            return json.loads(text[start:end])
+        except ValueError as e:
+            raise InvalidStream(f"malformed value in {self.key}: {e}")
+
+    def _add_element(self, element, elements):
+        if self.key == "persons":
+            person, errors = clean_person(element)
+            if person is not None and person["person_number"] in self.person_numbers:
+                person, errors = None, [f"duplicate person_number {person['person_number']}"]
+            self._report(person, errors, "dropped_persons")
+            if person is not None:
+                self.person_numbers.add(person["person_number"])
+                elements.append(("person", person))
+        elif self.persons_done:
+            self._add_relation(element, elements)
+        else:
+            # relations before persons have to wait for the person numbers
+            self.pending_relations.append(element)
+
+    def _add_relation(self, element, elements):
+        relation, errors = clean_relation(element, self.person_numbers)
+        self._report(relation, errors, "dropped_relations")
+        if relation is not None:
+            elements.append(("relation", relation))
+
+    def _report(self, element, errors, dropped):
+        if element is None:
+            if self.strict:
+                raise InvalidStream(errors[0])
+            setattr(self, dropped, getattr(self, dropped) + 1)
+        self.errors.extend(errors)
+
+    def _array_done(self, elements):
+        if self.key == "persons":
+            self.persons_done = True
+            elements.extend(self._flush_relations())
+        self.state = "after_value"
+
+    def _flush_relations(self):
+        self.persons_done = True
+        elements = []
+        for element in self.pending_relations:
+            self._add_relation(element, elements)
+        self.pending_relations = []
+        return elements
+
+
+class GraphIngest:
+    def __init__(self, graph):
+        """
+        Starts the writer thread merging streamed extractions into graph
+        (a FamilyGraph or one of its subclasses).
+
+        The streams call element(), abort() and done() from any thread; the
+        writer collects the elements per name and merges an extraction when
+        it is done, in the order the streams finish.
+        """
+        self.graph = graph
+        self.reports = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def element(self, name, kind, element):
+        self._queue.put(("element", name, kind, element))
+
+    def abort(self, name):
+        """
+        Discards the elements received for name so far (before a retry).
+        """
+        self._queue.put(("abort", name, None, None))
+
+    def done(self, name, errors=(), dropped_persons=0, dropped_relations=0):
+        self._queue.put(("done", name, None, (list(errors), dropped_persons, dropped_relations)))
+
+    def close(self):
+        """
+        Waits until everything queued is merged and returns the reports (see
+        FamilyGraph.load_extractions). The reports of extractions that could
+        not be merged have the error under "failed".
+        """
+        self._queue.put(None)
+        self._thread.join()
+        return self.reports
+
+    def _run(self):
+        pending = {}
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            action, name, kind, value = message
+            if action == "element":
+                pending.setdefault(name, {"persons": [], "relations": []})[kind + "s"].append(value)
+            elif action == "abort":
+                pending.pop(name, None)
+            else:
+                extraction = pending.pop(name, {"persons": [], "relations": []})
+                errors, dropped_persons, dropped_relations = value
+                extraction = {
+                    "file": name,
+                    "persons": extraction["persons"],
+                    "relations": extraction["relations"],
+                    "errors": errors,
+                    "dropped_persons": dropped_persons,
+                    "dropped_relations": dropped_relations,
+                }
+                try:
+                    self.reports.append(self.graph.add_extraction(extraction))
+                except Exception as e:
+                    # a failing extraction must not stop the merging of the others
+                    self.reports.append({
+                        "file": name, "created": 0, "merged": 0,
+                        "dropped_persons": dropped_persons, "relations": 0,
+                        "dropped_relations": dropped_relations, "errors": errors,
+                        "failed": f"{type(e).__name__}: {e}",
+                    })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Local stand-in for the OpenAI chat completion endpoint.
+
+Used by the tests and for dry runs of chunk_to_graph.py without spending
+tokens:
+
+    python fake_openai_server.py --port 8000
+    python chunk_to_graph.py --base-url http://127.0.0.1:8000/v1 ...
+
+By default the server answers every request with an empty extraction.
+A custom responder can be passed to FakeCompletionServer to return
+something else or to simulate rate limits (answer with status 429).
+Requests with "stream": true are answered with server-sent events of a few
+characters each.
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMPTY_EXTRACTION = json.dumps({"persons": [], "relations": []})
+
+
+def default_responder(request):
+    """
+    Returns (status, content) for a parsed chat completion request.
+    """
+    return 200, EMPTY_EXTRACTION
+
+
+def completion_body(model, content, prompt_tokens=0, completion_tokens=0):
+    """
+    Returns a chat completion response body as dict.
+    """
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def stream_events(model, content, prompt_tokens=0, completion_tokens=0, piece=16):
+    """
+    Returns the server-sent events of a streamed chat completion of content
+    (in pieces of the given number of characters, the usage last).
+    """
+    def chunk(delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    chunks = [chunk({"role": "assistant", "content": ""})]
+    chunks.extend(chunk({"content": content[i:i + piece]}) for i in range(0, len(content), piece))
+    chunks.append(chunk({}, "stop"))
+    usage = completion_body(model, content, prompt_tokens, completion_tokens)["usage"]
+    chunks.append({**chunk({}), "choices": [], "usage": usage})
+    return [f"data: {json.dumps(body)}\n\n".encode("utf8") for body in chunks] + [b"data: [DONE]\n\n"]
+
+
+class FakeCompletionServer:
+    def __init__(self, responder=default_responder, host="127.0.0.1", port=0):
+        """
+        Initializes the server. port=0 picks a free port.
+
+        Parameters:
+            responder: function called with the parsed request body (dict)
+                returning (status, content). For status 200 content is the
+                message content, otherwise it is sent as error message.
+        """
+        self.responder = responder
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests.append(request)
+                status, content = server.responder(request)
+                if status == 200 and request.get("stream"):
+                    messages = request.get("messages", [])
+                    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    try:
+                        for event in stream_events(request.get("model"), content,
+                                                   prompt_tokens, len(content) // 4):
+                            self.wfile.write(event)
+                            self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # the client aborted the stream
+                        pass
+                    self.close_connection = True
+                    return
+                if status == 200:
+                    messages = request.get("messages", [])
+                    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                    body = completion_body(request.get("model"), content,
+                                           prompt_tokens, len(content) // 4)
+                else:
+                    body = {"error": {"message": content, "type": "fake_error", "code": status}}
+                payload = json.dumps(body).encode("utf8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local stand-in for the chat completion endpoint.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--response-file', help='File whose content is returned for every request.')
+    args = parser.parse_args()
+
+    responder = default_responder
+    if args.response_file is not None:
+        with open(args.response_file, encoding="utf8") as file:
+            fixed_content = file.read()
+        responder = lambda request: (200, fixed_content)
+
+    server = FakeCompletionServer(responder, port=args.port)
+    print(f"Serving fake completions on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
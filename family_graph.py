@@ -1,16 +1,144 @@
 import networkx as nx
-import matplotlib.pyplot as plt
 import uuid
+import os
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_schema import RELATION_TYPES, clean_extraction
+
+
+def normalize_given_name(given_name):
+    """
+    Returns the given_name as compared by the duplicate detection:
+    case-folded and with collapsed whitespace. The result is interned, as the
+    same names are used as index keys again and again.
+    """
+    if given_name is None:
+        return None
+    return sys.intern(" ".join(str(given_name).split()).casefold())
+
+
+def merge_attributes(node, person_attributes):
+    """
+    Merges person_attributes into the attributes of an existing node:
+    missing values are filled in, and the longer value wins.
+    """
+    for key, val in node.items():
+        if val is None or (
+            len(str(val)) < len(str(person_attributes.get(key))) 
+            and person_attributes.get(key) is not None
+            ):
+            node[key] = person_attributes.get(key)
+
+
+# private generator of the person ids, seeded from os.urandom: seeding the
+# global random (in a notebook, test or library) must not repeat ids that
+# are persisted (see graph_store.py and provenance.py). A forked child (as
+# in a ProcessPoolExecutor) would repeat the ids of its parent, so it is
+# reseeded after fork.
+_id_random = random.Random(os.urandom(32))
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: _id_random.seed(os.urandom(32)))
+
+
+def new_person_id():
+    """
+    Returns a random (version 4) UUID for a new person node. Drawn from a
+    random.Random instead of os.urandom, which is noticeably faster in bulk.
+    """
+    return uuid.UUID(int=_id_random.getrandbits(128), version=4)
+
+
+def parse_extraction(source):
+    """
+    Reads and validates one extraction (see extraction_schema.py).
+
+    Parameters:
+        source: path of an extraction JSON, or a tuple (name, parsed dict)
+
+    Returns:
+        dict with "file", "persons", "relations", "errors" and the numbers of
+        dropped persons and relations
+    """
+    if isinstance(source, tuple):
+        name, data = source
+    else:
+        name = source
+        try:
+            with open(source, encoding="utf8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            return {"file": name, "persons": [], "relations": [], "errors": [str(e)],
+                    "dropped_persons": 0, "dropped_relations": 0}
+    persons, relations, errors = clean_extraction(data)
+    raw_persons = data.get("persons") if isinstance(data, dict) else None
+    raw_relations = data.get("relations") if isinstance(data, dict) else None
+    return {
+        "file": name,
+        "persons": persons,
+        "relations": relations,
+        "errors": errors,
+        "dropped_persons": (len(raw_persons) if isinstance(raw_persons, list) else 0) - len(persons),
+        "dropped_relations": (len(raw_relations) if isinstance(raw_relations, list) else 0) - len(relations),
+    }
+
+
+def extraction_sources(path_or_iterable):
+    """
+    Returns the list of extraction sources for FamilyGraph.load_extractions:
+    all *.json files of a directory (sorted), a single file, or the items of
+    an iterable (paths, parsed dicts or (name, parsed dict) tuples).
+    """
+    if isinstance(path_or_iterable, (str, os.PathLike)):
+        path = os.fspath(path_or_iterable)
+        if os.path.isdir(path):
+            return [
+                os.path.join(path, filename)
+                for filename in sorted(os.listdir(path))
+                if filename.endswith(".json")
+            ]
+        return [path]
+    sources = []
+    for i, item in enumerate(path_or_iterable):
+        if isinstance(item, dict):
+            item = (f"<extraction {i}>", item)
+        elif isinstance(item, os.PathLike):
+            item = os.fspath(item)
+        sources.append(item)
+    return sources
 
 
 class FamilyGraph:
+    # ProvenanceIndex recording which node every extracted person was merged
+    # into (see provenance.py), None to record nothing
+    provenance = None
+    # PersonSearchIndex kept up to date with the persons (see person_search.py)
+    search_index = None
+    # contributions of the extraction files (see track_contributions), None
+    # while they are not tracked
+    person_contributions = None
+    relation_contributions = None
+    extraction_contributions = None
+    # extraction file being merged by add_extraction
+    _extraction_file = None
+
     def __init__(self):
         """
         Initializes an empty directed graph self.G and 
         an empty dict self.family_id_index used to relate each family_id to node ids.
+
+        The secondary indexes used for duplicate detection relate the node of a
+        father or husband (i.e. the node its family_id resolves to through
+        self.family_id_index) to its successors:
+            self.successor_name_index: (node id, normalized given_name) -> [successor ids]
+            self.successor_year_index: (node id, normalized given_name, birth_year) -> [successor ids]
         """
         self.G = nx.DiGraph()
         self.family_id_index = {}
+        self.successor_name_index = {}
+        self.successor_year_index = {}
 
     def add_person(self, person_attributes):
         """
@@ -49,46 +177,616 @@ class FamilyGraph:
             if key not in person_attributes.keys():
                 person_attributes[key] = None
 
+        return self._add_person(person_attributes)[0]
+
+    def _add_person(self, person_attributes):
+        """
+        Adds or merges a person with complete person_attributes (see add_person).
+
+        Returns:
+            (person_id, created): created is False if the person was merged
+            into an already existing node
+        """
         # check if person is already in self.G:
         person_id = self.get_id_from_attributes(person_attributes)
         # print(f"person_id: {person_id}")
+        created = person_id is None
 
         if person_id is not None:
+            node = self.G.nodes[person_id]
+            if self.person_contributions is not None and person_id not in self.person_contributions:
+                # a person from before the tracking started is never retracted
+                self.person_contributions[person_id] = {None: [dict(node.items())]}
+            old_key = (normalize_given_name(node["given_name"]), node["birth_year"])
             # Merge the new person_attributes with already existing ones ...
-            for key, val in self.G.nodes[person_id].items():
-                if val is None or (
-                    len(str(val)) < len(str(person_attributes.get(key))) 
-                    and person_attributes.get(key) is not None
-                    ):
-                    self.G.nodes[person_id][key] = person_attributes.get(key)
+            merge_attributes(node, person_attributes)
+            # Keep the indexes up to date with the merged attributes:
+            if node["family_id"] is not None:
+                self.family_id_index.setdefault(node["family_id"], person_id)
+            if (normalize_given_name(node["given_name"]), node["birth_year"]) != old_key:
+                for pre_node_id in self.G.predecessors(person_id):
+                    self._unindex_successor(pre_node_id, person_id, *old_key)
+                    self._index_successor(pre_node_id, person_id)
         else:
             # Person is not in self.G yet:
-            person_id = uuid.uuid4()
-            self.G.add_node(person_id, **person_attributes)
+            person_id = self._new_person(person_attributes)
             # Add person_id to self.family_id_index
             if person_attributes.get("family_id") is not None:
                 self.family_id_index[person_attributes["family_id"]] = person_id
-        
-        return person_id
+
+        if self.person_contributions is not None:
+            file = self._extraction_file
+            self.person_contributions.setdefault(person_id, {}).setdefault(file, []).append(dict(person_attributes))
+            if file is not None:
+                self.extraction_contributions.setdefault(file, (set(), set()))[0].add(person_id)
+        if self.search_index is not None:
+            self.search_index.update(person_id, self.G.nodes[person_id])
+        return person_id, created
     
+    def _new_person(self, person_attributes):
+        """
+        Adds a new person node and returns its id (a UUID).
+        """
+        person_id = new_person_id()
+        self.G.add_node(person_id, **person_attributes)
+        return person_id
+
+    def _restore_person(self, person_uuid, person_attributes):
+        """
+        Adds a person node with a given UUID (see restore) and returns its id.
+        """
+        self.G.add_node(person_uuid, **person_attributes)
+        return person_uuid
+
+    def person_uuid(self, person_id):
+        """
+        Returns the UUID identifying a person outside of the graph (its node id).
+        """
+        return person_id
+
+    def restore(self, persons, relations):
+        """
+        Adds persons and relations as saved by graph_io (without duplicate
+        detection) and rebuilds the indexes.
+
+        Parameters:
+            persons: iterable of (UUID, person_attributes)
+            relations: iterable of (UUID from, UUID to, relation_type)
+        """
+        person_ids = {}
+        for person_uuid, person_attributes in persons:
+            for key in ["family_id", "father_family_id", "husband_family_id", "family_name",
+                        "given_name", "birth_year", "death_year", "profession", "origin"]:
+                person_attributes.setdefault(key, None)
+            person_id = self._restore_person(person_uuid, person_attributes)
+            person_ids[person_uuid] = person_id
+            if self.search_index is not None:
+                self.search_index.update(person_id, person_attributes)
+            if person_attributes["family_id"] is not None:
+                self.family_id_index.setdefault(person_attributes["family_id"], person_id)
+        for uuid_from, uuid_to, relation_type in relations:
+            if relation_type not in RELATION_TYPES:
+                raise Exception(f"Invalid relation_type {relation_type}")
+            id_from, id_to = person_ids[uuid_from], person_ids[uuid_to]
+            self.G.add_edge(id_from, id_to, relation_type=relation_type)
+            self._index_successor(id_from, id_to)
+
+    def save(self, path, positions=None):
+        """
+        Saves the graph with typed attributes (see graph_io.py); the format
+        follows the extension: .gexf, .graphml or .parquet (a directory with
+        nodes.parquet and edges.parquet). positions (person_id -> (x, y), see
+        graph_layout.py) are written into GEXF files for Gephi.
+        """
+        import graph_io
+        graph_io.save(self, path, positions=positions)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a graph saved by save (or a GEXF written by networkx).
+        """
+        import graph_io
+        graph = cls()
+        graph_io.load(graph, path)
+        return graph
+
     def add_relation(self, id_from, id_to, relation_type):
         """
-        Creates a directed edge from id_from to id_to.
+        Creates a directed edge from id_from to id_to. A child (wife) gets the
+        family_id of the father (husband) as father_family_id
+        (husband_family_id), if he has one.
 
         Parameters:
             id_from: person_id of first node
             id_to: persion_id of second note
             relation_type: code specifying relation of first to second node (FATHER_CHILD, HUSBAND_WIFE, MOTHER_CHILD)
         """
-        if relation_type not in ['FATHER_CHILD', 'HUSBAND_WIFE', 'MOTHER_CHILD']:
+        if relation_type not in RELATION_TYPES:
             raise Exception('relation_type should be one of: FATHER_CHILD, HUSBAND_WIFE, MOTHER_CHILD')
+        if self.relation_contributions is not None:
+            self._record_relations([(id_from, id_to, relation_type)])
         self.G.add_edge(id_from, id_to, relation_type=relation_type)
+        self._relation_added(id_from, id_to, relation_type)
+
+    def _relation_added(self, id_from, id_to, relation_type):
+        """
+        Updates the indexes and the person attributes implied by a new edge.
+        """
+        self._index_successor(id_from, id_to)
+
+        # The child (wife) gets the family_id of the father (husband), if he has one:
+        family_id = self.G.nodes[id_from]["family_id"]
+        if relation_type == "FATHER_CHILD" and family_id is not None:
+            self.G.nodes[id_to]["father_family_id"] = family_id
+
+        if relation_type == "HUSBAND_WIFE" and family_id is not None:
+            self.G.nodes[id_to]["husband_family_id"] = family_id
+
+    def _person_updated(self, person_id):
+        """
+        Called after the attributes of a person were recomputed by retract_extraction.
+        """
+
+    def _person_removed(self, person_id):
+        """
+        Called after a person was removed by retract_extraction.
+        """
+
+    def _relation_removed(self, id_from, id_to):
+        """
+        Called after a relation was removed by retract_extraction.
+        """
+
+    def _index_successor(self, pre_node_id, node_id):
+        """
+        Adds node_id to the secondary indexes as successor of pre_node_id.
+        """
+        node = self.G.nodes[node_id]
+        name = normalize_given_name(node["given_name"])
+        for index, key in [
+            (self.successor_name_index, (pre_node_id, name)),
+            (self.successor_year_index, (pre_node_id, name, node["birth_year"])),
+        ]:
+            ids = index.setdefault(key, [])
+            if node_id not in ids:
+                ids.append(node_id)
+
+    def _unindex_successor(self, pre_node_id, node_id, name, birth_year):
+        """
+        Removes node_id as successor of pre_node_id from the secondary indexes,
+        given its (normalized) given_name and birth_year at the time it was indexed.
+        """
+        for index, key in [
+            (self.successor_name_index, (pre_node_id, name)),
+            (self.successor_year_index, (pre_node_id, name, birth_year)),
+        ]:
+            ids = index.get(key, [])
+            if node_id in ids:
+                ids.remove(node_id)
+            if not ids:
+                index.pop(key, None)
+
+    def merge_persons(self, keep_id, merged_id):
+        """
+        Merges the person merged_id into the person keep_id: the attributes are
+        merged as in add_person, the relations of merged_id are moved to keep_id
+        (relations between the two are dropped) and merged_id is removed.
+
+        Parameters:
+            keep_id: person_id of the node that is kept
+            merged_id: person_id of the node that is removed
+        """
+        if keep_id == merged_id:
+            raise Exception("Cannot merge a person with itself.")
+        if self.provenance is not None:
+            self.provenance.merge(self.person_uuid(keep_id), self.person_uuid(merged_id))
+        if self.person_contributions is not None:
+            self._move_contributions(keep_id, merged_id)
+        keep = self.G.nodes[keep_id]
+        merged = self.G.nodes[merged_id]
+        old_key = (normalize_given_name(keep["given_name"]), keep["birth_year"])
+        merged_key = (normalize_given_name(merged["given_name"]), merged["birth_year"])
+
+        in_edges = [
+            (pre_node_id, relation_type)
+            for pre_node_id, _, relation_type in self.G.in_edges(merged_id, data="relation_type")
+            if pre_node_id != keep_id
+        ]
+        out_edges = [
+            (node_id, relation_type)
+            for _, node_id, relation_type in self.G.out_edges(merged_id, data="relation_type")
+            if node_id != keep_id
+        ]
+        # remove merged_id from the indexes before removing the node:
+        for pre_node_id in self.G.predecessors(merged_id):
+            self._unindex_successor(pre_node_id, merged_id, *merged_key)
+        for node_id in self.G.successors(merged_id):
+            node = self.G.nodes[node_id]
+            self._unindex_successor(
+                merged_id, node_id, normalize_given_name(node["given_name"]), node["birth_year"])
+        for pre_node_id in self.G.predecessors(keep_id):
+            self._unindex_successor(pre_node_id, keep_id, *old_key)
+        merged_attributes = dict(merged.items())
+        self.G.remove_node(merged_id)
+
+        merge_attributes(keep, merged_attributes)
+        for family_id in {keep["family_id"], merged_attributes["family_id"]} - {None}:
+            if self.family_id_index.get(family_id, merged_id) == merged_id:
+                self.family_id_index[family_id] = keep_id
+
+        for pre_node_id, relation_type in in_edges:
+            if not self.G.has_edge(pre_node_id, keep_id):
+                self.G.add_edge(pre_node_id, keep_id, relation_type=relation_type)
+        for node_id, relation_type in out_edges:
+            if not self.G.has_edge(keep_id, node_id):
+                self.G.add_edge(keep_id, node_id, relation_type=relation_type)
+        for pre_node_id in self.G.predecessors(keep_id):
+            self._index_successor(pre_node_id, keep_id)
+        for node_id in self.G.successors(keep_id):
+            self._index_successor(keep_id, node_id)
+        if self.search_index is not None:
+            self.search_index.remove(merged_id)
+            self.search_index.update(keep_id, keep)
+
+    def _move_contributions(self, keep_id, merged_id):
+        """
+        Moves the contributions of merged_id and its relations to keep_id
+        (before merge_persons moves the relations themselves).
+        """
+        for person_id in [keep_id, merged_id]:
+            if person_id not in self.person_contributions:
+                self.person_contributions[person_id] = {None: [dict(self.G.nodes[person_id].items())]}
+        keep = self.person_contributions[keep_id]
+        for file, contributions in self.person_contributions.pop(merged_id).items():
+            keep.setdefault(file, []).extend(contributions)
+            if file is not None:
+                persons = self.extraction_contributions[file][0]
+                persons.discard(merged_id)
+                persons.add(keep_id)
+
+        edges = [(edge, (edge[0], keep_id)) for edge in self.G.in_edges(merged_id)]
+        edges += [(edge, (keep_id, edge[1])) for edge in self.G.out_edges(merged_id)]
+        for edge, moved_edge in edges:
+            contributors = self.relation_contributions.pop(edge, {None: None})
+            if moved_edge[0] == moved_edge[1]:
+                # relations between the two persons are dropped
+                moved_edge = None
+            elif moved_edge not in self.relation_contributions:
+                self.relation_contributions[moved_edge] = {None: None} if self.G.has_edge(*moved_edge) else {}
+            for file in contributors:
+                if file is not None:
+                    relations = self.extraction_contributions[file][1]
+                    relations.discard(edge)
+                    if moved_edge is not None:
+                        relations.add(moved_edge)
+            if moved_edge is not None:
+                self.relation_contributions[moved_edge].update(contributors)
+
+    def _record_relations(self, edges):
+        """
+        Records the extraction file being merged as contributor of edges
+        (before the edges are added).
+        """
+        file = self._extraction_file
+        for id_from, id_to, relation_type in edges:
+            contributors = self.relation_contributions.get((id_from, id_to))
+            if contributors is None:
+                # a relation from before the tracking started is never retracted
+                contributors = {None: None} if self.G.has_edge(id_from, id_to) else {}
+                self.relation_contributions[id_from, id_to] = contributors
+            contributors.pop(file, None)
+            contributors[file] = relation_type
+            if file is not None:
+                self.extraction_contributions.setdefault(file, (set(), set()))[1].add((id_from, id_to))
+
+    def track_contributions(self):
+        """
+        Starts tracking which extraction file contributed which attribute
+        values, persons and relations, so that the contributions of a file
+        can be retracted again (see replace_extraction).
+
+        Persons and relations already in the graph (and those added with
+        add_person and add_relation) are kept as they are.
+        """
+        if self.person_contributions is None:
+            self.person_contributions = {}
+            self.relation_contributions = {}
+            self.extraction_contributions = {}
+
+    def _family_ids(self, person_id):
+        """
+        Returns the family ids of a person and of all its contributions.
+        """
+        family_ids = {
+            contribution.get("family_id")
+            for contributions in self.person_contributions.get(person_id, {}).values()
+            for contribution in contributions
+        }
+        family_ids.add(self.G.nodes[person_id]["family_id"])
+        family_ids.discard(None)
+        return family_ids
+
+    def retract_extraction(self, file):
+        """
+        Undoes what an extraction file contributed: its relations are removed
+        unless another file contributed them too, persons only it contributed
+        are removed, and the attributes of the other persons it contributed to
+        are merged again from the remaining contributions (as in add_person;
+        ties go to the contribution merged first). The family_id index and
+        the secondary indexes are updated for these persons only, so the cost
+        depends on the size of the extraction, not of the graph.
+
+        Parameters:
+            file: the extraction file (as in the reports of load_extractions)
+
+        Returns:
+            {"persons_removed": 1, "persons_updated": 4, "relations_removed": 3}
+        """
+        if self.person_contributions is None:
+            raise Exception("Contributions are not tracked (see track_contributions).")
+        report = {"persons_removed": 0, "persons_updated": 0, "relations_removed": 0}
+        persons, relations = self.extraction_contributions.pop(file, (set(), set()))
+        if self.provenance is not None:
+            self.provenance.remove_mentions(file)
+
+        affected = set(persons)
+        for id_from, id_to in relations:
+            contributors = self.relation_contributions[id_from, id_to]
+            contributors.pop(file, None)
+            affected.update((id_from, id_to))
+            if contributors:
+                relation_type = list(contributors.values())[-1]
+                if relation_type is not None:
+                    self.G.add_edge(id_from, id_to, relation_type=relation_type)
+                continue
+            del self.relation_contributions[id_from, id_to]
+            node = self.G.nodes[id_to]
+            self._unindex_successor(id_from, id_to, normalize_given_name(node["given_name"]), node["birth_year"])
+            self.G.remove_edge(id_from, id_to)
+            self._relation_removed(id_from, id_to)
+            report["relations_removed"] += 1
+
+        old_family_ids = {}
+        for person_id in persons:
+            old_family_ids[person_id] = self._family_ids(person_id)
+            self.person_contributions[person_id].pop(file, None)
+
+        # merge the attributes again from the remaining contributions
+        updated = {}
+        for person_id in affected:
+            contributions = self.person_contributions.get(person_id)
+            if contributions is None:
+                continue
+            if not contributions:
+                self._remove_person(person_id, old_family_ids[person_id])
+                report["persons_removed"] += 1
+                continue
+            updated[person_id] = self._contributed_attributes(person_id)
+
+        # children (wives) of persons whose family_id changes get the new one
+        for person_id in list(updated):
+            if updated[person_id]["family_id"] != self.G.nodes[person_id]["family_id"]:
+                for node_id in self.G.successors(person_id):
+                    if node_id not in updated and node_id in self.person_contributions:
+                        updated[node_id] = self._contributed_attributes(node_id)
 
-        if relation_type == "FATHER_CHILD":
-            self.G.nodes[id_to]["father_family_id"] = self.G.nodes[id_from]["father_family_id"]
+        old_keys = {}
+        for person_id, attributes in updated.items():
+            node = self.G.nodes[person_id]
+            old_keys[person_id] = (normalize_given_name(node["given_name"]), node["birth_year"])
+            for key, value in attributes.items():
+                node[key] = value
+        for person_id in updated:
+            for pre_node_id, _, relation_type in self.G.in_edges(person_id, data="relation_type"):
+                family_id = self.G.nodes[pre_node_id]["family_id"]
+                if relation_type == "FATHER_CHILD" and family_id is not None:
+                    self.G.nodes[person_id]["father_family_id"] = family_id
+                if relation_type == "HUSBAND_WIFE" and family_id is not None:
+                    self.G.nodes[person_id]["husband_family_id"] = family_id
+        for person_id in updated:
+            node = self.G.nodes[person_id]
+            if (normalize_given_name(node["given_name"]), node["birth_year"]) != old_keys[person_id]:
+                for pre_node_id in self.G.predecessors(person_id):
+                    self._unindex_successor(pre_node_id, person_id, *old_keys[person_id])
+                    self._index_successor(pre_node_id, person_id)
+            family_ids = self._family_ids(person_id)
+            for family_id in old_family_ids.get(person_id, set()) - family_ids:
+                if self.family_id_index.get(family_id) == person_id:
+                    del self.family_id_index[family_id]
+            for family_id in family_ids:
+                self.family_id_index.setdefault(family_id, person_id)
+            if self.search_index is not None:
+                self.search_index.update(person_id, self.G.nodes[person_id])
+            self._person_updated(person_id)
+        report["persons_updated"] = len(updated)
+        return report
 
-        if relation_type == "HUSBAND_WIFE":
-            self.G.nodes[id_to]["husband_family_id"] = self.G.nodes[id_from]["husband_family_id"]
+    def _contributed_attributes(self, person_id):
+        """
+        Returns the attributes of a person merged again from its contributions.
+        """
+        attributes = dict.fromkeys(self.G.nodes[person_id].keys())
+        for contributions in self.person_contributions[person_id].values():
+            for person_attributes in contributions:
+                merge_attributes(attributes, person_attributes)
+        return attributes
+
+    def _remove_person(self, person_id, family_ids):
+        """
+        Removes a person without contributions left (see retract_extraction).
+        """
+        node = self.G.nodes[person_id]
+        key = (normalize_given_name(node["given_name"]), node["birth_year"])
+        for pre_node_id in list(self.G.predecessors(person_id)):
+            self._unindex_successor(pre_node_id, person_id, *key)
+            self.relation_contributions.pop((pre_node_id, person_id), None)
+        for node_id in list(self.G.successors(person_id)):
+            successor = self.G.nodes[node_id]
+            self._unindex_successor(
+                person_id, node_id, normalize_given_name(successor["given_name"]), successor["birth_year"])
+            self.relation_contributions.pop((person_id, node_id), None)
+        for family_id in family_ids:
+            if self.family_id_index.get(family_id) == person_id:
+                del self.family_id_index[family_id]
+        del self.person_contributions[person_id]
+        self.G.remove_node(person_id)
+        if self.search_index is not None:
+            self.search_index.remove(person_id)
+        self._person_removed(person_id)
+
+    def replace_extraction(self, source):
+        """
+        Replaces the contributions of an extraction file by its new content:
+        retract_extraction and then the extraction is merged as in
+        load_extractions (without rebuilding the rest of the graph).
+
+        Parameters:
+            source: path of the extraction JSON, (name, parsed dict) tuple or
+                an extraction already parsed with parse_extraction
+
+        Returns:
+            the report of the file (see load_extractions) with the report of
+            retract_extraction under "retracted"
+        """
+        extraction = source if isinstance(source, dict) else parse_extraction(source)
+        retracted = self.retract_extraction(extraction["file"])
+        report = self.add_extraction(extraction)
+        report["retracted"] = retracted
+        return report
+
+    def check_indexes(self):
+        """
+        Verifies family_id_index and the secondary indexes against the graph.
+
+        Returns:
+            list of inconsistencies found (empty if the indexes are consistent)
+        """
+        problems = []
+        for family_id, person_id in self.family_id_index.items():
+            if person_id not in self.G:
+                problems.append(f"family_id_index: {family_id} points to missing node {person_id}")
+        for person_id, family_id in self.G.nodes(data="family_id"):
+            if family_id is not None and family_id not in self.family_id_index:
+                problems.append(f"family_id_index: {family_id} of node {person_id} missing")
+
+        expected_names = {}
+        expected_years = {}
+        for pre_node_id, node_id in self.G.edges():
+            node = self.G.nodes[node_id]
+            name = normalize_given_name(node["given_name"])
+            expected_names.setdefault((pre_node_id, name), set()).add(node_id)
+            expected_years.setdefault((pre_node_id, name, node["birth_year"]), set()).add(node_id)
+        for index_name, index, expected in [
+            ("successor_name_index", self.successor_name_index, expected_names),
+            ("successor_year_index", self.successor_year_index, expected_years),
+        ]:
+            actual = {key: set(ids) for key, ids in index.items()}
+            for key in set(actual) | set(expected):
+                if actual.get(key) != expected.get(key):
+                    problems.append(
+                        f"{index_name}: {key} is {actual.get(key)}, expected {expected.get(key)}")
+        return problems
+
+    def load_extractions(self, path_or_iterable, workers=None):
+        """
+        Adds all persons and relations of many extraction JSONs (as written
+        to data/bashoutput) to the graph.
+
+        The files are read and validated in parallel (see extraction_schema.py);
+        invalid persons and relations are dropped. They are then merged into the
+        graph file by file in the given order, since duplicate detection depends
+        on the persons already in the graph. The relations of a file are added
+        in one batch.
+
+        Parameters:
+            path_or_iterable: directory (all *.json files in it, sorted by name),
+                single file, or iterable of paths, parsed dicts or
+                (name, parsed dict) tuples
+            workers: number of processes to parse with (None: number of CPUs,
+                1: parse in this process)
+
+        Returns:
+            list with one report per file:
+            {
+                "file": "data/bashoutput/chunkx1.json",
+                "created": 17,            # persons added as new nodes
+                "merged": 1,              # persons merged into existing nodes
+                "dropped_persons": 0,     # invalid persons
+                "relations": 20,          # relations added
+                "dropped_relations": 0,   # invalid relations
+                "errors": []              # validation messages
+            }
+        """
+        sources = extraction_sources(path_or_iterable)
+        if workers == 1 or len(sources) < 2:
+            parsed = map(parse_extraction, sources)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(workers)
+            parsed = executor.map(parse_extraction, sources, chunksize=64)
+
+        reports = []
+        try:
+            for extraction in parsed:
+                reports.append(self.add_extraction(extraction))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return reports
+
+    def add_extraction(self, extraction):
+        """
+        Merges one parsed extraction (see parse_extraction) into the graph,
+        as load_extractions does for every file.
+
+        Returns:
+            the report of the extraction (see load_extractions)
+        """
+        report = {
+            "file": extraction["file"],
+            "created": 0,
+            "merged": 0,
+            "dropped_persons": extraction["dropped_persons"],
+            "relations": 0,
+            "dropped_relations": extraction["dropped_relations"],
+            "errors": extraction["errors"],
+        }
+
+        self._extraction_file = extraction["file"]
+        try:
+            self._merge_extraction(extraction, report)
+        finally:
+            self._extraction_file = None
+        return report
+
+    def _merge_extraction(self, extraction, report):
+        node_ids = {}
+        for person in extraction["persons"]:
+            attributes = dict(person)
+            for key in ["father_family_id", "husband_family_id", "birth_year", "death_year", "profession", "origin"]:
+                attributes.setdefault(key, None)
+            person_id, created = self._add_person(attributes)
+            report["created" if created else "merged"] += 1
+            node_ids[person["person_number"]] = person_id
+        if self.provenance is not None:
+            self.provenance.add_mentions(extraction["file"], [
+                (person_number, self.person_uuid(person_id)) for person_number, person_id in node_ids.items()
+            ])
+
+        edges = [
+            (node_ids[relation["person_number_1"]], node_ids[relation["person_number_2"]], relation["relation_type"])
+            for relation in extraction["relations"]
+        ]
+        if self.relation_contributions is not None:
+            self._record_relations(edges)
+        self.G.add_edges_from(
+            (id_from, id_to, {"relation_type": relation_type})
+            for id_from, id_to, relation_type in edges
+        )
+        for id_from, id_to, relation_type in edges:
+            self._relation_added(id_from, id_to, relation_type)
+        report["relations"] = len(edges)
 
     def get_id_from_attributes(self, person_attributes):
         """
@@ -96,7 +794,8 @@ class FamilyGraph:
         It finds already existing persons through matching the family_id of person_attributes
         with the nodes in the graph.
         Otherwise it also looks if father_family_id of person_attributes is already in the graph
-        and matches the name and birth_year of its children
+        and matches the name and birth_year of its children (through the secondary indexes,
+        so the cost doesn't grow with the number of children)
         
         Parameters:
             person_attributes: person attribute containing (at least):
@@ -135,20 +834,14 @@ class FamilyGraph:
 
                 if pre_node_id is not None:
                     # Father is already in self.G
-                    # get all children:
-                    children_ids = list(self.G.successors(pre_node_id))
-
-                    # Filter children with same names only:
-                    children_ids = [
-                        id for id in children_ids 
-                        if self.G.nodes[id]['given_name'] == person_attributes['given_name']
-                    ]
+                    # get all children with the same name:
+                    name = normalize_given_name(person_attributes['given_name'])
+                    children_ids = self.successor_name_index.get((pre_node_id, name), [])
                     if len(children_ids) > 1:
                         # If multiple children with same name, filter for same birth_year only:
-                        children_ids = [
-                            id for id in children_ids 
-                            if self.G.nodes[id]['birth_year'] == person_attributes['birth_year']
-                        ]
+                        children_ids = self.successor_year_index.get(
+                            (pre_node_id, name, person_attributes['birth_year']), []
+                        )
                     if len(children_ids) > 0:
                         # print(f"{person_attributes['given_name']} is already in self.G!")
                         return children_ids[0]
@@ -156,21 +849,47 @@ class FamilyGraph:
         # Person doesn't exist yet in self.G:
         return None
 
-    def visualize(self):
+    def to_networkx(self):
+        """
+        Returns the graph as networkx DiGraph with UUID nodes (self.G itself).
+        """
+        return self.G
+
+    def visualize(self, layout="spring", path=None, person_ids=None):
         """
         Visualizes the directed graph using matplotlib and networkx.
+
+        Parameters:
+            layout: "spring" (nx.spring_layout, only for small graphs), or the
+                layered "generation" or "birth_year" layout (see graph_layout.py)
+            path: image file to render to without a display (layered layouts)
+            person_ids: persons to draw, e.g. graph_layout.family_persons(graph, "Billeter")
+                (layered layouts, default: all)
         """
+        # pyplot takes most of the import time of this module
+        import matplotlib.pyplot as plt
+
+        if layout != "spring":
+            import graph_layout
+            if path is not None:
+                graph_layout.render(self, path, person_ids, by=layout)
+                return
+            plt.figure(figsize=(12, 8))
+            graph_layout.draw(plt.gca(), self, graph_layout.layered_layout(self, layout, person_ids))
+            plt.show()
+            return
+        G = self.to_networkx()
         plt.figure(figsize=(8, 6))
-        pos = nx.spring_layout(self.G)  # Positions for all nodes
-        label1 = nx.get_node_attributes(self.G, 'given_name')
-        label2 = nx.get_node_attributes(self.G, 'family_name')
+        pos = nx.spring_layout(G)  # Positions for all nodes
+        label1 = nx.get_node_attributes(G, 'given_name')
+        label2 = nx.get_node_attributes(G, 'family_name')
         labels = {
             key: label1.get(key, '') + ' ' + label2.get(key, '')
             for key in set(label1) | set(label2)
         }
-        edge_labels = nx.get_edge_attributes(self.G, 'relation_type')
-        nx.draw(self.G, pos, with_labels=True, labels=labels, node_color="lightblue", node_size=100, font_size=7, edge_color='gray', arrows=True)
-        nx.draw_networkx_edge_labels(self.G, pos, edge_labels=edge_labels, font_size=7)
+        edge_labels = nx.get_edge_attributes(G, 'relation_type')
+        nx.draw(G, pos, with_labels=True, labels=labels, node_color="lightblue", node_size=100, font_size=7, edge_color='gray', arrows=True)
+        nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=7)
         plt.title("Directed Graph")
         plt.show()
 
@@ -0,0 +1,456 @@
+"""
+Saving and loading FamilyGraphs with typed attributes.
+
+* GEXF (for Gephi) and GraphML are written in a stream, one node or edge at
+  a time, instead of building the XML tree in memory like nx.write_gexf.
+  Years are integers and missing values are left out (instead of "None").
+* Parquet writes two columnar tables, nodes.parquet and edges.parquet, into
+  a directory, for fast reloading (needs the optional dependency pyarrow).
+
+The attributes the notebooks added are computed during the export:
+
+    node_label    family name and birth year ("Billeter 1613")
+    node_weight   see kinship.KinshipIndex.node_weights
+    weight        of edges: 1 for FATHER_CHILD and MOTHER_CHILD, 0 for HUSBAND_WIFE
+
+They are dropped again on loading. GEXF files written by networkx with all
+attributes converted to strings (data/graph_data/*.gexf) can be loaded as well.
+
+    graph.save("data/graph_data/graph_parsed.gexf")
+    graph = FamilyGraph.load("data/graph_data/graph_parsed.gexf")
+"""
+
+import os
+import uuid
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+from xml.etree.ElementTree import iterparse
+
+from kinship import KinshipIndex
+
+# types of the person attributes
+PERSON_ATTRIBUTE_TYPES = {
+    "person_number": int,
+    "family_id": str,
+    "father_family_id": str,
+    "husband_family_id": str,
+    "family_name": str,
+    "given_name": str,
+    "birth_year": int,
+    "death_year": int,
+    "profession": str,
+    "origin": str,
+}
+DERIVED_NODE_ATTRIBUTE_TYPES = {"node_label": str, "node_weight": int}
+EDGE_ATTRIBUTE_TYPES = {"relation_type": str}
+EDGE_WEIGHTS = {"FATHER_CHILD": 1, "MOTHER_CHILD": 1, "HUSBAND_WIFE": 0}
+
+GEXF_TYPES = {int: "integer", float: "double", bool: "boolean", str: "string"}
+GRAPHML_TYPES = {int: "int", float: "double", bool: "boolean", str: "string"}
+TYPES_BY_NAME = {
+    "integer": int, "int": int, "long": int,
+    "double": float, "float": float,
+    "boolean": bool,
+    "string": str,
+}
+
+# rows per record batch of the Parquet tables
+BATCH_ROWS = 65536
+
+
+def node_label(attributes):
+    """
+    Returns the label the notebooks gave a person: family name and birth year.
+    """
+    parts = [attributes.get("family_name"), attributes.get("birth_year")]
+    return " ".join(str(part) for part in parts if part is not None)
+
+
+def value_type(value):
+    for type_ in (bool, int, float):
+        if isinstance(value, type_):
+            return type_
+    return str
+
+
+def node_attribute_types(graph, derived=True):
+    """
+    Returns the types of all node attributes: the person attributes, the
+    derived ones and those of any other attributes found in the graph (the
+    type of their values, or str if they are mixed).
+    """
+    types = dict(PERSON_ATTRIBUTE_TYPES)
+    extra = {}
+    for _, attributes in graph.G.nodes(data=True):
+        for key, value in attributes.items():
+            if key in types or value is None:
+                continue
+            type_ = value_type(value)
+            extra[key] = type_ if extra.get(key, type_) is type_ else str
+    types.update(extra)
+    if derived:
+        types.update(DERIVED_NODE_ATTRIBUTE_TYPES)
+    return types
+
+
+def typed_value(value, type_):
+    """
+    Returns value as type_, or None if it cannot be converted.
+    """
+    if value is None or isinstance(value, type_) and not (type_ is int and isinstance(value, bool)):
+        return value
+    try:
+        if type_ is bool:
+            return str(value).lower() in ("true", "1")
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_nodes(graph, derived=True):
+    """
+    Yields (UUID string, attributes) of all persons, with the derived
+    attributes added if derived is True.
+    """
+    weights = KinshipIndex(graph).node_weights() if derived else None
+    for person_id, attributes in graph.G.nodes(data=True):
+        attributes = dict(attributes)
+        if derived:
+            attributes["node_label"] = node_label(attributes)
+            attributes["node_weight"] = weights[person_id]
+        yield str(graph.person_uuid(person_id)), attributes
+
+
+def iter_edges(graph):
+    """
+    Yields (UUID string from, UUID string to, relation_type) of all relations.
+    """
+    uuids = {}
+
+    def person_uuid(person_id):
+        if person_id not in uuids:
+            uuids[person_id] = str(graph.person_uuid(person_id))
+        return uuids[person_id]
+
+    for id_from, id_to, data in graph.G.edges(data=True):
+        yield person_uuid(id_from), person_uuid(id_to), data["relation_type"]
+
+
+def xml_values(attributes, keys, types):
+    """
+    Yields (key id, value string) of the non-null attributes.
+    """
+    for key_id, key in keys:
+        value = typed_value(attributes.get(key), types[key])
+        if value is not None:
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            yield key_id, str(value)
+
+
+def write_gexf(graph, path, derived=True, positions=None):
+    """
+    Writes the graph as GEXF 1.2 with typed attributes, streaming it to disk
+    (see module docstring).
+
+    Parameters:
+        positions: dict person_id -> (x, y) (see graph_layout.layered_layout),
+            written as viz:position so Gephi opens the graph laid out
+    """
+    if positions is not None:
+        positions = {str(graph.person_uuid(person_id)): xy for person_id, xy in positions.items()}
+    node_types = node_attribute_types(graph, derived)
+    node_keys = list(enumerate(node_types))
+    edge_keys = [(f"e{i}", key) for i, key in enumerate(EDGE_ATTRIBUTE_TYPES)]
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<gexf xmlns="http://www.gexf.net/1.2draft" xmlns:viz="http://www.gexf.net/1.2draft/viz" version="1.2">\n')
+        file.write('  <graph defaultedgetype="directed" mode="static">\n')
+        file.write('    <attributes class="node" mode="static">\n')
+        for key_id, key in node_keys:
+            file.write(f'      <attribute id="{key_id}" title={quoteattr(key)} type="{GEXF_TYPES[node_types[key]]}" />\n')
+        file.write('    </attributes>\n')
+        file.write('    <attributes class="edge" mode="static">\n')
+        for key_id, key in edge_keys:
+            file.write(f'      <attribute id="{key_id}" title={quoteattr(key)} type="{GEXF_TYPES[EDGE_ATTRIBUTE_TYPES[key]]}" />\n')
+        file.write('    </attributes>\n')
+
+        file.write('    <nodes>\n')
+        for node_id, attributes in iter_nodes(graph, derived):
+            label = attributes.get("node_label") or node_id
+            values = "".join(
+                f'<attvalue for="{key_id}" value={quoteattr(value)} />'
+                for key_id, value in xml_values(attributes, node_keys, node_types)
+            )
+            viz = ""
+            if positions is not None and node_id in positions:
+                x, y = positions[node_id]
+                viz = f'<viz:position x="{x:g}" y="{y:g}" z="0" />'
+            file.write(f'      <node id="{node_id}" label={quoteattr(label)}><attvalues>{values}</attvalues>{viz}</node>\n')
+        file.write('    </nodes>\n')
+
+        file.write('    <edges>\n')
+        for i, (source, target, relation_type) in enumerate(iter_edges(graph)):
+            weight = f' weight="{EDGE_WEIGHTS[relation_type]}"' if derived else ""
+            values = "".join(
+                f'<attvalue for="{key_id}" value={quoteattr(value)} />'
+                for key_id, value in xml_values({"relation_type": relation_type}, edge_keys, EDGE_ATTRIBUTE_TYPES)
+            )
+            file.write(f'      <edge id="{i}" source="{source}" target="{target}"{weight}><attvalues>{values}</attvalues></edge>\n')
+        file.write('    </edges>\n')
+        file.write('  </graph>\n')
+        file.write('</gexf>\n')
+
+
+def write_graphml(graph, path, derived=True):
+    """
+    Writes the graph as GraphML with typed attributes, streaming it to disk
+    (see module docstring).
+    """
+    node_types = node_attribute_types(graph, derived)
+    node_keys = [(f"n{i}", key) for i, key in enumerate(node_types)]
+    edge_types = dict(EDGE_ATTRIBUTE_TYPES, **({"weight": int} if derived else {}))
+    edge_keys = [(f"e{i}", key) for i, key in enumerate(edge_types)]
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for key_id, key in node_keys:
+            file.write(f'  <key id="{key_id}" for="node" attr.name={quoteattr(key)} attr.type="{GRAPHML_TYPES[node_types[key]]}" />\n')
+        for key_id, key in edge_keys:
+            file.write(f'  <key id="{key_id}" for="edge" attr.name={quoteattr(key)} attr.type="{GRAPHML_TYPES[edge_types[key]]}" />\n')
+        file.write('  <graph edgedefault="directed">\n')
+        for node_id, attributes in iter_nodes(graph, derived):
+            values = "".join(
+                f'<data key="{key_id}">{escape(value)}</data>'
+                for key_id, value in xml_values(attributes, node_keys, node_types)
+            )
+            file.write(f'    <node id="{node_id}">{values}</node>\n')
+        for source, target, relation_type in iter_edges(graph):
+            attributes = {"relation_type": relation_type, "weight": EDGE_WEIGHTS[relation_type]}
+            values = "".join(
+                f'<data key="{key_id}">{escape(value)}</data>'
+                for key_id, value in xml_values(attributes, edge_keys, edge_types)
+            )
+            file.write(f'    <edge source="{source}" target="{target}">{values}</edge>\n')
+        file.write('  </graph>\n')
+        file.write('</graphml>\n')
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_value(text, key, file_type):
+    """
+    Converts an attribute value read from XML to the type of the attribute
+    (the person attribute type, else the one declared in the file). "None"
+    strings as written by str(None) become None.
+    """
+    if text is None or (file_type is str and text == "None"):
+        return None
+    return typed_value(text, PERSON_ATTRIBUTE_TYPES.get(key, file_type))
+
+
+def iter_gexf(path):
+    """
+    Yields ("node", node id, attributes) and ("edge", source, target,
+    attributes) records of a GEXF file, parsing it incrementally.
+    """
+    # attribute ids are only unique per class (Gephi numbers both from 0)
+    keys = {}
+    attribute_class = None
+    for event, element in iterparse(path, events=("start", "end")):
+        tag = local_name(element.tag)
+        if event == "start":
+            if tag == "attributes":
+                attribute_class = element.get("class")
+            continue
+        if tag == "attribute":
+            keys[attribute_class, element.get("id")] = (
+                element.get("title"), TYPES_BY_NAME.get(element.get("type"), str))
+        elif tag in ("node", "edge"):
+            attributes = {}
+            for child in element.iter():
+                if local_name(child.tag) == "attvalue":
+                    key, file_type = keys[tag, child.get("for")]
+                    attributes[key] = parse_value(child.get("value"), key, file_type)
+            if tag == "node":
+                yield "node", element.get("id"), attributes
+            else:
+                yield "edge", element.get("source"), element.get("target"), attributes
+            element.clear()
+
+
+def iter_graphml(path):
+    """
+    Yields the node and edge records of a GraphML file (see iter_gexf).
+    """
+    keys = {}
+    for _, element in iterparse(path, events=("end",)):
+        tag = local_name(element.tag)
+        if tag == "key":
+            keys[element.get("id")] = (element.get("attr.name"), TYPES_BY_NAME.get(element.get("attr.type"), str))
+        elif tag in ("node", "edge"):
+            attributes = {}
+            for child in element:
+                if local_name(child.tag) == "data":
+                    key, file_type = keys[child.get("key")]
+                    attributes[key] = parse_value(child.text, key, file_type)
+            if tag == "node":
+                yield "node", element.get("id"), attributes
+            else:
+                yield "edge", element.get("source"), element.get("target"), attributes
+            element.clear()
+
+
+def parse_uuid(node_id):
+    """
+    Returns the UUID of a node id; ids that are no UUIDs are mapped to a
+    name based UUID.
+    """
+    try:
+        return uuid.UUID(node_id)
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_URL, node_id)
+
+
+def person_records(records):
+    """
+    Splits the node and edge records of iter_gexf or iter_graphml (nodes
+    first) into the persons and relations for FamilyGraph.restore, without
+    the derived attributes.
+    """
+    first_edge = []
+
+    def persons():
+        for record in records:
+            if record[0] == "edge":
+                first_edge.append(record)
+                return
+            _, node_id, attributes = record
+            for key in DERIVED_NODE_ATTRIBUTE_TYPES:
+                attributes.pop(key, None)
+            yield parse_uuid(node_id), attributes
+
+    def relations():
+        for _, source, target, attributes in chain(first_edge, records):
+            yield parse_uuid(source), parse_uuid(target), attributes["relation_type"]
+
+    return persons(), relations()
+
+
+def pyarrow_modules():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+def batches(rows, size=BATCH_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_parquet(graph, path, derived=True):
+    """
+    Writes the graph into the directory path as the tables nodes.parquet
+    (column id and one column per attribute) and edges.parquet (columns
+    source, target, relation_type and weight), in record batches.
+    """
+    pa, pq = pyarrow_modules()
+    arrow_types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), str: pa.string()}
+    os.makedirs(path, exist_ok=True)
+
+    node_types = node_attribute_types(graph, derived)
+    node_schema = pa.schema(
+        [("id", pa.string())] + [(key, arrow_types[type_]) for key, type_ in node_types.items()]
+    )
+    with pq.ParquetWriter(os.path.join(path, "nodes.parquet"), node_schema) as writer:
+        for batch in batches(iter_nodes(graph, derived)):
+            columns = {"id": [node_id for node_id, _ in batch]}
+            for key, type_ in node_types.items():
+                columns[key] = [typed_value(attributes.get(key), type_) for _, attributes in batch]
+            writer.write_table(pa.table(columns, schema=node_schema))
+
+    edge_schema = pa.schema(
+        [("source", pa.string()), ("target", pa.string()), ("relation_type", pa.string())]
+        + ([("weight", pa.int8())] if derived else [])
+    )
+    with pq.ParquetWriter(os.path.join(path, "edges.parquet"), edge_schema) as writer:
+        for batch in batches(iter_edges(graph)):
+            source, target, relation_type = (list(column) for column in zip(*batch))
+            columns = {"source": source, "target": target, "relation_type": relation_type}
+            if derived:
+                columns["weight"] = [EDGE_WEIGHTS[relation] for relation in relation_type]
+            writer.write_table(pa.table(columns, schema=edge_schema))
+
+
+def read_parquet(path):
+    """
+    Returns the persons and relations (see person_records) of a directory
+    written by write_parquet, read in record batches.
+    """
+    _, pq = pyarrow_modules()
+
+    def persons():
+        for batch in pq.ParquetFile(os.path.join(path, "nodes.parquet")).iter_batches(BATCH_ROWS):
+            columns = batch.to_pydict()
+            ids = columns.pop("id")
+            for key in DERIVED_NODE_ATTRIBUTE_TYPES:
+                columns.pop(key, None)
+            for i, node_id in enumerate(ids):
+                yield uuid.UUID(node_id), {key: values[i] for key, values in columns.items()}
+
+    def relations():
+        columns = ["source", "target", "relation_type"]
+        for batch in pq.ParquetFile(os.path.join(path, "edges.parquet")).iter_batches(BATCH_ROWS, columns=columns):
+            batch = batch.to_pydict()
+            for source, target, relation_type in zip(batch["source"], batch["target"], batch["relation_type"]):
+                yield uuid.UUID(source), uuid.UUID(target), relation_type
+
+    return persons(), relations()
+
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".gexf", ".graphml", ".parquet"):
+        raise ValueError(f"Unknown graph format {extension} (use .gexf, .graphml or .parquet)")
+    return extension[1:]
+
+
+def save(graph, path, derived=True, positions=None):
+    """
+    Saves the graph in the format given by the extension of path (positions
+    only to GEXF, see write_gexf).
+    """
+    format_ = file_format(path)
+    if format_ == "gexf":
+        write_gexf(graph, path, derived, positions)
+    elif positions is not None:
+        raise ValueError("Positions can only be saved to GEXF")
+    else:
+        writers = {"graphml": write_graphml, "parquet": write_parquet}
+        writers[format_](graph, path, derived)
+
+
+def load(graph, path):
+    """
+    Adds the persons and relations of a saved graph to an (empty) FamilyGraph.
+    """
+    format_ = file_format(path)
+    if format_ == "parquet":
+        persons, relations = read_parquet(path)
+    else:
+        persons, relations = person_records(iter_gexf(path) if format_ == "gexf" else iter_graphml(path))
+    graph.restore(persons, relations)
+    return graph
@@ -0,0 +1,304 @@
+"""
+Layered (generational) layout of a FamilyGraph, as a scalable alternative to
+nx.spring_layout (quadratic per iteration, and blind to the genealogy).
+
+Persons are put into rows by generation (see kinship.KinshipIndex.generation;
+persons without known parents move to the row of their spouse) or by birth
+year (rounded to year_step, missing years estimated from the generation), and
+ordered within the rows by a few barycenter sweeps (each person moves towards
+the mean position of its parents, then of its children) to reduce crossings.
+Every sweep is linear in the number of relations, plus sorting the rows.
+
+    positions = layered_layout(graph)
+    graph.save("graph.gexf", positions=positions)       # Gephi opens it laid out
+    render(graph, "billeter.png", family_persons(graph, "Billeter"))
+"""
+
+from kinship import KinshipIndex
+from entity_resolution import normalize_family_name
+
+DEFAULT_SWEEPS = 4
+DEFAULT_YEAR_STEP = 10
+# assumed years between generations, for persons without birth year
+GENERATION_YEARS = 30
+# labels are only drawn for graphs up to this size
+MAX_LABELS = 300
+EDGE_COLORS = {"FATHER_CHILD": "gray", "MOTHER_CHILD": "gray", "HUSBAND_WIFE": "indianred"}
+
+
+def subgraph_edges(G, person_ids):
+    """
+    Returns the (id_from, id_to, relation_type) relations among person_ids.
+    """
+    edges = []
+    for person_id in person_ids:
+        for _, node_id, relation_type in G.out_edges(person_id, data="relation_type"):
+            if node_id in person_ids:
+                edges.append((person_id, node_id, relation_type))
+    return edges
+
+
+def layout_index(graph, person_ids=None):
+    """
+    Returns a KinshipIndex of the graph, or of the persons person_ids only.
+    """
+    if person_ids is None:
+        return KinshipIndex(graph)
+    import networkx as nx
+    person_ids = set(person_ids)
+    G = nx.DiGraph()
+    G.add_nodes_from(person_ids)
+    G.add_edges_from(
+        (id_from, id_to, {"relation_type": relation_type})
+        for id_from, id_to, relation_type in subgraph_edges(graph.G, person_ids)
+    )
+    return KinshipIndex(G)
+
+
+def generation_layers(kinship):
+    """
+    Returns the row of every person (by index of kinship): the generation
+    depth, with persons without known parents moved to the row of their
+    spouse (and their descendants below).
+    """
+    n = len(kinship.nodes)
+    layer = list(kinship.depth)
+    spouses = [list(kinship.spouses[i]) for i in range(n)]
+    for i in range(n):
+        for j in kinship.spouses[i]:
+            spouses[j].append(i)
+    for i in range(n):
+        if not kinship.parents[i]:
+            layer[i] = max([layer[i]] + [layer[j] for j in spouses[i] if kinship.parents[j]])
+    # push the descendants of moved persons down again, in topological order
+    post = kinship.descendant_labels.post
+    for i in sorted(range(n), key=post.__getitem__, reverse=True):
+        for j in kinship.children[i]:
+            if layer[j] < layer[i] + 1:
+                layer[j] = layer[i] + 1
+    return layer, spouses
+
+
+def birth_year_layers(kinship, G, year_step=DEFAULT_YEAR_STEP):
+    """
+    Returns the row of every person by birth year (rounded down to
+    year_step). Missing years are estimated as the mean birth year of the
+    generation row of the person, or from the neighbouring generations.
+    """
+    generations, spouses = generation_layers(kinship)
+    years = [G.nodes[node].get("birth_year") for node in kinship.nodes]
+    known = {}
+    for generation, year in zip(generations, years):
+        if isinstance(year, int):
+            known.setdefault(generation, []).append(year)
+    means = {generation: sum(values) / len(values) for generation, values in known.items()}
+    estimates = {}
+    for generation in set(generations):
+        if generation in means:
+            estimates[generation] = means[generation]
+        elif means:
+            nearest = min(means, key=lambda known_generation: abs(known_generation - generation))
+            estimates[generation] = means[nearest] + (generation - nearest) * GENERATION_YEARS
+        else:
+            estimates[generation] = generation * GENERATION_YEARS
+    rows = [
+        int((year if isinstance(year, int) else estimates[generation]) // year_step)
+        for generation, year in zip(generations, years)
+    ]
+    first = min(rows, default=0)
+    return [row - first for row in rows], spouses
+
+
+def dfs_order(kinship, spouses):
+    """
+    Returns an initial position for every person: depth first from the
+    persons without parents, with spouses after each other, so families
+    start out next to each other.
+    """
+    n = len(kinship.nodes)
+    order = [None] * n
+    position = 0
+    for root in range(n):
+        if order[root] is not None or kinship.parents[root]:
+            continue
+        stack = [root]
+        while stack:
+            i = stack.pop()
+            if order[i] is not None:
+                continue
+            order[i] = position
+            position += 1
+            stack.extend(reversed(kinship.children[i]))
+            stack.extend(j for j in spouses[i] if order[j] is None)
+    # persons only reachable through cycles of bad data
+    for i in range(n):
+        if order[i] is None:
+            order[i] = position
+            position += 1
+    return order
+
+
+def order_rows(kinship, layers, spouses, sweeps=DEFAULT_SWEEPS):
+    """
+    Returns the rows (lists of person indexes, top to bottom) ordered by
+    barycenter sweeps, alternating between parents (downwards) and children
+    (upwards).
+    """
+    order = dfs_order(kinship, spouses)
+    rows = [[] for _ in range(max(layers, default=-1) + 1)]
+    for i in sorted(range(len(layers)), key=order.__getitem__):
+        rows[layers[i]].append(i)
+    x = [0.0] * len(layers)
+
+    def place(row):
+        offset = (len(row) - 1) / 2
+        for position, i in enumerate(row):
+            x[i] = position - offset
+
+    for row in rows:
+        place(row)
+    for sweep in range(sweeps):
+        downwards = sweep % 2 == 0
+        neighbours = kinship.parents if downwards else kinship.children
+        for r in (range(len(rows)) if downwards else reversed(range(len(rows)))):
+            row = rows[r]
+            keys = {}
+            for i in row:
+                if neighbours[i]:
+                    keys[i] = sum(x[j] for j in neighbours[i]) / len(neighbours[i])
+            # persons without neighbours in that direction stay next to their
+            # spouse if it has some, else where they are
+            partner_keys = {}
+            for i in row:
+                if i not in keys:
+                    partner = next((j for j in spouses[i] if j in keys and layers[j] == r), None)
+                    partner_keys[i] = keys[partner] + 0.001 if partner is not None else x[i]
+            keys.update(partner_keys)
+            row.sort(key=keys.__getitem__)
+            place(row)
+    return rows
+
+
+def layered_layout(graph, by="generation", person_ids=None, sweeps=DEFAULT_SWEEPS,
+                   year_step=DEFAULT_YEAR_STEP, x_spacing=10.0, y_spacing=50.0):
+    """
+    Computes the layered layout (see module docstring).
+
+    Parameters:
+        graph: FamilyGraph or CompactFamilyGraph
+        by: "generation" or "birth_year"
+        person_ids: persons to lay out (default: all)
+        sweeps: number of barycenter sweeps
+        year_step: years per row for by="birth_year"
+        x_spacing, y_spacing: distance between neighbours in a row and between rows
+
+    Returns:
+        dict person_id -> (x, y), the first row at the top (y = 0, below negative)
+    """
+    kinship = layout_index(graph, person_ids)
+    if by == "generation":
+        layers, spouses = generation_layers(kinship)
+    elif by == "birth_year":
+        layers, spouses = birth_year_layers(kinship, graph.G, year_step)
+    else:
+        raise ValueError(f"Unknown layout {by} (use generation or birth_year)")
+    positions = {}
+    for r, row in enumerate(order_rows(kinship, layers, spouses, sweeps)):
+        offset = (len(row) - 1) / 2
+        for position, i in enumerate(row):
+            positions[kinship.nodes[i]] = ((position - offset) * x_spacing, -r * y_spacing)
+    return positions
+
+
+def family_persons(graph, family_name):
+    """
+    Returns the ids of the persons of a family (by normalized family name)
+    and of their spouses.
+    """
+    key = normalize_family_name(family_name)
+    person_ids = {
+        person_id for person_id, name in graph.G.nodes(data="family_name")
+        if name and normalize_family_name(name) == key
+    }
+    for person_id in list(person_ids):
+        for _, node_id, relation_type in graph.G.out_edges(person_id, data="relation_type"):
+            if relation_type == "HUSBAND_WIFE":
+                person_ids.add(node_id)
+        for node_id, _, relation_type in graph.G.in_edges(person_id, data="relation_type"):
+            if relation_type == "HUSBAND_WIFE":
+                person_ids.add(node_id)
+    return person_ids
+
+
+def neighborhood(graph, person_id, ancestors=2, descendants=2, kinship=None):
+    """
+    Returns the ids of a person, its ancestors and descendants up to the given
+    number of generations, and their spouses.
+    """
+    kinship = kinship or KinshipIndex(graph)
+    i = kinship.index[person_id]
+    indexes = {i}
+    for neighbours, generations in [(kinship.parents, ancestors), (kinship.children, descendants)]:
+        for level in kinship._levels(i, neighbours, generations):
+            indexes.update(level)
+    for j in list(indexes):
+        indexes.update(kinship.spouses[j])
+    for j in range(len(kinship.nodes)):
+        if any(k in indexes for k in kinship.spouses[j]):
+            indexes.add(j)
+    return {kinship.nodes[j] for j in indexes}
+
+
+def draw(ax, graph, positions):
+    """
+    Draws the persons in positions and the relations among them on a
+    matplotlib Axes.
+    """
+    from matplotlib.collections import LineCollection
+
+    segments = {}
+    for id_from, id_to, relation_type in subgraph_edges(graph.G, positions.keys()):
+        segments.setdefault(relation_type, []).append((positions[id_from], positions[id_to]))
+    for relation_type, lines in segments.items():
+        ax.add_collection(LineCollection(
+            lines, colors=EDGE_COLORS.get(relation_type, "gray"), linewidths=0.5, zorder=1))
+    xs = [x for x, _ in positions.values()]
+    ys = [y for _, y in positions.values()]
+    ax.scatter(xs, ys, s=12 if len(positions) <= MAX_LABELS else 2, color="steelblue", zorder=2)
+    if len(positions) <= MAX_LABELS:
+        for person_id, (x, y) in positions.items():
+            node = graph.G.nodes[person_id]
+            label = " ".join(str(part) for part in [node.get("given_name"), node.get("birth_year")] if part)
+            ax.annotate(label, (x, y), textcoords="offset points", xytext=(0, 4),
+                        ha="center", fontsize=5, rotation=30)
+    ax.autoscale()
+    ax.set_axis_off()
+
+
+def render(graph, path, person_ids=None, by="generation", positions=None, title=None):
+    """
+    Renders (a part of) the graph with the layered layout to an image file
+    (png, svg, pdf, ...), without a display.
+
+    Parameters:
+        graph: FamilyGraph or CompactFamilyGraph
+        path: image file
+        person_ids: persons to draw (e.g. family_persons or neighborhood), default all
+        by: layout rows, see layered_layout
+        positions: precomputed positions (layered_layout is used otherwise)
+        title: title of the image
+    """
+    from matplotlib.figure import Figure
+
+    if positions is None:
+        positions = layered_layout(graph, by, person_ids)
+    elif person_ids is not None:
+        positions = {person_id: positions[person_id] for person_id in person_ids}
+    rows = len({y for _, y in positions.values()})
+    width = max(len(positions) / max(rows, 1) * 0.4, 6)
+    figure = Figure(figsize=(min(width, 60), min(max(rows * 1.2, 4), 40)))
+    ax = figure.add_subplot()
+    draw(ax, graph, positions)
+    if title:
+        ax.set_title(title)
+    figure.savefig(path, dpi=150, bbox_inches="tight")
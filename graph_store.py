@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Persistent SQLite store behind FamilyGraph.
+
+StoredFamilyGraph is a FamilyGraph whose persons, relations, family ids and
+provenance (the extraction files mentioning a person) are written through to
+a SQLite file (WAL mode), in transactions of about batch_size added persons
+and relations. Opening a store reads nothing: families are loaded on demand,
+by name with load_family, or automatically when duplicate detection needs a
+family_id stored in a family that isn't loaded yet. Loading a family loads its persons
+(by normalized family name, see entity_resolution.normalize_family_name),
+their relations and the persons at the other end of them (e.g. the wives).
+Contributions (see FamilyGraph.track_contributions) are written through as
+well and loaded with their families, so replace_extraction can retract what a
+file contributed in any earlier session that tracked them; removed persons
+and relations are deleted from the store.
+
+    with StoredFamilyGraph("graph.sqlite") as graph:
+        graph.load_extractions("data/bashoutput")
+
+    with StoredFamilyGraph("graph.sqlite") as graph:
+        graph.load_family("Billeter")
+        graph.save("billeter.gexf")
+
+Usage as CLI:
+
+    python graph_store.py --store graph.sqlite add -i data/bashoutput
+    python graph_store.py --store graph.sqlite export -o billeter.gexf --family Billeter
+    python graph_store.py --store graph.sqlite snapshot snapshots/2024-05-01.sqlite
+    python graph_store.py --store graph.sqlite stats
+"""
+
+import sys
+import json
+import uuid
+import sqlite3
+import argparse
+from itertools import chain
+
+from family_graph import FamilyGraph
+from entity_resolution import normalize_family_name
+
+DEFAULT_BATCH_SIZE = 10000
+PERSON_COLUMNS = [
+    "person_number", "family_id", "father_family_id", "husband_family_id", "family_name",
+    "given_name", "birth_year", "death_year", "profession", "origin",
+]
+# rows per query when fetching persons by id
+FETCH_ROWS = 500
+# (table, column) of the rows deleted with a person
+PERSON_REFERENCES = [
+    ("persons", "id"), ("relations", "id_from"), ("relations", "id_to"), ("provenance", "person_id"),
+    ("person_contributions", "person_id"), ("relation_contributions", "id_from"),
+    ("relation_contributions", "id_to"),
+]
+
+
+def family_key(family_name):
+    """
+    Returns the key families are stored and loaded by.
+    """
+    return normalize_family_name(family_name) if family_name else ""
+
+
+class StoredFamilyGraph(FamilyGraph):
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Opens (or creates) the store at path. Nothing is loaded yet.
+
+        Parameters:
+            path: SQLite file
+            batch_size: number of added persons and relations after which the
+                open transaction is committed
+        """
+        super().__init__()
+        self.path = path
+        self.batch_size = batch_size
+        self.loaded_families = set()
+        self._pending = 0
+        self._source = None
+        self._changed_persons = set()
+        self._changed_relations = {}
+        self._new_provenance = []
+        self._unstored_family_ids = set()
+        # used from one thread at a time, but not necessarily the opening one
+        # (e.g. the writer thread of extraction_stream.GraphIngest)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS persons (
+                id BLOB PRIMARY KEY,
+                family_key TEXT NOT NULL,
+                person_number INTEGER,
+                family_id TEXT,
+                father_family_id TEXT,
+                husband_family_id TEXT,
+                family_name TEXT,
+                given_name TEXT,
+                birth_year INTEGER,
+                death_year INTEGER,
+                profession TEXT,
+                origin TEXT,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS persons_family ON persons (family_key);
+            CREATE INDEX IF NOT EXISTS persons_family_id ON persons (family_id);
+            CREATE TABLE IF NOT EXISTS relations (
+                id_from BLOB NOT NULL,
+                id_to BLOB NOT NULL,
+                relation_type TEXT NOT NULL,
+                PRIMARY KEY (id_from, id_to)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS relations_to ON relations (id_to);
+            CREATE TABLE IF NOT EXISTS provenance (
+                person_id BLOB NOT NULL,
+                source TEXT NOT NULL,
+                PRIMARY KEY (person_id, source)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS person_contributions (
+                person_id BLOB NOT NULL,
+                position INTEGER NOT NULL,
+                source TEXT,
+                attributes TEXT NOT NULL,
+                PRIMARY KEY (person_id, position)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS person_contributions_source ON person_contributions (source);
+            CREATE TABLE IF NOT EXISTS relation_contributions (
+                id_from BLOB NOT NULL,
+                id_to BLOB NOT NULL,
+                position INTEGER NOT NULL,
+                source TEXT,
+                relation_type TEXT,
+                PRIMARY KEY (id_from, id_to, position)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS relation_contributions_to ON relation_contributions (id_to);
+            CREATE INDEX IF NOT EXISTS relation_contributions_source ON relation_contributions (source);
+        """)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def commit(self):
+        """
+        Writes the pending changes and commits them.
+        """
+        self.flush()
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def snapshot(self, path):
+        """
+        Writes a consistent copy of the committed store to path (SQLite
+        backup), e.g. to keep the state of the graph before a new run.
+        """
+        self.commit()
+        target = sqlite3.connect(path)
+        with target:
+            self._conn.backup(target)
+        target.close()
+
+    def stats(self):
+        """
+        Returns a dict with the number of stored persons, relations, families
+        and provenance entries.
+        """
+        queries = {
+            "persons": "SELECT COUNT(*) FROM persons",
+            "relations": "SELECT COUNT(*) FROM relations",
+            "families": "SELECT COUNT(DISTINCT family_key) FROM persons",
+            "provenance": "SELECT COUNT(*) FROM provenance",
+        }
+        self.flush()
+        return {name: self._conn.execute(query).fetchone()[0] for name, query in queries.items()}
+
+    def sources(self, person_id):
+        """
+        Returns the extraction files the person was found in.
+        """
+        self.flush()
+        rows = self._conn.execute(
+            "SELECT source FROM provenance WHERE person_id = ? ORDER BY source", (person_id.bytes,))
+        return [row[0] for row in rows]
+
+    # loading
+
+    def load_family(self, family_name):
+        """
+        Loads one family (all persons of the family name, their relations
+        and the persons related to them) into self.G, unless it is loaded.
+        """
+        self.load_families([family_name])
+
+    def load_families(self, family_names):
+        keys = {family_key(family_name) for family_name in family_names} - self.loaded_families
+        added_persons, added_edges = [], []
+        for key in keys:
+            persons = self._conn.execute(
+                f"SELECT id, {', '.join(PERSON_COLUMNS)}, extra FROM persons WHERE family_key = ?", (key,))
+            added_persons += self._add_rows(persons)
+            relations = self._conn.execute("""
+                SELECT r.id_from, r.id_to, r.relation_type FROM relations r
+                    JOIN persons p ON p.id = r.id_from WHERE p.family_key = ?
+                UNION
+                SELECT r.id_from, r.id_to, r.relation_type FROM relations r
+                    JOIN persons p ON p.id = r.id_to WHERE p.family_key = ?
+            """, (key, key)).fetchall()
+            missing = list({
+                person_id
+                for row in relations for person_id in row[:2]
+                if uuid.UUID(bytes=person_id) not in self.G
+            })
+            for start in range(0, len(missing), FETCH_ROWS):
+                batch = missing[start:start + FETCH_ROWS]
+                added_persons += self._add_rows(self._conn.execute(
+                    f"SELECT id, {', '.join(PERSON_COLUMNS)}, extra FROM persons "
+                    f"WHERE id IN ({', '.join('?' * len(batch))})", batch))
+            for id_from, id_to, relation_type in relations:
+                id_from, id_to = uuid.UUID(bytes=id_from), uuid.UUID(bytes=id_to)
+                if not self.G.has_edge(id_from, id_to):
+                    self.G.add_edge(id_from, id_to, relation_type=relation_type)
+                    self._index_successor(id_from, id_to)
+                    added_edges.append((id_from, id_to))
+            self.loaded_families.add(key)
+        if self.person_contributions is not None:
+            self._load_contributions(added_persons, added_edges)
+
+    def load_all(self):
+        """
+        Loads all stored families.
+        """
+        self.load_families(row[0] for row in self._conn.execute("SELECT DISTINCT family_key FROM persons"))
+
+    def families(self):
+        """
+        Returns a dict of the stored family keys and their numbers of persons.
+        """
+        self.flush()
+        return dict(self._conn.execute(
+            "SELECT family_key, COUNT(*) FROM persons GROUP BY family_key ORDER BY family_key"))
+
+    def _add_rows(self, rows):
+        """
+        Adds the persons of rows that aren't loaded yet and returns their ids.
+        """
+        added = []
+        for row in rows:
+            person_id = uuid.UUID(bytes=row[0])
+            if person_id in self.G:
+                continue
+            added.append(person_id)
+            attributes = dict(zip(PERSON_COLUMNS, row[1:-1]))
+            if row[-1] is not None:
+                attributes.update(json.loads(row[-1]))
+            self.G.add_node(person_id, **attributes)
+            if attributes["family_id"] is not None:
+                self.family_id_index.setdefault(attributes["family_id"], person_id)
+            if self.search_index is not None:
+                self.search_index.update(person_id, attributes)
+        return added
+
+    def _load_contributions(self, person_ids, edges):
+        """
+        Loads the stored contributions of loaded persons and relations (see
+        track_contributions). Persons and relations without stored
+        contributions get theirs when they are merged into, as in FamilyGraph.
+        """
+        person_ids = [person_id for person_id in person_ids if person_id not in self.person_contributions]
+        for start in range(0, len(person_ids), FETCH_ROWS):
+            batch = [person_id.bytes for person_id in person_ids[start:start + FETCH_ROWS]]
+            rows = self._conn.execute(
+                f"SELECT person_id, source, attributes FROM person_contributions "
+                f"WHERE person_id IN ({', '.join('?' * len(batch))}) ORDER BY person_id, position", batch)
+            for person_id, source, attributes in rows:
+                person_id = uuid.UUID(bytes=person_id)
+                self.person_contributions.setdefault(person_id, {}).setdefault(source, []).append(
+                    json.loads(attributes))
+                if source is not None:
+                    self.extraction_contributions.setdefault(source, (set(), set()))[0].add(person_id)
+
+        edges = {edge for edge in edges if edge not in self.relation_contributions}
+        id_froms = list({id_from.bytes for id_from, _ in edges})
+        for start in range(0, len(id_froms), FETCH_ROWS):
+            batch = id_froms[start:start + FETCH_ROWS]
+            rows = self._conn.execute(
+                f"SELECT id_from, id_to, source, relation_type FROM relation_contributions "
+                f"WHERE id_from IN ({', '.join('?' * len(batch))}) ORDER BY id_from, id_to, position", batch)
+            for id_from, id_to, source, relation_type in rows:
+                edge = (uuid.UUID(bytes=id_from), uuid.UUID(bytes=id_to))
+                if edge not in edges:
+                    continue
+                self.relation_contributions.setdefault(edge, {})[source] = relation_type
+                if source is not None:
+                    self.extraction_contributions.setdefault(source, (set(), set()))[1].add(edge)
+
+    def _load_families_of(self, person_attributes):
+        """
+        Loads the families of the stored persons with the family ids the
+        duplicate detection looks up for person_attributes.
+        """
+        family_ids = [
+            person_attributes.get(key)
+            for key in ["family_id", "father_family_id", "husband_family_id"]
+            if person_attributes.get(key) is not None
+        ]
+        # family ids in memory are either loaded or not stored before:
+        family_ids = [
+            family_id for family_id in family_ids
+            if family_id not in self.family_id_index and family_id not in self._unstored_family_ids
+        ]
+        if not family_ids:
+            return
+        rows = self._conn.execute(
+            f"SELECT family_id, family_key FROM persons WHERE family_id IN ({', '.join('?' * len(family_ids))})",
+            family_ids).fetchall()
+        self._unstored_family_ids.update(set(family_ids) - {row[0] for row in rows})
+        keys = {row[1] for row in rows if row[1] not in self.loaded_families}
+        if keys:
+            self.load_families(keys)
+
+    # writing through
+
+    def flush(self):
+        """
+        Writes the changed persons and relations and the new provenance
+        entries into the open transaction.
+        """
+        rows = []
+        for person_id in self._changed_persons:
+            if person_id not in self.G:
+                continue
+            attributes = self.G.nodes[person_id]
+            extra = {key: value for key, value in attributes.items() if key not in PERSON_COLUMNS}
+            rows.append(
+                [person_id.bytes, family_key(attributes.get("family_name"))]
+                + [attributes.get(key) for key in PERSON_COLUMNS]
+                + [json.dumps(extra) if extra else None])
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO persons VALUES ({', '.join('?' * (len(PERSON_COLUMNS) + 3))})", rows)
+        self._conn.executemany("INSERT OR REPLACE INTO relations VALUES (?, ?, ?)", [
+            (id_from.bytes, id_to.bytes, relation_type)
+            for (id_from, id_to), relation_type in self._changed_relations.items()
+            if self.G.has_edge(id_from, id_to)
+        ])
+        self._conn.executemany("INSERT OR IGNORE INTO provenance VALUES (?, ?)", [
+            (person_id.bytes, source) for person_id, source in self._new_provenance if person_id in self.G
+        ])
+        if self.person_contributions is not None:
+            self._write_contributions()
+        self._changed_persons = set()
+        self._changed_relations = {}
+        self._new_provenance = []
+
+    def _write_contributions(self):
+        """
+        Replaces the stored contributions of the changed persons and relations.
+        """
+        persons = [person_id for person_id in self._changed_persons if person_id in self.person_contributions]
+        self._conn.executemany("DELETE FROM person_contributions WHERE person_id = ?", [
+            (person_id.bytes,) for person_id in persons
+        ])
+        self._conn.executemany("INSERT INTO person_contributions VALUES (?, ?, ?, ?)", [
+            (person_id.bytes, position, source, json.dumps(attributes))
+            for person_id in persons
+            for position, (source, attributes) in enumerate(
+                (source, attributes)
+                for source, contributions in self.person_contributions[person_id].items()
+                for attributes in contributions)
+        ])
+        edges = [edge for edge in self._changed_relations if edge in self.relation_contributions]
+        self._conn.executemany("DELETE FROM relation_contributions WHERE id_from = ? AND id_to = ?", [
+            (id_from.bytes, id_to.bytes) for id_from, id_to in edges
+        ])
+        self._conn.executemany("INSERT INTO relation_contributions VALUES (?, ?, ?, ?, ?)", [
+            (id_from.bytes, id_to.bytes, position, source, relation_type)
+            for id_from, id_to in edges
+            for position, (source, relation_type) in enumerate(self.relation_contributions[id_from, id_to].items())
+        ])
+
+    def _changed(self, n=1):
+        self._pending += n
+        if self._pending >= self.batch_size:
+            self.commit()
+
+    def get_id_from_attributes(self, person_attributes):
+        self._load_families_of(person_attributes)
+        return super().get_id_from_attributes(person_attributes)
+
+    def _add_person(self, person_attributes):
+        person_id, created = super()._add_person(person_attributes)
+        self._changed_persons.add(person_id)
+        if self._source is not None:
+            self._new_provenance.append((person_id, self._source))
+        return person_id, created
+
+    def _relation_added(self, id_from, id_to, relation_type):
+        super()._relation_added(id_from, id_to, relation_type)
+        self._changed_relations[id_from, id_to] = relation_type
+        # the father (husband) may have given the child (wife) a family id:
+        self._changed_persons.add(id_to)
+
+    def add_extraction(self, extraction):
+        self._source = extraction["file"]
+        try:
+            report = super().add_extraction(extraction)
+        finally:
+            self._source = None
+        self._changed(len(extraction["persons"]) + len(extraction["relations"]))
+        return report
+
+    def add_person(self, person_attributes):
+        person_id = super().add_person(person_attributes)
+        self._changed()
+        return person_id
+
+    def add_relation(self, id_from, id_to, relation_type):
+        super().add_relation(id_from, id_to, relation_type)
+        self._changed()
+
+    def _person_updated(self, person_id):
+        self._changed_persons.add(person_id)
+
+    def _delete_person(self, person_id):
+        for table, column in PERSON_REFERENCES:
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (person_id.bytes,))
+
+    def _person_removed(self, person_id):
+        self._delete_person(person_id)
+
+    def _relation_removed(self, id_from, id_to):
+        self._changed_relations.pop((id_from, id_to), None)
+        for table in ["relations", "relation_contributions"]:
+            self._conn.execute(f"DELETE FROM {table} WHERE id_from = ? AND id_to = ?", (id_from.bytes, id_to.bytes))
+
+    def track_contributions(self):
+        super().track_contributions()
+        self._load_contributions(list(self.G.nodes), list(self.G.edges))
+
+    def retract_extraction(self, file):
+        persons, relations = [], []
+        if self.person_contributions is not None:
+            # the families of everything the file contributed to, with their contributions
+            self.flush()
+            self.load_families(row[0] for row in self._conn.execute("""
+                SELECT p.family_key FROM person_contributions c JOIN persons p ON p.id = c.person_id
+                    WHERE c.source = ?
+                UNION
+                SELECT p.family_key FROM relation_contributions c JOIN persons p ON p.id IN (c.id_from, c.id_to)
+                    WHERE c.source = ?
+            """, (file, file)))
+            persons, relations = (list(items) for items in self.extraction_contributions.get(file, ((), ())))
+        report = super().retract_extraction(file)
+        # relations other files contributed too stay, maybe with another type
+        for edge in relations:
+            if self.G.has_edge(*edge):
+                self._changed_relations[edge] = self.G.edges[edge]["relation_type"]
+        self._conn.executemany("DELETE FROM provenance WHERE person_id = ? AND source = ?", [
+            (person_id.bytes, file) for person_id in persons
+        ])
+        self._changed(len(persons))
+        return report
+
+    def merge_persons(self, keep_id, merged_id):
+        super().merge_persons(keep_id, merged_id)
+        self.flush()
+        self._conn.execute(
+            "UPDATE OR IGNORE provenance SET person_id = ? WHERE person_id = ?", (keep_id.bytes, merged_id.bytes))
+        self._delete_person(merged_id)
+        self._changed_persons.add(keep_id)
+        for id_from, id_to, relation_type in chain(
+                self.G.in_edges(keep_id, data="relation_type"), self.G.out_edges(keep_id, data="relation_type")):
+            self._changed_relations[id_from, id_to] = relation_type
+        self._changed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the persistent family graph store.')
+    parser.add_argument('--store', '-s', required=True, help='SQLite file of the store.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add = subparsers.add_parser('add', help='Add extraction JSONs to the store.')
+    add.add_argument('--input', '-i', required=True, help='Directory containing the extraction JSONs.')
+    add.add_argument('--workers', type=int, default=None, help='Processes for parsing (default: number of CPUs).')
+    export = subparsers.add_parser('export', help='Save families (or everything) as .gexf, .graphml or .parquet.')
+    export.add_argument('--output', '-o', required=True, help='File to save the graph to.')
+    export.add_argument('--family', '-f', action='append', help='Family name to export (repeatable, default: all).')
+    snapshot = subparsers.add_parser('snapshot', help='Copy the store to a snapshot file.')
+    snapshot.add_argument('path', help='SQLite file of the snapshot.')
+    subparsers.add_parser('stats', help='Print the numbers of persons, relations and families.')
+    args = parser.parse_args()
+
+    with StoredFamilyGraph(args.store) as graph:
+        if args.command == 'add':
+            reports = graph.load_extractions(args.input, workers=args.workers)
+            print(f"{len(reports)} files added")
+        elif args.command == 'export':
+            if args.family:
+                graph.load_families(args.family)
+            else:
+                graph.load_all()
+            graph.save(args.output)
+            print(f"Graph with {graph.G.number_of_nodes()} persons saved to {args.output}")
+        elif args.command == 'snapshot':
+            graph.snapshot(args.path)
+        for name, value in graph.stats().items():
+            print(f"{name}: {value}")
+    sys.exit(0)
@@ -0,0 +1,391 @@
+"""
+Kinship queries on a FamilyGraph (or a networkx DiGraph with "relation_type"
+edge attributes, e.g. read from GEXF).
+
+KinshipIndex precomputes in one pass over the FATHER_CHILD/MOTHER_CHILD
+edges (a DAG: parents -> children):
+
+* a post-order interval labeling of a spanning forest, extended by the
+  (few) intervals reached through non-tree edges, for "is X an ancestor of
+  Y" checks in O(1) (O(log k) for the rare persons reachable on several
+  paths, e.g. after marriages between cousins)
+* descendant counts (the sizes of the labels)
+* the generation depth of every person (longest line of ancestors)
+
+and answers lowest common ancestors, relationship paths and descendants by
+generation on top of them:
+
+    kinship = KinshipIndex(graph)
+    kinship.is_ancestor(grandfather_id, person_id)
+    kinship.relationship(person_id, cousin_id)["term"]   # "first cousin"
+    kinship.node_weights()                                # see the notebook
+"""
+
+from bisect import bisect_right
+from collections import deque
+
+PARENT_TYPES = ("FATHER_CHILD", "MOTHER_CHILD")
+
+# labels of the steps of relationship_path: (relation_type, forward) -> label
+STEP_LABELS = {
+    ("FATHER_CHILD", True): "child",
+    ("FATHER_CHILD", False): "father",
+    ("MOTHER_CHILD", True): "child",
+    ("MOTHER_CHILD", False): "mother",
+    ("HUSBAND_WIFE", True): "wife",
+    ("HUSBAND_WIFE", False): "husband",
+}
+
+ORDINALS = ["first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth"]
+
+
+class ReachabilityLabels:
+    def __init__(self, successors):
+        """
+        Interval labeling of the nodes 0..n-1 of a directed graph for
+        reachability queries.
+
+        A depth first search numbers the nodes in post order; the subtree of
+        node v in the search forest then covers the numbers [low[v], post[v]].
+        Nodes reached through other edges are added as further intervals,
+        merged with those of the successors. Edges closing a cycle (back edges
+        of the search) are ignored.
+
+        Parameters:
+            successors: list with the list of successors of every node
+        """
+        n = len(successors)
+        self.post = [-1] * n
+        self.low = [0] * n
+        # merged intervals (lo, hi) of nodes not covered by their subtree alone
+        self.extra = {}
+        self.back_edges = []
+
+        in_degree = [0] * n
+        for targets in successors:
+            for target in targets:
+                in_degree[target] += 1
+        roots = [v for v in range(n) if in_degree[v] == 0]
+        on_stack = [False] * n
+        counter = 0
+        for root in roots + list(range(n)):
+            if self.post[root] != -1 or on_stack[root]:
+                continue
+            self.low[root] = counter
+            on_stack[root] = True
+            stack = [(root, iter(successors[root]))]
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    if on_stack[child]:
+                        self.back_edges.append((node, child))
+                    elif self.post[child] == -1:
+                        self.low[child] = counter
+                        on_stack[child] = True
+                        stack.append((child, iter(successors[child])))
+                        break
+                else:
+                    stack.pop()
+                    on_stack[node] = False
+                    self.post[node] = counter
+                    counter += 1
+                    self._merge_intervals(node, successors[node])
+
+    def _merge_intervals(self, node, targets):
+        low, post = self.low[node], self.post[node]
+        intervals = []
+        for target in targets:
+            if self.post[target] > post:
+                # back edge
+                continue
+            if target in self.extra:
+                intervals.extend(self.extra[target])
+            elif not low <= self.post[target] <= post:
+                intervals.append((self.low[target], self.post[target]))
+        if not intervals:
+            return
+        intervals.append((low, post))
+        intervals.sort()
+        merged = [intervals[0]]
+        for lo, hi in intervals[1:]:
+            if lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        if merged != [(low, post)]:
+            self.extra[node] = merged
+
+    def intervals(self, node):
+        return self.extra.get(node, [(self.low[node], self.post[node])])
+
+    def reaches(self, node, target):
+        """
+        Returns True if target is reachable from node (or is node).
+        """
+        number = self.post[target]
+        if node not in self.extra:
+            return self.low[node] <= number <= self.post[node]
+        intervals = self.extra[node]
+        i = bisect_right(intervals, (number, float("inf"))) - 1
+        return i >= 0 and intervals[i][0] <= number <= intervals[i][1]
+
+    def count(self, node):
+        """
+        Returns the number of nodes reachable from node (including node).
+        """
+        return sum(hi - lo + 1 for lo, hi in self.intervals(node))
+
+
+def kinship_term(up, down):
+    """
+    Returns the English term of a relationship through a common ancestor up
+    generations above the first person and down generations above the second.
+
+    kinship_term(2, 2) -> "first cousin", kinship_term(0, 3) -> "great-grandchild"
+    """
+    if up == 0 and down == 0:
+        return "self"
+    if down == 0:
+        return lineal_term("parent", up)
+    if up == 0:
+        return lineal_term("child", down)
+    if up == 1 and down == 1:
+        return "sibling"
+    if down == 1:
+        return lineal_term("uncle/aunt", up - 1, prefix="great-")
+    if up == 1:
+        return lineal_term("nephew/niece", down - 1, prefix="great-")
+    degree = min(up, down) - 1
+    removed = abs(up - down)
+    ordinal = ORDINALS[degree - 1] if degree <= len(ORDINALS) else f"{degree}th"
+    term = f"{ordinal} cousin"
+    if removed == 1:
+        term += " once removed"
+    elif removed == 2:
+        term += " twice removed"
+    elif removed > 2:
+        term += f" {removed} times removed"
+    return term
+
+
+def lineal_term(term, generations, prefix="grand"):
+    """
+    lineal_term("parent", 3) -> "great-grandparent"
+    """
+    if generations == 1:
+        return term
+    return "great-" * (generations - 2) + prefix + term
+
+
+class KinshipIndex:
+    def __init__(self, graph):
+        """
+        Precomputes the ancestry indexes of a graph (see module docstring).
+
+        Parameters:
+            graph: FamilyGraph, CompactFamilyGraph or networkx DiGraph with
+                "relation_type" edge attributes
+        """
+        G = getattr(graph, "G", graph)
+        self.nodes = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        self.children = [[] for _ in range(n)]
+        self.parents = [[] for _ in range(n)]
+        # all relations in both directions, as (neighbour, label) for relationship_path
+        self.neighbours = [[] for _ in range(n)]
+        self.spouses = [[] for _ in range(n)]
+        for source, target, data in G.edges(data=True):
+            i, j = self.index[source], self.index[target]
+            relation_type = data.get("relation_type")
+            if relation_type in PARENT_TYPES:
+                self.children[i].append(j)
+                self.parents[j].append(i)
+            elif relation_type == "HUSBAND_WIFE":
+                self.spouses[i].append(j)
+            self.neighbours[i].append((j, STEP_LABELS.get((relation_type, True), relation_type)))
+            self.neighbours[j].append((i, STEP_LABELS.get((relation_type, False), relation_type)))
+
+        # Ancestor checks use the same labeling (X is an ancestor of Y iff Y
+        # is reachable from X). Ancestor sets are not labeled: with two parents
+        # per person their intervals would grow with the depth of the pedigree.
+        self.descendant_labels = ReachabilityLabels(self.children)
+
+        # generation depth: longest line of ancestors, in topological order
+        # (decreasing post order of the descendant labeling)
+        post = self.descendant_labels.post
+        self.depth = [0] * n
+        for i in sorted(range(n), key=post.__getitem__, reverse=True):
+            for j in self.children[i]:
+                if post[j] < post[i] and self.depth[j] < self.depth[i] + 1:
+                    self.depth[j] = self.depth[i] + 1
+
+    def _i(self, person_id):
+        return self.index[person_id]
+
+    def is_ancestor(self, ancestor_id, person_id):
+        """
+        Returns True if ancestor_id is a (strict) ancestor of person_id.
+        """
+        a, p = self._i(ancestor_id), self._i(person_id)
+        return a != p and self.descendant_labels.reaches(a, p)
+
+    def descendant_count(self, person_id):
+        return self.descendant_labels.count(self._i(person_id)) - 1
+
+    def ancestor_count(self, person_id):
+        return len(self.ancestors(person_id))
+
+    def generation(self, person_id):
+        """
+        Returns the generation depth: 0 for persons without known parents,
+        else 1 + the largest generation of the parents.
+        """
+        return self.depth[self._i(person_id)]
+
+    def _levels(self, start, neighbours, max_generations=None):
+        """
+        Breadth first search from start: list of the nodes of each generation
+        (every node in the first generation it is reached in).
+        """
+        seen = {start}
+        levels = []
+        level = [start]
+        while level and (max_generations is None or len(levels) < max_generations):
+            next_level = []
+            for i in level:
+                for j in neighbours[i]:
+                    if j not in seen:
+                        seen.add(j)
+                        next_level.append(j)
+            if next_level:
+                levels.append(next_level)
+            level = next_level
+        return levels
+
+    def descendants_by_generation(self, person_id, max_generations=None):
+        """
+        Returns the descendants of a person grouped by generation:
+        [[children], [grandchildren], ...] (persons descending on several lines
+        are listed in the closest generation).
+        """
+        return [
+            [self.nodes[i] for i in level]
+            for level in self._levels(self._i(person_id), self.children, max_generations)
+        ]
+
+    def ancestors(self, person_id):
+        return {self.nodes[i] for level in self._levels(self._i(person_id), self.parents) for i in level}
+
+    def descendants(self, person_id):
+        return {self.nodes[i] for level in self._levels(self._i(person_id), self.children) for i in level}
+
+    def _ancestor_distances(self, i):
+        distances = {i: 0}
+        for distance, level in enumerate(self._levels(i, self.parents), start=1):
+            for j in level:
+                distances[j] = distance
+        return distances
+
+    def lowest_common_ancestors(self, person_a, person_b):
+        """
+        Returns the lowest common ancestors of two persons (a person counts as
+        its own ancestor): the common ancestors none of whose descendants is a
+        common ancestor as well. Usually both parents of the closest
+        common couple, sorted by the total number of generations to them.
+
+        Returns:
+            list of (person_id, generations up from person_a, generations up from person_b)
+        """
+        a, b = self._i(person_a), self._i(person_b)
+        distances_a = self._ancestor_distances(a)
+        distances_b = self._ancestor_distances(b)
+        common = [i for i in distances_a if i in distances_b]
+        common_set = set(common)
+        lowest = [
+            i for i in common
+            if not any(j in common_set for j in self.children[i])
+        ]
+        lowest.sort(key=lambda i: (distances_a[i] + distances_b[i], self.descendant_labels.post[i]))
+        return [(self.nodes[i], distances_a[i], distances_b[i]) for i in lowest]
+
+    def relationship(self, person_a, person_b):
+        """
+        Returns the blood relationship of person_b to person_a, or None if they
+        have no common ancestor:
+        {
+            "lowest_common_ancestors": [person_id, ...],
+            "up": 2,        # generations from person_a up to the common ancestor
+            "down": 2,      # generations from there down to person_b
+            "term": "first cousin"
+        }
+        """
+        lowest = self.lowest_common_ancestors(person_a, person_b)
+        if not lowest:
+            return None
+        _, up, down = lowest[0]
+        return {
+            "lowest_common_ancestors": [
+                person_id for person_id, a, b in lowest if (a, b) == (up, down)
+            ],
+            "up": up,
+            "down": down,
+            "term": kinship_term(up, down),
+        }
+
+    def relationship_path(self, person_a, person_b):
+        """
+        Returns a shortest chain of relations (of any type, in both directions)
+        from person_a to person_b, or None if they are not connected.
+
+        Returns:
+            list of (label, person_id): label is the role of person_id for the
+            previous person ("father", "mother", "child", "husband", "wife")
+        """
+        a, b = self._i(person_a), self._i(person_b)
+        previous = {a: None}
+        queue = deque([a])
+        while queue and b not in previous:
+            i = queue.popleft()
+            for j, label in self.neighbours[i]:
+                if j not in previous:
+                    previous[j] = (i, label)
+                    queue.append(j)
+        if b not in previous:
+            return None
+        path = []
+        i = b
+        while previous[i] is not None:
+            i_previous, label = previous[i]
+            path.append((label, self.nodes[i]))
+            i = i_previous
+        return path[::-1]
+
+    def node_weights(self):
+        """
+        Returns the "node_weight" of every person as computed by the notebook
+        graph_add_label_and_weight with all_pairs_dijkstra_path_length: the
+        number of persons reachable through at least one FATHER_CHILD or
+        MOTHER_CHILD edge (HUSBAND_WIFE edges have weight 0), i.e. the
+        descendants of the person and of its wives, and their spouses.
+        Computed with one interval labeling of all relations instead of a
+        shortest path search from every person.
+
+        Returns:
+            dict person_id -> node_weight
+        """
+        successors = [self.children[i] + self.spouses[i] for i in range(len(self.nodes))]
+        labels = ReachabilityLabels(successors)
+        weights = {}
+        for i, node in enumerate(self.nodes):
+            # persons reached through HUSBAND_WIFE edges only are at distance 0
+            spouses_only = {i}
+            stack = [i]
+            while stack:
+                for j in self.spouses[stack.pop()]:
+                    if j not in spouses_only:
+                        spouses_only.add(j)
+                        stack.append(j)
+            weights[node] = labels.count(i) - len(spouses_only)
+        return weights
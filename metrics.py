@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Instrumentation of chunking, extraction and graph building.
+
+A Metrics object is passed to the stages like the ExtractionCache (metrics=None
+disables it) and records events as JSON lines:
+
+    {"event": "stage", "stage": "extraction", "seconds": 812.4, ...}
+    {"event": "request", "model": "gpt-4o", "seconds": 3.1, "prompt_tokens": 2310,
+     "completion_tokens": 412, "retries": 0, "persons": 5, "chunk_chars": 804, ...}
+    {"event": "cache_hit", "model": "gpt-4o", ...}
+    {"event": "failed", "model": "gpt-4o", "retries": 5, "error": "RateLimitError", ...}
+    {"event": "pack_failed", "chunks": 12, "error": "packed answer is not JSON", ...}
+    {"event": "stream_aborted", "model": "gpt-4o", "error": "relations is not a list", "chars": 812, ...}
+    {"event": "routed", "model": "gpt-4o-mini", "outcome": "escalated", "confidence": 0.25, ...}
+    {"event": "chunks", "family": "Billeter", "sizes": [804, 312, ...], ...}
+    {"event": "graph", "created": 5210, "merged": 130, "nodes": 5210, ...}
+
+The scripts can append to the same file. summarize() condenses the events
+into wall time per stage, p50/p95 request latency, tokens, retries, cache
+hits, the distribution of the chunk sizes, merge statistics of the last built
+graph, tokens per extracted person and the outcomes per model tier (see
+model_router.py).
+
+One stage can be profiled: its cProfile stats are dumped to a file that can be
+read with pstats or snakeviz. cProfile only sees the calling thread/process,
+so profile the extraction with --workers 1 and the chunking with -j 1.
+
+    python pipeline.py ... --metrics build/metrics.jsonl --profile graph
+    python metrics.py build/metrics.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0 <= q <= 100) of values, interpolated
+    linearly between the closest ranks, or None for no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def distribution(values):
+    """
+    Returns count, min, p50, p95, max and mean of values.
+    """
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min": min(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values),
+        "mean": sum(values) / len(values),
+    }
+
+
+def count_persons(triples):
+    """
+    Returns the number of persons of an extraction answer, or None if it is
+    not an extraction JSON.
+    """
+    try:
+        persons = json.loads(triples).get("persons")
+    except (ValueError, AttributeError):
+        return None
+    return len(persons) if isinstance(persons, list) else None
+
+
+class Metrics:
+    def __init__(self, path=None, profile=None, profile_file=None):
+        """
+        Starts recording.
+
+        Parameters:
+            path: JSON lines file the events are appended to (None keeps
+                them in memory only)
+            profile: name of the stage to profile with cProfile
+            profile_file: file for the profile stats (default <profile>.prof
+                next to path)
+        """
+        self.path = path
+        self.profile = profile
+        if profile_file is None and profile is not None:
+            profile_file = os.path.join(os.path.dirname(path or ""), f"{profile}.prof")
+        self.profile_file = profile_file
+        self.events = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf8") if path is not None else None
+
+    def record(self, event, **fields):
+        """
+        Records an event (see module docstring) with the given fields.
+        """
+        entry = {"event": event, "time": round(time.time(), 3), **fields}
+        with self._lock:
+            self.events.append(entry)
+            if self._file is not None:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Context manager recording the wall time of a stage (and profiling
+        it if it is the chosen one).
+        """
+        profiler = None
+        if name == self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_file)
+            self.record("stage", stage=name, seconds=round(seconds, 4), **fields)
+
+    def request(self, model, seconds, usage, retries, persons=None, chunk_chars=None):
+        """
+        Records a finished completion request; usage is response.usage.
+        """
+        self.record(
+            "request", model=model, seconds=round(seconds, 4),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            retries=retries, persons=persons, chunk_chars=chunk_chars,
+        )
+
+    def summary(self):
+        return summarize(self.events)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_events(path):
+    """
+    Returns the events of a JSON lines file written by Metrics.
+    """
+    with open(path, encoding="utf8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def summarize(events):
+    """
+    Returns the summary report of a list of events as dict.
+    """
+    stages = {}
+    requests = []
+    cache_hits = 0
+    packs_failed = 0
+    streams_aborted = 0
+    failed = []
+    chunk_sizes = []
+    graph = {}
+    tiers = {}
+    for event in events:
+        kind = event["event"]
+        if kind == "stage":
+            stages[event["stage"]] = stages.get(event["stage"], 0) + event["seconds"]
+        elif kind == "request":
+            requests.append(event)
+        elif kind == "cache_hit":
+            cache_hits += 1
+        elif kind == "pack_failed":
+            packs_failed += 1
+        elif kind == "stream_aborted":
+            streams_aborted += 1
+        elif kind == "failed":
+            failed.append(event)
+        elif kind == "routed":
+            outcomes = tiers.setdefault(event["model"], {"chunks": 0})
+            outcomes["chunks"] += 1
+            outcomes[event["outcome"]] = outcomes.get(event["outcome"], 0) + 1
+        elif kind == "chunks":
+            chunk_sizes.extend(event["sizes"])
+        elif kind == "graph":
+            # every build replaces the graph, the last one counts
+            graph = {key: value for key, value in event.items() if key not in ("event", "time")}
+
+    latencies = [request["seconds"] for request in requests]
+    prompt_tokens = sum(request["prompt_tokens"] or 0 for request in requests)
+    completion_tokens = sum(request["completion_tokens"] or 0 for request in requests)
+    persons = sum(request["persons"] or 0 for request in requests)
+    if graph.get("created"):
+        graph["merge_rate"] = graph["merged"] / (graph["created"] + graph["merged"])
+    return {
+        "stages": {name: round(seconds, 4) for name, seconds in stages.items()},
+        "requests": {
+            "count": len(requests),
+            "failed": len(failed),
+            "retries": sum(event["retries"] for event in requests + failed),
+            "cache_hits": cache_hits,
+            "packs_failed": packs_failed,
+            "streams_aborted": streams_aborted,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_max": max(latencies, default=None),
+        },
+        "tokens": {
+            "prompt": prompt_tokens,
+            "completion": completion_tokens,
+            "persons_extracted": persons,
+            "per_person": (prompt_tokens + completion_tokens) / persons if persons else None,
+        },
+        "chunk_bytes": distribution(chunk_sizes),
+        "graph": graph,
+        "tiers": tiers,
+    }
+
+
+def format_summary(summary):
+    """
+    Returns the summary as readable text.
+    """
+    def number(value):
+        if value is None:
+            return "-"
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    lines = []
+    for section, values in summary.items():
+        lines.append(f"{section}:")
+        for key, value in values.items():
+            if isinstance(value, dict):
+                value = ", ".join(f"{count} {name}" for name, count in value.items())
+                lines.append(f"    {key:20} {value}")
+            else:
+                lines.append(f"    {key:20} {number(value)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize a metrics file written with --metrics.')
+    parser.add_argument('metrics', help='JSON lines file of the events.')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+    args = parser.parse_args()
+
+    try:
+        events = load_events(args.metrics)
+    except FileNotFoundError:
+        print(f"Error: '{args.metrics}' not found.")
+        sys.exit(1)
+    summary = summarize(events)
+    print(json.dumps(summary, indent=4) if args.json else format_summary(summary))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tiered model routing for the extraction (see chunk_to_graph.py).
+
+Most chunks are short entries a small model extracts as well as a large
+one. A ModelRouter sends every chunk to the cheapest tier first and checks
+the answer:
+
+* schema: valid JSON with valid persons and relations (see
+  extraction_schema.clean_extraction), relations only between persons of the
+  answer
+* plausible years: between MIN_YEAR and MAX_YEAR, lifespans up to MAX_AGE,
+  parents MIN_PARENT_AGE to MAX_PARENT_AGE years older than their children
+* confidence: the share of the lifespan years of the chunk ("1613-1654",
+  "+1665") found in the answer and the share of the persons linked by a
+  relation, whichever is lower
+
+Only answers with errors or a confidence below the min_confidence of their
+tier (and requests that fail) are escalated to the next tier. The answer of
+the last tier is taken as it is; the graph loader drops what is invalid.
+
+    router = ModelRouter([ModelTier("gpt-4o-mini"), ModelTier("gpt-4o")])
+    extract_directory("chunks/", "jsons/", prompt, client, router=router)
+    router.stats["gpt-4o-mini"]   # {"chunks": 120, "accepted": 104, "escalated": 16, ...}
+
+    python chunk_to_graph.py --input-dir chunks/ --output-dir jsons/ -p prompt.txt \
+        --tiers gpt-4o-mini gpt-4o
+
+A tier can use its own endpoint, e.g. a local model: --tiers llama3@http://127.0.0.1:8080/v1 gpt-4o
+"""
+
+import re
+import json
+import time
+import threading
+
+from extraction_schema import clean_extraction
+
+MIN_YEAR = 1000
+MAX_YEAR = 2000
+MAX_AGE = 110
+MIN_PARENT_AGE = 12
+MAX_PARENT_AGE = 80
+DEFAULT_MIN_CONFIDENCE = 0.4
+
+# years of birth ("1613-") and death ("-1654", "+1665") in the transcriptions
+lifespan_year_pattern = re.compile(r"\b(1\d{3})(?=\s?-)|[-+]\s?(1\d{3})\b")
+
+
+def lifespan_years(chunk):
+    return {int(birth or death) for birth, death in lifespan_year_pattern.findall(chunk)}
+
+
+def implausible_years(persons, relations):
+    """
+    Returns the error messages for the years of the (cleaned) persons and
+    relations of an answer that can not be right.
+    """
+    errors = []
+    births = {}
+    for person in persons:
+        number = person["person_number"]
+        birth, death = person.get("birth_year"), person.get("death_year")
+        for key, year in [("birth_year", birth), ("death_year", death)]:
+            if year is not None and not MIN_YEAR <= year <= MAX_YEAR:
+                errors.append(f"person {number}: implausible {key} {year}")
+        if birth is not None and death is not None and not 0 <= death - birth <= MAX_AGE:
+            errors.append(f"person {number}: implausible lifespan {birth}-{death}")
+        births[number] = birth
+    for relation in relations:
+        if relation["relation_type"] == "HUSBAND_WIFE":
+            continue
+        parent, child = births.get(relation["person_number_1"]), births.get(relation["person_number_2"])
+        if parent is not None and child is not None and not MIN_PARENT_AGE <= child - parent <= MAX_PARENT_AGE:
+            errors.append(
+                f"child {relation['person_number_2']} born {child} to person {relation['person_number_1']} born {parent}")
+    return errors
+
+
+def answer_confidence(persons, relations, chunk):
+    """
+    Returns the confidence (0 to 1) in an answer (see module docstring).
+    """
+    chunk_years = lifespan_years(chunk)
+    if not persons:
+        return 0.0 if chunk_years else 1.0
+    answer_years = {person.get(key) for person in persons for key in ("birth_year", "death_year")}
+    year_share = len(chunk_years & answer_years) / len(chunk_years) if chunk_years else 1.0
+    if len(persons) == 1:
+        return year_share
+    related = {relation[key] for relation in relations for key in ("person_number_1", "person_number_2")}
+    related_share = sum(person["person_number"] in related for person in persons) / len(persons)
+    return min(year_share, related_share)
+
+
+def validate_answer(answer, chunk):
+    """
+    Validates the answer for a chunk.
+
+    Returns:
+        (errors, confidence): list of error messages and the confidence
+    """
+    try:
+        data = json.loads(answer)
+    except ValueError:
+        return ["answer is not JSON"], 0.0
+    persons, relations, errors = clean_extraction(data)
+    errors.extend(implausible_years(persons, relations))
+    return errors, answer_confidence(persons, relations, chunk)
+
+
+class ModelTier:
+    def __init__(self, model, client=None, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """
+        Parameters:
+            model: model name
+            client: OpenAI client of the tier, None for the client the
+                extraction is called with
+            min_confidence: answers with a lower confidence are escalated
+        """
+        self.model = model
+        self.client = client
+        self.min_confidence = min_confidence
+
+    def __repr__(self):
+        return f"ModelTier({self.model!r}, min_confidence={self.min_confidence})"
+
+
+def parse_tiers(specs, client_for, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """
+    Returns the tiers of the --tiers arguments ("model" or "model@base url").
+
+    Parameters:
+        client_for: function returning the client for a base url
+    """
+    tiers = []
+    for spec in specs:
+        model, _, base_url = spec.partition("@")
+        tiers.append(ModelTier(model, client_for(base_url) if base_url else None, min_confidence))
+    return tiers
+
+
+class ModelRouter:
+    def __init__(self, tiers):
+        """
+        Parameters:
+            tiers: list of ModelTier, the cheapest first
+        """
+        if not tiers:
+            raise ValueError("a router needs at least one tier")
+        self.tiers = list(tiers)
+        # per tier: chunks asked, answers accepted, escalated (invalid or not
+        # confident enough), failed requests, invalid answers kept by the
+        # last tier and the seconds spent
+        self.stats = {
+            tier.model: {"chunks": 0, "accepted": 0, "escalated": 0, "failed": 0, "invalid": 0, "seconds": 0.0}
+            for tier in self.tiers
+        }
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        """
+        Names the tiers ("gpt-4o-mini>gpt-4o"), e.g. for the pipeline manifest.
+        """
+        return ">".join(tier.model for tier in self.tiers)
+
+    def _count(self, tier, outcome, start):
+        with self._lock:
+            stats = self.stats[tier.model]
+            stats["chunks"] += 1
+            stats[outcome] += 1
+            stats["seconds"] = round(stats["seconds"] + time.perf_counter() - start, 4)
+
+    def route(self, chunk, request, validate=None, on_escalate=None, metrics=None):
+        """
+        Asks the tiers in turn until an answer passes the validation.
+
+        Parameters:
+            chunk: text of the chunk
+            request: function called with a ModelTier returning the answer,
+                e.g. chunk2triple with the model and client of the tier
+            validate: function returning (errors, confidence) of an answer,
+                validate_answer for the chunk by default
+            on_escalate: called before the next tier is asked
+            metrics: optional Metrics recording a "routed" event per tier asked
+
+        Returns:
+            (answer, tier): the first answer that passes, or that of the last
+            tier; the request errors of the last tier are raised
+        """
+        for position, tier in enumerate(self.tiers):
+            last = position == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                answer = request(tier)
+            except Exception as e:
+                self._count(tier, "failed", start)
+                if metrics is not None:
+                    metrics.record("routed", model=tier.model, outcome="failed",
+                                   error=type(e).__name__, chunk_chars=len(chunk))
+                if last:
+                    raise
+                if on_escalate is not None:
+                    on_escalate()
+                continue
+            errors, confidence = validate(answer) if validate is not None else validate_answer(answer, chunk)
+            passed = not errors and confidence >= tier.min_confidence
+            outcome = "accepted" if passed else "invalid" if last else "escalated"
+            self._count(tier, outcome, start)
+            if metrics is not None:
+                metrics.record("routed", model=tier.model, outcome=outcome, confidence=round(confidence, 3),
+                               errors=errors[:3], chunk_chars=len(chunk))
+            if passed or last:
+                return answer, tier
+            if on_escalate is not None:
+                on_escalate()
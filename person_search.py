@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Search index over the persons of a FamilyGraph for interactive lookup.
+
+PersonSearchIndex keeps
+
+* inverted indexes of the words of family_name, given_name, profession and
+  origin, with the distinct words in a sorted list for prefix lookups
+* sorted arrays of birth_year and death_year for range queries
+
+Words are compared by a normalized spelling: case-folded, umlauts spelled out,
+abbreviations and variants of given names expanded (see entity_resolution)
+and spelling variants folded ("Caspar" and "Kaspar", "Männedorf" and
+"Mänedorf", "Schlosser" and "Schloßer" give the same word).
+
+Once built, the index is kept up to date by the graph (like the provenance
+index): add_person, merge_persons, restore and retract_extraction update the
+persons they change.
+
+    index = PersonSearchIndex(graph)
+    index.search(given_name="Hans Caspar", profession="Pfarrer", birth_year=(1600, 1650),
+                 origin="Männedorf")
+
+Usage as CLI:
+
+    python person_search.py -g graph.gexf --given-name "Hans Caspar" --profession Pfarrer \
+        --born 1600-1650 --origin Männedorf
+"""
+
+import re
+import sys
+import heapq
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from entity_resolution import GIVEN_NAME_FORMS, NAME_PARTICLES, name_words
+
+# spelling variants folded by spelling_key, in this order
+SPELLING_RULES = [("ph", "f"), ("th", "t"), ("dt", "t"), ("ck", "k"), ("c", "k"), ("y", "i"), ("tz", "z")]
+double_letter_pattern = re.compile(r"(.)\1+")
+
+TEXT_FIELDS = ("family_name", "given_name", "profession", "origin")
+
+
+def spelling_key(word):
+    """
+    Returns the normalized spelling of a (case-folded) word.
+    """
+    for old, new in SPELLING_RULES:
+        word = word.replace(old, new)
+    return double_letter_pattern.sub(r"\1", word)
+
+
+@lru_cache(maxsize=1 << 16)
+def field_words(field, text):
+    """
+    Returns the normalized words of the value of a text field (also used for
+    the words of a query). Cached, as the same names, professions and
+    origins come up again and again.
+    """
+    if text is None:
+        return ()
+    words = name_words(text)
+    if field == "family_name":
+        words = [word for word in words if word not in NAME_PARTICLES]
+    elif field == "given_name":
+        words = [GIVEN_NAME_FORMS.get(word, word) for word in words]
+    return tuple(dict.fromkeys(spelling_key(word) for word in words))
+
+
+def year_of(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+class WordIndex:
+    def __init__(self):
+        """
+        Inverted index word -> set of person ids, with the words in a sorted
+        list for prefix lookups.
+        """
+        self.postings = {}
+        self.words = []
+
+    def add(self, word, person_id):
+        ids = self.postings.get(word)
+        if ids is None:
+            ids = self.postings[word] = set()
+            self.words.insert(bisect_left(self.words, word), word)
+        ids.add(person_id)
+
+    def remove(self, word, person_id):
+        ids = self.postings.get(word)
+        if ids is None:
+            return
+        ids.discard(person_id)
+        if not ids:
+            del self.postings[word]
+            del self.words[bisect_left(self.words, word)]
+
+    def lookup(self, word, prefix=False):
+        """
+        Returns the list of the sets of persons with the word (or with the
+        words starting with it); the sets must not be changed.
+        """
+        if not prefix:
+            return [self.postings[word]] if word in self.postings else []
+        start = bisect_left(self.words, word)
+        end = bisect_left(self.words, word + "\uffff", start)
+        return [self.postings[found] for found in self.words[start:end]]
+
+
+class YearIndex:
+    def __init__(self, pairs=()):
+        """
+        Sorted array of years with the persons in the same order, for range
+        queries.
+
+        Parameters:
+            pairs: iterable of (year, person id) to start with
+        """
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.years = array("i", (year for year, _ in pairs))
+        self.ids = [person_id for _, person_id in pairs]
+
+    def add(self, year, person_id):
+        i = bisect_right(self.years, year)
+        self.years.insert(i, year)
+        self.ids.insert(i, person_id)
+
+    def remove(self, year, person_id):
+        i = self.ids.index(person_id, bisect_left(self.years, year), bisect_right(self.years, year))
+        del self.years[i]
+        del self.ids[i]
+
+    def range(self, first=None, last=None):
+        """
+        Returns the persons with first <= year <= last (None: open end).
+        """
+        start = 0 if first is None else bisect_left(self.years, first)
+        end = len(self.years) if last is None else bisect_right(self.years, last)
+        return self.ids[start:end]
+
+
+class PersonSearchIndex:
+    def __init__(self, graph):
+        """
+        Indexes all persons of graph (a FamilyGraph or one of its subclasses)
+        and attaches the index to it (graph.search_index), so the graph keeps
+        it up to date.
+        """
+        self.graph = graph
+        # person id -> (words of the TEXT_FIELDS..., birth_year, death_year)
+        self.entries = {}
+        self.words = {field: WordIndex() for field in TEXT_FIELDS}
+        for person_id, attributes in graph.G.nodes(data=True):
+            entry = self._entry(attributes)
+            self.entries[person_id] = entry
+            for field, words in zip(TEXT_FIELDS, entry):
+                postings = self.words[field].postings
+                for word in words:
+                    postings.setdefault(word, set()).add(person_id)
+        for index in self.words.values():
+            index.words = sorted(index.postings)
+        self.birth_years = YearIndex(
+            (entry[4], person_id) for person_id, entry in self.entries.items() if entry[4] is not None)
+        self.death_years = YearIndex(
+            (entry[5], person_id) for person_id, entry in self.entries.items() if entry[5] is not None)
+        graph.search_index = self
+
+    def _entry(self, attributes):
+        return tuple(field_words(field, attributes.get(field)) for field in TEXT_FIELDS) + (
+            year_of(attributes.get("birth_year")), year_of(attributes.get("death_year")))
+
+    def update(self, person_id, attributes):
+        """
+        Indexes a new person or the changed attributes of a person.
+        """
+        entry = self._entry(attributes)
+        old = self.entries.get(person_id)
+        if old == entry:
+            return
+        if old is not None:
+            self.remove(person_id)
+        self.entries[person_id] = entry
+        for field, words in zip(TEXT_FIELDS, entry):
+            for word in words:
+                self.words[field].add(word, person_id)
+        if entry[4] is not None:
+            self.birth_years.add(entry[4], person_id)
+        if entry[5] is not None:
+            self.death_years.add(entry[5], person_id)
+
+    def remove(self, person_id):
+        entry = self.entries.pop(person_id, None)
+        if entry is None:
+            return
+        for field, words in zip(TEXT_FIELDS, entry):
+            for word in words:
+                self.words[field].remove(word, person_id)
+        if entry[4] is not None:
+            self.birth_years.remove(entry[4], person_id)
+        if entry[5] is not None:
+            self.death_years.remove(entry[5], person_id)
+
+    def search(self, family_name=None, given_name=None, profession=None, origin=None,
+               birth_year=None, death_year=None, prefix=True, limit=None):
+        """
+        Returns the persons matching all given criteria.
+
+        Parameters:
+            family_name, given_name, profession, origin: every word has to
+                match a word of the attribute in its normalized spelling (with
+                prefix also the beginning of a word, for search as you type)
+            birth_year, death_year: a year or a (first, last) range, either
+                end may be None
+            limit: maximum number of persons returned
+
+        Returns:
+            list of person ids, sorted by birth year (unknown last)
+        """
+        # the postings of every query word, starting with the most selective
+        matches = [
+            self.words[field].lookup(word, prefix)
+            for field, text in zip(TEXT_FIELDS, [family_name, given_name, profession, origin])
+            for word in field_words(field, text)
+        ]
+        matches = sorted(((sum(map(len, sets)), sets) for sets in matches), key=lambda match: match[0])
+        candidates = None
+        if matches:
+            candidates = set().union(*matches[0][1])
+            for size, sets in matches[1:]:
+                if not candidates:
+                    break
+                if len(sets) == 1:
+                    candidates &= sets[0]
+                elif len(candidates) * len(sets) < size:
+                    candidates = {person_id for person_id in candidates if any(person_id in ids for ids in sets)}
+                else:
+                    candidates &= set().union(*sets)
+            if not candidates:
+                return []
+
+        for position, years, value in [(4, self.birth_years, birth_year), (5, self.death_years, death_year)]:
+            if value is None:
+                continue
+            first, last = (value, value) if isinstance(value, int) else value
+            if candidates is None:
+                candidates = set(years.range(first, last))
+            else:
+                # the other criteria are usually more selective than a range
+                candidates = {
+                    person_id for person_id in candidates
+                    if self.entries[person_id][position] is not None
+                    and (first is None or self.entries[person_id][position] >= first)
+                    and (last is None or self.entries[person_id][position] <= last)
+                }
+        if candidates is None:
+            candidates = self.entries
+
+        def key(person_id):
+            entry = self.entries[person_id]
+            return entry[4] is None, entry[4] or 0, entry[1], entry[0]
+
+        if limit is not None:
+            return heapq.nsmallest(limit, candidates, key=key)
+        return sorted(candidates, key=key)
+
+
+def parse_years(text):
+    """
+    Returns a year or (first, last) range from "1620", "1600-1650", "1600-" or "-1650".
+    """
+    if text is None:
+        return None
+    if "-" not in text:
+        return int(text)
+    first, last = text.split("-", 1)
+    return (int(first) if first else None, int(last) if last else None)
+
+
+if __name__ == "__main__":
+    from family_graph import FamilyGraph
+
+    parser = argparse.ArgumentParser(description='Search the persons of a saved family graph.')
+    parser.add_argument('--graph', '-g', required=True, help='Graph file (.gexf, .graphml or .parquet).')
+    parser.add_argument('--family-name', default=None, help='Words of the family name.')
+    parser.add_argument('--given-name', default=None, help='Words of the given name.')
+    parser.add_argument('--profession', default=None, help='Words of the profession.')
+    parser.add_argument('--origin', default=None, help='Words of the origin.')
+    parser.add_argument('--born', default=None, help='Birth year or range, e.g. 1600-1650.')
+    parser.add_argument('--died', default=None, help='Death year or range, e.g. 1650-.')
+    parser.add_argument('--exact', action='store_true', help='Match whole words only (no prefixes).')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum number of persons printed.')
+    args = parser.parse_args()
+
+    try:
+        graph = FamilyGraph.load(args.graph)
+        born, died = parse_years(args.born), parse_years(args.died)
+    except FileNotFoundError:
+        print(f"Error: '{args.graph}' not found.")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    index = PersonSearchIndex(graph)
+    for person_id in index.search(args.family_name, args.given_name, args.profession, args.origin,
+                                  born, died, prefix=not args.exact, limit=args.limit):
+        person = graph.G.nodes[person_id]
+        years = f"{person['birth_year'] or '?'}-{person['death_year'] or '?'}"
+        details = ", ".join(str(person[key]) for key in ["profession", "origin"] if person.get(key))
+        print(f"{graph.person_uuid(person_id)}  {person['given_name']} {person['family_name']} ({years}) {details}")
+    sys.exit(0)
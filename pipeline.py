@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Incremental end-to-end pipeline: transcriptions -> person chunks -> extraction
+JSONs -> graph.
+
+All stages write into one build directory:
+
+    build/chunks/        person chunks (txt_to_chunks.py)
+    build/extractions/   one JSON per chunk (chunk_to_graph.py)
+    build/graph.sqlite   the family graph with the contributions of every
+                         extraction (see graph_store.py)
+    build/graph.gexf     the family graph exported for Gephi
+    build/provenance.sqlite  source spans of the chunks and extractions of the nodes
+                         (see provenance.py)
+    build/manifest.json  hashes of all inputs and outputs of the last run
+
+On a rerun only the stages downstream of changed files are redone: a family is
+re-chunked if one of its *_md.txt files was added, removed or changed, a chunk
+is re-extracted if its text, the prompt or the model (or model tiers) changed, and only
+the changed and removed extraction JSONs are retracted from the graph and merged
+again (see FamilyGraph.replace_extraction).
+
+Usage:
+
+    python pipeline.py -i promptuarium/ -o build/ -p promts/prompt_pilou02.txt
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from contextlib import nullcontext
+
+import txt_to_chunks
+from extraction_cache import text_hash
+from chunk_to_graph import DEFAULT_MODEL, DEFAULT_TOKEN_BUDGET, load_client, promptread, extract_files
+from model_router import DEFAULT_MIN_CONFIDENCE, ModelRouter, parse_tiers
+from graph_store import StoredFamilyGraph
+from graph_io import write_gexf
+from build_graph import summarize
+from provenance import ProvenanceIndex, chunk_id_of
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(path):
+    """
+    Returns the hex sha256 hash of the content of a file.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class BuildManifest:
+    def __init__(self, path):
+        """
+        Loads the manifest stored at path, or starts an empty one.
+
+        The manifest is a JSON file with the sections:
+            chunk_settings: options used for chunking
+            families: family -> {"sources": {md file: hash}, "chunks": [chunk files]}
+            extractions: chunk file -> {"chunk_hash", "prompt_hash", "model", "output"}
+            graph: {"inputs": {extraction file: hash}, "output": graph file,
+                    "store": stored graph the inputs are merged into}
+        """
+        self.path = path
+        self.data = {
+            "version": MANIFEST_VERSION,
+            "chunk_settings": None,
+            "families": {},
+            "extractions": {},
+            "graph": {"inputs": {}, "output": None},
+        }
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as file:
+                data = json.load(file)
+            if data.get("version") == MANIFEST_VERSION:
+                self.data = data
+
+    @property
+    def families(self):
+        return self.data["families"]
+
+    @property
+    def extractions(self):
+        return self.data["extractions"]
+
+    @property
+    def graph(self):
+        return self.data["graph"]
+
+    def save(self):
+        """
+        Writes the manifest atomically.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            json.dump(self.data, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def update_chunks(manifest, input_directory, chunks_dir, chunk_settings, metrics=None, provenance=None):
+    """
+    Re-chunks all families whose transcription files changed since the last
+    run and removes the chunks of families that disappeared (also from the
+    ProvenanceIndex provenance).
+
+    Returns:
+        list of re-chunked families
+    """
+    sources = {}
+    for md_file in txt_to_chunks.find_md_files(input_directory):
+        sources.setdefault(txt_to_chunks.family_name(md_file), {})[md_file] = file_hash(md_file)
+
+    settings_changed = manifest.data["chunk_settings"] != chunk_settings
+    manifest.data["chunk_settings"] = chunk_settings
+
+    for family in set(manifest.families) - set(sources):
+        logging.info(f"Family {family} was removed")
+        chunks = manifest.families.pop(family)["chunks"]
+        remove_files(chunks)
+        if provenance is not None:
+            provenance.remove_chunks(map(chunk_id_of, chunks))
+
+    dirty = {}
+    for family, family_sources in sorted(sources.items()):
+        entry = manifest.families.get(family)
+        if (
+            not settings_changed
+            and entry is not None
+            and entry["sources"] == family_sources
+            and all(os.path.exists(chunk) for chunk in entry["chunks"])
+        ):
+            continue
+        if entry is not None:
+            remove_files(entry["chunks"])
+            if provenance is not None:
+                provenance.remove_chunks(map(chunk_id_of, entry["chunks"]))
+        dirty[family] = sorted(family_sources)
+
+    settings = txt_to_chunks.ChunkSettings(**chunk_settings)
+    for family, written in txt_to_chunks.chunk_families(
+            dirty, chunks_dir, settings, metrics=metrics, provenance=provenance):
+        manifest.families[family] = {
+            "sources": sources[family],
+            "chunks": written,
+        }
+    return sorted(dirty)
+
+
+def update_extractions(manifest, extractions_dir, prompt, model, client_factory,
+                       workers=8, cache=None, metrics=None, token_budget=None, router=None):
+    """
+    Extracts all chunks whose text, prompt or model changed since the last run
+    and removes the extractions of chunks that disappeared.
+
+    Parameters:
+        client_factory: function returning the OpenAI client, only called if
+            there is anything to extract
+        token_budget: pack chunks into requests up to this many tokens (see
+            chunk_to_graph.extract_chunks)
+        router: optional ModelRouter used instead of model (see model_router.py)
+
+    Returns:
+        report of extract_files (or an empty report)
+    """
+    prompt_hash = text_hash(prompt)
+    chunks = {
+        chunk for entry in manifest.families.values() for chunk in entry["chunks"]
+    }
+
+    for chunk in set(manifest.extractions) - chunks:
+        remove_files([manifest.extractions.pop(chunk)["output"]])
+
+    jobs = []
+    pending = {}
+    for chunk in sorted(chunks):
+        chunk_hash = file_hash(chunk)
+        output = os.path.join(
+            extractions_dir, os.path.splitext(os.path.basename(chunk))[0] + ".json"
+        )
+        record = {
+            "chunk_hash": chunk_hash,
+            "prompt_hash": prompt_hash,
+            "model": router.name if router is not None else model,
+            "output": output,
+        }
+        if manifest.extractions.get(chunk) == record and os.path.exists(output):
+            continue
+        manifest.extractions.pop(chunk, None)
+        jobs.append((chunk, output))
+        pending[output] = (chunk, record)
+
+    if not jobs:
+        return {"written": [], "failed": []}
+
+    logging.info(f"Extracting {len(jobs)} of {len(chunks)} chunks")
+    report = extract_files(jobs, prompt, client_factory(), model=model,
+                           workers=workers, cache=cache, metrics=metrics,
+                           token_budget=token_budget, router=router)
+    for output in report["written"]:
+        chunk, record = pending[output]
+        manifest.extractions[chunk] = record
+    return report
+
+
+def update_graph(manifest, graph_file, store_file, metrics=None, provenance=None):
+    """
+    Brings the graph up to date with the extraction JSONs: the files that
+    changed or disappeared since the last run are retracted from the stored
+    graph (see graph_store.StoredFamilyGraph) and the changed ones merged
+    again. Without a store of the last run the graph is built from scratch.
+    The mentions of the nodes are recorded in provenance.
+
+    Returns:
+        None if the graph is unchanged, else {"rebuilt": bool, "replaced":
+        [extraction files], "retracted": [extraction files]}
+    """
+    inputs = {
+        record["output"]: file_hash(record["output"])
+        for record in manifest.extractions.values()
+    }
+    if manifest.graph["inputs"] == inputs and os.path.exists(graph_file) and os.path.exists(store_file):
+        return None
+
+    rebuilt = manifest.graph.get("store") != store_file or not os.path.exists(store_file)
+    previous = {} if rebuilt else manifest.graph["inputs"]
+    if rebuilt:
+        remove_files([store_file, store_file + "-wal", store_file + "-shm"])
+        if provenance is not None:
+            provenance.clear_mentions()
+    # the graph doesn't match the manifest until it is committed
+    manifest.data["graph"] = {"inputs": {}, "output": None}
+    manifest.save()
+
+    retracted = sorted(set(previous) - set(inputs))
+    replaced = sorted(file for file, file_hash in inputs.items() if previous.get(file) != file_hash)
+    with StoredFamilyGraph(store_file) as graph:
+        graph.provenance = provenance
+        graph.track_contributions()
+        for file in retracted:
+            graph.retract_extraction(file)
+        reports = [graph.replace_extraction(file) for file in replaced]
+        graph.load_all()
+        if provenance is not None:
+            provenance.commit()
+        for report in reports:
+            for error in report["errors"]:
+                logging.warning(f"{report['file']}: {error}")
+        if metrics is not None:
+            metrics.record("graph", nodes=graph.G.number_of_nodes(), edges=graph.G.number_of_edges(),
+                           retracted=len(retracted), **summarize(reports))
+        write_gexf(graph, graph_file)
+    manifest.data["graph"] = {"inputs": inputs, "output": graph_file, "store": store_file}
+    return {"rebuilt": rebuilt, "replaced": replaced, "retracted": retracted}
+
+
+def run_pipeline(input_directory, build_directory, prompt_file, model=DEFAULT_MODEL,
+                 client_factory=load_client, workers=8, cache=None, chunk_settings=None,
+                 metrics=None, token_budget=None, router=None):
+    """
+    Runs all stages incrementally (see module docstring). metrics (see
+    metrics.py) records the wall time of the stages "chunking", "extraction"
+    and "graph" and the statistics of each of them.
+
+    Returns:
+        report: dict with "rechunked" families, the extraction report and
+            the "graph" update (see update_graph)
+    """
+    chunks_dir = os.path.join(build_directory, "chunks")
+    extractions_dir = os.path.join(build_directory, "extractions")
+    os.makedirs(chunks_dir, exist_ok=True)
+    os.makedirs(extractions_dir, exist_ok=True)
+
+    manifest = BuildManifest(os.path.join(build_directory, "manifest.json"))
+    provenance_file = os.path.join(build_directory, "provenance.sqlite")
+    if not os.path.exists(provenance_file):
+        # a new index needs the spans of all chunks and the mentions of all nodes
+        manifest.data["chunk_settings"] = None
+        manifest.data["graph"] = {"inputs": {}, "output": None}
+    provenance = ProvenanceIndex(provenance_file)
+    settings = {
+        "footnote_delimiter_start": " FNS",
+        "footnote_delimiter_end": "FNE",
+        "remove_hyphenation": True,
+        "remove_html": True,
+    }
+    settings.update(chunk_settings or {})
+
+    stage = metrics.stage if metrics is not None else lambda name: nullcontext()
+
+    with stage("chunking"):
+        rechunked = update_chunks(manifest, input_directory, chunks_dir, settings, metrics, provenance)
+    manifest.save()
+
+    with stage("extraction"):
+        extraction_report = update_extractions(
+            manifest, extractions_dir, promptread(prompt_file), model, client_factory,
+            workers=workers, cache=cache, metrics=metrics, token_budget=token_budget, router=router,
+        )
+    manifest.save()
+
+    with stage("graph"):
+        graph_update = update_graph(manifest, os.path.join(build_directory, "graph.gexf"),
+                                    os.path.join(build_directory, "graph.sqlite"), metrics, provenance)
+    manifest.save()
+    provenance.close()
+
+    return {
+        "rechunked": rechunked,
+        "extractions": extraction_report,
+        "graph": graph_update,
+    }
+
+
+if __name__ == "__main__":
+    from extraction_cache import ExtractionCache
+    from metrics import Metrics, format_summary
+
+    parser = argparse.ArgumentParser(description='Incrementally run chunking, extraction and graph building.')
+    parser.add_argument('--input-directory', '-i', required=True, help='Directory containing the *_md.txt transcriptions.')
+    parser.add_argument('--build-directory', '-o', required=True, help='Directory for chunks, extractions, graph and manifest.')
+    parser.add_argument('--prompt', '-p', required=True, help='File containing prompt.')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Model name.')
+    parser.add_argument('--tiers', nargs='+', default=None,
+                        help='Models to try in turn, the cheapest first (model or model@base_url); overrides --model.')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help='Answers with a lower confidence are sent to the next tier (see model_router.py).')
+    parser.add_argument('--workers', type=int, default=8, help='Maximum number of concurrent requests.')
+    parser.add_argument('--cache', default=None, help='SQLite file caching responses (see extraction_cache.py).')
+    parser.add_argument('--token-budget', type=int, nargs='?', const=DEFAULT_TOKEN_BUDGET, default=None,
+                        help=f'Pack chunks of a family into one request up to this many tokens (default {DEFAULT_TOKEN_BUDGET}).')
+    parser.add_argument('--api-key-file', default='api_key.txt', help='File containing the API key.')
+    parser.add_argument('--base-url', default=None, help='Base url of an alternative (e.g. local) endpoint.')
+    parser.add_argument('--metrics', default=None, help='JSON lines file for timings, token usage and statistics (see metrics.py).')
+    parser.add_argument('--profile', choices=['chunking', 'extraction', 'graph'], help='Dump cProfile stats of a stage next to --metrics.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    cache = ExtractionCache(args.cache) if args.cache is not None else None
+    metrics = Metrics(args.metrics, profile=args.profile) if args.metrics is not None else None
+    router = None
+    if args.tiers is not None:
+        router = ModelRouter(parse_tiers(
+            args.tiers, lambda base_url: load_client(args.api_key_file, base_url), args.min_confidence))
+    report = run_pipeline(
+        args.input_directory, args.build_directory, args.prompt, model=args.model,
+        client_factory=lambda: load_client(args.api_key_file, args.base_url),
+        workers=args.workers, cache=cache, metrics=metrics, token_budget=args.token_budget,
+        router=router,
+    )
+    if metrics is not None:
+        print(format_summary(metrics.summary()))
+        metrics.close()
+    print(f"{len(report['rechunked'])} families re-chunked, "
+          f"{len(report['extractions']['written'])} chunks extracted, "
+          f"{len(report['extractions']['failed'])} failed, "
+          + ("graph unchanged" if report["graph"] is None
+             else "graph rebuilt" if report["graph"]["rebuilt"]
+             else f"graph updated ({len(report['graph']['replaced'])} extractions replaced, "
+                  f"{len(report['graph']['retracted'])} retracted)"))
+    sys.exit(1 if report['extractions']['failed'] else 0)
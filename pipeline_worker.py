@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Resident pipeline worker: keeps the OpenAI client, the prompt and the family
+graph warm and processes jobs as they come in, so a new chunk only costs its
+request (no interpreter start, imports, client setup or graph loading).
+
+Jobs are JSON objects:
+
+    {"type": "chunk", "name": "Billeter_12", "text": "12\\. Hs. Caspar ..."}
+    {"type": "chunk", "path": "chunks/Billeter_12.txt"}
+    {"type": "extraction", "path": "jsons/Billeter_12.json"}
+    {"type": "extraction", "name": "Billeter_12", "data": {"persons": [...], "relations": [...]}}
+    {"type": "save", "path": "graph.gexf"}
+    {"type": "stats"}
+
+Chunks and extractions sent inline need a name, which takes the place of the
+file name.
+
+A chunk is extracted (streamed and validated, see
+chunk_to_graph.stream_chunk2triple), written to the output directory and
+merged into the graph; an extraction is merged as it is. The graph tracks
+the contributions of the extraction files, so a chunk or extraction that
+comes in again replaces what its earlier version contributed (see
+FamilyGraph.replace_extraction). The prompt file is read again when it changes.
+With --tiers chunks go to a cheap model first and only answers that fail the
+validation to the next tier (see model_router.py); "stats" reports the tiers.
+
+Jobs are sent over a Unix socket (one JSON object per line, answered with
+one line) or dropped into a watched directory (*.txt chunks and *.json
+extractions, moved to done/ or failed/ once processed; write them under
+another name and rename them, so they are never read half written):
+
+    python pipeline_worker.py serve -p promts/prompt_pilou02.txt --graph build/worker.sqlite \
+        --output-dir build/extractions --socket /tmp/promptuarium.sock --watch build/inbox
+    python pipeline_worker.py submit --socket /tmp/promptuarium.sock chunks/Billeter_12.txt
+
+With a .sqlite graph the worker works on a graph_store.StoredFamilyGraph and
+commits after every job, any other graph file is loaded at the start and
+saved on "save" jobs and at the end.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+
+from chunk_to_graph import (DEFAULT_MODEL, load_client, promptread, stream_chunk2triple,
+                            write_atomic)
+from model_router import DEFAULT_MIN_CONFIDENCE, ModelRouter, parse_tiers
+
+# seconds between two scans of the watched directory
+POLL_INTERVAL = 0.5
+
+
+def open_graph(path):
+    """
+    Returns the graph the worker works on: a StoredFamilyGraph for .sqlite
+    files, else a FamilyGraph loaded from path if it exists, tracking the
+    contributions of the extractions merged from now on.
+    """
+    if path is not None and path.endswith(".sqlite"):
+        from graph_store import StoredFamilyGraph
+        graph = StoredFamilyGraph(path)
+    else:
+        from family_graph import FamilyGraph
+        graph = FamilyGraph.load(path) if path is not None and os.path.exists(path) else FamilyGraph()
+    graph.track_contributions()
+    return graph
+
+
+class PipelineWorker:
+    def __init__(self, prompt_file, graph, graph_path=None, output_dir=None, model=DEFAULT_MODEL,
+                 client_factory=load_client, max_retries=5, cache=None, metrics=None, router=None):
+        """
+        Sets up the worker; the client is created with the first chunk job
+        (or by warm_up).
+
+        Parameters:
+            prompt_file: file containing the prompt
+            graph: FamilyGraph (or subclass) to merge into (see open_graph)
+            graph_path: file the graph is saved to at the end (unless stored)
+            output_dir: directory the extraction JSONs of chunk jobs are
+                written to (None: not written)
+            client_factory: function returning the OpenAI client
+            (model, max_retries, cache and metrics see chunk_to_graph.chunk2triple)
+            router: optional ModelRouter used instead of model (see model_router.py)
+        """
+        self.prompt_file = prompt_file
+        self.graph = graph
+        self.graph_path = graph_path
+        self.output_dir = output_dir
+        self.model = model
+        self.client_factory = client_factory
+        self.max_retries = max_retries
+        self.cache = cache
+        self.metrics = metrics
+        self.router = router
+        self.jobs = 0
+        self._client = None
+        self._prompt = None
+        self._prompt_mtime = None
+        self._client_lock = threading.Lock()
+        self._graph_lock = threading.Lock()
+        # the job types clients may send (see module docstring)
+        self._handlers = {
+            "chunk": self._chunk,
+            "extraction": self._extraction,
+            "save": self._save,
+            "stats": self._stats,
+        }
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def warm_up(self):
+        """
+        Creates the client and reads the prompt before the first job.
+        """
+        self.client()
+        self.prompt()
+
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def prompt(self):
+        """
+        Returns the prompt, read again if the file changed.
+        """
+        mtime = os.stat(self.prompt_file).st_mtime_ns
+        if mtime != self._prompt_mtime:
+            self._prompt = promptread(self.prompt_file)
+            self._prompt_mtime = mtime
+        return self._prompt
+
+    def handle(self, job):
+        """
+        Processes a job (see module docstring) and returns the answer as dict
+        with "ok" and either the result or the "error".
+        """
+        start = time.perf_counter()
+        try:
+            handler = self._handlers.get(job.get("type"))
+            if handler is None:
+                raise ValueError(f"unknown job type {job.get('type')!r}")
+            result = handler(job)
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        self.jobs += 1
+        return {"ok": True, "seconds": round(time.perf_counter() - start, 4), **result}
+
+    def _merge(self, extraction):
+        with self._graph_lock:
+            if self.graph.extraction_contributions is not None:
+                report = self.graph.replace_extraction(extraction)
+            else:
+                report = self.graph.add_extraction(extraction)
+            if hasattr(self.graph, "commit"):
+                self.graph.commit()
+        return report
+
+    def _job_name(self, job):
+        # the name keys the contributions (see _merge), so a default name would
+        # let every unnamed job retract the one before
+        if "name" not in job:
+            raise ValueError(f"{job['type']} job without a path needs a name")
+        return job["name"]
+
+    def _chunk(self, job):
+        if "text" in job:
+            name, text = self._job_name(job), job["text"]
+        else:
+            name = os.path.splitext(os.path.basename(job["path"]))[0]
+            with open(job["path"], encoding="utf8") as file:
+                text = file.read().strip()
+        elements = {"persons": [], "relations": []}
+
+        def on_element(kind, element):
+            elements[kind + "s"].append(element)
+
+        def on_abort():
+            elements["persons"].clear()
+            elements["relations"].clear()
+
+        prompt, client = self.prompt(), self.client()
+        parser = None
+
+        def request(model, client):
+            nonlocal parser
+            triples, parser = stream_chunk2triple(
+                text, prompt, client, model, max_retries=self.max_retries,
+                cache=self.cache, metrics=self.metrics, on_element=on_element, on_abort=on_abort)
+            return triples
+
+        model = self.model
+        if self.router is None:
+            triples = request(model, client)
+        else:
+            triples, tier = self.router.route(text, lambda tier: request(tier.model, tier.client or client),
+                                              on_escalate=on_abort, metrics=self.metrics)
+            model = tier.model
+        output = None
+        if self.output_dir is not None:
+            output = os.path.join(self.output_dir, name + ".json")
+            write_atomic(output, triples)
+        report = self._merge({
+            "file": output or name,
+            **elements,
+            "errors": parser.errors,
+            "dropped_persons": parser.dropped_persons,
+            "dropped_relations": parser.dropped_relations,
+        })
+        return {**report, "output": output, "model": model}
+
+    def _extraction(self, job):
+        from family_graph import parse_extraction
+        if "data" in job:
+            extraction = parse_extraction((self._job_name(job), job["data"]))
+        else:
+            extraction = parse_extraction(job["path"])
+        return self._merge(extraction)
+
+    def _save(self, job):
+        path = job.get("path", self.graph_path)
+        with self._graph_lock:
+            self.graph.save(path)
+        return {"path": path}
+
+    def _stats(self, job):
+        with self._graph_lock:
+            stats = {
+                "jobs": self.jobs,
+                "persons": self.graph.G.number_of_nodes(),
+                "relations": self.graph.G.number_of_edges(),
+            }
+        if self.router is not None:
+            stats["tiers"] = self.router.stats
+        return stats
+
+    def close(self):
+        """
+        Saves (or commits and closes) the graph.
+        """
+        with self._graph_lock:
+            if hasattr(self.graph, "close"):
+                self.graph.close()
+            elif self.graph_path is not None:
+                self.graph.save(self.graph_path)
+
+    def serve_socket(self, path):
+        """
+        Returns a (not yet started) server answering the jobs sent to the
+        Unix socket at path; call serve_forever() on it.
+        """
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        answer = worker.handle(json.loads(line))
+                    except ValueError as e:
+                        answer = {"ok": False, "error": f"invalid job: {e}"}
+                    self.wfile.write(json.dumps(answer).encode("utf8") + b"\n")
+                    self.wfile.flush()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        server.daemon_threads = True
+        return server
+
+    def scan(self, directory):
+        """
+        Processes the *.txt chunks and *.json extractions in directory and
+        moves them to done/ or failed/ (with the error in <name>.error).
+
+        Returns:
+            list of (file name, answer)
+        """
+        answers = []
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".txt"):
+                job = {"type": "chunk", "path": entry.path}
+            elif entry.name.endswith(".json"):
+                job = {"type": "extraction", "path": entry.path}
+            else:
+                continue
+            answer = self.handle(job)
+            target = os.path.join(directory, "done" if answer["ok"] else "failed")
+            os.makedirs(target, exist_ok=True)
+            os.replace(entry.path, os.path.join(target, entry.name))
+            if not answer["ok"]:
+                with open(os.path.join(target, entry.name + ".error"), "w", encoding="utf8") as file:
+                    file.write(answer["error"])
+            answers.append((entry.name, answer))
+        return answers
+
+    def watch(self, directory, stop, interval=POLL_INTERVAL):
+        """
+        Scans directory until the threading.Event stop is set.
+        """
+        os.makedirs(directory, exist_ok=True)
+        while not stop.is_set():
+            for name, answer in self.scan(directory):
+                print(f"{name}: {'ok' if answer['ok'] else answer['error']}", flush=True)
+            stop.wait(interval)
+
+
+def submit(socket_path, jobs):
+    """
+    Sends jobs to a worker listening on socket_path and returns the answers.
+    """
+    answers = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile("rwb") as stream:
+            for job in jobs:
+                stream.write(json.dumps(job).encode("utf8") + b"\n")
+                stream.flush()
+                answers.append(json.loads(stream.readline()))
+    return answers
+
+
+def serve(args):
+    from extraction_cache import ExtractionCache
+
+    graph = open_graph(args.graph)
+    cache = ExtractionCache(args.cache) if args.cache is not None else None
+    router = None
+    if args.tiers is not None:
+        router = ModelRouter(parse_tiers(
+            args.tiers, lambda base_url: load_client(args.api_key_file, base_url), args.min_confidence))
+    worker = PipelineWorker(
+        args.prompt, graph, graph_path=args.graph, output_dir=args.output_dir, model=args.model,
+        client_factory=lambda: load_client(args.api_key_file, args.base_url), cache=cache, router=router,
+    )
+    worker.warm_up()
+
+    stop = threading.Event()
+    threads = []
+    server = None
+    if args.socket is not None:
+        server = worker.serve_socket(args.socket)
+        threads.append(threading.Thread(target=server.serve_forever, daemon=True))
+        print(f"Listening on {args.socket}", flush=True)
+    if args.watch is not None:
+        threads.append(threading.Thread(target=worker.watch, args=(args.watch, stop), daemon=True))
+        print(f"Watching {args.watch}", flush=True)
+    for thread in threads:
+        thread.start()
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        stop.set()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        os.remove(args.socket)
+    for thread in threads:
+        thread.join()
+    worker.close()
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resident worker extracting chunks into a warm family graph.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the worker.')
+    serve_parser.add_argument('--prompt', '-p', required=True, help='File containing prompt.')
+    serve_parser.add_argument('--graph', '-g', default=None, help='Graph file (.sqlite: persistent store, else saved at the end).')
+    serve_parser.add_argument('--output-dir', '-o', default=None, help='Directory to save the extraction JSONs to.')
+    serve_parser.add_argument('--socket', default=None, help='Unix socket to accept jobs on.')
+    serve_parser.add_argument('--watch', default=None, help='Directory to take *.txt chunks and *.json extractions from.')
+    serve_parser.add_argument('--model', default=DEFAULT_MODEL, help='Model name.')
+    serve_parser.add_argument('--tiers', nargs='+', default=None,
+                              help='Models to try in turn, the cheapest first (model or model@base_url); overrides --model.')
+    serve_parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                              help='Answers with a lower confidence are sent to the next tier (see model_router.py).')
+    serve_parser.add_argument('--cache', default=None, help='SQLite file caching responses (see extraction_cache.py).')
+    serve_parser.add_argument('--api-key-file', default='api_key.txt', help='File containing the API key.')
+    serve_parser.add_argument('--base-url', default=None, help='Base url of an alternative (e.g. local) endpoint.')
+
+    submit_parser = subparsers.add_parser('submit', help='Send chunk (*.txt) or extraction (*.json) files to a worker.')
+    submit_parser.add_argument('--socket', required=True, help='Unix socket of the worker.')
+    submit_parser.add_argument('files', nargs='*', help='Chunk or extraction files.')
+    submit_parser.add_argument('--save', default=None, help='Let the worker save the graph to this file.')
+    submit_parser.add_argument('--stats', action='store_true', help='Print the numbers of jobs, persons and relations.')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.socket is None and args.watch is None:
+            parser.error('serve requires --socket or --watch')
+        serve(args)
+        sys.exit(0)
+
+    jobs = [
+        {"type": "extraction" if path.endswith(".json") else "chunk", "path": os.path.abspath(path)}
+        for path in args.files
+    ]
+    if args.save is not None:
+        jobs.append({"type": "save", "path": os.path.abspath(args.save)})
+    if args.stats:
+        jobs.append({"type": "stats"})
+    try:
+        answers = submit(args.socket, jobs)
+    except OSError as e:
+        print(f"Error: no worker on '{args.socket}'. {e}")
+        sys.exit(1)
+    for job, answer in zip(jobs, answers):
+        print(f"{job.get('path', job['type'])}: {json.dumps(answer)}")
+    sys.exit(0 if all(answer["ok"] for answer in answers) else 1)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Provenance of the graph nodes, from a person back to the transcription lines.
+
+The chain is kept in one SQLite index (a few integers per chunk and per
+mention, with the file names stored once):
+
+    *_md.txt file and byte span -> chunk id -> extraction file and person_number -> node
+
+txt_to_chunks.py records the spans of every chunk (see
+txt_to_chunks.family_chunks), FamilyGraph records the mentions while it merges
+extractions if its provenance attribute is set, and merge_persons moves the
+mentions of a merged person to the person it is merged into. Extraction files
+are named after their chunk (Billeter_1.txt -> Billeter_1.json).
+
+Looking up a person reads only the bytes of its spans from the memory-mapped
+source files, independent of the size of the corpus:
+
+    index = ProvenanceIndex("build/provenance.sqlite")
+    graph = FamilyGraph()
+    graph.provenance = index
+    graph.load_extractions("build/extractions")
+    for source, line, lines in index.source_lines(graph.person_uuid(person_id)):
+        ...
+
+Usage as CLI:
+
+    python provenance.py --index build/provenance.sqlite show 0f8e...-...
+    python provenance.py --index build/provenance.sqlite stats
+"""
+
+import os
+import sys
+import mmap
+import uuid
+import sqlite3
+import argparse
+
+# memory maps kept open at the same time
+OPEN_SOURCES = 64
+
+
+def chunk_id_of(path):
+    """
+    Returns the chunk id of a chunk file or of the extraction file written
+    for it (its name without directory and extension).
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class ProvenanceIndex:
+    def __init__(self, path=":memory:"):
+        """
+        Opens (or creates) the index stored at path.
+
+        Tables:
+            sources: id -> path of a *_md.txt file
+            chunk_spans: chunk id -> (source id, start byte, end byte, first line)
+            extractions: id -> extraction file and its chunk id
+            mentions: person UUID -> (extraction id, person_number)
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunk_spans (
+                chunk_id TEXT NOT NULL,
+                source_id INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                line INTEGER NOT NULL,
+                PRIMARY KEY (chunk_id, source_id, start)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS extractions (
+                id INTEGER PRIMARY KEY,
+                file TEXT UNIQUE NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS mentions (
+                person_id BLOB NOT NULL,
+                extraction_id INTEGER NOT NULL,
+                person_number INTEGER NOT NULL,
+                PRIMARY KEY (person_id, extraction_id, person_number)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS mentions_extraction ON mentions (extraction_id);
+        """)
+        self._source_ids = {}
+        self._extraction_ids = {}
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        for file, source_map in self._maps.values():
+            source_map.close()
+            file.close()
+        self._maps = {}
+        self._conn.commit()
+        self._conn.close()
+
+    def _source_id(self, path):
+        if path not in self._source_ids:
+            self._conn.execute("INSERT OR IGNORE INTO sources (path) VALUES (?)", (path,))
+            self._source_ids[path] = self._conn.execute(
+                "SELECT id FROM sources WHERE path = ?", (path,)).fetchone()[0]
+        return self._source_ids[path]
+
+    def _extraction_id(self, file):
+        if file not in self._extraction_ids:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO extractions (file, chunk_id) VALUES (?, ?)", (file, chunk_id_of(file)))
+            self._extraction_ids[file] = self._conn.execute(
+                "SELECT id FROM extractions WHERE file = ?", (file,)).fetchone()[0]
+        return self._extraction_ids[file]
+
+    def add_chunks(self, chunks):
+        """
+        Records (or replaces) the source spans of chunks.
+
+        Parameters:
+            chunks: iterable of (chunk id, spans), spans as in ChunkRecord.spans:
+                [(source file, start byte, end byte, first line), ...]
+        """
+        chunks = list(chunks)
+        self.remove_chunks(chunk_id for chunk_id, _ in chunks)
+        self._conn.executemany("INSERT OR REPLACE INTO chunk_spans VALUES (?, ?, ?, ?, ?)", [
+            (chunk_id, self._source_id(source), start, end, line)
+            for chunk_id, spans in chunks
+            for source, start, end, line in spans
+        ])
+        self.commit()
+
+    def remove_chunks(self, chunk_ids):
+        self._conn.executemany("DELETE FROM chunk_spans WHERE chunk_id = ?", [
+            (chunk_id,) for chunk_id in chunk_ids
+        ])
+
+    def add_mentions(self, file, mentions):
+        """
+        Records which nodes the persons of an extraction were merged into.
+
+        Parameters:
+            file: the extraction file (as in the reports of load_extractions)
+            mentions: iterable of (person_number, person UUID)
+        """
+        extraction_id = self._extraction_id(file)
+        self._conn.executemany("INSERT OR IGNORE INTO mentions VALUES (?, ?, ?)", [
+            (person_uuid.bytes, extraction_id, person_number) for person_number, person_uuid in mentions
+        ])
+
+    def remove_mentions(self, file):
+        """
+        Forgets the mentions of an extraction file (see FamilyGraph.retract_extraction).
+        """
+        self._conn.execute(
+            "DELETE FROM mentions WHERE extraction_id IN (SELECT id FROM extractions WHERE file = ?)", (file,))
+
+    def clear_mentions(self):
+        """
+        Forgets all mentions (before the graph is rebuilt with new node ids).
+        """
+        self._conn.execute("DELETE FROM mentions")
+        self._conn.execute("DELETE FROM extractions")
+        self._extraction_ids = {}
+
+    def merge(self, keep_uuid, merged_uuid):
+        """
+        Moves the mentions of merged_uuid to keep_uuid (see FamilyGraph.merge_persons).
+        """
+        self._conn.execute(
+            "UPDATE OR IGNORE mentions SET person_id = ? WHERE person_id = ?", (keep_uuid.bytes, merged_uuid.bytes))
+        self._conn.execute("DELETE FROM mentions WHERE person_id = ?", (merged_uuid.bytes,))
+
+    def mentions(self, person_uuid):
+        """
+        Returns:
+            list of (extraction file, person_number, chunk id) mentioning the person
+        """
+        return self._conn.execute("""
+            SELECT extractions.file, mentions.person_number, extractions.chunk_id
+            FROM mentions JOIN extractions ON extractions.id = mentions.extraction_id
+            WHERE mentions.person_id = ?
+            ORDER BY extractions.file, mentions.person_number
+        """, (person_uuid.bytes,)).fetchall()
+
+    def spans(self, person_uuid):
+        """
+        Returns:
+            list of (chunk id, source file, start byte, end byte, first line) of
+            the chunks mentioning the person
+        """
+        return self._conn.execute("""
+            SELECT DISTINCT chunk_spans.chunk_id, sources.path, chunk_spans.start, chunk_spans.end, chunk_spans.line
+            FROM mentions
+            JOIN extractions ON extractions.id = mentions.extraction_id
+            JOIN chunk_spans ON chunk_spans.chunk_id = extractions.chunk_id
+            JOIN sources ON sources.id = chunk_spans.source_id
+            WHERE mentions.person_id = ?
+            ORDER BY sources.path, chunk_spans.start
+        """, (person_uuid.bytes,)).fetchall()
+
+    def source_bytes(self, path, start, end):
+        """
+        Returns the bytes start:end of a source file through a memory map.
+        """
+        if path not in self._maps:
+            if len(self._maps) >= OPEN_SOURCES:
+                oldest = next(iter(self._maps))
+                file, source_map = self._maps.pop(oldest)
+                source_map.close()
+                file.close()
+            file = open(path, "rb")
+            if os.fstat(file.fileno()).st_size == 0:
+                file.close()
+                return b""
+            self._maps[path] = (file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[path][1][start:end]
+
+    def source_lines(self, person_uuid):
+        """
+        Returns the transcription lines of the chunks mentioning a person.
+
+        Returns:
+            list of (source file, first line number, list of lines)
+        """
+        return [
+            (path, line, self.source_bytes(path, start, end).decode("utf8", errors="replace").splitlines())
+            for _, path, start, end, line in self.spans(person_uuid)
+        ]
+
+    def stats(self):
+        """
+        Returns the number of sources, chunk spans, extractions and mentions.
+        """
+        return {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ["sources", "chunk_spans", "extractions", "mentions"]
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Look up where the persons of the graph come from.')
+    parser.add_argument('--index', required=True, help='SQLite file of the provenance index.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show = subparsers.add_parser('show', help='Print the source lines of persons.')
+    show.add_argument('persons', nargs='+', help='UUIDs of the persons (node ids of the graph).')
+    subparsers.add_parser('stats', help='Print the size of the index.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index):
+        print(f"Error: '{args.index}' not found.")
+        sys.exit(1)
+    with ProvenanceIndex(args.index) as index:
+        if args.command == 'stats':
+            for key, value in index.stats().items():
+                print(f"{key}: {value}")
+            sys.exit(0)
+        for person in args.persons:
+            person_uuid = uuid.UUID(person)
+            for file, person_number, chunk_id in index.mentions(person_uuid):
+                print(f"{person}: person {person_number} of {file}")
+            for path, line, lines in index.source_lines(person_uuid):
+                print(f"--- {path}:{line}")
+                for number, text in enumerate(lines, line):
+                    print(f"{number:6} {text}")
+    sys.exit(0)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Generator of synthetic Promptuarium corpora, to measure how the stages
+scale beyond the three samples in data/.
+
+Families are simulated generation by generation: every entry ("No 3") is a
+man with his wife and children, and some sons get entries of their own.
+Some daughters marry into other families, so they are mentioned twice (as
+daughter and as wife, sometimes with an abbreviated given name and without
+birth year), as in the real data. The families are written
+
+* as transcriptions in the real format to data/<Family>/<Family>_<n>_md.txt
+  (<center> header, __BLANK__ before every entry, [^fnN] footnotes,
+  hyphenated line breaks), the input of txt_to_chunks.py
+* as the matching extraction JSONs in the schema of data/bashoutput (one
+  per entry) to bashoutput/<Family>_<entry>.json, the input of
+  FamilyGraph.load_extractions
+* with truth.json: the numbers of families, files, entries, distinct
+  persons, person mentions and marriages between families
+
+    python synthetic_corpus.py -o build/synthetic --persons 10000 [--seed 0]
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+from typing import NamedTuple
+
+MALE_NAMES: list[str] = [
+    "Heinrich", "Hans Caspar", "Hans Jakob", "Rudolf", "Conrad", "Christoph", "Felix",
+    "Melchior", "Hans Ulrich", "Jakob", "Caspar", "Hans Heinrich", "Johannes", "Salomon",
+    "David", "Hans Conrad", "Hans Rudolf", "Adrian",
+]
+FEMALE_NAMES: list[str] = [
+    "Anna", "Anna Maria", "Susanna", "Elisabetha", "Dorothea", "Regula", "Verena", "Barbara",
+    "Margaretha", "Magdalena", "Cleophea", "Katharina", "Emerentiana", "Maria", "Anna Barbara",
+]
+FAMILY_NAMES: list[str] = [
+    "Billeter", "Geiger", "Hirzel", "Escher", "Orelli", "Vogel", "Hofmeister", "Ulrich",
+    "Bodmer", "Heiz", "Schaufelberger", "Widerkehr", "Stocker", "Werdmüller", "Lavater", "Hess",
+]
+# families of the wives not from the corpus
+OTHER_FAMILY_NAMES: list[str] = [
+    "Wirth", "Irminger", "Ott", "Lochmann", "Körner", "Brysacher", "Scheuchzer", "Fries",
+]
+ORIGINS: list[str] = ["Mänedorf", "Pfäffikon", "Zollikon", "Stäfa", "Meilen", "Horgen", "Wädenswil"]
+PROFESSIONS: list[str] = [
+    "Pfister", "Pfarrer zu Schwerzenbach", "Provisor am Carolinum", "Buchbinder",
+    "Gastwirt zum Hecht", "Zunftmeister zur Meisen", "Alumnatsinspektor", "Landvogt zu Grüningen",
+    "Chorherr am Grossmünster", "Goldschmied", "Seckelmeister", "Schulmeister zu Wipkingen",
+]
+# abbreviations used in the transcriptions (see entity_resolution.GIVEN_NAME_FORMS)
+ABBREVIATIONS: dict[str, str] = {
+    "Hans": "Hs.", "Heinrich": "Hch.", "Jakob": "Jb.", "Rudolf": "Rud.", "Conrad": "Conr.",
+    "Anna": "A.", "Elisabetha": "Elis.", "Margaretha": "Marg.", "Barbara": "Barb.", "Magdalena": "Magd.",
+}
+
+# entries per transcription file
+FILE_ENTRIES: int = 20
+# probabilities
+SON_ENTRY: float = 0.6
+DAUGHTER_MARRIES_OUT: float = 0.5
+WIFE_FROM_CORPUS: float = 0.4
+FOOTNOTE: float = 0.1
+
+
+class Corpus(NamedTuple):
+    """a generated corpus"""
+
+    # family name: texts of its transcription files
+    texts: dict[str, list[str]]
+    # file name: extraction of one entry
+    extractions: dict[str, dict]
+    # the numbers written to truth.json
+    truth: dict[str, int]
+
+
+def name_suffix(number: int) -> str:
+    """number written with the letters a-z (family names may only contain letters)"""
+    word: str = ""
+    while True:
+        number, digit = divmod(number, 26)
+        word += chr(ord("a") + digit)
+        if not number:
+            return word
+
+
+def abbreviate(given_name: str) -> str:
+    """abbreviate the first word of a given name, if it has an abbreviation"""
+    first, _, rest = given_name.partition(" ")
+    return " ".join(part for part in [ABBREVIATIONS.get(first, first), rest] if part)
+
+
+def hyphenate(text: str, rng: random.Random) -> str:
+    """break the line within the longest word of text, like the transcriptions do"""
+    words: list[str] = text.split(" ")
+    i: int = max(range(len(words)), key=lambda j: len(words[j]))
+    word: str = words[i]
+    if len(word) < 8 or not word.isalpha():
+        return text
+    middle: int = rng.randint(3, len(word) - 3)
+    words[i] = f"{word[:middle]}-\n{word[middle:]}"
+    return " ".join(words)
+
+
+def years(birth_year: int | None, death_year: int | None) -> str:
+    return f"{birth_year or ''}-{death_year or ''}"
+
+
+class Generator:
+    def __init__(self, seed: int = 0) -> None:
+        self.rng: random.Random = random.Random(seed)
+        # daughters who may marry into another family: birth decade -> [(family name, daughter)]
+        self.daughters: dict[int, list[tuple[str, dict]]] = {}
+        self.truth: dict[str, int] = {
+            "families": 0, "files": 0, "entries": 0, "persons": 0, "mentions": 0, "marriages": 0,
+        }
+
+    def wife(self, family: str, husband: dict) -> tuple[dict, bool]:
+        """(wife as mentioned in the husband's entry, whether she is a daughter of the corpus)"""
+        rng: random.Random = self.rng
+        if rng.random() < WIFE_FROM_CORPUS:
+            for decade in (husband["birth_year"] // 10, husband["birth_year"] // 10 - 1):
+                candidates: list[tuple[str, dict]] = self.daughters.get(decade, [])
+                if candidates and candidates[-1][0] != family:
+                    birth_family, daughter = candidates.pop()
+                    given_name: str = daughter["given_name"]
+                    return {
+                        "family_name": daughter["family_name"],
+                        "given_name": abbreviate(given_name) if rng.random() < 0.3 else given_name,
+                        "birth_year": daughter["birth_year"] if rng.random() < 0.5 else None,
+                        "death_year": None,
+                    }, True
+        self.truth["persons"] += 1
+        return {
+            "family_name": rng.choice(OTHER_FAMILY_NAMES),
+            "given_name": rng.choice(FEMALE_NAMES),
+            "birth_year": husband["birth_year"] + rng.randint(-2, 8) if rng.random() < 0.3 else None,
+            "death_year": None,
+        }, False
+
+    def family(self, family: str, max_persons: int) -> tuple[list[str], dict[str, dict]]:
+        """(transcription texts, extractions) of one family with at most about max_persons persons"""
+        rng: random.Random = self.rng
+        founder_birth: int = rng.randint(1450, 1700)
+        founder: dict = {
+            "given_name": rng.choice(MALE_NAMES),
+            "birth_year": founder_birth,
+            "death_year": founder_birth + rng.randint(30, 75),
+        }
+        self.truth["families"] += 1
+        self.truth["persons"] += 1
+        persons: int = 1
+        max_entries: int = rng.randint(2, 40)
+        # (entry number, number of the father's entry, head)
+        entries: list[tuple[int, int | None, dict]] = [(1, None, founder)]
+        blocks: list[str] = []
+        extractions: dict[str, dict] = {}
+
+        i: int = 0
+        while i < len(entries):
+            number, father_number, head = entries[i]
+            i += 1
+            family_id: str = f"{family}{number:04d}"
+            wife, married_in = self.wife(family, head)
+            persons += not married_in
+            self.truth["marriages"] += married_in
+            profession: str = rng.choice(PROFESSIONS)
+            origin: str = rng.choice(ORIGINS)
+
+            children: list[tuple[dict, int | None]] = []
+            birth_year: int = head["birth_year"] + rng.randint(22, 35)
+            # siblings get different names (children of the same name are merged)
+            names: dict[bool, list[str]] = {
+                True: rng.sample(MALE_NAMES, 7), False: rng.sample(FEMALE_NAMES, 7),
+            }
+            for _ in range(rng.randint(0, 7)):
+                male: bool = rng.random() < 0.5
+                child: dict = {
+                    "given_name": names[male].pop(),
+                    "birth_year": birth_year,
+                    "death_year": birth_year + rng.randint(0, 80) if rng.random() < 0.6 else None,
+                }
+                birth_year += rng.randint(1, 3)
+                entry: int | None = None
+                if male and len(entries) < max_entries and persons < max_persons and rng.random() < SON_ENTRY:
+                    entry = len(entries) + 1
+                    entries.append((entry, number, child))
+                elif not male and rng.random() < DAUGHTER_MARRIES_OUT:
+                    self.daughters.setdefault(child["birth_year"] // 10, []).append(
+                        (family, dict(child, family_name=family)))
+                children.append((child, entry))
+                persons += 1
+                self.truth["persons"] += 1
+
+            # transcription of the entry
+            if number == 1:
+                lines: list[str] = [f"{number}\\. {head['given_name']} {family} {years(head['birth_year'], head['death_year'])}"]
+            else:
+                lines = [f"{number}\\.{father_number} {abbreviate(head['given_name'])} {years(head['birth_year'], head['death_year'])}"]
+            lines.append(f"> ux. {wife['given_name']} {wife['family_name']}" + (f" {wife['birth_year']}" if wife["birth_year"] else ""))
+            lines.append(hyphenate(f"{profession} von {origin}", rng))
+            lines.append("")
+            for j, (child, entry) in enumerate(children):
+                line: str = ("> " if j == 0 else "") + f"{child['given_name']} {years(child['birth_year'], child['death_year'])}"
+                if entry is not None:
+                    line += f"      No {entry}"
+                if rng.random() < FOOTNOTE:
+                    line += "[^fn{}]"
+                lines.append(line)
+            blocks.append("\n".join(lines))
+
+            # extraction of the entry
+            extraction_persons: list[dict] = [{
+                "person_number": 1,
+                "family_id": family_id,
+                "father_family_id": f"{family}{father_number:04d}" if father_number else None,
+                "husband_family_id": None,
+                "family_name": family,
+                "given_name": head["given_name"],
+                "birth_year": head["birth_year"],
+                "death_year": head["death_year"],
+                "profession": profession,
+                "origin": origin,
+            }, {
+                "person_number": 2,
+                "family_id": None,
+                "father_family_id": None,
+                "husband_family_id": family_id,
+                **wife,
+            }]
+            relations: list[dict] = [{"person_number_1": 1, "person_number_2": 2, "relation_type": "HUSBAND_WIFE"}]
+            for j, (child, entry) in enumerate(children, start=3):
+                extraction_persons.append({
+                    "person_number": j,
+                    "family_id": f"{family}{entry:04d}" if entry else None,
+                    "father_family_id": family_id,
+                    "husband_family_id": None,
+                    "family_name": family,
+                    **child,
+                })
+                relations.append({"person_number_1": 1, "person_number_2": j, "relation_type": "FATHER_CHILD"})
+                relations.append({"person_number_1": 2, "person_number_2": j, "relation_type": "MOTHER_CHILD"})
+            extractions[f"{family}_{number:04d}.json"] = {"persons": extraction_persons, "relations": relations}
+            self.truth["mentions"] += len(extraction_persons)
+        self.truth["entries"] += len(entries)
+
+        # transcription files with numbered footnotes
+        texts: list[str] = []
+        for start in range(0, len(blocks), FILE_ENTRIES):
+            footnotes: list[str] = []
+            parts: list[str] = []
+            # every page starts with a header, so that the __BLANK__ of its first
+            # entry is on a line of its own (txt_to_chunks adds the headers of the
+            # following pages to the last chunk of the previous page)
+            parts.append(f"<center>{family}</center>\n---\n")
+            if start == 0:
+                parts.append(f"a. {founder['given_name']} {family} v. {rng.choice(ORIGINS)} B. Z. {founder_birth - 20}\n")
+            for block in blocks[start:start + FILE_ENTRIES]:
+                while "[^fn{}]" in block:
+                    footnotes.append(f"[^fn{len(footnotes) + 1}]: überschrieben {rng.randint(1, 9)}")
+                    block = block.replace("[^fn{}]", f"[^fn{len(footnotes)}]", 1)
+                parts.append(f"__BLANK__\n{block}\n")
+            parts.extend(footnote + "\n" for footnote in footnotes)
+            texts.append("\n".join(parts))
+        self.truth["files"] += len(texts)
+        return texts, extractions
+
+    def corpus(self, persons: int) -> Corpus:
+        """a corpus of about the given number of distinct persons"""
+        texts: dict[str, list[str]] = {}
+        extractions: dict[str, dict] = {}
+        number: int = 0
+        while self.truth["persons"] < persons:
+            family: str = FAMILY_NAMES[number % len(FAMILY_NAMES)]
+            if number >= len(FAMILY_NAMES):
+                family += name_suffix(number // len(FAMILY_NAMES) - 1)
+            number += 1
+            family_texts, family_extractions = self.family(family, persons - self.truth["persons"])
+            texts[family] = family_texts
+            extractions.update(family_extractions)
+        return Corpus(texts, extractions, dict(self.truth))
+
+
+def generate_corpus(persons: int, seed: int = 0) -> Corpus:
+    """generate a corpus of about the given number of distinct persons"""
+    return Generator(seed).corpus(persons)
+
+
+def write_corpus(corpus: Corpus, directory: str) -> None:
+    """write the transcriptions, extraction JSONs and truth.json of a corpus to directory"""
+    for family, texts in corpus.texts.items():
+        family_directory: str = os.path.join(directory, "data", family)
+        os.makedirs(family_directory, exist_ok=True)
+        for i, text in enumerate(texts, start=1):
+            with open(os.path.join(family_directory, f"{family}_{i}_md.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+    extraction_directory: str = os.path.join(directory, "bashoutput")
+    os.makedirs(extraction_directory, exist_ok=True)
+    for name, extraction in corpus.extractions.items():
+        with open(os.path.join(extraction_directory, name), "w", encoding="utf-8") as f:
+            json.dump(extraction, f, indent=4, ensure_ascii=False)
+    with open(os.path.join(directory, "truth.json"), "w", encoding="utf-8") as f:
+        json.dump(corpus.truth, f, indent=4)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Promptuarium corpus.")
+    parser.add_argument("-o", "--output-directory", dest="output_directory", required=True,
+                        help="directory to write data/, bashoutput/ and truth.json to")
+    parser.add_argument("--persons", type=int, default=10000, help="number of distinct persons")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    corpus: Corpus = generate_corpus(args.persons, args.seed)
+    write_corpus(corpus, args.output_directory)
+    for key, value in corpus.truth.items():
+        print(f"{key}: {value}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import unittest
+
+from openai import OpenAI
+
+import chunk_to_graph
+from chunk_writer import ChunkRecord, ChunkWriter
+from extraction_cache import ExtractionCache
+from family_graph import FamilyGraph
+from fake_openai_server import FakeCompletionServer
+
+
+class TestExtractDirectory(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up input and output directories with a few chunks.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, "chunks")
+        self.output_dir = os.path.join(self.tmp.name, "jsons")
+        os.makedirs(self.input_dir)
+        for i in range(6):
+            with open(os.path.join(self.input_dir, f"Billeter_{i}.txt"), "w", encoding="utf8") as f:
+                f.write(f"{i}\\. Heinrich Billeter")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def client(self, server):
+        return OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+
+    def test_extracts_all_chunks_with_prompt(self):
+        """
+        Every chunk is sent once with the prompt and gets its own output file.
+        """
+        with FakeCompletionServer(lambda request: (200, request["messages"][1]["content"])) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server), workers=3)
+
+        self.assertEqual(len(report["written"]), 6)
+        self.assertEqual(report["failed"], [])
+        self.assertEqual(len(server.requests), 6)
+        self.assertTrue(all(r["messages"][0]["content"] == "PROMPT" for r in server.requests))
+        with open(os.path.join(self.output_dir, "Billeter_2.json"), encoding="utf8") as f:
+            self.assertEqual(f.read(), "2\\. Heinrich Billeter")
+
+    def test_retries_rate_limits(self):
+        """
+        Requests answered with 429 are retried until they succeed.
+        """
+        lock = threading.Lock()
+        calls = {"n": 0}
+
+        def responder(request):
+            with lock:
+                calls["n"] += 1
+                if calls["n"] <= 4:
+                    return 429, "Rate limit reached"
+            return 200, json.dumps({"persons": [], "relations": []})
+
+        with FakeCompletionServer(responder) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server),
+                workers=2, backoff=0.01)
+
+        self.assertEqual(len(report["written"]), 6)
+        self.assertEqual(len(server.requests), 10)
+
+    def test_skips_existing_and_reports_failures(self):
+        """
+        Existing outputs are skipped; chunks failing after all retries are reported.
+        """
+        os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, "Billeter_0.json"), "w", encoding="utf8") as f:
+            f.write("{}")
+
+        with FakeCompletionServer(lambda request: (500, "boom")) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server),
+                workers=2, max_retries=1, backoff=0.01)
+
+        self.assertEqual(len(report["skipped"]), 1)
+        self.assertEqual(len(report["failed"]), 5)
+        self.assertEqual(len(server.requests), 10)
+
+    def test_missing_chunk_reported(self):
+        """
+        A chunk file that can not be read fails on its own, also in a packed
+        or streamed run.
+        """
+        os.makedirs(self.output_dir)
+        jobs = [(os.path.join(self.input_dir, f"Billeter_{i}.txt"), os.path.join(self.output_dir, f"Billeter_{i}.json"))
+                for i in [0, 9, 1]]
+        answer = json.dumps({"persons": [], "relations": []})
+        for kwargs in [{}, {"token_budget": 100}, {"graph": FamilyGraph()}]:
+            with self.subTest(**{key: type(value).__name__ for key, value in kwargs.items()}):
+                with FakeCompletionServer(lambda request: (200, answer)) as server:
+                    report = chunk_to_graph.extract_files(jobs, "PROMPT", self.client(server), workers=2, **kwargs)
+                self.assertEqual(len(report["written"]), 2)
+                self.assertEqual([name for name, _ in report["failed"]], [jobs[1][0]])
+
+    def test_extracts_shard(self):
+        """
+        Chunks of a JSON lines shard are extracted to <chunk id>.json.
+        """
+        shard_dir = os.path.join(self.tmp.name, "shard")
+        with ChunkWriter(shard_dir, "jsonl") as writer:
+            writer.write([
+                ChunkRecord("Billeter_1", "Billeter", "a_md.txt", "1\\. Heinrich"),
+                ChunkRecord("Billeter_2", "Billeter", "a_md.txt", "2\\. Hs. Caspar"),
+            ])
+
+        with FakeCompletionServer(lambda request: (200, request["messages"][1]["content"])) as server:
+            report = chunk_to_graph.extract_shard(
+                os.path.join(shard_dir, "chunks.jsonl"), self.output_dir, "PROMPT",
+                self.client(server), workers=2)
+
+        self.assertEqual(len(report["written"]), 2)
+        with open(os.path.join(self.output_dir, "Billeter_2.json"), encoding="utf8") as f:
+            self.assertEqual(f.read(), "2\\. Hs. Caspar")
+
+
+def packed_responder(valid=True, packed_status=200):
+    """
+    Answers packed requests with one person per chunk (named after the chunk
+    text), and single chunks with one extraction. With valid=False packed
+    answers miss their last chunk, other packed_status let packed requests fail.
+    """
+    def extraction(text):
+        return {"persons": [{"person_number": 1, "family_id": None, "family_name": "Billeter",
+                             "given_name": text.strip()}], "relations": []}
+
+    def responder(request):
+        content = request["messages"][1]["content"]
+        chunks = re.findall(r'<chunk id="(\d+)">\n(.*?)\n</chunk>', content, re.DOTALL)
+        if not chunks:
+            return 200, json.dumps(extraction(content))
+        if packed_status != 200:
+            return packed_status, "packed requests fail"
+        if not valid:
+            chunks = chunks[:-1]
+        return 200, json.dumps({chunk_id: extraction(text) for chunk_id, text in chunks})
+
+    return responder
+
+
+class TestPackedExtraction(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Ten short chunks of two families.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, "chunks")
+        self.output_dir = os.path.join(self.tmp.name, "jsons")
+        os.makedirs(self.input_dir)
+        for family in ["Billeter", "Geiger"]:
+            for i in range(5):
+                with open(os.path.join(self.input_dir, f"{family}_{i}.txt"), "w", encoding="utf8") as f:
+                    f.write(f"{family} {i}")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def extract(self, responder, **kwargs):
+        with FakeCompletionServer(responder) as server:
+            client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", client, workers=2, **kwargs)
+        return report, server.requests
+
+    def given_name(self, chunk):
+        with open(os.path.join(self.output_dir, chunk + ".json"), encoding="utf8") as f:
+            return json.load(f)["persons"][0]["given_name"]
+
+    def test_packs_families_and_splits_answers(self):
+        """
+        Chunks are packed per family and every chunk gets its own extraction.
+        """
+        report, requests = self.extract(packed_responder(), token_budget=100)
+
+        self.assertEqual(len(report["written"]), 10)
+        self.assertEqual(len(requests), 2)
+        self.assertTrue(requests[0]["messages"][0]["content"].endswith(
+            chunk_to_graph.PACKED_INSTRUCTIONS))
+        self.assertEqual(self.given_name("Geiger_3"), "Geiger 3")
+
+        # max_pack and a smaller budget (three chunks of 3 tokens) split the families further
+        report, requests = self.extract(packed_responder(), token_budget=100, max_pack=2, overwrite=True)
+        self.assertEqual(len(requests), 6)
+        report, requests = self.extract(packed_responder(), token_budget=9, overwrite=True)
+        self.assertEqual(len(requests), 4)
+
+    def test_invalid_packed_answer_retried_per_chunk(self):
+        """
+        The chunks of a packed answer that misses a chunk are sent one by one.
+        """
+        report, requests = self.extract(packed_responder(valid=False), token_budget=100)
+
+        self.assertEqual(len(report["written"]), 10)
+        self.assertEqual(len(requests), 2 + 10)
+        self.assertEqual(self.given_name("Billeter_4"), "Billeter 4")
+
+    def test_failed_packed_request_retried_per_chunk(self):
+        """
+        The chunks of a packed request that fails are sent one by one.
+        """
+        report, requests = self.extract(packed_responder(packed_status=400), token_budget=100)
+
+        self.assertEqual(report["failed"], [])
+        self.assertEqual(len(report["written"]), 10)
+        self.assertEqual(len(requests), 2 + 10)
+        self.assertEqual(self.given_name("Geiger_0"), "Geiger 0")
+
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ExtractionCache(os.path.join(self.tmp.name, "cache.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_hit_skips_request(self):
+        """
+        A second call with the same model, prompt and chunk is answered from the cache.
+        """
+        with FakeCompletionServer(lambda request: (200, " answer ")) as server:
+            client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            first = chunk_to_graph.chunk2triple("chunk", "PROMPT", client, cache=self.cache)
+            second = chunk_to_graph.chunk2triple("chunk", "PROMPT", client, cache=self.cache)
+            chunk_to_graph.chunk2triple("chunk", "OTHER PROMPT", client, cache=self.cache)
+
+        self.assertEqual(first, "answer")
+        self.assertEqual(second, "answer")
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_invalidate_prompt(self):
+        """
+        Invalidating a prompt only removes the entries created with it.
+        """
+        self.cache.put("gpt-4o", "PROMPT", "a", "1")
+        self.cache.put("gpt-4o", "PROMPT", "b", "2")
+        self.cache.put("gpt-4o", "OTHER", "a", "3")
+
+        self.assertEqual(self.cache.invalidate_prompt("PROMPT"), 2)
+        self.assertIsNone(self.cache.get("gpt-4o", "PROMPT", "a"))
+        self.assertEqual(self.cache.get("gpt-4o", "OTHER", "a"), "3")
+
+    def test_invalidate_packed_prompt(self):
+        """
+        Packed requests are cached under the extended prompt, which is removed
+        together with the prompt.
+        """
+        packed_prompt = "PROMPT" + chunk_to_graph.PACKED_INSTRUCTIONS
+        self.cache.put("gpt-4o", "PROMPT", "a", "1")
+        self.cache.put("gpt-4o", packed_prompt, "a b", "2")
+        self.cache.put("gpt-4o", "OTHER" + chunk_to_graph.PACKED_INSTRUCTIONS, "a b", "3")
+
+        self.assertEqual(self.cache.invalidate_prompt("PROMPT", suffixes=(chunk_to_graph.PACKED_INSTRUCTIONS,)), 2)
+        self.assertIsNone(self.cache.get("gpt-4o", packed_prompt, "a b"))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_size_based_eviction(self):
+        """
+        Least recently used entries are evicted once max_bytes is exceeded.
+        """
+        self.cache.max_bytes = 25
+        for chunk in ["a", "b", "c"]:
+            self.cache.put("gpt-4o", "PROMPT", chunk, "x" * 10)
+            self.cache.get("gpt-4o", "PROMPT", chunk)
+
+        self.assertIsNone(self.cache.get("gpt-4o", "PROMPT", "a"))
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
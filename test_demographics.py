@@ -0,0 +1,111 @@
+import os
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from demographics import (
+    CHILD_AGE, MISSING, GraphColumns, child_mortality, couple_children, demographic_report,
+    generation_intervals, lifespan_distribution,
+)
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+
+
+def family():
+    """
+    A couple with three children (only one linked to the mother), a second
+    childless couple, years as strings like in GEXF files of other tools.
+    """
+    G = nx.DiGraph()
+    persons = {
+        "hans": ("Billeter", "1600", "1660"), "anna": ("Wirth", "1605", None),
+        "jorg": ("Billeter", "1625", "1627"), "ulrich": ("Billeter", "1628", "1690"),
+        "maria": ("Billeter", "1631", None), "felix": ("Geiger", None, None), "vreni": ("Geiger", "", None),
+    }
+    for name, (family_name, birth_year, death_year) in persons.items():
+        G.add_node(name, family_name=family_name, birth_year=birth_year, death_year=death_year)
+    G.add_edge("hans", "anna", relation_type="HUSBAND_WIFE")
+    G.add_edge("felix", "vreni", relation_type="HUSBAND_WIFE")
+    for child in ["jorg", "ulrich", "maria"]:
+        G.add_edge("hans", child, relation_type="FATHER_CHILD")
+    G.add_edge("anna", "jorg", relation_type="MOTHER_CHILD")
+    return G
+
+
+class TestDemographics(unittest.TestCase):
+
+    def test_columns(self):
+        """
+        Years are converted, parents and children are indexed by row.
+        """
+        columns = GraphColumns(family())
+        row = columns.index
+        self.assertEqual(columns.birth.tolist(), [1600, 1605, 1625, 1628, 1631, MISSING, MISSING])
+        self.assertEqual(columns.family_names[columns.family[row["vreni"]]], "Geiger")
+        self.assertEqual(columns.father[row["maria"]], row["hans"])
+        self.assertEqual(columns.mother[row["maria"]], MISSING)
+        self.assertEqual(columns.mothers()[row["maria"]], row["anna"])
+        self.assertEqual(sorted(columns.children(row["hans"]).tolist()), [row["jorg"], row["ulrich"], row["maria"]])
+        self.assertEqual(columns.children(row["anna"]).tolist(), [row["jorg"]])
+        self.assertEqual(columns.child_counts().sum(), 4)
+
+    def test_analyses(self):
+        """
+        Children without a mother count for the only wife of their father.
+        """
+        columns = GraphColumns(family())
+        self.assertEqual(couple_children(columns).tolist(), [3, 0])
+        self.assertEqual(child_mortality(columns), {
+            1620: {"children": 2, "deaths": 1, "rate": 0.5},
+            1630: {"children": 1, "deaths": 0, "rate": 0.0},
+        })
+        self.assertEqual(child_mortality(columns, "decade_family"), {"Billeter": child_mortality(columns)})
+        intervals = generation_intervals(columns)
+        self.assertEqual((intervals["father"]["count"], intervals["father"]["mean"]), (3, 28.0))
+        self.assertEqual((intervals["mother"]["min"], intervals["mother"]["max"]), (20.0, 26.0))
+        lifespans = lifespan_distribution(columns)
+        self.assertEqual(lifespans["histogram"], {0: 1, 60: 2})
+        with self.assertRaises(ValueError):
+            child_mortality(columns, "century")
+
+    def test_same_as_loops(self):
+        """
+        The vectorized analyses agree with loops over the node attributes, for both backends.
+        """
+        graph = FamilyGraph()
+        graph.load_extractions(BASHOUTPUT, workers=1)
+        compact = CompactFamilyGraph()
+        compact.load_extractions(BASHOUTPUT, workers=1)
+        report = demographic_report(GraphColumns(graph))
+        self.assertEqual(report, demographic_report(GraphColumns(compact)))
+
+        ages = sorted(
+            data["death_year"] - data["birth_year"] for _, data in graph.G.nodes(data=True)
+            if data["birth_year"] is not None and data["death_year"] is not None
+            and 0 <= data["death_year"] - data["birth_year"] <= 110
+        )
+        self.assertEqual(report["lifespans"]["count"], len(ages))
+        self.assertEqual(report["lifespans"]["median"], float(np.median(ages)))
+
+        mortality = {}
+        for person_id, data in graph.G.nodes(data=True):
+            has_parent = any(
+                graph.G.edges[parent, person_id]["relation_type"] in ("FATHER_CHILD", "MOTHER_CHILD")
+                for parent in graph.G.predecessors(person_id)
+            )
+            if has_parent and data["birth_year"] is not None:
+                counts = mortality.setdefault(data["family_name"], [0, 0])
+                counts[0] += 1
+                counts[1] += data["death_year"] is not None and 0 <= data["death_year"] - data["birth_year"] < CHILD_AGE
+        self.assertEqual(
+            {name: [row["children"], row["deaths"]] for name, row in report["child_mortality_by_family"].items()},
+            mortality,
+        )
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import unittest
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from entity_resolution import given_name_tokens, normalize_family_name, resolve_entities
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+
+
+def person(given_name, family_id=None, father_family_id=None, husband_family_id=None,
+           birth_year=None, death_year=None, family_name="Billeter"):
+    return {
+        "family_id": family_id,
+        "father_family_id": father_family_id,
+        "husband_family_id": husband_family_id,
+        "family_name": family_name,
+        "given_name": given_name,
+        "birth_year": birth_year,
+        "death_year": death_year,
+    }
+
+
+class TestNormalization(unittest.TestCase):
+
+    def test_given_name_tokens(self):
+        self.assertEqual(given_name_tokens("Hs. Caspar"), given_name_tokens("Hans Kaspar"))
+        self.assertEqual(given_name_tokens("A. Maria"), ("anna", "maria"))
+        self.assertEqual(given_name_tokens(None), ())
+
+    def test_normalize_family_name(self):
+        self.assertEqual(normalize_family_name("v. Orelli"), "orelli")
+        self.assertEqual(normalize_family_name("Räuchli"), "raeuchli")
+
+
+class TestResolveEntities(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = FamilyGraph()
+        self.father = self.graph.add_person(person("Hs. Jakob", family_id="Billeter0003", birth_year=1635))
+
+    def add_child(self, attributes):
+        child = self.graph.add_person(attributes)
+        self.graph.add_relation(self.father, child, "FATHER_CHILD")
+        return child
+
+    def test_merge_child_mention_with_own_entry(self):
+        """
+        "Hs. Caspar" in the list of children is the same person as the entry "Hans Caspar".
+        """
+        mention = self.add_child(person("Hs. Caspar", father_family_id="Billeter0003", birth_year=1665))
+        entry = self.graph.add_person(person(
+            "Hans Caspar", family_id="Billeter0016", father_family_id="Billeter0003",
+            birth_year=1665, death_year=1720))
+        wife = self.graph.add_person(person("Regula", husband_family_id="Billeter0016", family_name="Hirzel"))
+        self.graph.add_relation(entry, wife, "HUSBAND_WIFE")
+
+        merges = resolve_entities(self.graph)
+
+        self.assertEqual(len(merges), 1)
+        self.assertEqual((merges[0]["kept"], merges[0]["merged"]), (entry, mention))
+        self.assertNotIn(mention, self.graph.G)
+        self.assertTrue(self.graph.G.has_edge(self.father, entry))
+        self.assertTrue(self.graph.G.has_edge(entry, wife))
+        self.assertEqual(self.graph.G.nodes[entry]["given_name"], "Hans Caspar")
+        self.assertEqual(self.graph.check_indexes(), [])
+
+    def test_distinct_persons_are_kept(self):
+        """
+        Siblings of the same name with their own entries, persons with
+        different birth years and father and son are not merged.
+        """
+        self.add_child(person("Rudolf", family_id="Billeter0010", father_family_id="Billeter0003", birth_year=1674))
+        self.add_child(person("Rudolf", family_id="Billeter0011", father_family_id="Billeter0003", birth_year=1675))
+        self.add_child(person("Anna", father_family_id="Billeter0003", birth_year=1670))
+        self.graph.add_person(person("Anna", husband_family_id="Geiger0001", birth_year=1680))
+        self.add_child(person("Hs. Jakob", father_family_id="Billeter0003", birth_year=1635))
+
+        self.assertEqual(resolve_entities(self.graph), [])
+
+    def test_ambiguous_candidates_are_not_merged(self):
+        """
+        A wife matching more than MAX_CANDIDATES daughters of different fathers is left alone.
+        """
+        for i in range(5):
+            self.graph.add_person(person("Verena", father_family_id=f"Billeter00{20 + i}"))
+        self.graph.add_person(person("Verena", husband_family_id="Geiger0001", birth_year=1650))
+
+        self.assertEqual(resolve_entities(self.graph), [])
+
+
+class TestResolveExtractions(unittest.TestCase):
+
+    def test_wife_linked_to_birth_family(self):
+        """
+        Susanna Billeter, wife of Geiger0006, is merged with Susanna, daughter
+        of Billeter0001, with both backends.
+        """
+        for graph_class in [FamilyGraph, CompactFamilyGraph]:
+            graph = graph_class()
+            graph.load_extractions(BASHOUTPUT, workers=1)
+            persons = graph.G.number_of_nodes()
+
+            merges = resolve_entities(graph)
+
+            self.assertEqual(len(merges), 1)
+            self.assertEqual(
+                {merges[0]["kept_person"]["husband_family_id"], merges[0]["merged_person"]["husband_family_id"]},
+                {"Billeter0002", "Geiger0006"})
+            self.assertEqual(graph.G.number_of_nodes(), persons - 1)
+            self.assertEqual(graph.to_networkx().number_of_nodes(), persons - 1)
+            self.assertEqual(graph.check_indexes(), [])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import json
+import random
+import tempfile
+import threading
+import unittest
+
+from openai import OpenAI
+
+import chunk_to_graph
+from family_graph import FamilyGraph
+from fake_openai_server import FakeCompletionServer
+from extraction_schema import clean_extraction
+from extraction_stream import ExtractionStreamParser, GraphIngest, InvalidStream
+from metrics import Metrics
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput", "chunkx1.json"),
+          encoding="utf8") as f:
+    ANSWER = f.read()
+
+
+def feed_all(parser, text, piece=7):
+    elements = []
+    for i in range(0, len(text), piece):
+        elements.extend(parser.feed(text[i:i + piece]))
+    return elements + parser.close()
+
+
+class TestExtractionStreamParser(unittest.TestCase):
+
+    def test_elements_arrive_before_the_answer_is_complete(self):
+        """
+        Every element is returned as soon as its closing brace has arrived, and
+        all of them match clean_extraction of the whole answer.
+        """
+        parser = ExtractionStreamParser()
+        data = json.loads(ANSWER)
+        first = json.dumps(data["persons"][0])
+        elements = parser.feed('{"persons": [' + first)
+        self.assertEqual(elements, [("person", data["persons"][0])])
+
+        elements = feed_all(ExtractionStreamParser(), ANSWER)
+        self.assertEqual([element for kind, element in elements if kind == "person"], data["persons"])
+        self.assertEqual([element for kind, element in elements if kind == "relation"], data["relations"])
+
+    def test_tolerated_variations(self):
+        """
+        A code block fence, other keys, relations before persons and strings
+        with braces are accepted.
+        """
+        text = (
+            '```json\n{"note": "a } and a \\" [", "relations": [{"person_number_1": 1, '
+            '"person_number_2": 2, "relation_type": "HUSBAND_WIFE"}], "count": 2, "persons": ['
+            '{"person_number": 1, "family_id": null, "family_name": "Geiger", "given_name": "Rudolf"},'
+            '{"person_number": 2, "family_id": null, "family_name": "Geiger", "given_name": "Regula", '
+            '"birth_year": "1610"}]}\n```'
+        )
+        for piece in [1, 5, 1000]:
+            elements = feed_all(ExtractionStreamParser(), text, piece)
+            self.assertEqual([kind for kind, _ in elements], ["person", "person", "relation"])
+            self.assertEqual(elements[1][1]["birth_year"], 1610)
+
+    def test_null_values_at_any_split(self):
+        """
+        null values (of other keys and as dropped elements) are parsed
+        wherever the answer is split.
+        """
+        text = (
+            '{"notes": null, "persons": [null, {"person_number": 1, "family_id": null, '
+            '"family_name": "Geiger", "given_name": "Rudolf", "birth_year": null}], '
+            '"relations": [null], "count": null}'
+        )
+        persons, relations, _ = clean_extraction(json.loads(text))
+        rng = random.Random(0)
+        for _ in range(50):
+            cuts = sorted(rng.sample(range(1, len(text)), 3))
+            parser = ExtractionStreamParser(strict=False)
+            elements = []
+            for start, end in zip([0] + cuts, cuts + [len(text)]):
+                elements.extend(parser.feed(text[start:end]))
+            elements.extend(parser.close())
+            self.assertEqual([element for kind, element in elements if kind == "person"], persons)
+            self.assertEqual([element for kind, element in elements if kind == "relation"], relations)
+            self.assertEqual((parser.dropped_persons, parser.dropped_relations), (1, 1))
+
+    def test_invalid_answers_raise_early(self):
+        """
+        An invalid element raises as soon as it is complete, without waiting
+        for the rest of the answer; non-strict parsing drops it instead.
+        """
+        text = '{"persons": [{"family_name": "Geiger"}, '
+        with self.assertRaises(InvalidStream):
+            ExtractionStreamParser().feed(text)
+        parser = ExtractionStreamParser(strict=False)
+        self.assertEqual(feed_all(parser, text + ']}'), [])
+        self.assertEqual(parser.dropped_persons, 1)
+
+        for text in ['Here is the JSON', '{"persons": {}}', '{"persons": [1}']:
+            with self.assertRaises(InvalidStream):
+                ExtractionStreamParser().feed(text)
+        with self.assertRaises(InvalidStream):
+            feed_all(ExtractionStreamParser(), '{"persons": []')
+
+
+class TestExtractToGraph(unittest.TestCase):
+
+    def test_streams_into_graph_and_retries_bad_answers(self):
+        """
+        The graph gets the same persons as building it from the written
+        files; a truncated answer is aborted and its elements are discarded.
+        """
+        lock = threading.Lock()
+        calls = {}
+
+        def responder(request):
+            chunk = request["messages"][1]["content"]
+            with lock:
+                calls[chunk] = calls.get(chunk, 0) + 1
+                first = calls[chunk] == 1
+            if chunk == "chunk 1" and first:
+                # persons arrive, then the answer breaks off into prose
+                return 200, ANSWER[:ANSWER.index('"relations"')] + 'oops'
+            return 200, ANSWER.replace("Billeter", f"Billeter{chunk[-1]}")
+
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = [
+                (f"chunk_{i}", os.path.join(directory, f"chunk_{i}.json"), lambda i=i: f"chunk {i}")
+                for i in range(3)
+            ]
+            graph = FamilyGraph()
+            metrics = Metrics()
+            with FakeCompletionServer(responder) as server:
+                client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+                report = chunk_to_graph.extract_chunks(jobs, "PROMPT", client, workers=3,
+                                                       graph=graph, metrics=metrics)
+            self.assertEqual(report["failed"], [])
+            self.assertEqual(len(report["graph"]), 3)
+
+            expected = FamilyGraph()
+            expected.load_extractions(directory, workers=1)
+        self.assertEqual(graph.G.number_of_nodes(), expected.G.number_of_nodes())
+        self.assertEqual(graph.G.number_of_edges(), expected.G.number_of_edges())
+        self.assertEqual(metrics.summary()["requests"]["streams_aborted"], 1)
+
+    def test_failed_merge_does_not_stop_the_writer(self):
+        """
+        An extraction that can not be merged is reported as failed, the
+        extractions queued after it are still merged.
+        """
+        person = {"person_number": 1, "family_id": None, "family_name": "Billeter", "given_name": "Hans"}
+        ingest = GraphIngest(FamilyGraph())
+        ingest.element("a", "person", person)
+        ingest.element("a", "relation",
+                       {"person_number_1": 1, "person_number_2": 2, "relation_type": "FATHER_CHILD"})
+        ingest.done("a")
+        ingest.element("b", "person", dict(person, given_name="Jakob"))
+        ingest.done("b")
+        reports = ingest.close()
+        self.assertEqual([report["file"] for report in reports], ["a", "b"])
+        self.assertIn("KeyError", reports[0]["failed"])
+        self.assertNotIn("failed", reports[1])
+        self.assertEqual(reports[1]["created"], 1)
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,29 @@
+import os
+import json
+import random
+import tempfile
 import unittest
-from family_graph import FamilyGraph
+
+import networkx as nx
+from family_graph import FamilyGraph, new_person_id
+from compact_family_graph import CompactFamilyGraph
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+
+
+def billeter_0001():
+    return {
+        "family_id": "Billeter0001",
+        "father_family_id": None,
+        "family_name": "Billeter",
+        "given_name": "Heinrich",
+        "birth_year": 1613,
+        "death_year": None
+    }
+
 
 class TestDirectedGraph(unittest.TestCase):
-    
+
     def setUp(self):
         """
         Set up a new FamilyGraph object before each test.
@@ -13,13 +34,357 @@ class TestDirectedGraph(unittest.TestCase):
         """
         Test the add_nodes function to check if the nodes are correctly added to the graph.
         """
+        id1 = self.graph.add_person(billeter_0001())
+        id2 = self.graph.add_person({
+            "family_id": None,
+            "husband_family_id": "Billeter0001",
+            "family_name": "Wirth",
+            "given_name": "Aa Maria",
+        })
+        self.graph.add_relation(id1, id2, "HUSBAND_WIFE")
 
-        # TODO: Write tests...
-        #         
         # Assert that the nodes added are the same as the nodes in the graph
-        #self.assertEqual(set(nodes_to_add), set(nodes_in_graph), "Nodes added to the graph should match the expected nodes.")
-        pass
-        
+        self.assertEqual({id1, id2}, set(self.graph.get_nodes()), "Nodes added to the graph should match the expected nodes.")
+        self.assertEqual([(id1, id2)], self.graph.get_edges())
+        self.assertIsNone(self.graph.G.nodes[id2]["birth_year"])
+
+    def test_ids_ignore_global_seed(self):
+        """
+        Seeding the global random doesn't repeat the (persisted) node ids.
+        """
+        random.seed(0)
+        first = self.graph.add_person(billeter_0001())
+        random.seed(0)
+        second = FamilyGraph().add_person(billeter_0001())
+        self.assertNotEqual(first, second)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_ids_differ_after_fork(self):
+        """
+        A forked child draws other node ids than its parent.
+        """
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            os.write(write_end, str(new_person_id()).encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as pipe:
+            child = pipe.read()
+        os.waitpid(pid, 0)
+        self.assertNotEqual(child, str(new_person_id()))
+
+    def test_relations_pass_on_family_ids(self):
+        """
+        A child (wife) gets the family_id of the father (husband), not his
+        own father_family_id (husband_family_id), with both backends.
+        """
+        for graph in [FamilyGraph(), CompactFamilyGraph()]:
+            father = graph.add_person(dict(billeter_0001(), father_family_id="Billeter0000"))
+            child = graph.add_person({"family_id": None, "family_name": "Billeter", "given_name": "Susanna"})
+            wife = graph.add_person({"family_id": None, "family_name": "Wirth", "given_name": "Anna",
+                                     "husband_family_id": "Billeter0002"})
+            unknown = graph.add_person({"family_id": None, "family_name": "Billeter", "given_name": "Jakob"})
+            graph.add_relation(father, child, "FATHER_CHILD")
+            graph.add_relation(father, wife, "HUSBAND_WIFE")
+            # a father (husband) without family_id leaves the ids as they are
+            graph.add_relation(unknown, wife, "HUSBAND_WIFE")
+            graph.add_relation(unknown, child, "FATHER_CHILD")
+
+            self.assertEqual(graph.G.nodes[child]["father_family_id"], "Billeter0001")
+            self.assertEqual(graph.G.nodes[wife]["husband_family_id"], "Billeter0001")
+            self.assertIsNone(graph.G.nodes[child]["husband_family_id"])
+            self.assertIsNone(graph.G.nodes[father]["husband_family_id"])
+
+    def test_merge_by_family_id(self):
+        """
+        A person with a known family_id is merged, the longer value wins.
+        """
+        id1 = self.graph.add_person(billeter_0001())
+        person = billeter_0001()
+        person.update({"given_name": "Heinrich Jakob", "death_year": 1650})
+        id2 = self.graph.add_person(person)
+
+        self.assertEqual(id1, id2)
+        self.assertEqual(self.graph.G.nodes[id1]["given_name"], "Heinrich Jakob")
+        self.assertEqual(self.graph.G.nodes[id1]["death_year"], 1650)
+
+    def test_merge_child_by_father(self):
+        """
+        A child without family_id is found through its father's family_id and its given_name.
+        """
+        father = self.graph.add_person(billeter_0001())
+        susanna = {
+            "family_id": None,
+            "father_family_id": "Billeter0001",
+            "family_name": "Billeter",
+            "given_name": "Susanna",
+            "birth_year": 1615,
+        }
+        child = self.graph.add_person(dict(susanna))
+        self.graph.add_relation(father, child, "FATHER_CHILD")
+
+        self.assertEqual(self.graph.add_person(dict(susanna, birth_year=None)), child)
+        self.assertNotEqual(self.graph.add_person(dict(susanna, given_name="Anna")), child)
+
+    def test_merge_child_among_many(self):
+        """
+        Duplicate detection goes through the secondary indexes: names are compared
+        case-insensitively and homonymous children are told apart by birth_year.
+        """
+        father = self.graph.add_person(billeter_0001())
+        children = {}
+        # all children are added before the relations, so homonyms aren't merged
+        for i in range(50):
+            children[i] = self.graph.add_person({
+                "family_id": None,
+                "father_family_id": "Billeter0001",
+                "family_name": "Billeter",
+                "given_name": "Hans" if i % 2 else f"Kind {i}",
+                "birth_year": 1620 + i,
+            })
+        for child in children.values():
+            self.graph.add_relation(father, child, "FATHER_CHILD")
+
+        lookup = {"family_id": None, "father_family_id": "Billeter0001", "husband_family_id": None}
+        self.assertEqual(
+            self.graph.get_id_from_attributes(dict(lookup, given_name="kind  10", birth_year=None)),
+            children[10])
+        self.assertEqual(
+            self.graph.get_id_from_attributes(dict(lookup, given_name="Hans", birth_year=1627)),
+            children[7])
+        self.assertIsNone(
+            self.graph.get_id_from_attributes(dict(lookup, given_name="Hans", birth_year=1700)))
+        self.assertEqual(self.graph.check_indexes(), [])
+
+    def test_indexes_follow_merges(self):
+        """
+        When a merge changes the given_name, the child is found under its new name.
+        """
+        father = self.graph.add_person(billeter_0001())
+        susanna = {
+            "family_id": None,
+            "father_family_id": "Billeter0001",
+            "family_name": "Billeter",
+            "given_name": "Susanna",
+            "birth_year": None,
+        }
+        child = self.graph.add_person(dict(susanna))
+        self.graph.add_relation(father, child, "FATHER_CHILD")
+        self.assertEqual(self.graph.add_person(dict(susanna, given_name="Susanna", birth_year=1615)), child)
+        self.graph.add_person(dict(susanna, family_id="Billeter0002"))
+
+        self.assertEqual(self.graph.G.nodes[child]["birth_year"], 1615)
+        self.assertEqual(self.graph.family_id_index["Billeter0002"], child)
+        self.assertEqual(self.graph.check_indexes(), [])
+
+    def test_invalid_relation_type(self):
+        id1 = self.graph.add_person(billeter_0001())
+        with self.assertRaises(Exception):
+            self.graph.add_relation(id1, id1, "BROTHER_SISTER")
+
+
+class TestLoadExtractions(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = FamilyGraph()
+
+    def test_load_directory(self):
+        """
+        All JSONs of data/bashoutput are loaded; persons repeated across chunks are merged.
+        """
+        reports = self.graph.load_extractions(BASHOUTPUT, workers=2)
+
+        self.assertEqual([os.path.basename(r["file"]) for r in reports],
+                         ["chunkx1.json", "chunkx2.json", "chunkx3.json"])
+        self.assertEqual(reports[0]["created"], 18)
+        self.assertEqual(reports[0]["relations"], 20)
+        self.assertGreater(sum(r["merged"] for r in reports), 0)
+        self.assertEqual(self.graph.G.number_of_nodes(), sum(r["created"] for r in reports))
+        self.assertEqual(self.graph.check_indexes(), [])
+
+    def test_same_result_as_single_additions(self):
+        """
+        Bulk loading builds the same graph as add_person/add_relation one by one.
+        """
+        self.graph.load_extractions(BASHOUTPUT, workers=1)
+
+        reference = FamilyGraph()
+        for filename in sorted(os.listdir(BASHOUTPUT)):
+            with open(os.path.join(BASHOUTPUT, filename), encoding="utf8") as f:
+                parsed_dict = json.load(f)
+            node_ids = {}
+            for person in parsed_dict["persons"]:
+                node_ids[person["person_number"]] = reference.add_person(person)
+            for relation in parsed_dict["relations"]:
+                reference.add_relation(
+                    node_ids[relation["person_number_1"]],
+                    node_ids[relation["person_number_2"]],
+                    relation["relation_type"])
+
+        def signature(graph):
+            return sorted(
+                (str(graph.G.nodes[a]["given_name"]), str(graph.G.nodes[b]["given_name"]), data["relation_type"])
+                for a, b, data in graph.G.edges(data=True))
+
+        self.assertEqual(self.graph.G.number_of_nodes(), reference.G.number_of_nodes())
+        self.assertEqual(signature(self.graph), signature(reference))
+
+    def test_invalid_entries_are_dropped(self):
+        """
+        Invalid persons, relations to them and unparsable files are reported.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            broken = os.path.join(tmp, "broken.json")
+            with open(broken, "w", encoding="utf8") as f:
+                f.write("```json\n{")
+            extraction = {
+                "persons": [
+                    dict(billeter_0001(), person_number=1, birth_year="1613"),
+                    {"person_number": 2, "given_name": "Aa Maria"},
+                ],
+                "relations": [
+                    {"person_number_1": 1, "person_number_2": 2, "relation_type": "HUSBAND_WIFE"},
+                ],
+            }
+            reports = self.graph.load_extractions([extraction, broken], workers=1)
+
+        self.assertEqual(reports[0]["created"], 1)
+        self.assertEqual(reports[0]["dropped_persons"], 1)
+        self.assertEqual(reports[0]["dropped_relations"], 1)
+        self.assertEqual(reports[1]["created"], 0)
+        self.assertEqual(len(reports[1]["errors"]), 1)
+        person_id = self.graph.family_id_index["Billeter0001"]
+        self.assertEqual(self.graph.G.nodes[person_id]["birth_year"], 1613)
+
+
+class TestCompactFamilyGraph(unittest.TestCase):
+
+    def test_same_graph_as_networkx_backend(self):
+        """
+        The compact backend merges the same persons and exports the same graph.
+        """
+        compact = CompactFamilyGraph()
+        compact_reports = compact.load_extractions(BASHOUTPUT, workers=1)
+        reference = FamilyGraph()
+        reports = reference.load_extractions(BASHOUTPUT, workers=1)
+
+        self.assertEqual(compact_reports, reports)
+        self.assertEqual(compact.check_indexes(), [])
+
+        def signature(G):
+            nodes = sorted(
+                tuple(sorted((key, str(val)) for key, val in data.items()))
+                for _, data in G.nodes(data=True))
+            edges = sorted(
+                (str(G.nodes[a]["given_name"]), str(G.nodes[b]["given_name"]), data["relation_type"])
+                for a, b, data in G.edges(data=True))
+            return nodes, edges
+
+        exported = compact.to_networkx()
+        self.assertEqual(signature(exported), signature(reference.G))
+        self.assertIn(compact.person_uuid(0), exported)
+
+    def test_interned_attributes(self):
+        graph = CompactFamilyGraph()
+        id1 = graph.add_person(billeter_0001())
+        id2 = graph.add_person(dict(billeter_0001(), family_id="Billeter0002", given_name="Hans"))
+        graph.add_relation(id1, id2, "FATHER_CHILD")
+        graph.add_relation(id1, id2, "HUSBAND_WIFE")
+
+        self.assertEqual((id1, id2), (0, 1))
+        # Billeter0001, Billeter, Heinrich, Billeter0002, Hans: "Billeter" is stored once
+        self.assertEqual(len(graph.G.pool), 5)
+        self.assertEqual(graph.G.nodes[id2]["family_name"], "Billeter")
+        self.assertEqual(graph.get_edges(), [(id1, id2)])
+        self.assertEqual(list(graph.G.edges(data=True))[0][2], {"relation_type": "HUSBAND_WIFE"})
+        with self.assertRaises(Exception):
+            graph.add_person(dict(billeter_0001(), family_id=None, birth_year="1613"))
+
+    def test_remove_edge(self):
+        """
+        Removing a missing edge raises like networkx and changes nothing.
+        """
+        graph = CompactFamilyGraph()
+        a, b, c = (graph.add_person(dict(billeter_0001(), family_id=None, given_name=name))
+                   for name in ["A", "B", "C"])
+        graph.add_relation(a, c, "FATHER_CHILD")
+        graph.add_relation(c, b, "FATHER_CHILD")
+        for node_from, node_to in [(a, b), (b, a), (b, c)]:
+            with self.assertRaises(nx.NetworkXError):
+                graph.G.remove_edge(node_from, node_to)
+        self.assertEqual(sorted(graph.G.edges()), sorted([(a, c), (c, b)]))
+        self.assertEqual(graph.G.number_of_edges(), 2)
+
+        graph.G.remove_edge(a, c)
+        self.assertEqual(list(graph.G.edges()), [(c, b)])
+        self.assertEqual((list(graph.G.successors(a)), list(graph.G.predecessors(c))), ([], []))
+        self.assertEqual(graph.G.number_of_edges(), 1)
+
+
+class TestReplaceExtraction(unittest.TestCase):
+
+    def signature(self, graph):
+        nodes = sorted(str(sorted(data.items())) for _, data in graph.G.nodes(data=True))
+        edges = sorted(
+            (str(sorted(graph.G.nodes[a].items())), str(sorted(graph.G.nodes[b].items())), relation_type)
+            for a, b, relation_type in graph.G.edges(data="relation_type"))
+        return nodes, edges, sorted(graph.family_id_index)
+
+    def test_same_result_as_rebuild(self):
+        """
+        Replacing a file gives the graph built with that file merged last.
+        """
+        files = [os.path.join(BASHOUTPUT, name) for name in ["chunkx1.json", "chunkx2.json", "chunkx3.json"]]
+        for graph_class in [FamilyGraph, CompactFamilyGraph]:
+            for file in files:
+                graph = graph_class()
+                graph.track_contributions()
+                graph.load_extractions(files, workers=1)
+                report = graph.replace_extraction(file)
+                reference = graph_class()
+                reference.load_extractions([other for other in files if other != file] + [file], workers=1)
+
+                self.assertGreater(report["retracted"]["relations_removed"], 0)
+                self.assertEqual(self.signature(graph), self.signature(reference))
+                self.assertEqual(graph.check_indexes(), [])
+
+    def test_retract_only_touches_contributions(self):
+        """
+        Persons from before the tracking started keep their attributes; the
+        others disappear with the last file contributing them, also after merges.
+        """
+        graph = FamilyGraph()
+        heinrich = graph.add_person(billeter_0001())
+        graph.track_contributions()
+        graph.load_extractions([("a.json", {
+            "persons": [
+                dict(billeter_0001(), person_number=1, given_name="Heinrich Ulrich", profession="Pfister"),
+                {"person_number": 2, "family_id": "Billeter0002", "family_name": "Billeter", "given_name": "Hans"},
+            ],
+            "relations": [{"person_number_1": 1, "person_number_2": 2, "relation_type": "FATHER_CHILD"}],
+        }), ("b.json", {
+            "persons": [{"person_number": 1, "family_id": "Billeter0003", "family_name": "Billeter", "given_name": "Hans"}],
+            "relations": [],
+        })], workers=1)
+        hans = graph.family_id_index["Billeter0002"]
+        graph.merge_persons(hans, graph.family_id_index["Billeter0003"])
+        self.assertEqual(graph.G.nodes[heinrich]["given_name"], "Heinrich Ulrich")
+
+        report = graph.retract_extraction("a.json")
+        self.assertEqual(report, {"persons_removed": 0, "persons_updated": 2, "relations_removed": 1})
+        self.assertEqual(
+            (graph.G.nodes[heinrich]["given_name"], graph.G.nodes[heinrich]["profession"]), ("Heinrich", None))
+        self.assertEqual(graph.G.nodes[hans]["family_id"], "Billeter0003")
+        self.assertEqual(graph.G.nodes[hans]["father_family_id"], None)
+        self.assertEqual(sorted(graph.family_id_index), ["Billeter0001", "Billeter0003"])
+
+        graph.retract_extraction("b.json")
+        self.assertEqual(list(graph.G.nodes), [heinrich])
+        self.assertEqual(graph.check_indexes(), [])
+
+
 # Run the test
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+import graph_io
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from kinship import KinshipIndex
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def build_family(graph_class):
+    """
+    Heinrich Billeter (1613) and Anna Maria Wirth with their son Caspar.
+    """
+    graph = graph_class()
+    father = graph.add_person({
+        "person_number": 1, "family_id": "Billeter0001", "family_name": "Billeter",
+        "given_name": "Heinrich", "birth_year": 1613, "death_year": 1671, "profession": "Pfister & Müller <Zunft>"})
+    mother = graph.add_person({
+        "person_number": 2, "family_id": None, "husband_family_id": "Billeter0001", "family_name": "Wirth", "given_name": "Anna Maria"})
+    son = graph.add_person({
+        "person_number": 3, "family_id": "Billeter0002", "father_family_id": "Billeter0001",
+        "family_name": "Billeter", "given_name": "Caspar", "birth_year": 1640})
+    graph.add_relation(father, mother, "HUSBAND_WIFE")
+    graph.add_relation(father, son, "FATHER_CHILD")
+    graph.add_relation(mother, son, "MOTHER_CHILD")
+    return graph
+
+
+def persons_by_uuid(graph):
+    return {graph.person_uuid(person_id): attributes for person_id, attributes in graph.G.nodes(data=True)}
+
+
+def relations_by_uuid(graph):
+    return {
+        (graph.person_uuid(id_from), graph.person_uuid(id_to), data["relation_type"])
+        for id_from, id_to, data in graph.G.edges(data=True)
+    }
+
+
+class TestGraphIO(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertRoundTrip(self, graph_class, file_name):
+        graph = build_family(graph_class)
+        path = os.path.join(self.directory, file_name)
+        graph.save(path)
+        loaded = graph_class.load(path)
+
+        self.assertEqual(persons_by_uuid(loaded), persons_by_uuid(graph))
+        self.assertEqual(relations_by_uuid(loaded), relations_by_uuid(graph))
+        self.assertEqual(loaded.check_indexes(), [])
+        self.assertEqual(loaded.family_id_index.keys(), graph.family_id_index.keys())
+        return loaded
+
+    def test_gexf_and_graphml_round_trip(self):
+        for graph_class in [FamilyGraph, CompactFamilyGraph]:
+            for file_name in ["graph.gexf", "graph.graphml"]:
+                with self.subTest(graph_class=graph_class.__name__, file_name=file_name):
+                    loaded = self.assertRoundTrip(graph_class, file_name)
+                    years = [attributes["birth_year"] for _, attributes in loaded.G.nodes(data=True)]
+                    self.assertEqual(sorted(years, key=str), [1613, 1640, None])
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_round_trip(self):
+        for graph_class in [FamilyGraph, CompactFamilyGraph]:
+            with self.subTest(graph_class=graph_class.__name__):
+                self.assertRoundTrip(graph_class, "graph.parquet")
+
+    def test_derived_attributes_for_gephi(self):
+        """
+        networkx reads the typed attributes and the attributes the notebooks
+        added (node_label, node_weight and the edge weight).
+        """
+        graph = build_family(FamilyGraph)
+        path = os.path.join(self.directory, "graph.gexf")
+        graph.save(path)
+
+        G = nx.read_gexf(path)
+        weights = KinshipIndex(graph).node_weights()
+        for person_id, attributes in graph.G.nodes(data=True):
+            node = G.nodes[str(person_id)]
+            self.assertEqual(node.get("birth_year"), attributes["birth_year"])
+            self.assertEqual(node["node_weight"], weights[person_id])
+        self.assertIn("Billeter 1613", {node["node_label"] for _, node in G.nodes(data=True)})
+        self.assertEqual(sorted(weight for _, _, weight in G.edges(data="weight")), [0, 1, 1])
+
+    def test_load_string_gexf_written_by_networkx(self):
+        """
+        Graphs saved like in the notebooks (all attributes as strings) load
+        with integer years and None instead of "None".
+        """
+        graph = build_family(FamilyGraph)
+        G = graph.G.copy()
+        for node in G.nodes():
+            for key, value in G.nodes[node].items():
+                G.nodes[node][key] = str(value)
+        path = os.path.join(self.directory, "graph.gexf")
+        nx.write_gexf(G, path)
+
+        loaded = FamilyGraph.load(path)
+
+        self.assertEqual(persons_by_uuid(loaded), persons_by_uuid(graph))
+        self.assertEqual(relations_by_uuid(loaded), relations_by_uuid(graph))
+
+    def test_gexf_attribute_ids_per_class(self):
+        """
+        Node and edge attributes may use the same ids, as in files saved by
+        Gephi.
+        """
+        path = os.path.join(self.directory, "graph.gexf")
+        with open(path, "w", encoding="utf8") as file:
+            file.write("""<?xml version="1.0" encoding="UTF-8"?>
+<gexf xmlns="http://gexf.net/1.3" version="1.3">
+  <graph defaultedgetype="directed">
+    <attributes class="node">
+      <attribute id="0" title="given_name" type="string"/>
+      <attribute id="1" title="birth_year" type="integer"/>
+    </attributes>
+    <attributes class="edge">
+      <attribute id="0" title="relation_type" type="string"/>
+    </attributes>
+    <nodes>
+      <node id="a"><attvalues><attvalue for="0" value="Hans"/><attvalue for="1" value="1613"/></attvalues></node>
+      <node id="b"><attvalues><attvalue for="0" value="Caspar"/></attvalues></node>
+    </nodes>
+    <edges>
+      <edge source="a" target="b"><attvalues><attvalue for="0" value="FATHER_CHILD"/></attvalues></edge>
+    </edges>
+  </graph>
+</gexf>
+""")
+        self.assertEqual(list(graph_io.iter_gexf(path)), [
+            ("node", "a", {"given_name": "Hans", "birth_year": 1613}),
+            ("node", "b", {"given_name": "Caspar"}),
+            ("edge", "a", "b", {"relation_type": "FATHER_CHILD"}),
+        ])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from graph_layout import family_persons, layered_layout, neighborhood, render
+
+
+def crossings(graph, positions):
+    """
+    Number of crossing parent-child edges between two rows.
+    """
+    edges = [
+        (positions[id_from], positions[id_to])
+        for id_from, id_to, data in graph.G.edges(data=True)
+        if data["relation_type"] != "HUSBAND_WIFE"
+    ]
+    count = 0
+    for i, ((a_x, a_y), (b_x, b_y)) in enumerate(edges):
+        for (c_x, c_y), (d_x, d_y) in edges[i + 1:]:
+            if a_y == c_y and b_y == d_y and (a_x - c_x) * (b_x - d_x) < 0:
+                count += 1
+    return count
+
+
+class TestLayeredLayout(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Two couples (the wives without parents); the children of the second
+        couple are related first, so they start out on the wrong side.
+        """
+        self.graph = FamilyGraph()
+        self.ids = {}
+        for name, family_name, birth_year in [
+            ("Heinrich", "Billeter", 1613), ("Anna", "Wirth", 1615),
+            ("Rudolf", "Geiger", 1603), ("Regula", "Hirzel", None),
+            ("Jakob", "Geiger", 1630), ("Verena", "Geiger", 1632),
+            ("Caspar", "Billeter", 1640), ("Susanna", "Billeter", 1643),
+        ]:
+            self.ids[name] = self.graph.add_person({
+                "family_id": None, "family_name": family_name, "given_name": name, "birth_year": birth_year})
+        for a, b, relation_type in [
+            ("Rudolf", "Jakob", "FATHER_CHILD"), ("Regula", "Jakob", "MOTHER_CHILD"),
+            ("Rudolf", "Verena", "FATHER_CHILD"), ("Regula", "Verena", "MOTHER_CHILD"),
+            ("Heinrich", "Caspar", "FATHER_CHILD"), ("Anna", "Caspar", "MOTHER_CHILD"),
+            ("Heinrich", "Susanna", "FATHER_CHILD"), ("Anna", "Susanna", "MOTHER_CHILD"),
+            ("Heinrich", "Anna", "HUSBAND_WIFE"), ("Rudolf", "Regula", "HUSBAND_WIFE"),
+            ("Caspar", "Verena", "HUSBAND_WIFE"),
+        ]:
+            self.graph.add_relation(self.ids[a], self.ids[b], relation_type)
+
+    def test_generation_rows(self):
+        positions = layered_layout(self.graph)
+        rows = {name: positions[person_id][1] for name, person_id in self.ids.items()}
+        self.assertEqual(rows["Heinrich"], rows["Anna"])
+        self.assertEqual(rows["Rudolf"], rows["Regula"])
+        self.assertEqual(rows["Caspar"], rows["Verena"])
+        self.assertGreater(rows["Heinrich"], rows["Caspar"])
+        # both parents of two children always cross once
+        self.assertEqual(crossings(self.graph, layered_layout(self.graph, sweeps=0)), 6)
+        self.assertEqual(crossings(self.graph, positions), 2)
+
+    def test_birth_year_rows(self):
+        positions = layered_layout(self.graph, by="birth_year", year_step=10)
+        rows = {name: positions[person_id][1] for name, person_id in self.ids.items()}
+        self.assertGreater(rows["Rudolf"], rows["Heinrich"])
+        self.assertGreater(rows["Jakob"], rows["Caspar"])
+        # Regula has no birth year and is put into the decade of her generation
+        self.assertGreater(rows["Regula"], rows["Jakob"])
+
+    def test_selections(self):
+        self.assertEqual(
+            family_persons(self.graph, "Billeter"),
+            {self.ids[name] for name in ["Heinrich", "Anna", "Caspar", "Susanna", "Verena"]})
+        self.assertEqual(
+            neighborhood(self.graph, self.ids["Caspar"], ancestors=1, descendants=1),
+            {self.ids[name] for name in ["Caspar", "Verena", "Heinrich", "Anna"]})
+
+
+class TestRenderAndExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render_family_and_gexf_positions(self):
+        bashoutput = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+        for graph_class in [FamilyGraph, CompactFamilyGraph]:
+            graph = graph_class()
+            graph.load_extractions(bashoutput, workers=1)
+
+            image = os.path.join(self.directory, "billeter.png")
+            render(graph, image, family_persons(graph, "Billeter"))
+            self.assertGreater(os.path.getsize(image), 0)
+
+            positions = layered_layout(graph)
+            path = os.path.join(self.directory, "graph.gexf")
+            graph.save(path, positions=positions)
+            G = nx.read_gexf(path)
+            for person_id, (x, y) in positions.items():
+                position = G.nodes[str(graph.person_uuid(person_id))]["viz"]["position"]
+                self.assertEqual((position["x"], position["y"]), (x, y))
+            self.assertEqual(graph_class.load(path).G.number_of_nodes(), graph.G.number_of_nodes())
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import unittest
+from family_graph import FamilyGraph
+from graph_store import StoredFamilyGraph
+from entity_resolution import resolve_entities
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+
+
+def person_attributes(graph):
+    return sorted(str(sorted(attributes.items(), key=str)) for _, attributes in graph.G.nodes(data=True))
+
+
+class TestStoredFamilyGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "graph.sqlite")
+        with StoredFamilyGraph(self.path, batch_size=16) as graph:
+            self.reports = graph.load_extractions(BASHOUTPUT, workers=1)
+        self.reference = FamilyGraph()
+        self.reference.load_extractions(BASHOUTPUT, workers=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reopen_and_load_all(self):
+        with StoredFamilyGraph(self.path) as graph:
+            self.assertEqual(graph.G.number_of_nodes(), 0)
+            self.assertEqual(graph.stats()["persons"], self.reference.G.number_of_nodes())
+            graph.load_all()
+            self.assertEqual(person_attributes(graph), person_attributes(self.reference))
+            self.assertEqual(graph.G.number_of_edges(), self.reference.G.number_of_edges())
+            self.assertEqual(graph.check_indexes(), [])
+
+    def test_load_one_family(self):
+        """
+        Loading the Billeter family loads all Billeter, their wives and the
+        husbands of the daughters, but not the rest of the Geiger family.
+        """
+        with StoredFamilyGraph(self.path) as graph:
+            graph.load_family("Billeter")
+            names = [attributes["family_name"] for _, attributes in graph.G.nodes(data=True)]
+            self.assertEqual(names.count("Billeter"), graph.families()["billeter"])
+            self.assertIn("Wirth", names)
+            self.assertLess(names.count("Geiger"), graph.families()["geiger"])
+            self.assertEqual(graph.check_indexes(), [])
+
+    def test_rerun_merges_into_lazily_loaded_families(self):
+        """
+        Adding the same extractions again to a reopened store merges like
+        adding them again to the graph in memory.
+        """
+        with StoredFamilyGraph(self.path) as graph:
+            reports = graph.load_extractions(BASHOUTPUT, workers=1)
+            stored = graph.stats()["persons"]
+        expected = self.reference.load_extractions(BASHOUTPUT, workers=1)
+        self.assertEqual([report["created"] for report in reports], [report["created"] for report in expected])
+        self.assertEqual(stored, self.reference.G.number_of_nodes())
+
+    def test_merges_provenance_and_snapshot(self):
+        snapshot = os.path.join(self.directory, "snapshot.sqlite")
+        with StoredFamilyGraph(self.path) as graph:
+            graph.snapshot(snapshot)
+            graph.load_all()
+            merges = resolve_entities(graph)
+            self.assertEqual(len(merges), 1)
+            kept = merges[0]["kept"]
+            self.assertEqual(len(graph.sources(kept)), 2)
+        with StoredFamilyGraph(self.path) as graph:
+            graph.load_all()
+            self.assertEqual(graph.G.number_of_nodes(), self.reference.G.number_of_nodes() - 1)
+            self.assertIn(kept, graph.G)
+            self.assertEqual(graph.check_indexes(), [])
+        with StoredFamilyGraph(snapshot) as graph:
+            self.assertEqual(graph.stats()["persons"], self.reference.G.number_of_nodes())
+
+
+    def test_replace_extraction_writes_through(self):
+        """
+        A replaced file is retracted from the store and merged again.
+        """
+        chunkx2 = os.path.join(BASHOUTPUT, "chunkx2.json")
+        with StoredFamilyGraph(self.path) as graph:
+            graph.load_all()
+            graph.track_contributions()
+            graph.load_extractions([("new.json", {"persons": [
+                {"person_number": 1, "family_id": "Wirth0099", "family_name": "Wirth", "given_name": "Anna"},
+            ], "relations": []})], workers=1)
+            graph.replace_extraction(("new.json", {"persons": [], "relations": []}))
+            graph.track_contributions()
+        with StoredFamilyGraph(self.path) as graph:
+            graph.load_all()
+            self.assertEqual(person_attributes(graph), person_attributes(self.reference))
+
+        with StoredFamilyGraph(os.path.join(self.directory, "tracked.sqlite")) as graph:
+            graph.track_contributions()
+            graph.load_extractions(BASHOUTPUT, workers=1)
+            graph.replace_extraction(chunkx2)
+        reference = FamilyGraph()
+        reference.load_extractions(
+            [os.path.join(BASHOUTPUT, "chunkx1.json"), os.path.join(BASHOUTPUT, "chunkx3.json"), chunkx2], workers=1)
+        with StoredFamilyGraph(os.path.join(self.directory, "tracked.sqlite")) as graph:
+            graph.load_all()
+            self.assertEqual(person_attributes(graph), person_attributes(reference))
+            self.assertEqual(graph.G.number_of_edges(), reference.G.number_of_edges())
+            self.assertEqual(graph.check_indexes(), [])
+
+    def test_contributions_persist(self):
+        """
+        Contributions tracked in one session are retracted in a later one,
+        without loading the families the file didn't contribute to.
+        """
+        path = os.path.join(self.directory, "tracked.sqlite")
+        files = [os.path.join(BASHOUTPUT, name) for name in ["chunkx1.json", "chunkx2.json", "chunkx3.json"]]
+        with StoredFamilyGraph(path) as graph:
+            graph.track_contributions()
+            graph.load_extractions(files, workers=1)
+        with StoredFamilyGraph(path) as graph:
+            graph.track_contributions()
+            report = graph.replace_extraction(files[1])
+            self.assertGreater(report["retracted"]["persons_updated"] + report["retracted"]["persons_removed"], 0)
+        with StoredFamilyGraph(path) as graph:
+            graph.track_contributions()
+            graph.retract_extraction(files[2])
+
+        reference = FamilyGraph()
+        reference.load_extractions([files[0], files[1]], workers=1)
+        with StoredFamilyGraph(path) as graph:
+            graph.load_all()
+            self.assertEqual(person_attributes(graph), person_attributes(reference))
+            self.assertEqual(graph.G.number_of_edges(), reference.G.number_of_edges())
+            self.assertEqual(graph.check_indexes(), [])
+            self.assertEqual(graph.stats()["persons"], reference.G.number_of_nodes())
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import networkx as nx
+from family_graph import FamilyGraph
+from kinship import KinshipIndex, kinship_term
+
+
+def dijkstra_node_weights(G):
+    """
+    node_weight as computed in graph_add_label_and_weight.ipynb
+    """
+    G = G.copy()
+    for _, _, data in G.edges(data=True):
+        data["weight"] = 1 if data["relation_type"] in ("FATHER_CHILD", "MOTHER_CHILD") else 0
+    return {
+        node: sum(1 for length in lengths.values() if length != 0)
+        for node, lengths in nx.all_pairs_dijkstra_path_length(G)
+    }
+
+
+class TestKinshipIndex(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Heinrich and Anna have the children Caspar and Susanna; Caspar's son
+        Jakob and Susanna's daughter Maria are first cousins.
+        """
+        self.graph = FamilyGraph()
+        self.ids = {}
+        for name, family_id in [
+            ("Heinrich", "Billeter0001"), ("Anna", None), ("Caspar", "Billeter0002"),
+            ("Dorothea", None), ("Susanna", None), ("Rudolf", "Geiger0001"),
+            ("Jakob", "Billeter0003"), ("Maria", None),
+        ]:
+            self.ids[name] = self.graph.add_person(
+                {"family_id": family_id, "family_name": "Billeter", "given_name": name})
+        for a, b, relation_type in [
+            ("Heinrich", "Anna", "HUSBAND_WIFE"),
+            ("Heinrich", "Caspar", "FATHER_CHILD"), ("Anna", "Caspar", "MOTHER_CHILD"),
+            ("Heinrich", "Susanna", "FATHER_CHILD"), ("Anna", "Susanna", "MOTHER_CHILD"),
+            ("Caspar", "Dorothea", "HUSBAND_WIFE"), ("Rudolf", "Susanna", "HUSBAND_WIFE"),
+            ("Caspar", "Jakob", "FATHER_CHILD"), ("Dorothea", "Jakob", "MOTHER_CHILD"),
+            ("Rudolf", "Maria", "FATHER_CHILD"), ("Susanna", "Maria", "MOTHER_CHILD"),
+        ]:
+            self.graph.add_relation(self.ids[a], self.ids[b], relation_type)
+        self.kinship = KinshipIndex(self.graph)
+
+    def test_ancestors_and_descendants(self):
+        ids, kinship = self.ids, self.kinship
+        self.assertTrue(kinship.is_ancestor(ids["Anna"], ids["Maria"]))
+        self.assertTrue(kinship.is_ancestor(ids["Heinrich"], ids["Jakob"]))
+        self.assertFalse(kinship.is_ancestor(ids["Caspar"], ids["Maria"]))
+        self.assertFalse(kinship.is_ancestor(ids["Jakob"], ids["Jakob"]))
+        self.assertEqual(kinship.descendant_count(ids["Heinrich"]), 4)
+        self.assertEqual(kinship.ancestor_count(ids["Maria"]), 4)
+        self.assertEqual(kinship.generation(ids["Jakob"]), 2)
+        self.assertEqual(kinship.generation(ids["Dorothea"]), 0)
+        self.assertEqual(
+            [set(level) for level in kinship.descendants_by_generation(ids["Anna"])],
+            [{ids["Caspar"], ids["Susanna"]}, {ids["Jakob"], ids["Maria"]}])
+
+    def test_relationship(self):
+        ids, kinship = self.ids, self.kinship
+        relationship = kinship.relationship(ids["Jakob"], ids["Maria"])
+        self.assertEqual(set(relationship["lowest_common_ancestors"]), {ids["Heinrich"], ids["Anna"]})
+        self.assertEqual(relationship["term"], "first cousin")
+        self.assertEqual(kinship.relationship(ids["Jakob"], ids["Susanna"])["term"], "uncle/aunt")
+        self.assertEqual(kinship.relationship(ids["Maria"], ids["Heinrich"])["term"], "grandparent")
+        self.assertIsNone(kinship.relationship(ids["Dorothea"], ids["Rudolf"]))
+
+        path = kinship.relationship_path(ids["Dorothea"], ids["Rudolf"])
+        self.assertEqual(len(path), 4)
+        self.assertEqual(path[0][0], "husband")
+        self.assertEqual(path[-1], ("husband", ids["Rudolf"]))
+
+    def test_node_weights_as_notebook(self):
+        self.assertEqual(self.kinship.node_weights(), dijkstra_node_weights(self.graph.G))
+
+    def test_kinship_term(self):
+        self.assertEqual(kinship_term(0, 3), "great-grandchild")
+        self.assertEqual(kinship_term(1, 2), "nephew/niece")
+        self.assertEqual(kinship_term(3, 2), "first cousin once removed")
+        self.assertEqual(kinship_term(3, 3), "second cousin")
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
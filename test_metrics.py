@@ -0,0 +1,60 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from openai import OpenAI
+
+import chunk_to_graph
+from extraction_cache import ExtractionCache
+from fake_openai_server import FakeCompletionServer
+from metrics import Metrics, percentile, summarize
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 95), 95.05)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_requests_retries_and_cache_hits(self):
+        """
+        Retries are counted with their request, answers from the cache as
+        cache hits without latency or tokens.
+        """
+        lock = threading.Lock()
+        calls = {"n": 0}
+
+        def responder(request):
+            with lock:
+                calls["n"] += 1
+                if calls["n"] == 1:
+                    return 429, "Rate limit reached"
+            return 200, '{"persons": [{"person_number": 1}, {"person_number": 2}], "relations": []}'
+
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ExtractionCache(os.path.join(directory, "cache.sqlite"))
+            with FakeCompletionServer(responder) as server:
+                client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+                for chunk in ["a", "b", "a"]:
+                    chunk_to_graph.chunk2triple(chunk, "PROMPT", client, backoff=0.01,
+                                                cache=cache, metrics=metrics)
+            cache.close()
+
+        summary = summarize(metrics.events)
+        self.assertEqual(summary["requests"]["count"], 2)
+        self.assertEqual(summary["requests"]["retries"], 1)
+        self.assertEqual(summary["requests"]["cache_hits"], 1)
+        self.assertEqual(summary["tokens"]["persons_extracted"], 4)
+        tokens = summary["tokens"]["prompt"] + summary["tokens"]["completion"]
+        self.assertEqual(summary["tokens"]["per_person"], tokens / 4)
+        self.assertGreaterEqual(summary["requests"]["latency_p95"], summary["requests"]["latency_p50"])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
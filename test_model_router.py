@@ -0,0 +1,162 @@
+import os
+import json
+import tempfile
+import unittest
+
+from openai import OpenAI
+
+import chunk_to_graph
+from family_graph import FamilyGraph
+from fake_openai_server import FakeCompletionServer
+from metrics import Metrics
+from model_router import ModelRouter, ModelTier, validate_answer
+
+CHUNKS = {
+    "Billeter_1": "1\\. Heinrich Billeter",
+    "Billeter_2": "2\\. Hs. Caspar 1613-1654\n> Susanna 1640-1690",
+    "Billeter_3": "3\\. Adrian 1617-",
+}
+
+
+def person(number, given_name, birth_year=None, death_year=None):
+    return {"person_number": number, "family_id": None, "family_name": "Billeter",
+            "given_name": given_name, "birth_year": birth_year, "death_year": death_year}
+
+
+def answer(persons, relations=()):
+    return json.dumps({"persons": persons, "relations": [
+        {"person_number_1": first, "person_number_2": second, "relation_type": "FATHER_CHILD"}
+        for first, second in relations
+    ]})
+
+
+# the strong model gets everything right
+GOOD_ANSWERS = {
+    CHUNKS["Billeter_1"]: answer([person(1, "Heinrich")]),
+    CHUNKS["Billeter_2"]: answer([person(1, "Hs. Caspar", 1613, 1654), person(2, "Susanna", 1640, 1690)], [(1, 2)]),
+    CHUNKS["Billeter_3"]: answer([person(1, "Adrian", 1617)]),
+}
+# the cheap model only gets the trivial chunk right
+CHEAP_ANSWERS = {
+    CHUNKS["Billeter_1"]: GOOD_ANSWERS[CHUNKS["Billeter_1"]],
+    CHUNKS["Billeter_2"]: answer([person(1, "Hs. Caspar", 1613, 1654)], [(1, 2)]),
+    CHUNKS["Billeter_3"]: answer([person(1, "Adrian")]),
+}
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, "chunks")
+        self.output_dir = os.path.join(self.tmp.name, "jsons")
+        os.makedirs(self.input_dir)
+        for name, text in CHUNKS.items():
+            with open(os.path.join(self.input_dir, name + ".txt"), "w", encoding="utf8") as f:
+                f.write(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def client(self, server):
+        return OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+
+    def responder(self, cheap_status=200):
+        def respond(request):
+            chunk = request["messages"][1]["content"]
+            if request["model"] == "cheap":
+                return cheap_status, CHEAP_ANSWERS[chunk]
+            return 200, GOOD_ANSWERS[chunk]
+        return respond
+
+    def test_validation(self):
+        """
+        Schema errors, unknown relation ends and implausible years are errors;
+        missing years and unrelated persons lower the confidence.
+        """
+        for chunk, text in GOOD_ANSWERS.items():
+            self.assertEqual(validate_answer(text, chunk), ([], 1.0))
+        errors, confidence = validate_answer(CHEAP_ANSWERS[CHUNKS["Billeter_2"]], CHUNKS["Billeter_2"])
+        self.assertEqual(len(errors), 1)
+        self.assertIn("unknown person_number_2", errors[0])
+        self.assertEqual(confidence, 0.5)
+        self.assertEqual(validate_answer(CHEAP_ANSWERS[CHUNKS["Billeter_3"]], CHUNKS["Billeter_3"]), ([], 0.0))
+        self.assertEqual(validate_answer("```json", "")[0], ["answer is not JSON"])
+
+        errors, _ = validate_answer(answer([person(1, "Hs. Caspar", 1613, 1754), person(2, "Susanna", 1620)],
+                                           [(1, 2)]), "")
+        self.assertEqual(errors, ["person 1: implausible lifespan 1613-1754",
+                                  "child 2 born 1620 to person 1 born 1613"])
+        errors, confidence = chunk_to_graph.validate_packed(
+            json.dumps({"1": json.loads(GOOD_ANSWERS[CHUNKS["Billeter_1"]])}), [CHUNKS["Billeter_1"], ""])
+        self.assertEqual((errors, confidence), (["packed answer does not have the chunk ids 1 to 2"], 0.0))
+
+    def test_escalates_only_failing_chunks(self):
+        """
+        The cheap tier answers the trivial chunk; the others go to the strong
+        tier, which is recorded per tier.
+        """
+        router = ModelRouter([ModelTier("cheap"), ModelTier("strong")])
+        metrics = Metrics()
+        with FakeCompletionServer(self.responder()) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server), workers=2,
+                router=router, metrics=metrics)
+
+        self.assertEqual(len(report["written"]), 3)
+        self.assertEqual(sorted(request["model"] for request in server.requests), ["cheap"] * 3 + ["strong"] * 2)
+        for name, text in CHUNKS.items():
+            with open(os.path.join(self.output_dir, name + ".json"), encoding="utf8") as f:
+                self.assertEqual(f.read(), GOOD_ANSWERS[text])
+        self.assertEqual(
+            {model: (stats["chunks"], stats["accepted"], stats["escalated"]) for model, stats in router.stats.items()},
+            {"cheap": (3, 1, 2), "strong": (2, 2, 0)},
+        )
+        self.assertEqual(metrics.summary()["tiers"], {
+            "cheap": {"chunks": 3, "accepted": 1, "escalated": 2},
+            "strong": {"chunks": 2, "accepted": 2},
+        })
+
+    def test_failed_tier_escalates(self):
+        """
+        A tier whose requests fail hands the chunk to the next tier.
+        """
+        router = ModelRouter([ModelTier("cheap"), ModelTier("strong")])
+        with FakeCompletionServer(self.responder(cheap_status=500)) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server), workers=1,
+                max_retries=0, router=router)
+        self.assertEqual(report["failed"], [])
+        self.assertEqual(router.stats["cheap"]["failed"], 3)
+        self.assertEqual(router.stats["strong"]["accepted"], 3)
+
+        # without a tier to escalate to, the error is reported
+        router = ModelRouter([ModelTier("cheap")])
+        with FakeCompletionServer(self.responder(cheap_status=500)) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server), workers=1,
+                max_retries=0, overwrite=True, router=router)
+        self.assertEqual(len(report["failed"]), 3)
+
+    def test_streamed_into_graph(self):
+        """
+        The elements of escalated streams never reach the graph.
+        """
+        router = ModelRouter([ModelTier("cheap"), ModelTier("strong")])
+        graph = FamilyGraph()
+        with FakeCompletionServer(self.responder()) as server:
+            report = chunk_to_graph.extract_directory(
+                self.input_dir, self.output_dir, "PROMPT", self.client(server), workers=2,
+                max_retries=0, graph=graph, router=router)
+        self.assertEqual(len(report["written"]), 3)
+        self.assertEqual(
+            sorted(graph.G.nodes[node]["given_name"] for node in graph.G.nodes),
+            ["Adrian", "Heinrich", "Hs. Caspar", "Susanna"],
+        )
+        self.assertEqual(graph.G.number_of_edges(), 1)
+        self.assertEqual(router.stats["cheap"]["escalated"], 2)
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from person_search import PersonSearchIndex, parse_years, spelling_key
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+
+
+def given_names(graph, person_ids):
+    return [graph.G.nodes[person_id]["given_name"] for person_id in person_ids]
+
+
+class TestPersonSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = FamilyGraph()
+        self.graph.track_contributions()
+        self.graph.load_extractions(BASHOUTPUT, workers=1)
+        self.index = PersonSearchIndex(self.graph)
+
+    def test_spelling_variants(self):
+        """
+        Abbreviations, umlauts and spelling variants find the same persons.
+        """
+        self.assertEqual(spelling_key("caspar"), spelling_key("kaspar"))
+        self.assertEqual(spelling_key("maennedorf"), spelling_key("maenedorf"))
+        found = self.index.search(given_name="Hans Kaspar", family_name="Billeter", prefix=False)
+        self.assertIn("Hans Caspar", given_names(self.graph, found))
+        self.assertEqual(
+            self.index.search(given_name="Hs. Caspar", family_name="Billeter", prefix=False), found)
+        self.assertEqual(
+            self.index.search(origin="Männedorf"), self.index.search(origin="Mänedorf"))
+        self.assertGreater(len(self.index.search(origin="Männedorf")), 0)
+
+    def test_prefixes_and_years(self):
+        """
+        Query words match the beginning of words; years filter by range and
+        the results are sorted by birth year.
+        """
+        exact = self.index.search(family_name="Billeter", prefix=False)
+        self.assertEqual(self.index.search(family_name="bill"), exact)
+        self.assertEqual(self.index.search(family_name="bill", prefix=False), [])
+        self.assertEqual(self.index.search(family_name="Bill", limit=3), exact[:3])
+
+        born = self.index.search(family_name="Bill", birth_year=(1600, 1650))
+        self.assertGreater(len(born), 0)
+        years = [self.graph.G.nodes[person_id]["birth_year"] for person_id in born]
+        self.assertEqual(years, sorted(years))
+        self.assertTrue(all(1600 <= year <= 1650 for year in years))
+        self.assertEqual(
+            sorted(self.index.search(birth_year=(1600, 1650))),
+            sorted(person_id for person_id, birth_year in self.graph.G.nodes(data="birth_year")
+                   if isinstance(birth_year, int) and 1600 <= birth_year <= 1650),
+        )
+        self.assertEqual(self.index.search(family_name="Billeter", given_name="Nobody"), [])
+        self.assertEqual(parse_years("1600-"), (1600, None))
+        self.assertEqual(parse_years("1620"), 1620)
+
+    def test_incremental_updates(self):
+        """
+        The index follows additions, merges and retracted files as if it had
+        been built again, for both graph backends.
+        """
+        for graph in [self.graph, CompactFamilyGraph()]:
+            if graph is not self.graph:
+                graph.track_contributions()
+                graph.load_extractions(BASHOUTPUT, workers=1)
+            index = PersonSearchIndex(graph)
+            person_id = graph.add_person(
+                {"family_id": None, "family_name": "von Escher", "given_name": "Hs. Jacob", "birth_year": 1701})
+            self.assertEqual(index.search(family_name="Escher", given_name="Hans Jakob"), [person_id])
+
+            keep_id, merged_id = index.search(family_name="Billeter", birth_year=(1600, 1700))[:2]
+            graph.merge_persons(keep_id, merged_id)
+            report = graph.retract_extraction(os.path.join(BASHOUTPUT, "chunkx2.json"))
+            self.assertGreater(report["persons_removed"], 0)
+
+            rebuilt = PersonSearchIndex(graph)
+            self.assertEqual(index.entries, rebuilt.entries)
+            for field, words in index.words.items():
+                self.assertEqual(words.postings, rebuilt.words[field].postings)
+                self.assertEqual(words.words, rebuilt.words[field].words)
+            self.assertEqual(sorted(index.birth_years.years), sorted(rebuilt.birth_years.years))
+            self.assertEqual(sorted(index.death_years.ids), sorted(rebuilt.death_years.ids))
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import json
+import tempfile
+import unittest
+
+from openai import OpenAI
+
+import pipeline
+from family_graph import FamilyGraph
+from metrics import Metrics, load_events, summarize
+from fake_openai_server import FakeCompletionServer
+
+
+
+def extraction(request):
+    """
+    Answers with one person named after the second word of the chunk.
+    """
+    given_name = request["messages"][1]["content"].split()[1]
+    return 200, json.dumps({
+        "persons": [{
+            "person_number": 1,
+            "family_id": None,
+            "family_name": "Billeter",
+            "given_name": given_name,
+        }],
+        "relations": [],
+    })
+
+
+class TestIncrementalPipeline(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Set up a transcription tree with two families.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, "data")
+        self.build_dir = os.path.join(self.tmp.name, "build")
+        self.prompt_file = os.path.join(self.tmp.name, "prompt.txt")
+        with open(self.prompt_file, "w", encoding="utf8") as f:
+            f.write("PROMPT")
+        self.write_source("Billeter", "1_md.txt", "1\\. Heinrich\n\n__BLANK__\n2\\. Hs. Caspar\n")
+        self.write_source("Geiger", "1_md.txt", "6\\.2. Christoph 1607\n")
+        self.server = FakeCompletionServer(extraction).start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def write_source(self, family, name, text):
+        os.makedirs(os.path.join(self.input_dir, family), exist_ok=True)
+        with open(os.path.join(self.input_dir, family, name), "w", encoding="utf8") as f:
+            f.write(text)
+
+    def run_pipeline(self, metrics=None):
+        return pipeline.run_pipeline(
+            self.input_dir, self.build_dir, self.prompt_file,
+            client_factory=lambda: OpenAI(api_key="test", base_url=self.server.base_url, max_retries=0),
+            workers=2, metrics=metrics,
+        )
+
+    def test_rerun_only_redoes_changed_family(self):
+        """
+        A changed transcription only re-chunks and re-extracts its own family.
+        """
+        report = self.run_pipeline()
+        self.assertEqual(report["rechunked"], ["Billeter", "Geiger"])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertTrue(report["graph"]["rebuilt"])
+
+        report = self.run_pipeline()
+        self.assertEqual(report["rechunked"], [])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertIsNone(report["graph"])
+
+        self.write_source("Billeter", "1_md.txt", "1\\. Heinrich\n\n__BLANK__\n2\\. Hans Caspar\n")
+        report = self.run_pipeline()
+        self.assertEqual(report["rechunked"], ["Billeter"])
+        # only the changed chunk is sent again
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertIn("Hans Caspar", self.server.requests[-1]["messages"][1]["content"])
+        # and only its extraction is replaced in the graph
+        self.assertFalse(report["graph"]["rebuilt"])
+        self.assertEqual([os.path.basename(file) for file in report["graph"]["replaced"]], ["Billeter_2.json"])
+        graph = FamilyGraph.load(os.path.join(self.build_dir, "graph.gexf"))
+        self.assertEqual(sorted(given_name for _, given_name in graph.G.nodes(data="given_name")),
+                         ["Christoph", "Hans", "Heinrich"])
+
+    def test_removed_family_is_cleaned_up(self):
+        """
+        Chunks and extractions of a removed family are deleted.
+        """
+        self.run_pipeline()
+        os.remove(os.path.join(self.input_dir, "Geiger", "1_md.txt"))
+        report = self.run_pipeline()
+
+        chunks = os.listdir(os.path.join(self.build_dir, "chunks"))
+        extractions = os.listdir(os.path.join(self.build_dir, "extractions"))
+        self.assertFalse(any(name.startswith("Geiger") for name in chunks + extractions))
+        self.assertEqual([os.path.basename(file) for file in report["graph"]["retracted"]], ["Geiger_6.json"])
+        graph = FamilyGraph.load(os.path.join(self.build_dir, "graph.gexf"))
+        self.assertNotIn("Christoph", [given_name for _, given_name in graph.G.nodes(data="given_name")])
+
+    def test_metrics_of_all_stages(self):
+        """
+        The metrics file gets the stage timings, one request per chunk with
+        its token usage, the chunk sizes and the graph statistics; the chosen
+        stage is profiled.
+        """
+        path = os.path.join(self.tmp.name, "metrics.jsonl")
+        with Metrics(path, profile="graph") as metrics:
+            self.run_pipeline(metrics)
+
+        summary = summarize(load_events(path))
+        self.assertEqual(set(summary["stages"]), {"chunking", "extraction", "graph"})
+        self.assertEqual(summary["requests"]["count"], 3)
+        self.assertEqual(summary["requests"]["retries"], 0)
+        self.assertGreater(summary["tokens"]["prompt"], 0)
+        self.assertEqual(summary["tokens"]["persons_extracted"], 3)
+        self.assertEqual(summary["chunk_bytes"]["count"], 3)
+        self.assertEqual((summary["graph"]["created"], summary["graph"]["nodes"]), (3, 3))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "graph.prof")))
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
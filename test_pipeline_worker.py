@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from openai import OpenAI
+
+from fake_openai_server import FakeCompletionServer
+from pipeline_worker import PipelineWorker, open_graph, submit
+
+BASHOUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bashoutput")
+with open(os.path.join(BASHOUTPUT, "chunkx1.json"), encoding="utf8") as f:
+    ANSWER = f.read()
+
+
+class TestPipelineWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.prompt_file = os.path.join(self.tmp, "prompt.txt")
+        with open(self.prompt_file, "w", encoding="utf8") as f:
+            f.write("PROMPT")
+        self.server = FakeCompletionServer(lambda request: (200, ANSWER)).start()
+        self.clients = 0
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def worker(self, graph_file):
+        def client_factory():
+            self.clients += 1
+            return OpenAI(api_key="test", base_url=self.server.base_url, max_retries=0)
+
+        graph_path = os.path.join(self.tmp, graph_file)
+        return PipelineWorker(self.prompt_file, open_graph(graph_path), graph_path=graph_path,
+                              output_dir=os.path.join(self.tmp, "jsons"), client_factory=client_factory)
+
+    def test_socket_jobs(self):
+        """
+        Chunks and extractions sent over the socket are merged into one warm
+        graph with one client; the prompt is read again when it changes.
+        """
+        worker = self.worker("graph.gexf")
+        socket_path = os.path.join(self.tmp, "worker.sock")
+        server = worker.serve_socket(socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            answers = submit(socket_path, [
+                {"type": "chunk", "name": "Billeter_1", "text": "1\\. Heinrich"},
+                {"type": "chunk", "name": "Billeter_1_", "text": "1\\. Heinrich Billeter"},
+                {"type": "chunk", "name": "Billeter_1", "text": "1\\. Heinrich"},
+                {"type": "extraction", "path": os.path.join(BASHOUTPUT, "chunkx2.json")},
+                {"type": "unknown"},
+                # private methods are not job types
+                {"type": "merge", "persons": [{"given_name": "Unchecked"}]},
+            ])
+            with open(self.prompt_file, "w", encoding="utf8") as f:
+                f.write("NEW PROMPT")
+            os.utime(self.prompt_file, ns=(0, 0))
+            unnamed, _, stats = submit(socket_path, [
+                {"type": "chunk", "text": "2\\. Hs. Caspar"},
+                {"type": "chunk", "name": "Billeter_2", "text": "2\\. Hs. Caspar"},
+                {"type": "stats"},
+            ])
+        finally:
+            server.shutdown()
+            server.server_close()
+        worker.close()
+
+        self.assertEqual([answer["ok"] for answer in answers], [True, True, True, True, False, False])
+        self.assertEqual(answers[5]["error"], "ValueError: unknown job type 'merge'")
+        self.assertGreater(answers[0]["created"], 0)
+        # the same answer again only merges into the existing persons
+        self.assertEqual(answers[1]["created"], 0)
+        # a chunk extracted again replaces its earlier contributions
+        self.assertEqual(answers[2]["retracted"]["persons_removed"], 0)
+        self.assertEqual(answers[2]["retracted"]["persons_updated"], answers[0]["created"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "jsons", "Billeter_1.json")))
+        self.assertEqual(self.clients, 1)
+        self.assertEqual(self.server.requests[-1]["messages"][0]["content"], "NEW PROMPT")
+        self.assertEqual(unnamed["error"], "ValueError: chunk job without a path needs a name")
+        self.assertEqual(stats["jobs"], 5)
+        self.assertEqual(open_graph(os.path.join(self.tmp, "graph.gexf")).G.number_of_nodes(), stats["persons"])
+
+    def test_watched_directory_with_store(self):
+        """
+        Files dropped into the watched directory are processed and moved; the
+        stored graph is committed after every job.
+        """
+        inbox = os.path.join(self.tmp, "inbox")
+        os.makedirs(inbox)
+        with open(os.path.join(inbox, "Billeter_1.txt"), "w", encoding="utf8") as f:
+            f.write("1\\. Heinrich")
+        shutil.copy(os.path.join(BASHOUTPUT, "chunkx2.json"), inbox)
+        with open(os.path.join(inbox, "broken.json"), "w", encoding="utf8") as f:
+            f.write("{")
+
+        worker = self.worker("graph.sqlite")
+        answers = dict(worker.scan(inbox))
+        self.assertTrue(answers["Billeter_1.txt"]["ok"])
+        self.assertEqual(answers["broken.json"]["errors"][0][:9], "Expecting")
+        self.assertEqual(sorted(os.listdir(os.path.join(inbox, "done"))),
+                         ["Billeter_1.txt", "broken.json", "chunkx2.json"])
+        self.assertEqual(worker.scan(inbox), [])
+        persons = worker.graph.G.number_of_nodes()
+        worker.close()
+        self.assertEqual(open_graph(os.path.join(self.tmp, "graph.sqlite")).stats()["persons"], persons)
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+import txt_to_chunks
+from family_graph import FamilyGraph
+from compact_family_graph import CompactFamilyGraph
+from provenance import ProvenanceIndex
+
+SOURCE = (
+    "<center>Bächli</center>\n"
+    "__BLANK__\n"
+    "1\\. Jörg Provisor am Caro-\n"
+    "linum 1640[^fn1]\n"
+    "__BLANK__\n"
+    "2\\. Hs. Caspar 1642\n"
+    "[^fn1]: überschrieben 1642\n"
+)
+
+
+def extraction(given_names):
+    return {
+        "persons": [
+            {"person_number": number, "family_id": None, "family_name": "Bächli", "given_name": name}
+            for number, name in enumerate(given_names, 1)
+        ],
+        "relations": [],
+    }
+
+
+class TestProvenance(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "data", "Baechli", "Baechli_01_md.txt")
+        os.makedirs(os.path.dirname(self.source))
+        with open(self.source, "w", encoding="utf8") as f:
+            f.write(SOURCE)
+        self.index = ProvenanceIndex(os.path.join(self.tmp.name, "provenance.sqlite"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_footnote_source_map(self):
+        """
+        Kept characters and footnote texts map back onto the unresolved text.
+        """
+        text = "Rudolf 1603[^fn1] + 1662\n[^fn1]: anno 1604"
+        resolution = txt_to_chunks.resolve_footnotes(text, " FNS", "FNE", track_offsets=True)
+        self.assertEqual(resolution.text, "Rudolf 1603 FNSanno 1604FNE + 1662\n")
+        source_map = resolution.source_map
+        for target in [0, resolution.text.index("+"), resolution.text.index("anno")]:
+            self.assertEqual(text[source_map.source_offset(target)], resolution.text[target])
+        self.assertEqual(source_map.source_offset(resolution.text.index(" +") - 1), text.index(" +") - 1)
+
+    def test_chunk_spans(self):
+        """
+        The byte spans of the chunks cover their persons in the file as written.
+        """
+        records = txt_to_chunks.family_chunks("Baechli", [self.source], txt_to_chunks.ChunkSettings())
+        self.assertEqual([record.chunk_id for record in records], ["Baechli_Bäc", "Baechli_1", "Baechli_2"])
+        with open(self.source, "rb") as f:
+            raw = f.read()
+        (path, start, end, line), = records[1].spans
+        self.assertEqual(path, self.source)
+        self.assertEqual(line, 3)
+        self.assertEqual(
+            raw[start:end].decode("utf8"),
+            "1\\. Jörg Provisor am Caro-\nlinum 1640[^fn1]",
+        )
+        (_, start, end, line), = records[2].spans
+        self.assertEqual((raw[start:end].decode("utf8"), line), ("2\\. Hs. Caspar 1642", 6))
+
+    def test_person_source_lines(self):
+        """
+        A node leads back to the lines of all chunks it was extracted from, also after merges.
+        """
+        for output_format in ["files", "jsonl"]:
+            output = os.path.join(self.tmp.name, output_format)
+            list(txt_to_chunks.chunk_families(
+                {"Baechli": [self.source]}, output, processes=1,
+                output_format=output_format, provenance=self.index,
+            ))
+        self.assertEqual(self.index.stats()["chunk_spans"], 3)
+
+        for graph in [FamilyGraph(), CompactFamilyGraph()]:
+            self.index.clear_mentions()
+            graph.provenance = self.index
+            graph.load_extractions([
+                ("extractions/Baechli_1.json", extraction(["Jörg"])),
+                ("extractions/Baechli_2.json", extraction(["Hs. Caspar"])),
+            ], workers=1)
+            jorg, caspar = sorted(graph.G.nodes, key=lambda node: graph.G.nodes[node]["given_name"])[::-1]
+            self.assertEqual(
+                self.index.mentions(graph.person_uuid(jorg)),
+                [("extractions/Baechli_1.json", 1, "Baechli_1")],
+            )
+            self.assertEqual(
+                self.index.source_lines(graph.person_uuid(jorg)),
+                [(self.source, 3, ["1\\. Jörg Provisor am Caro-", "linum 1640[^fn1]"])],
+            )
+
+            caspar_uuid = graph.person_uuid(caspar)
+            graph.merge_persons(jorg, caspar)
+            self.assertEqual(len(self.index.source_lines(graph.person_uuid(jorg))), 2)
+            self.assertEqual(self.index.mentions(caspar_uuid), [])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
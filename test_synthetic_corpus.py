@@ -0,0 +1,60 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+import txt_to_chunks
+from family_graph import FamilyGraph
+from extraction_schema import clean_extraction
+from synthetic_corpus import generate_corpus, write_corpus
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = generate_corpus(500, seed=1)
+
+    def test_deterministic(self):
+        self.assertEqual(generate_corpus(500, seed=1), self.corpus)
+        self.assertNotEqual(generate_corpus(500, seed=2).texts, self.corpus.texts)
+
+    def test_extractions_are_valid(self):
+        for name, extraction in self.corpus.extractions.items():
+            persons, relations, errors = clean_extraction(extraction)
+            self.assertEqual(errors, [], name)
+        self.assertEqual(len(self.corpus.extractions), self.corpus.truth["entries"])
+
+    def test_chunking_and_ingestion_match_truth(self):
+        """
+        The transcriptions split into one chunk per entry (and one for the
+        header of each family); the extractions load into the distinct persons
+        plus the daughters mentioned again as wives.
+        """
+        truth = self.corpus.truth
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(self.corpus, directory)
+            with open(os.path.join(directory, "truth.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f), truth)
+
+            families = txt_to_chunks.discover_families(
+                sorted(txt_to_chunks.find_md_files(os.path.join(directory, "data"))))
+            self.assertEqual(len(families), truth["families"])
+            logging.disable(logging.WARNING)
+            try:
+                chunks = sum(
+                    len(written) for _, written in txt_to_chunks.chunk_families(
+                        families, os.path.join(directory, "chunks"), processes=1, output_format="jsonl"))
+            finally:
+                logging.disable(logging.NOTSET)
+            self.assertEqual(chunks, truth["entries"] + truth["families"])
+
+            graph = FamilyGraph()
+            reports = graph.load_extractions(os.path.join(directory, "bashoutput"), workers=1)
+            self.assertEqual(sum(report["created"] + report["merged"] for report in reports), truth["mentions"])
+            self.assertEqual(graph.G.number_of_nodes(), truth["persons"] + truth["marriages"])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+
+from chunk_writer import ChunkRegistry
+from text_normalizer import filename_suffix, normalize_text
+from txt_to_chunks import resolve_footnotes
+
+
+class TestResolveFootnotes(unittest.TestCase):
+
+    def test_anchors_replaced_by_numbered_texts(self):
+        """
+        Anchors get the footnote text with the same number; the texts are removed.
+        """
+        text = (
+            "ux.2. (Sus)anna v. Orelli 1640[^fn1] + 1681\n"
+            "heir.2. Antistes J. Ulrich[^fn2]\n"
+            "__BLANK__\n"
+            "[^fn2]: Joh. Jakob Ulrich (1602-1668)\n"
+            "[^fn1]: überschrieben 2 (= 1642)"
+        )
+        resolution = resolve_footnotes(text, " FNS", "FNE")
+
+        self.assertEqual(
+            resolution.text,
+            "ux.2. (Sus)anna v. Orelli 1640 FNSüberschrieben 2 (= 1642)FNE + 1681\n"
+            "heir.2. Antistes J. Ulrich FNSJoh. Jakob Ulrich (1602-1668)FNE\n"
+            "__BLANK__\n\n",
+        )
+        self.assertEqual(resolution.missing_texts, [])
+        self.assertEqual(resolution.unused_texts, [])
+
+    def test_reports_unmatched_anchors_and_texts(self):
+        """
+        Anchors without text stay and are reported, texts without anchor stay and are reported.
+        """
+        text = "Rudolf 1603[^fn1] + 1662[^fn3]\n[^fn1]: a\n[^fn2]: b"
+        resolution = resolve_footnotes(text, "<", ">")
+
+        self.assertEqual(resolution.text, "Rudolf 1603<a> + 1662[^fn3]\n\n[^fn2]: b")
+        self.assertEqual(resolution.missing_texts, ["3"])
+        self.assertEqual(resolution.unused_texts, ["2"])
+
+    def test_multiline_footnote_text(self):
+        """
+        A footnote text runs until the next footnote text or the end of the text.
+        """
+        text = "a[^fn1] b[^fn2]\n[^fn1]: erste\nZeile\n[^fn2]: zweite"
+        resolution = resolve_footnotes(text, "(", ")")
+
+        self.assertEqual(resolution.text, "a(erste\nZeile) b(zweite)\n\n")
+
+
+class TestNormalizeText(unittest.TestCase):
+
+    SOURCE = "<center>Billeter</center>\n__BLANK__\n1\\. Provisor am Caro-\nlinum\n> Emerentiana 1638-\nm. Felix\n__BLANK__\n2\\.1 Hs. Caspar"
+
+    def test_single_pass(self):
+        """
+        De-hyphenation, html stripping and person markers are applied in one pass.
+        """
+        self.assertEqual(
+            normalize_text(self.SOURCE).text,
+            "Billeter\nNEWFILE\n1\\. Provisor am Carolinum\n> Emerentiana 1638-\nm. Felix\nNEWFILE\n2\\.1 Hs. Caspar",
+        )
+        self.assertEqual(
+            normalize_text(self.SOURCE, remove_hyphenation=False, remove_html=False, mark_persons=False).text,
+            self.SOURCE,
+        )
+
+    def test_source_map(self):
+        """
+        Every kept character maps back to the same character of the source.
+        """
+        normalized = normalize_text(self.SOURCE)
+        source_map = normalized.source_map
+        for i, character in enumerate(normalized.text):
+            if character not in "\nNEWFIL":
+                self.assertEqual(self.SOURCE[source_map.source_offset(i)], character)
+
+        start = normalized.text.index("2\\.1")
+        span = source_map.source_span(start, len(normalized.text))
+        self.assertEqual(self.SOURCE[span[0]:span[1]], "2\\.1 Hs. Caspar")
+
+    def test_filename_suffix(self):
+        self.assertEqual(filename_suffix("1\\. Heinrich"), "1")
+        self.assertEqual(filename_suffix("2\\.1 Hs. Caspar"), "2")
+        self.assertEqual(filename_suffix("a. Hans"), "a_")
+        self.assertEqual(filename_suffix("12/3"), "12")
+
+
+class TestChunkRegistry(unittest.TestCase):
+
+    def test_collisions_get_underlines(self):
+        registry = ChunkRegistry()
+        names = [registry.resolve(name) for name in ["B_1", "B_1", "B_2", "B_1", "B_1_"]]
+        self.assertEqual(names, ["B_1", "B_1_", "B_2", "B_1__", "B_1___"])
+
+
+# Run the test
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Single-pass normalization of transcription texts before splitting them into
+person chunks (see txt_to_chunks.py).
+
+normalize_text applies in one scan over the text:
+
+* de-hyphenation of words broken at the end of a line ("Caro-\\nlinum")
+* removal of html tags ("<center>Billeter</center>")
+* marking of new persons: "\\n__BLANK__\\n" followed by a digit becomes "\\nNEWFILE\\n"
+
+and keeps a SourceMap from the result back to the character offsets of the
+source, so that chunks can be traced back to the source.
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from typing import NamedTuple
+
+# marker for the beginning of a new person, see txt_to_chunks.split_persons
+PERSON_MARKER: str = "\nNEWFILE\n"
+
+# Every alternative is entered through its first character, so that the
+# combined pattern starts with a character class ([-<\n]) the regex engine can
+# scan for quickly; the lookbehinds make sure each alternative only applies to
+# its own first character.
+
+# a word broken by a hyphen at the end of a line (letters only, so that open
+# year ranges like "1638-" at the end of a line are kept)
+HYPHENATION: tuple[str, str] = ("-", r"(?P<hyphen>(?<=[^\W\d_]-)\n(?=[^\W\d_]))")
+HTML: tuple[str, str] = ("<", r"(?P<html>(?<=<).*?>)")
+# [linebreak]"__BLANK__"[linebreak][digit] (lookahead so as not including the digit)
+BLANK: tuple[str, str] = ("\n", r"(?P<blank>(?<=\n)__BLANK__\n(?=\d))")
+
+# "__BLANK__"[linebreak][digit] at the very beginning of a text
+leading_blank_pattern: re.Pattern[str] = re.compile(r"__BLANK__\n(?=\d)")
+
+# characters ending the file name suffix of a person chunk
+suffix_pattern: re.Pattern[str] = re.compile(r"[^/\s\\]*")
+
+
+class SourceMap:
+    """
+    piecewise linear map from offsets in a derived text to offsets in its source
+
+    segment k starts at targets[k] in the derived text and at sources[k] in the
+    source; within a segment offsets advance in step. Only one segment per edit
+    is stored instead of one offset per character.
+    """
+
+    __slots__ = ("targets", "sources")
+
+    def __init__(self) -> None:
+        self.targets: array = array("l")
+        self.sources: array = array("l")
+
+    def add(self, target: int, source: int) -> None:
+        """start a new segment at target, mapped to source"""
+        if self.targets and self.targets[-1] == target:
+            self.sources[-1] = source
+        else:
+            self.targets.append(target)
+            self.sources.append(source)
+
+    def source_offset(self, target: int) -> int:
+        """offset in the source of the character at target"""
+        k: int = bisect_right(self.targets, target) - 1
+        return self.sources[k] + target - self.targets[k]
+
+    def source_span(self, start: int, end: int) -> tuple[int, int]:
+        """smallest span of the source covering the derived span [start, end)"""
+        last: int = max(start, end - 1)
+        k_start: int = bisect_right(self.targets, start) - 1
+        k_end: int = bisect_right(self.targets, last) - 1
+        offsets: list[int] = [self.source_offset(start), self.source_offset(last)]
+        # segments need not be in source order: add the ends of all segments inside the span
+        for k in range(k_start + 1, k_end + 1):
+            offsets.append(self.sources[k])
+            offsets.append(self.sources[k - 1] + self.targets[k] - 1 - self.targets[k - 1])
+        return min(offsets), max(offsets) + 1
+
+
+class NormalizedText(NamedTuple):
+    """result of normalize_text"""
+
+    text: str
+    # map back to the offsets of the source (None if not tracked)
+    source_map: SourceMap | None
+
+
+@lru_cache(maxsize=None)
+def normalizer_pattern(
+    remove_hyphenation: bool, remove_html: bool, mark_persons: bool
+) -> re.Pattern[str] | None:
+    """compile the alternation of all enabled transformations"""
+    alternatives: list[tuple[str, str]] = []
+    if remove_hyphenation:
+        alternatives.append(HYPHENATION)
+    if remove_html:
+        alternatives.append(HTML)
+    if mark_persons:
+        alternatives.append(BLANK)
+    if not alternatives:
+        return None
+    first_characters: str = re.escape("".join(first for first, _ in alternatives))
+    return re.compile(
+        f"[{first_characters}](?:" + "|".join(rest for _, rest in alternatives) + ")"
+    )
+
+
+def normalize_text(
+    text: str,
+    remove_hyphenation: bool = True,
+    remove_html: bool = True,
+    mark_persons: bool = True,
+    track_offsets: bool = True,
+) -> NormalizedText:
+    """
+    apply all enabled transformations to text in a single scan
+
+    the person marker is mapped onto the "__BLANK__" line it replaces
+    """
+    pattern: re.Pattern[str] | None = normalizer_pattern(
+        remove_hyphenation, remove_html, mark_persons
+    )
+    source_map: SourceMap | None = SourceMap() if track_offsets else None
+    if source_map is not None:
+        source_map.add(0, 0)
+    if pattern is None:
+        return NormalizedText(text, source_map)
+
+    parts: list[str] = []
+    length: int = 0
+    position: int = 0
+    leading: re.Match[str] | None = (
+        leading_blank_pattern.match(text) if mark_persons else None
+    )
+    if leading is not None:
+        parts.append(PERSON_MARKER)
+        length = len(PERSON_MARKER)
+        position = leading.end()
+        if source_map is not None:
+            source_map.add(length, position)
+    for match in pattern.finditer(text, position):
+        start: int = match.start()
+        parts.append(text[position:start])
+        length += start - position
+        replacement: str = PERSON_MARKER if match.lastgroup == "blank" else ""
+        parts.append(replacement)
+        position = match.end()
+        if source_map is not None:
+            source_map.add(length, start)
+            length += len(replacement)
+            source_map.add(length, position)
+        else:
+            length += len(replacement)
+    parts.append(text[position:])
+
+    return NormalizedText("".join(parts), source_map)
+
+
+def filename_suffix(person: str) -> str:
+    """
+    the first three characters of a person chunk used in its file name:
+    spaces become underlines, everything from the first slash, backslash or
+    line break on is dropped and dots are removed
+    """
+    return suffix_pattern.match(person[:3].replace(" ", "_")).group().replace(".", "")
@@ -36,14 +36,12 @@ desideratum:
 * ! documentation!
 * ! distinguish between different family stems (e.g. Schaad A, Schaad B, Meyer ...)
 * ! recognize beginning of new person description if preceding "__BLANK__" is not present
-* ! keep the file name of the original text files for reference
 * ! smarter handling of person numbering collisions
 * discard of introdutory text at the beginning of the family descriptions
 * smarter naming of the output files
 * remove repeating headers and footers and comments like "finis"
 * improved stripping of html tags from markdown
 * handling of repeating numbering when a person is mentioned at the end of a page and at the beginning of the next page
-* handling of footnote-anchors without corresponding footnote-text and vice versa
 * more transparancy about shortcuts and discarded information
 
 """
@@ -53,287 +51,584 @@ import re
 import argparse
 import sys
 import logging
-from colorama import just_fix_windows_console, Fore
-from alive_progress import alive_bar
+import multiprocessing
+from bisect import bisect_right
+from contextlib import nullcontext
+from typing import Iterator, NamedTuple
 
-parser = argparse.ArgumentParser()
+from chunk_writer import ChunkRecord, ChunkRegistry, ChunkWriter
+from metrics import Metrics, format_summary
+from provenance import ProvenanceIndex
+from text_normalizer import NormalizedText, SourceMap, filename_suffix, normalize_text
 
-parser.add_argument(
-    "-i",
-    "--input-directory",
-    dest="input_directory",
-    required=True,
-    help="Directory containing the text files",
-)
-
-parser.add_argument(
-    "-o",
-    "--output-directory",
-    dest="output_directory",
-    required=True,
-    help="Directory to output the chunked text files to",
-)
-
-parser.add_argument(
-    "-fns",
-    "--fn-delimiter-start",
-    dest="footnote_delimiter_start",
-    required=False,
-    default=" FNS",
-    help="string to mark beginning of footnote",
-)
-
-parser.add_argument(
-    "-fne",
-    "--fn-delimiter-end",
-    dest="footnote_delimiter_end",
-    required=False,
-    default="FNE",
-    help="string to mark end of footnote",
-)
-
-parser.add_argument(
-    "-rh",
-    "--remove-hyphenation",
-    dest="remove_hyphenation",
-    required=False,
-    default=True,
-    action="store_true",
-)
+# see https://en.wikipedia.org/wiki/List_of_mythological_places for version codenames
+version_string: str = "txt_to_chunks.py version 0.1.0 'Rarohenga'"
 
-parser.add_argument(
-    "--remove-html",
-    dest="remove_html",
-    required=False,
-    default=True,
-    action="store_true",
+family_pattern: re.Pattern[str] = re.compile(
+    r"[\/\\]data[\/\\](von\s+)?[a-zA-ZäöüÄÖÜ]+((\s+(v(om|\.|on)\s+)[a-zA-ZäöüÄÖÜ]+))?"
 )
 
+# regex pattern to match a footnote anchor [^fn##] (but not the label of a footnote text)
+fn_pattern: re.Pattern[str] = re.compile(r"\[\^fn(\d+)\](?!:)")
 
-parser.add_argument("-v", "--verbose", dest="verbose", action="store_true")
-
-parser.add_argument(
-    "--version",
-    action="store_true",
+# regex pattern to match the footnote text delimited by [^fn##]: and following label [^fn##] using a lookahead and allowing for newlines
+fn_text_pattern: re.Pattern[str] = re.compile(
+    r"^\[\^fn(\d+)\]:\s*(.*?)(?=\n\s?\[\^fn\d+\]|\Z)",
+    re.DOTALL | re.MULTILINE,
 )
 
-args = parser.parse_args()
-
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """parse the command line arguments"""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-i",
+        "--input-directory",
+        dest="input_directory",
+        required=True,
+        help="Directory containing the text files",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output-directory",
+        dest="output_directory",
+        required=True,
+        help="Directory to output the chunked text files to",
+    )
+
+    parser.add_argument(
+        "-fns",
+        "--fn-delimiter-start",
+        dest="footnote_delimiter_start",
+        required=False,
+        default=" FNS",
+        help="string to mark beginning of footnote",
+    )
+
+    parser.add_argument(
+        "-fne",
+        "--fn-delimiter-end",
+        dest="footnote_delimiter_end",
+        required=False,
+        default="FNE",
+        help="string to mark end of footnote",
+    )
+
+    parser.add_argument(
+        "-rh",
+        "--remove-hyphenation",
+        dest="remove_hyphenation",
+        required=False,
+        default=True,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--remove-html",
+        dest="remove_html",
+        required=False,
+        default=True,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--processes",
+        dest="processes",
+        type=int,
+        required=False,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        required=False,
+        default="files",
+        choices=["files", "jsonl"],
+        help="one text file per person chunk, or one JSON lines shard chunks.jsonl with all chunks",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        required=False,
+        default=None,
+        help="JSON lines file for the wall time and the chunk sizes (see metrics.py)",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="dump cProfile stats of the chunking next to --metrics (use with -j 1)",
+    )
+
+    parser.add_argument(
+        "--provenance",
+        dest="provenance",
+        required=False,
+        default=None,
+        help="SQLite index for the source file and byte span of every chunk (see provenance.py)",
+    )
+
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true")
+
+    parser.add_argument(
+        "--version",
+        action="store_true",
+    )
+
+    return parser.parse_args(argv)
+
+
+def configure_logging(verbose: bool) -> None:
+    """set the logging level and colorize the level names"""
+    from colorama import just_fix_windows_console, Fore
+
+    # get ANSI escapes to work on Windows
+    just_fix_windows_console()
+
+    # set logging level
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+    # use colorama to colorize logging output
+    logging.addLevelName(
+        logging.DEBUG, Fore.BLUE + logging.getLevelName(logging.DEBUG) + Fore.RESET
+    )
+    logging.addLevelName(
+        logging.INFO, Fore.GREEN + logging.getLevelName(logging.INFO) + Fore.RESET
+    )
+    logging.addLevelName(
+        logging.WARNING, Fore.YELLOW + logging.getLevelName(logging.WARNING) + Fore.RESET
+    )
+    logging.addLevelName(
+        logging.ERROR, Fore.RED + logging.getLevelName(logging.ERROR) + Fore.RESET
+    )
+    logging.addLevelName(
+        logging.CRITICAL, Fore.RED + logging.getLevelName(logging.CRITICAL) + Fore.RESET
+    )
+
+
+def check_input_directory(input_directory: str) -> None:
+    """check if input directory exists, is readable and contains files"""
+    try:
+        if not os.path.exists(input_directory):
+            logging.critical(f"The given directory {input_directory} doesn't exist.")
+            sys.exit(1)
+        if not os.access(input_directory, os.R_OK):
+            logging.critical(f"The given directory {input_directory} cannot be read.")
+            sys.exit(1)
+        if not any(os.scandir(input_directory)):
+            logging.critical(f"The given directory {input_directory} is empty.")
+            sys.exit(1)
+    except Exception as e:
+        logging.critical(f"An error occurred: {e}")
+        sys.exit(1)
 
-# get ANSI escapes to work on Windows
-just_fix_windows_console()
 
-# output version string and exit
-# see https://en.wikipedia.org/wiki/List_of_mythological_places for version codenames
-version_string: str = "txt_to_chunks.py version 0.1.0 'Rarohenga'"
-if args.version is True:
-    print(version_string)
-    sys.exit(0)
-
-# configure logging
-# set logging level
-if args.verbose:
-    logging.basicConfig(level=logging.DEBUG)
-else:
-    logging.basicConfig(level=logging.INFO)
-# use colorama to colorize logging output
-logging.addLevelName(
-    logging.DEBUG, Fore.BLUE + logging.getLevelName(logging.DEBUG) + Fore.RESET
-)
-logging.addLevelName(
-    logging.INFO, Fore.GREEN + logging.getLevelName(logging.INFO) + Fore.RESET
-)
-logging.addLevelName(
-    logging.WARNING, Fore.YELLOW + logging.getLevelName(logging.WARNING) + Fore.RESET
-)
-logging.addLevelName(
-    logging.ERROR, Fore.RED + logging.getLevelName(logging.ERROR) + Fore.RESET
-)
-logging.addLevelName(
-    logging.CRITICAL, Fore.RED + logging.getLevelName(logging.CRITICAL) + Fore.RESET
-)
+def find_md_files(input_directory: str) -> list[str]:
+    """traverse the given directory and return all files ending with _md.txt"""
+    md_files: list[str] = []
 
-# check if input directory exists, is readable and contains files
+    for root, dirs, files in os.walk(input_directory):
+        for file in files:
+            if file.endswith("_md.txt"):
+                md_files.append(os.path.join(root, file))
 
-try:
-    if not os.path.exists(args.input_directory):
-        logging.critical(f"The given directory {args.input_directory} doesn't exist.")
-        sys.exit(1)
-    if not os.access(args.input_directory, os.R_OK):
-        logging.critical(f"The given directory {args.input_directory} cannot be read.")
-        sys.exit(1)
-    if not any(os.scandir(args.input_directory)):
-        logging.critical(f"The given directory {args.input_directory} is empty.")
-        sys.exit(1)
-except Exception as e:
-    logging.critical(f"An error occurred: {e}")
-    sys.exit(1)
+    # Remove items containing the substring "1_Meta" from the list
+    # WARNING: this looses some families
+    md_files = [file for file in md_files if "1_Meta" not in file]
+    md_files = [file for file in md_files if "Abgestorbne" not in file]
+    return md_files
 
 
-# traverse the given directory and add all files ending with _md.txt to a list of strings
-md_files: list[str] = []
+def family_name(file: str) -> str:
+    """derive the family name from the path of a text file"""
+    return family_pattern.search(file).group().replace(os.sep + "data" + os.sep, "")
 
-for root, dirs, files in os.walk(args.input_directory):
-    for file in files:
-        if file.endswith("_md.txt"):
-            md_files.append(os.path.join(root, file))
 
-# Now md_files contains all the file paths ending with _md.txt
-if args.verbose:
-    print(len(md_files))
-    # print(md_files)
+def discover_families(md_files: list[str]) -> dict[str, list[str]]:
+    """group the text files by family name (keeping their order)"""
+    families: dict[str, list[str]] = {}
+    for file in md_files:
+        families.setdefault(family_name(file), []).append(file)
+    return families
 
-# Remove items containing the substring "1_Meta" from the list
-# WARNING: this looses some families
-md_files: list[str] = [file for file in md_files if "1_Meta" not in file]
-md_files: list[str] = [file for file in md_files if "Abgestorbne" not in file]
 
 #  Prepare files for splitting
 # ==============================================================================
 
-family_pattern: re.Pattern[str] = re.compile(
-    r"[\/\\]data[\/\\](von\s+)?[a-zA-ZäöüÄÖÜ]+((\s+(v(om|\.|on)\s+)[a-zA-ZäöüÄÖÜ]+))?"
-)
 
-# write text files to list of strings
-texts: list[list[str]] = []
-for file in md_files:
-    with open(file, "r", encoding="utf-8") as f:
-        texts.append(
-            [
-                f.read(),
-                file,
-                family_pattern.search(file)
-                .group()
-                .replace(os.sep + "data" + os.sep, ""),
-            ]
+class ChunkSettings(NamedTuple):
+    """options of the chunking, passed to the worker processes"""
+
+    footnote_delimiter_start: str = " FNS"
+    footnote_delimiter_end: str = "FNE"
+    remove_hyphenation: bool = True
+    remove_html: bool = True
+
+
+class FootnoteResolution(NamedTuple):
+    """result of resolve_footnotes"""
+
+    text: str
+    # numbers of anchors without footnote text
+    missing_texts: list[str]
+    # numbers of footnote texts without anchor
+    unused_texts: list[str]
+    # map back to the offsets of the unresolved text (None if not tracked)
+    source_map: SourceMap | None = None
+
+
+def resolve_footnotes(
+    text: str,
+    footnote_delimiter_start: str,
+    footnote_delimiter_end: str,
+    track_offsets: bool = False,
+) -> FootnoteResolution:
+    """
+    Put footnotes back into their context: every anchor [^fn##] is replaced by
+    its footnote text (delimited by the given markers) and the footnote texts
+    are removed from the end of the text.
+
+    All footnote texts are parsed once into a map, then the text is rebuilt in
+    a single pass. Footnote texts without anchor are left in place.
+
+    with track_offsets the delimiters are mapped onto the anchor they replace and
+    the inserted footnote text onto its definition
+    """
+    definitions: dict[str, str] = {}
+    definition_offsets: dict[str, int] = {}
+    definition_spans: dict[str, list[tuple[int, int]]] = {}
+    for match in fn_text_pattern.finditer(text):
+        number: str = match.group(1)
+        if number not in definitions:
+            definition: str = match.group(2)
+            definitions[number] = definition.strip()
+            definition_offsets[number] = match.start(2) + len(definition) - len(definition.lstrip())
+        definition_spans.setdefault(number, []).append(match.span())
+
+    # all anchors outside of the footnote texts
+    spans: list[tuple[int, int]] = sorted(
+        span for number_spans in definition_spans.values() for span in number_spans
+    )
+    anchors: list[re.Match[str]] = []
+    span_index: int = 0
+    for match in fn_pattern.finditer(text):
+        while span_index < len(spans) and spans[span_index][1] <= match.start():
+            span_index += 1
+        if span_index < len(spans) and spans[span_index][0] <= match.start():
+            continue
+        anchors.append(match)
+
+    used: set[str] = {match.group(1) for match in anchors if match.group(1) in definitions}
+    missing_texts: list[str] = sorted(
+        {match.group(1) for match in anchors} - used, key=int
+    )
+    unused_texts: list[str] = sorted(set(definitions) - used, key=int)
+
+    # (start, end, replacement, offset of the footnote text or -1) sorted by position
+    edits: list[tuple[int, int, str, int]] = [
+        (
+            match.start(),
+            match.end(),
+            footnote_delimiter_start
+            + definitions[match.group(1)]
+            + footnote_delimiter_end,
+            definition_offsets[match.group(1)],
         )
-
-# Put footnotes back into their context:
-
-# regex pattern to match the footnote number
-fn_pattern: re.Pattern[str] = re.compile(r"\[\^fn\d+\]")
-
-# regex pattern to match the footnote text delimited by [^fn##]: and following label [^fn##] using a lookahead and allowing for newlines
-
-fn_text_pattern: re.Pattern[str] = re.compile(
-    r"^(\[\^fn\d+\]:\s*(.*?))(?=(\n\s?\[\^fn\d+\]|$(?![\r\n])))",
-    re.DOTALL | re.MULTILINE,
-)
-
-# iterate over the footnotes and check if a footnote text is found and whether it is preceded by a footnote anchor with the corresponding number earlier in the string
-sublist: list[str]
-text: str
-for sublist in texts:
-    for text in sublist:
-
-        # optionally remove hyphenation
-        if args.remove_hyphenation:
-            text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
-
-        fn_matches: list[re.Match[str]] = fn_pattern.finditer(text)
-        for match in fn_matches:
-            fn_text_match: re.Match[str] = fn_text_pattern.search(text, match.end())
-            if fn_text_match:
-
-                # check if the corresponding footnote anchor is missing before trying to replace it by the footnote text
-                if not fn_text_match.group(1):
-                    logging.warning(
-                        f"Footnote text {fn_text_match.group(1)} has no corresponding anchor in text {text}"
-                    )
-                    continue
-                else:
-                    # replace the footnote anchor with the footnote text
-                    text = text.replace(
-                        str(match.group()),
-                        args.footnote_delimiter_start
-                        + str(fn_text_match.group(2)).strip()
-                        + args.footnote_delimiter_end,
-                        1,
-                    )
-                    # remove the footnote text from the text
-                    text = re.sub(fn_text_pattern, "", text, 1)
-                    texts[texts.index(sublist)][0] = text
-
-
-# output the family names from the texts list
-if args.verbose:
-    for sublist in texts:
-        print(sublist[2])
-
-# append all the texts regarding the same family to one string joined by two newlines
-# and write the string to a new set in the form: familyname: text
-# Warning: here we loose the file name of the original text files for reference!
-
-# create a dictionary to store the texts by family
-family_texts: dict[str, str] = {}
-
-for sublist in texts:
-    if sublist[2] in family_texts:
-        family_texts[sublist[2]] += "\n\n" + sublist[0]
-    else:
-        family_texts[sublist[2]] = sublist[0]
-
-if args.verbose:
-    print(family_texts)
-
-# remove any html tags from the family texts
-if args.remove_html:
-    html_pattern: re.Pattern[str] = re.compile(r"<.*?>")
-    for family in family_texts:
-        family_texts[family] = html_pattern.sub("", family_texts[family])
-
-# regex pattern to match [linebreak]"__BLANK__"[linebreak][digit] (lookahead so as not including the digit)
-blank_pattern: re.Pattern[str] = re.compile(r"\n__BLANK__\n(?=\d)")
-
-# iterate over the dictionary and replace the blank_pattern by the String "NEWFILE"
-
-for family in family_texts:
-    family_texts[family] = blank_pattern.sub("\nNEWFILE\n", family_texts[family])
-
-# split text for each family into separate person files at the marker NEWFILE named [familyname]_[first three chars at beginning of text].txt
-# and write the text to the output directory as utf-8 encoded text files
-
-# create the output directory if it doesn't exist
-if not os.path.exists(args.output_directory):
-    os.makedirs(args.output_directory)
-
-# iterate over the dictionary and write output the family texts split by the marker NEWFILE and using the family name and the first three characters of the text as the file name
-with alive_bar(len(family_texts)) as bar:
-    for family in family_texts:
-        family_text: str = family_texts[family]
-        family_text = family_text.split("NEWFILE")
-        for i, person in enumerate(family_text):
-            # remove empty lines at the beginning and ending of the person chunks
-            person = person.strip()
-            filename_suffix: str = re.sub(
-                r"\\.*",
-                "",
-                re.sub(
-                    r"\s+.*",
-                    "",
-                    re.sub(
-                        r"\.*", "", re.sub(r"/.*", "", person[:3].replace(" ", "_"))
-                    ),
-                ),
-            )
-            if person == "":
-                continue
-            # handle collisions: check if the file already exists and append an underline to the filename
-            while os.path.exists(
-                os.path.join(
-                    args.output_directory,
-                    f"{family}_{filename_suffix}.txt",
+        for match in anchors
+        if match.group(1) in used
+    ]
+    edits.extend(
+        (start, end, "", -1) for number in used for start, end in definition_spans[number]
+    )
+    edits.sort()
+
+    source_map: SourceMap | None = SourceMap() if track_offsets else None
+    if source_map is not None:
+        source_map.add(0, 0)
+    parts: list[str] = []
+    length: int = 0
+    position: int = 0
+    for start, end, replacement, definition_offset in edits:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        length += start - position
+        if source_map is not None:
+            if replacement:
+                source_map.add(length, start)
+                source_map.add(length + len(footnote_delimiter_start), definition_offset)
+                source_map.add(
+                    length + len(replacement) - len(footnote_delimiter_end),
+                    max(start, end - len(footnote_delimiter_end)),
                 )
-            ):
-                filename_suffix += "_"
-            with open(
-                os.path.join(
-                    args.output_directory,
-                    f"{family}_{filename_suffix}.txt",
-                ),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(person)
-        bar()
+            source_map.add(length + len(replacement), end)
+        length += len(replacement)
+        position = end
+    parts.append(text[position:])
+
+    return FootnoteResolution("".join(parts), missing_texts, unused_texts, source_map)
+
+
+def split_persons(family_text: str) -> Iterator[tuple[int, str]]:
+    """
+    split the family text at the marker NEWFILE and yield the non-empty person chunks
+    together with their offset in the family text
+    """
+    position: int = 0
+    for person in family_text.split("NEWFILE"):
+        start: int = position
+        position += len(person) + len("NEWFILE")
+        # remove empty lines at the beginning and ending of the person chunks
+        stripped: str = person.strip()
+        if stripped != "":
+            yield start + len(person) - len(person.lstrip()), stripped
+
+
+class PreparedText(NamedTuple):
+    """result of prepare_text"""
+
+    text: str
+    # maps back to the text as read, applied in this order
+    source_maps: tuple[SourceMap, ...]
+
+    def source_offset(self, offset: int) -> int:
+        """offset in the text as read of the character at offset"""
+        for source_map in self.source_maps:
+            offset = source_map.source_offset(offset)
+        return offset
+
+
+def prepare_text(text: str, file: str, settings: ChunkSettings) -> PreparedText:
+    """
+    normalize the text (optionally remove hyphenation and html tags, mark new persons)
+    and put footnotes back into their context
+    anchors without footnote text and footnote texts without anchor are logged as warnings
+    """
+    normalized: NormalizedText = normalize_text(
+        text, settings.remove_hyphenation, settings.remove_html
+    )
+
+    resolution: FootnoteResolution = resolve_footnotes(
+        normalized.text,
+        settings.footnote_delimiter_start,
+        settings.footnote_delimiter_end,
+        track_offsets=True,
+    )
+    for number in resolution.missing_texts:
+        logging.warning(f"Footnote anchor [^fn{number}] has no footnote text in {file}")
+    for number in resolution.unused_texts:
+        logging.warning(f"Footnote text [^fn{number}] has no anchor in {file}")
+    return PreparedText(resolution.text, (resolution.source_map, normalized.source_map))
+
+
+class SourceLocator:
+    """
+    byte offsets and line numbers of character offsets in a text, computed
+    incrementally (the chunks of a file are located in order)
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text: str = text
+        self.offset: int = 0
+        self.byte: int = 0
+        self.line: int = 1
+
+    def locate(self, offset: int) -> tuple[int, int]:
+        """return (byte offset, line number) of the character at offset"""
+        if offset < self.offset:
+            self.offset, self.byte, self.line = 0, 0, 1
+        piece: str = self.text[self.offset:offset]
+        self.byte += len(piece.encode("utf-8"))
+        self.line += piece.count("\n")
+        self.offset = offset
+        return self.byte, self.line
+
+
+def read_family(md_files: list[str]) -> Iterator[tuple[str, str]]:
+    """yield (file, text) for the text files of one family"""
+    for file in md_files:
+        with open(file, "r", encoding="utf-8") as f:
+            yield file, f.read()
+
+
+def family_chunks(
+    family: str, md_files: list[str], settings: ChunkSettings
+) -> list[ChunkRecord]:
+    """
+    read -> normalize and resolve footnotes -> split the texts of one family into person chunks
+    named [familyname]_[first three chars at beginning of text]
+
+    every chunk records the spans of the text files it was cut from as
+    (file, start byte, end byte, first line); footnote texts count as part of their anchor
+    """
+    # append all the texts regarding the same family to one string joined by two newlines
+    # and remember where each text file starts
+    prepared: list[PreparedText] = []
+    locators: list[SourceLocator] = []
+    file_starts: list[int] = []
+    length: int = 0
+    for file, text in read_family(md_files):
+        prepared_text: PreparedText = prepare_text(text, file, settings)
+        file_starts.append(length)
+        prepared.append(prepared_text)
+        locators.append(SourceLocator(text))
+        length += len(prepared_text.text) + 2
+    family_text: str = "\n\n".join(text.text for text in prepared)
+
+    def source_spans(start: int, end: int) -> list[tuple[str, int, int, int]]:
+        spans: list[tuple[str, int, int, int]] = []
+        for i in range(bisect_right(file_starts, start) - 1, bisect_right(file_starts, end - 1)):
+            file_start: int = max(start - file_starts[i], 0)
+            file_end: int = min(end - file_starts[i], len(prepared[i].text))
+            if file_end <= file_start:
+                continue
+            source_start: int = prepared[i].source_offset(file_start)
+            source_end: int = max(prepared[i].source_offset(file_end - 1) + 1, source_start)
+            byte_start, line = locators[i].locate(source_start)
+            byte_end: int = locators[i].locate(source_end)[0]
+            spans.append((md_files[i], byte_start, byte_end, line))
+        return spans
+
+    # handle collisions: append underlines to the names of colliding chunks
+    registry: ChunkRegistry = ChunkRegistry()
+    return [
+        ChunkRecord(
+            registry.resolve(f"{family}_{filename_suffix(person)}"),
+            family,
+            md_files[bisect_right(file_starts, start) - 1],
+            person,
+            source_spans(start, start + len(person)),
+        )
+        for start, person in split_persons(family_text)
+    ]
+
+
+def process_family(
+    job: tuple[str, list[str], str, ChunkSettings, str]
+) -> tuple[str, list[str] | list[ChunkRecord], list[tuple[str, list]]]:
+    """
+    run all steps for one family; only the texts of this family are held in memory
+
+    job: (family name, text files, output directory, settings, output format)
+    returns (family name, paths of the written person chunks, source spans per chunk id)
+    for the output format "files" and (family name, chunk records, source spans) otherwise
+    """
+    family, md_files, output_directory, settings, output_format = job
+    records: list[ChunkRecord] = family_chunks(family, md_files, settings)
+    spans: list[tuple[str, list]] = [(record.chunk_id, record.spans) for record in records]
+    if output_format == "files":
+        return family, ChunkWriter(output_directory).write(records), spans
+    return family, records, spans
+
+
+def chunk_families(
+    families: dict[str, list[str]],
+    output_directory: str,
+    settings: ChunkSettings = ChunkSettings(),
+    processes: int | None = None,
+    output_format: str = "files",
+    metrics: Metrics | None = None,
+    provenance: ProvenanceIndex | None = None,
+) -> Iterator[tuple[str, list[str]]]:
+    """
+    chunk the given families (family name: text files) across a process pool
+
+    with the output format "files" every person chunk is written to its own file by the
+    worker processes, with "jsonl" all chunks are packed into one shard (see chunk_writer.py)
+
+    yields (family name, paths of the written files or chunk ids) as soon as a family is done
+    processes=1 runs everything in the current process
+    metrics (see metrics.py) records the sizes of the chunks of every family in bytes
+    provenance (see provenance.py) records the source spans of every chunk
+    """
+    writer: ChunkWriter = ChunkWriter(output_directory, output_format)
+
+    jobs = (
+        (family, md_files, output_directory, settings, output_format)
+        for family, md_files in families.items()
+    )
+    with writer:
+        if processes == 1 or len(families) <= 1:
+            results = map(process_family, jobs)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(process_family, jobs)
+        try:
+            for family, written, spans in results:
+                if provenance is not None:
+                    provenance.add_chunks(spans)
+                if output_format != "files":
+                    sizes: list[int] = [len(record.text.encode("utf-8")) for record in written]
+                    written = writer.write(written)
+                elif metrics is not None:
+                    sizes = [os.path.getsize(path) for path in written]
+                if metrics is not None:
+                    metrics.record("chunks", family=family, sizes=sizes)
+                yield family, written
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+def main(argv: list[str] | None = None) -> None:
+    # the CLI dependencies are imported here, so importing the module as a library stays fast
+    from alive_progress import alive_bar
+
+    args: argparse.Namespace = parse_args(argv)
+
+    # output version string and exit
+    if args.version is True:
+        print(version_string)
+        sys.exit(0)
+
+    configure_logging(args.verbose)
+    check_input_directory(args.input_directory)
+
+    md_files: list[str] = find_md_files(args.input_directory)
+    if args.verbose:
+        print(len(md_files))
+
+    families: dict[str, list[str]] = discover_families(md_files)
+    settings = ChunkSettings(
+        args.footnote_delimiter_start,
+        args.footnote_delimiter_end,
+        args.remove_hyphenation,
+        args.remove_html,
+    )
+
+    metrics: Metrics | None = None
+    if args.metrics is not None:
+        metrics = Metrics(args.metrics, profile="chunking" if args.profile else None)
+
+    provenance: ProvenanceIndex | None = None
+    if args.provenance is not None:
+        provenance = ProvenanceIndex(args.provenance)
+
+    # chunk the families in parallel and write the family texts split by the marker NEWFILE using the family name and the first three characters of the text as the file name
+    with alive_bar(len(families)) as bar, metrics.stage("chunking") if metrics else nullcontext():
+        for family, written in chunk_families(
+            families, args.output_directory, settings, args.processes, args.output_format,
+            metrics, provenance,
+        ):
+            logging.debug(f"{family}: {len(written)} person chunks")
+            bar()
+
+    if provenance is not None:
+        provenance.close()
+
+    if metrics is not None:
+        print(format_summary(metrics.summary()))
+        metrics.close()
+
+
+if __name__ == "__main__":
+    main()